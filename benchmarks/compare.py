@@ -0,0 +1,119 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2017, UniFrac development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Compare two benchmark runs and flag regressions
+
+Results are matched by suite, dataset, method, variance adjustment, tip
+bypass, thread count and phase. The exit status is 1 if any time or peak
+memory of the candidate exceeds the baseline by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+KEY = ('suite', 'dataset', 'method', 'variance_adjusted', 'bypass_tips',
+       'threads', 'phase')
+
+
+def load(path):
+    with open(path) as fh:
+        results = json.load(fh)['results']
+    return {tuple(r[k] for k in KEY): r for r in results}
+
+
+def describe(key):
+    record = dict(zip(KEY, key))
+    flags = []
+    if record['variance_adjusted']:
+        flags.append('vaw')
+    if record['bypass_tips']:
+        flags.append('bypass')
+    return '%s/%s/%s%s/t%d/%s' % (record['suite'], record['dataset'],
+                                  record['method'],
+                                  ''.join('+' + f for f in flags),
+                                  record['threads'], record['phase'])
+
+
+def compare(baseline, candidate, threshold, statistic, min_seconds):
+    """Compare the matched results of two runs
+
+    Parameters
+    ----------
+    baseline : dict
+        The results of the reference run, keyed as by load.
+    candidate : dict
+        The results of the run to assess, keyed as by load.
+    threshold : float
+        The relative increase above which a result is a regression.
+    statistic : str
+        The timing summary compared, either 'min' or 'median'.
+    min_seconds : float
+        Timings for which both runs are below this are not flagged, as
+        they are dominated by noise.
+
+    Returns
+    -------
+    list of tuple
+        (key, baseline seconds, candidate seconds, time ratio, memory ratio,
+        regressed) for each result present in both runs.
+    """
+    rows = []
+    for key in sorted(set(baseline) & set(candidate), key=describe):
+        base, cand = baseline[key], candidate[key]
+        base_s, cand_s = base[statistic], cand[statistic]
+        time_ratio = cand_s / base_s if base_s > 0 else float('inf')
+        mem_ratio = cand['max_rss_kb'] / max(base['max_rss_kb'], 1)
+
+        slower = (time_ratio > 1 + threshold and
+                  max(base_s, cand_s) >= min_seconds)
+        larger = mem_ratio > 1 + threshold
+        rows.append((key, base_s, cand_s, time_ratio, mem_ratio,
+                     slower or larger))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('baseline', help='The reference results')
+    parser.add_argument('candidate', help='The results to assess')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='The relative increase flagged as a regression, '
+                             'default is 0.1')
+    parser.add_argument('--statistic', choices=('min', 'median'),
+                        default='min', help='The timing summary to compare')
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help='Do not flag timings below this, default is '
+                             '0.01')
+    args = parser.parse_args(argv)
+
+    baseline = load(args.baseline)
+    candidate = load(args.candidate)
+    rows = compare(baseline, candidate, args.threshold, args.statistic,
+                   args.min_seconds)
+
+    print('%-64s %10s %10s %7s %7s' % ('benchmark', 'baseline', 'candidate',
+                                       'time', 'memory'))
+    for key, base_s, cand_s, time_ratio, mem_ratio, regressed in rows:
+        print('%-64s %10.4f %10.4f %6.2fx %6.2fx%s'
+              % (describe(key), base_s, cand_s, time_ratio, mem_ratio,
+                 '  REGRESSION' if regressed else ''))
+
+    for label, keys in (('baseline', set(baseline) - set(candidate)),
+                        ('candidate', set(candidate) - set(baseline))):
+        for key in sorted(keys, key=describe):
+            print('only in %s: %s' % (label, describe(key)))
+
+    n_regressed = sum(row[-1] for row in rows)
+    if n_regressed:
+        print('%d of %d benchmarks regressed' % (n_regressed, len(rows)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
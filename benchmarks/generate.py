@@ -0,0 +1,203 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2017, UniFrac development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Deterministic synthetic trees and tables for benchmarking
+
+The same parameters and seed always produce the same files, so timings from
+different runs or machines are of the same inputs.
+"""
+import argparse
+import os
+
+import numpy as np
+
+
+# named dataset sizes used by run.py
+DATASETS = {'tiny': {'n_tips': 200, 'n_obs': 100, 'n_samples': 20,
+                     'density': 0.1},
+            'small': {'n_tips': 2000, 'n_obs': 1000, 'n_samples': 200,
+                      'density': 0.05},
+            'medium': {'n_tips': 20000, 'n_obs': 10000, 'n_samples': 1000,
+                       'density': 0.01},
+            'large': {'n_tips': 200000, 'n_obs': 100000, 'n_samples': 5000,
+                      'density': 0.002}}
+
+
+def tip_name(i):
+    return 'O%d' % i
+
+
+def random_tree(n_tips, seed=0):
+    """Construct a random rooted binary tree
+
+    Parameters
+    ----------
+    n_tips : int
+        The number of tips, named O0 to O{n_tips - 1}.
+    seed : int, optional
+        The random seed.
+
+    Returns
+    -------
+    str
+        The tree in Newick format.
+
+    Notes
+    -----
+    Pairs of subtrees are joined uniformly at random until one remains, and
+    branch lengths are drawn from an exponential distribution.
+    """
+    if n_tips < 2:
+        raise ValueError("A tree requires at least two tips.")
+
+    rng = np.random.RandomState(seed)
+    lengths = rng.exponential(0.1, size=2 * n_tips - 2)
+    pool = [tip_name(i) for i in range(n_tips)]
+    n_lengths = 0
+
+    def pop(index):
+        # swap with the last subtree so the removal is constant time
+        node = pool[index]
+        pool[index] = pool[-1]
+        pool.pop()
+        return node
+
+    while len(pool) > 1:
+        left = pop(rng.randint(len(pool)))
+        right = pop(rng.randint(len(pool)))
+        pool.append('(%s:%.6f,%s:%.6f)' % (left, lengths[n_lengths],
+                                           right, lengths[n_lengths + 1]))
+        n_lengths += 2
+
+    return pool[0] + ';'
+
+
+def random_table(n_obs, n_samples, density, seed=0):
+    """Construct a random sparse table
+
+    Parameters
+    ----------
+    n_obs : int
+        The number of observations, named O0 to O{n_obs - 1}.
+    n_samples : int
+        The number of samples, named S0 to S{n_samples - 1}.
+    density : float
+        The fraction of observations present in each sample.
+    seed : int, optional
+        The random seed.
+
+    Returns
+    -------
+    biom.Table
+        The table, in which every sample has at least one observation.
+    """
+    from biom import Table
+    from scipy.sparse import coo_matrix
+
+    if not 0 < density <= 1:
+        raise ValueError("The density must be in (0, 1].")
+
+    rng = np.random.RandomState(seed)
+    per_sample = max(1, int(round(density * n_obs)))
+
+    rows = np.concatenate([rng.choice(n_obs, per_sample, replace=False)
+                           for _ in range(n_samples)])
+    cols = np.repeat(np.arange(n_samples), per_sample)
+    # a skewed abundance distribution, as typical of amplicon data
+    counts = rng.geometric(0.05, size=rows.shape[0]).astype(float)
+
+    data = coo_matrix((counts, (rows, cols)), shape=(n_obs, n_samples))
+    return Table(data.tocsr(),
+                 [tip_name(i) for i in range(n_obs)],
+                 ['S%d' % i for i in range(n_samples)])
+
+
+def dataset_paths(output_dir, n_tips, n_obs, n_samples, density, seed=0):
+    """The table and tree paths of a dataset, generated if not present
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory in which the files are kept.
+    n_tips : int
+        The number of tips in the tree.
+    n_obs : int
+        The number of observations in the table, which must not exceed
+        n_tips.
+    n_samples : int
+        The number of samples in the table.
+    density : float
+        The fraction of observations present in each sample.
+    seed : int, optional
+        The random seed.
+
+    Returns
+    -------
+    tuple of str
+        The filepaths of the BIOM-Format 2.1 table and the Newick tree.
+    """
+    from biom.util import biom_open
+
+    if n_obs > n_tips:
+        raise ValueError("The table cannot have more observations than the "
+                         "tree has tips.")
+
+    # the parameters are part of the name so a cached file is never stale
+    prefix = os.path.join(output_dir, 't%d-o%d-s%d-d%g-r%d' % (
+        n_tips, n_obs, n_samples, density, seed))
+    table_path = prefix + '.biom'
+    tree_path = prefix + '.tre'
+    os.makedirs(output_dir, exist_ok=True)
+
+    if not os.path.exists(tree_path):
+        with open(tree_path + '.tmp', 'w') as fh:
+            fh.write(random_tree(n_tips, seed))
+            fh.write('\n')
+        os.rename(tree_path + '.tmp', tree_path)
+
+    if not os.path.exists(table_path):
+        table = random_table(n_obs, n_samples, density, seed)
+        with biom_open(table_path + '.tmp', 'w') as fh:
+            table.to_hdf5(fh, 'unifrac benchmark')
+        os.rename(table_path + '.tmp', table_path)
+
+    return table_path, tree_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--dataset', choices=sorted(DATASETS),
+                        help='A named dataset size; the explicit sizes below '
+                             'take precedence')
+    parser.add_argument('--tips', type=int, help='The number of tree tips')
+    parser.add_argument('--obs', type=int,
+                        help='The number of table observations')
+    parser.add_argument('--samples', type=int,
+                        help='The number of table samples')
+    parser.add_argument('--density', type=float,
+                        help='The fraction of observations in each sample')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='The random seed')
+    parser.add_argument('--output-dir', default='bench_data',
+                        help='The directory in which to write the files')
+    args = parser.parse_args(argv)
+
+    params = dict(DATASETS[args.dataset or 'small'])
+    for key, value in (('n_tips', args.tips), ('n_obs', args.obs),
+                       ('n_samples', args.samples),
+                       ('density', args.density)):
+        if value is not None:
+            params[key] = value
+
+    table_path, tree_path = dataset_paths(args.output_dir, seed=args.seed,
+                                          **params)
+    print(table_path)
+    print(tree_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2017, UniFrac development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Benchmark the C++ and Python interfaces over synthetic datasets
+
+Every combination of dataset, method, variance adjustment, tip bypass and
+thread count is run in a fresh process, so the reported peak memory is of
+that combination alone. The results are written as JSON for compare.py.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+from generate import DATASETS, dataset_paths
+
+
+METHODS = ('unweighted', 'weighted_normalized', 'weighted_unnormalized',
+           'generalized')
+
+# the value of alpha for generalized UniFrac, as 1.0 is weighted normalized
+ALPHA = 0.5
+
+PYTHON_BENCHMARK = """
+import json
+import resource
+import sys
+import time
+
+import unifrac
+
+table, tree, method, vaw, bypass_tips, threads, alpha, repeats = \\
+    json.loads(sys.argv[1])
+
+timings = []
+for _ in range(repeats):
+    start = time.perf_counter()
+    unifrac.ssu(table, tree, method, vaw, alpha, bypass_tips, threads)
+    timings.append(time.perf_counter() - start)
+
+max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    max_rss //= 1024
+print(json.dumps({'phases': {'ssu': timings}, 'max_rss_kb': max_rss}))
+"""
+
+
+def summarize(record, timings):
+    record['seconds'] = timings
+    record['min'] = min(timings)
+    record['median'] = statistics.median(timings)
+    return record
+
+
+def run_cpp(ssu_bench, table, tree, config, repeats):
+    method, vaw, bypass_tips, threads = config
+    cmd = [ssu_bench, '-i', table, '-t', tree, '-m', method,
+           '-n', str(threads), '-a', str(ALPHA), '--repeats', str(repeats)]
+    if vaw:
+        cmd.append('--vaw')
+    if bypass_tips:
+        cmd.append('-f')
+    return json.loads(subprocess.check_output(cmd).decode('utf-8'))
+
+
+def run_python(table, tree, config, repeats):
+    method, vaw, bypass_tips, threads = config
+    args = json.dumps([table, tree, method, vaw, bypass_tips, threads, ALPHA,
+                       repeats])
+    out = subprocess.check_output([sys.executable, '-c', PYTHON_BENCHMARK,
+                                   args])
+    return json.loads(out.decode('utf-8'))
+
+
+def git_commit():
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=here,
+                                      stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode('utf-8').strip()
+
+
+def metadata(args):
+    return {'created': datetime.datetime.now().isoformat(),
+            'host': platform.node(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'commit': git_commit(),
+            'repeats': args.repeats,
+            'seed': args.seed}
+
+
+def parse_list(value):
+    return [v for v in value.split(',') if v]
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--datasets', default='small', type=parse_list,
+                        help='Comma separated dataset sizes, of %s'
+                             % ', '.join(sorted(DATASETS)))
+    parser.add_argument('--methods', default=','.join(METHODS),
+                        type=parse_list, help='Comma separated methods')
+    parser.add_argument('--threads', default='1', type=parse_list,
+                        help='Comma separated thread counts')
+    parser.add_argument('--vaw', default='false,true', type=parse_list,
+                        help='Comma separated variance adjustment settings')
+    parser.add_argument('--bypass-tips', default='false,true',
+                        type=parse_list,
+                        help='Comma separated tip bypass settings')
+    parser.add_argument('--suites', default='cpp,python', type=parse_list,
+                        help='Comma separated suites, of cpp and python')
+    parser.add_argument('--repeats', default=3, type=int,
+                        help='The number of timings of each phase')
+    parser.add_argument('--seed', default=0, type=int,
+                        help='The random seed of the datasets')
+    parser.add_argument('--ssu-bench',
+                        default=os.path.join(here, '..', 'sucpp',
+                                             'ssu_bench'),
+                        help='The path to ssu_bench, from make bench')
+    parser.add_argument('--data-dir', default=os.path.join(here, 'data'),
+                        help='The directory of the generated datasets')
+    parser.add_argument('--output', default='bench_results.json',
+                        help='The JSON file to write')
+    args = parser.parse_args(argv)
+
+    for name in args.datasets:
+        if name not in DATASETS:
+            parser.error("Unknown dataset: %s" % name)
+    for method in args.methods:
+        if method not in METHODS:
+            parser.error("Unknown method: %s" % method)
+    for suite in args.suites:
+        if suite not in ('cpp', 'python'):
+            parser.error("Unknown suite: %s" % suite)
+
+    def to_bool(values):
+        return [v.lower() in ('true', 'yes', '1') for v in values]
+
+    threads = [int(t) for t in args.threads]
+    usable = [t for t in threads if t <= (os.cpu_count() or 1)]
+    if usable != threads:
+        sys.stderr.write("Skipping thread counts above the %d CPUs\n"
+                         % os.cpu_count())
+
+    configs = list(itertools.product(args.methods, to_bool(args.vaw),
+                                     to_bool(args.bypass_tips), usable))
+    results = []
+    for name in args.datasets:
+        table, tree = dataset_paths(args.data_dir, seed=args.seed,
+                                    **DATASETS[name])
+        for suite, config in itertools.product(args.suites, configs):
+            sys.stderr.write("%s %s %s vaw=%s bypass_tips=%s threads=%d\n"
+                             % ((suite, name) + config))
+            if suite == 'cpp':
+                out = run_cpp(args.ssu_bench, table, tree, config,
+                              args.repeats)
+            else:
+                out = run_python(table, tree, config, args.repeats)
+
+            method, vaw, bypass_tips, n_threads = config
+            for phase, timings in sorted(out['phases'].items()):
+                results.append(summarize({'suite': suite,
+                                          'dataset': name,
+                                          'method': method,
+                                          'variance_adjusted': vaw,
+                                          'bypass_tips': bypass_tips,
+                                          'threads': n_threads,
+                                          'phase': phase,
+                                          'max_rss_kb': out['max_rss_kb']},
+                                         timings))
+
+    with open(args.output, 'w') as fh:
+        json.dump({'metadata': metadata(args), 'results': results}, fh,
+                  indent=2)
+        fh.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,7 @@ import numpy as np
 
 import subprocess
 import os
+import re
 import sys
 
 
@@ -91,9 +92,14 @@ if USE_CYTHON:
 with open('README.md') as f:
     long_description = f.read()
 
+# the version is kept in the package, so that it is known without a lookup of
+# the installed distributions
+with open(os.path.join('unifrac', '_version.py')) as f:
+    version = re.search(r"__version__ = '(.*)'", f.read()).group(1)
+
 setup(
     name="unifrac",
-    version="0.10.0",
+    version=version,
     packages=find_packages(),
     author="Daniel McDonald",
     license='BSD-3-Clause',
@@ -2,10 +2,25 @@
 #include "biom.hpp"
 #include "tree.hpp"
 #include "unifrac.hpp"
+#include "stats.hpp"
+#include "ordination.hpp"
+#include "permutation.hpp"
+#include "pool.hpp"
+#include "serve.hpp"
 #include <fstream>
 #include <iomanip>
+#include <sstream>
 #include <thread>
 #include <cstring>
+#include <cerrno>
+#include <memory>
+#include <stdexcept>
+#include <new>
+#include <sys/stat.h>
+#include <algorithm>
+#include <cmath>
+#include <queue>
+#include <functional>
 
 #define CHECK_FILE(filename, err) if(!is_file_exists(filename)) { \
                                       return err;                 \
@@ -24,33 +39,271 @@
                                               return err;                                                      \
                                           }
 
-#define PARSE_SYNC_TREE_TABLE(tree_filename, table_filename) std::ifstream ifs(tree_filename);                                        \
-                                                             std::string content = std::string(std::istreambuf_iterator<char>(ifs),   \
-                                                                                               std::istreambuf_iterator<char>());     \
-                                                             su::BPTree tree = su::BPTree(content);                                   \
-                                                             su::biom table = su::biom(biom_filename);                                \
-                                                             if(table.n_samples <= 0 | table.n_obs <= 0) {                            \
-                                                                 return table_empty;                                                  \
-                                                             }                                                                        \
-                                                             std::string bad_id = su::test_table_ids_are_subset_of_tree(table, tree); \
-                                                             if(bad_id != "") {                                                       \
-                                                                 return table_and_tree_do_not_overlap;                                \
-                                                             }                                                                        \
-                                                             std::unordered_set<std::string> to_keep(table.obs_ids.begin(),           \
-                                                                                                     table.obs_ids.end());            \
-                                                             su::BPTree tree_sheared = tree.shear(to_keep).collapse();
+#define PARSE_TREE(tree_filename, stats) PhaseRecorder phases(stats);                                           \
+                                         std::ifstream ifs(tree_filename);                                      \
+                                         std::string content = std::string(std::istreambuf_iterator<char>(ifs), \
+                                                                           std::istreambuf_iterator<char>());   \
+                                         std::unique_ptr<su::BPTree> tree_ptr;                                  \
+                                         try {                                                                  \
+                                             tree_ptr.reset(new su::BPTree(content));                           \
+                                         } catch(const std::invalid_argument &e) {                              \
+                                             return tree_malformed;                                             \
+                                         } catch(const std::out_of_range &e) {                                  \
+                                             return tree_malformed;                                             \
+                                         }                                                                      \
+                                         su::BPTree &tree = *tree_ptr;                                          \
+                                         phases.stop_sized("parse", tree);
+
+#define SYNC_TABLE_SUBSET(table_filename, subset, shear_cache) std::unique_ptr<su::biom> table_ptr;                                                      \
+                                                               try {                                                                                     \
+                                                                   table_ptr.reset(load_table(biom_filename, subset));                                   \
+                                                               } catch(const std::invalid_argument &e) {                                                 \
+                                                                   return table_bad_format_version;                                                      \
+                                                               } catch(const std::out_of_range &e) {                                                     \
+                                                                   return sample_missing;                                                                \
+                                                               }                                                                                         \
+                                                               su::biom &table = *table_ptr;                                                             \
+                                                               phases.stop_sized("load", table);                                                         \
+                                                               if(table.n_samples <= 0 | table.n_obs <= 0) {                                             \
+                                                                   return table_empty;                                                                   \
+                                                               }                                                                                         \
+                                                               std::unordered_set<std::string> to_keep(table.obs_ids.begin(),                            \
+                                                                                                       table.obs_ids.end());                             \
+                                                               /* a tree which is reused is sheared through the cache */                                 \
+                                                               std::string missing_id;                                                                   \
+                                                               su::ShearCache *cache = shear_cache;                                                      \
+                                                               std::shared_ptr<su::BPTree> sheared_ptr;                                                  \
+                                                               if(cache == NULL)                                                                         \
+                                                                   sheared_ptr = std::make_shared<su::BPTree>(tree.shear_collapse(to_keep, missing_id)); \
+                                                               else                                                                                      \
+                                                                   sheared_ptr = cache->get(tree, to_keep, missing_id);                                  \
+                                                               if(missing_id != "") {                                                                    \
+                                                                   return table_and_tree_do_not_overlap;                                                 \
+                                                               }                                                                                         \
+                                                               su::BPTree &tree_sheared = *sheared_ptr;                                                  \
+                                                               phases.stop_sized("shear", tree_sheared);
+
+#define PARSE_SYNC_TREE_TABLE_SUBSET(tree_filename, table_filename, stats, subset) PARSE_TREE(tree_filename, stats)          \
+                                                                                   SYNC_TABLE_SUBSET(table_filename, subset, NULL)
+
+#define PARSE_SYNC_TREE_TABLE_RECORDED(tree_filename, table_filename, stats) PARSE_SYNC_TREE_TABLE_SUBSET(tree_filename, table_filename, stats, NULL)
+
+#define PARSE_SYNC_TREE_TABLE(tree_filename, table_filename) PARSE_SYNC_TREE_TABLE_RECORDED(tree_filename, table_filename, NULL)
 
 
 using namespace su;
 using namespace std;
 
-// https://stackoverflow.com/a/19841704/19741
+// the number of existing samples recomputed to verify an existing result
+#define APPEND_VERIFY_SAMPLES 4
+// the relative tolerance for verifying an existing result, allowing for a
+// result which has been round tripped through text
+#define APPEND_TOLERANCE 1e-9
+// the number of distances held at once by knn_query
+#define KNN_BLOCK_CELLS (1 << 24)
+// the relative slack on a lower bound before a sample is pruned, so that
+// rounding cannot exclude a neighbour
+#define KNN_PRUNE_SLACK 1e-9
+// the default cost model of plan_partials, from calibrate_cost_model for
+// unweighted UniFrac on a contemporary x86-64 core. the other methods are
+// cheaper per stripe, so these overestimate their time
+#define PLAN_NODE_SECONDS 2.7e-9
+#define PLAN_STRIPE_SECONDS 3.6e-9
+// the stripes and repeats timed by calibrate_cost_model
+#define PLAN_CALIBRATION_STRIPES 8
+#define PLAN_CALIBRATION_REPEATS 2
+// the estimated bytes of a sample or observation ID, as the IDs are not read
+// when planning
+#define PLAN_ID_BYTES 96
+// the 64-bit FNV-1a parameters, of the fingerprint of a checkpointed
+// computation
+#define FNV_OFFSET_BASIS 14695981039346656037ULL
+#define FNV_PRIME 1099511628211ULL
+// the bytes of the table read at once while fingerprinting it
+#define FINGERPRINT_BLOCK_BYTES (1 << 20)
+
+// sheared and collapsed trees from recent calls, so that repeated calls on
+// the same tree and feature set skip the shear
+static su::ShearCache sheared_trees(4);
+
+// load a table, reading only the samples and features of subset if it is
+// not NULL
+static su::biom* load_table(const char* biom_filename, const table_subset_t* subset) {
+    if(subset == NULL)
+        return new su::biom(biom_filename);
+
+    std::vector<std::string> sample_ids;
+    std::vector<std::string> feature_ids;
+    if(subset->sample_ids != NULL)
+        sample_ids.assign(subset->sample_ids, subset->sample_ids + subset->n_sample_ids);
+    if(subset->feature_ids != NULL)
+        feature_ids.assign(subset->feature_ids, subset->feature_ids + subset->n_feature_ids);
+    return new su::biom(biom_filename,
+                        subset->sample_ids != NULL ? &sample_ids : NULL,
+                        subset->feature_ids != NULL ? &feature_ids : NULL);
+}
+
+// test for existence without opening the file, as the loaders will
 bool is_file_exists(const char *fileName) {
-    std::ifstream infile(fileName);
-        return infile.good();
+    struct stat buffer;
+    return stat(fileName, &buffer) == 0;
 }
 
 
+/* records the phases of a computation into a run_stats_t, if requested
+ *
+ * The statistics are only handed to the caller by finish, and are otherwise
+ * freed, so that an early error return does not leak them. When not
+ * requested, each method is a test of a null pointer.
+ */
+class PhaseRecorder {
+    public:
+        PhaseRecorder(run_stats_t** out) : out(out), stats(NULL), wall(0.0), cpu(0.0) {
+            if(out != NULL) {
+                stats = (run_stats_t*)calloc(1, sizeof(run_stats_t));
+                start();
+            }
+        }
+
+        ~PhaseRecorder() {
+            if(stats != NULL)
+                destroy_run_stats(&stats);
+        }
+
+        // record the phase ending now, and begin the next
+        void stop(const char* name, uint64_t bytes) {
+            if(stats == NULL || stats->n_phases == RUN_STATS_MAX_PHASES)
+                return;
+            unsigned int i = stats->n_phases++;
+            stats->phase_names[i] = name;
+            stats->wall_seconds[i] = su::wall_seconds() - wall;
+            stats->cpu_seconds[i] = su::process_cpu_seconds() - cpu;
+            stats->bytes_allocated[i] = bytes;
+            stats->peak_rss_kb[i] = su::peak_rss_kb();
+            start();
+        }
+
+        // as stop, with the bytes of a structure which is only sized if recording
+        template<class T> void stop_sized(const char* name, const T &structure) {
+            if(stats == NULL || stats->n_phases == RUN_STATS_MAX_PHASES)
+                return;
+            stop(name, 0);
+            stats->bytes_allocated[stats->n_phases - 1] = structure.memory_bytes();
+            start();
+        }
+
+        // the number of samples whose distances were copied from an identical sample
+        void duplicates(unsigned int n_duplicates) {
+            if(stats != NULL)
+                stats->n_duplicates = n_duplicates;
+        }
+
+        // the per-thread CPU time of the tasks of the compute phase
+        void threads(const std::vector<su::task_parameters> &tasks) {
+            if(stats == NULL)
+                return;
+            free(stats->thread_cpu_seconds);
+            stats->n_threads = tasks.size();
+            stats->thread_cpu_seconds = (double*)malloc(sizeof(double) * std::max<size_t>(tasks.size(), 1));
+            for(unsigned int tid = 0; tid < tasks.size(); tid++)
+                stats->thread_cpu_seconds[tid] = tasks[tid].cpu_seconds;
+        }
+
+        void finish() {
+            if(stats != NULL) {
+                *out = stats;
+                stats = NULL;
+            }
+        }
+
+    private:
+        run_stats_t** out;
+        run_stats_t* stats;
+        double wall;
+        double cpu;
+
+        void start() {
+            wall = su::wall_seconds();
+            cpu = su::process_cpu_seconds();
+        }
+};
+
+// the bytes of the allocated stripes
+uint64_t stripes_bytes(std::vector<double*> &dm_stripes, std::vector<double*> &dm_stripes_total,
+                       unsigned int n_samples) {
+    uint64_t n_allocated = 0;
+    for(unsigned int i = 0; i < dm_stripes.size(); i++)
+        n_allocated += (dm_stripes[i] != NULL) + (dm_stripes_total[i] != NULL);
+    return n_allocated * n_samples * sizeof(double);
+}
+
+// whether the stripes of a method are paired with stripes of totals
+bool needs_stripe_totals(Method method, bool variance_adjust) {
+    if(variance_adjust)
+        return method != weighted_unnormalized;
+    return method == unweighted || method == generalized;
+}
+
+// the working bytes of a thread of process_stripes: the PropStack, the
+// embedded proportions and, if variance adjusted, the counts and totals
+uint64_t thread_working_bytes(uint64_t max_live, unsigned int n_samples, bool variance_adjust) {
+    uint64_t row_bytes = (uint64_t)n_samples * sizeof(double);
+    return variance_adjust ? (2 * max_live + 6) * row_bytes : (max_live + 2) * row_bytes;
+}
+
+// the bytes of a list of sample IDs as copied into a result
+uint64_t sample_ids_bytes(biom &table) {
+    uint64_t total = table.n_samples * sizeof(char*);
+    for(auto &id : table.sample_ids)
+        total += id.length() + 1;
+    return total;
+}
+
+// the FNV-1a hash of n bytes, continuing from hash
+uint64_t fnv1a(const void* data, size_t n, uint64_t hash) {
+    const unsigned char* bytes = (const unsigned char*)data;
+    for(size_t i = 0; i < n; i++) {
+        hash ^= bytes[i];
+        hash *= FNV_PRIME;
+    }
+    return hash;
+}
+
+// the fingerprint of a computation, under which its checkpoints are written,
+// so that a checkpoint is only resumed by the computation which wrote it.
+// the table file is hashed rather than the parsed table, as it is the
+// cheaper to read through
+uint64_t checkpoint_fingerprint(const char* biom_filename, const std::string &tree_content,
+                                Method method, bool variance_adjust, double alpha, bool bypass_tips) {
+    uint64_t hash = fnv1a(tree_content.data(), tree_content.size(), FNV_OFFSET_BASIS);
+
+    std::ifstream ifs(biom_filename, std::ios::binary);
+    std::vector<char> block(FINGERPRINT_BLOCK_BYTES);
+    while(ifs.read(block.data(), block.size()) || ifs.gcount() > 0)
+        hash = fnv1a(block.data(), ifs.gcount(), hash);
+
+    int32_t flags[3] = {method, variance_adjust, bypass_tips};
+    hash = fnv1a(flags, sizeof(flags), hash);
+    return fnv1a(&alpha, sizeof(alpha), hash);
+}
+
+// the checkpoints of a computation, or NULL if it is not checkpointed
+std::unique_ptr<su::checkpoint_parameters> make_checkpoint(const char* prefix, double interval, bool resume,
+                                                           uint64_t fingerprint) {
+    if(prefix == NULL)
+        return std::unique_ptr<su::checkpoint_parameters>();
+    return std::unique_ptr<su::checkpoint_parameters>(
+        new su::checkpoint_parameters({prefix, interval, fingerprint, resume, 0}));
+}
+
+// remove the checkpoints of completed tasks
+void remove_checkpoints(const su::checkpoint_parameters* checkpoint, std::vector<su::task_parameters> &tasks) {
+    if(checkpoint == NULL)
+        return;
+    for(auto &task : tasks)
+        remove(su::checkpoint_path(*checkpoint, &task).c_str());
+}
+
 void destroy_stripes(vector<double*> &dm_stripes, vector<double*> &dm_stripes_total, unsigned int n_samples,
                      unsigned int stripe_start, unsigned int stripe_stop) {
     unsigned int n_rotations = (n_samples + 1) / 2;
@@ -91,6 +344,58 @@ void initialize_mat(mat_t* &result, biom &table, bool is_upper_triangle) {
     }
 }
 
+void initialize_mat_full(mat_full_t* &result, char** sample_ids, unsigned int n_samples) {
+    result = (mat_full_t*)malloc(sizeof(mat_full));
+    result->n_samples = n_samples;
+    result->matrix = (double*)malloc(sizeof(double) * n_samples * n_samples);
+    result->sample_ids = (char**)malloc(sizeof(char*) * n_samples);
+    for(unsigned int i = 0; i < n_samples; i++)
+        result->sample_ids[i] = strdup(sample_ids[i]);
+}
+
+// the matrix a computation writes, either a mat_t of the condensed form or a
+// mat_full_t of the square form, which is initialized once the stripes are
+// computed
+struct matrix_result {
+    mat_t** condensed;
+    mat_full_t** full;
+
+    matrix_result(mat_t** condensed_) : condensed(condensed_), full(NULL) {}
+    matrix_result(mat_full_t** full_) : condensed(NULL), full(full_) {}
+
+    bool square() const {
+        return full != NULL;
+    }
+
+    // the bytes of the distances of n samples
+    uint64_t bytes(uint64_t n) const {
+        return (square() ? n * n : su::comb_2(n)) * sizeof(double);
+    }
+
+    void initialize(biom &table) {
+        if(square()) {
+            std::vector<char*> ids(table.n_samples);
+            for(unsigned int i = 0; i < table.n_samples; i++)
+                ids[i] = (char*)table.sample_ids[i].c_str();
+            initialize_mat_full(*full, ids.data(), table.n_samples);
+        } else {
+            initialize_mat(*condensed, table, true);  // true -> is_upper_triangle
+        }
+    }
+
+    double* values() {
+        return square() ? (*full)->matrix : (*condensed)->condensed_form;
+    }
+
+    // release a result which is initialized, as when a computation fails
+    void destroy() {
+        if(square())
+            destroy_mat_full(full);
+        else
+            destroy_mat(condensed);
+    }
+};
+
 void initialize_results_vec(r_vec* &result, biom& table){
     // Stores results for Faith PD
     result = (r_vec*)malloc(sizeof(results_vec));
@@ -122,6 +427,21 @@ void initialize_mat_no_biom(mat_t* &result, char** sample_ids, unsigned int n_sa
     }
 }
 
+void initialize_rect_mat(rect_mat_t* &result, const char** row_ids, unsigned int n_rows,
+                         const char** col_ids, unsigned int n_cols) {
+    result = (rect_mat_t*)malloc(sizeof(rect_mat));
+    result->n_rows = n_rows;
+    result->n_cols = n_cols;
+    result->values = (double*)malloc(sizeof(double) * n_rows * n_cols);
+    result->row_ids = (char**)malloc(sizeof(char*) * n_rows);
+    result->col_ids = (char**)malloc(sizeof(char*) * n_cols);
+
+    for(unsigned int i = 0; i < n_rows; i++)
+        result->row_ids[i] = strdup(row_ids[i]);
+    for(unsigned int i = 0; i < n_cols; i++)
+        result->col_ids[i] = strdup(col_ids[i]);
+}
+
 void initialize_partial_mat(partial_mat_t* &result, biom &table, std::vector<double*> &dm_stripes,
                             unsigned int stripe_start, unsigned int stripe_stop, bool is_upper_triangle) {
     result = (partial_mat_t*)malloc(sizeof(partial_mat));
@@ -165,6 +485,45 @@ void destroy_mat(mat_t** result) {
     free(*result);
 }
 
+void destroy_mat_full(mat_full_t** result) {
+    for(unsigned int i = 0; i < (*result)->n_samples; i++)
+        free((*result)->sample_ids[i]);
+    free((*result)->sample_ids);
+    free((*result)->matrix);
+    free(*result);
+    *result = NULL;
+}
+
+void destroy_rect_mat(rect_mat_t** result) {
+    for(unsigned int i = 0; i < (*result)->n_rows; i++)
+        free((*result)->row_ids[i]);
+    for(unsigned int i = 0; i < (*result)->n_cols; i++)
+        free((*result)->col_ids[i]);
+    free((*result)->row_ids);
+    free((*result)->col_ids);
+    free((*result)->values);
+    free(*result);
+}
+
+void destroy_knn_result(knn_result_t** result) {
+    for(unsigned int i = 0; i < (*result)->n_queries; i++)
+        free((*result)->query_ids[i]);
+    for(unsigned int i = 0; i < (*result)->n_samples; i++)
+        free((*result)->sample_ids[i]);
+    free((*result)->query_ids);
+    free((*result)->sample_ids);
+    free((*result)->indices);
+    free((*result)->distances);
+    free(*result);
+}
+
+void destroy_run_stats(run_stats_t** stats) {
+    if((*stats)->thread_cpu_seconds != NULL)
+        free((*stats)->thread_cpu_seconds);
+    free(*stats);
+    *stats = NULL;
+}
+
 void destroy_partial_mat(partial_mat_t** result) {
     for(unsigned int i = 0; i < (*result)->n_samples; i++) {
         if((*result)->sample_ids[i] != NULL)
@@ -227,16 +586,303 @@ void set_tasks(std::vector<su::task_parameters> &tasks,
     }
 }
 
+// compute the stripes [stripe_start, stripe_stop) of table into result, which
+// is initialized here
+compute_status compute_stripe_range(biom &table, BPTree &tree_sheared, Method method, bool variance_adjust,
+                                    double alpha, bool bypass_tips, unsigned int nthreads,
+                                    unsigned int stripe_start, unsigned int stripe_stop, partial_mat_t** result,
+                                    PhaseRecorder *phases = NULL,
+                                    const su::checkpoint_parameters* checkpoint = NULL) {
+    // we resize to the largest number of possible stripes even if only computing
+    // partial, however we do not allocate arrays for non-computed stripes so
+    // there is a little memory waste here but should be on the order of
+    // 8 bytes * N samples per vector.
+    std::vector<double*> dm_stripes((table.n_samples + 1) / 2);
+    std::vector<double*> dm_stripes_total((table.n_samples + 1) / 2);
+
+    if(stripe_stop <= stripe_start || dm_stripes.size() < stripe_stop)
+        return stripes_out_of_bounds;
+
+    if(nthreads > stripe_stop - stripe_start) {
+        fprintf(stderr, "More threads were requested than stripes. Using %u threads.\n", stripe_stop - stripe_start);
+        nthreads = stripe_stop - stripe_start;
+    }
+
+    std::vector<su::task_parameters> tasks(nthreads);
+
+    set_tasks(tasks, alpha, table.n_samples, stripe_start, stripe_stop, bypass_tips, nthreads);
+    try {
+        su::process_stripes(table, tree_sheared, method, variance_adjust, dm_stripes, dm_stripes_total, tasks,
+                            checkpoint);
+    } catch(const std::bad_alloc &e) {
+        destroy_stripes(dm_stripes, dm_stripes_total, table.n_samples, 0, 0);
+        return memory_limit_exceeded;
+    }
+    remove_checkpoints(checkpoint, tasks);
+    if(phases != NULL) {
+        phases->threads(tasks);
+        phases->stop("compute", stripes_bytes(dm_stripes, dm_stripes_total, table.n_samples));
+    }
+
+    initialize_partial_mat(*result, table, dm_stripes, stripe_start, stripe_stop, true);  // true -> is_upper_triangle
+    destroy_stripes(dm_stripes, dm_stripes_total, table.n_samples, stripe_start, stripe_stop);
+    if(phases != NULL)
+        phases->stop("partial", sample_ids_bytes(table) + (stripe_stop - stripe_start) * sizeof(double*));
+
+    return okay;
+}
+
+// partial_stats, and if checkpoint_prefix is not NULL, partial_checkpoint
+compute_status compute_partial(const char* biom_filename, const char* tree_filename,
+                               const char* unifrac_method, bool variance_adjust, double alpha, bool bypass_tips,
+                               unsigned int nthreads, unsigned int stripe_start, unsigned int stripe_stop,
+                               const table_subset_t* subset, partial_mat_t** result, run_stats_t** stats,
+                               const char* checkpoint_prefix, double checkpoint_interval, bool resume) {
+
+    CHECK_FILE(biom_filename, table_missing)
+    CHECK_FILE(tree_filename, tree_missing)
+    SET_METHOD(unifrac_method, unknown_method)
+    PARSE_SYNC_TREE_TABLE_SUBSET(tree_filename, table_filename, stats, subset)
+
+    std::unique_ptr<su::checkpoint_parameters> checkpoint;
+    if(checkpoint_prefix != NULL)
+        checkpoint = make_checkpoint(checkpoint_prefix, checkpoint_interval, resume,
+                                     checkpoint_fingerprint(biom_filename, content, method, variance_adjust,
+                                                            alpha, bypass_tips));
+
+    compute_status status = compute_stripe_range(table, tree_sheared, method, variance_adjust, alpha,
+                                                 bypass_tips, nthreads, stripe_start, stripe_stop, result,
+                                                 &phases, checkpoint.get());
+    if(status != okay)
+        return status;
+    phases.finish();
+
+    return okay;
+}
+
+// the state of a stripe_stream_t: the loaded table and sheared tree, and the
+// parameters of the computation
+struct stripe_stream_state {
+    std::unique_ptr<su::biom> table;
+    std::shared_ptr<su::BPTree> tree_sheared;
+    Method method;
+    bool variance_adjust;
+    double alpha;
+    bool bypass_tips;
+};
+
+compute_status open_stripe_stream(const char* biom_filename, const char* tree_filename,
+                                  const char* unifrac_method, bool variance_adjust, double alpha,
+                                  bool bypass_tips, stripe_stream_t** result) {
+    CHECK_FILE(biom_filename, table_missing)
+    CHECK_FILE(tree_filename, tree_missing)
+    SET_METHOD(unifrac_method, unknown_method)
+    PARSE_SYNC_TREE_TABLE(tree_filename, table_filename)
+
+    stripe_stream_state* state = new stripe_stream_state();
+    state->table = std::move(table_ptr);
+    state->tree_sheared = sheared_ptr;
+    state->method = method;
+    state->variance_adjust = variance_adjust;
+    state->alpha = alpha;
+    state->bypass_tips = bypass_tips;
+
+    *result = (stripe_stream_t*)malloc(sizeof(stripe_stream_t));
+    (*result)->n_samples = state->table->n_samples;
+    (*result)->n_stripes = (state->table->n_samples + 1) / 2;
+    (*result)->sample_ids = (char**)malloc(sizeof(char*) * state->table->n_samples);
+    for(unsigned int i = 0; i < state->table->n_samples; i++) {
+        (*result)->sample_ids[i] = strdup(state->table->sample_ids[i].c_str());
+    }
+    (*result)->state = state;
+
+    return okay;
+}
+
+compute_status stream_stripes(stripe_stream_t* stream, unsigned int nthreads, unsigned int stripe_start,
+                              unsigned int stripe_stop, partial_mat_t** result) {
+    stripe_stream_state* state = (stripe_stream_state*)stream->state;
+    return compute_stripe_range(*state->table, *state->tree_sheared, state->method, state->variance_adjust,
+                                state->alpha, state->bypass_tips, nthreads, stripe_start, stripe_stop, result);
+}
+
+void configure_worker_pool(unsigned int size, bool bind_to_cores) {
+    su::configure_pool(size, bind_to_cores ? su::affinity_core : su::affinity_none);
+}
+
+unsigned int worker_pool_size() {
+    return su::pool_size();
+}
+
+void destroy_stripe_stream(stripe_stream_t** stream) {
+    if(*stream == NULL)
+        return;
+    for(unsigned int i = 0; i < (*stream)->n_samples; i++)
+        free((*stream)->sample_ids[i]);
+    free((*stream)->sample_ids);
+    delete (stripe_stream_state*)(*stream)->state;
+    free(*stream);
+    *stream = NULL;
+}
+
+void destroy_ordination(ordination_t** result) {
+    for(unsigned int i = 0; i < (*result)->n_samples; i++)
+        free((*result)->sample_ids[i]);
+    free((*result)->sample_ids);
+    free((*result)->eigvals);
+    free((*result)->proportion_explained);
+    free((*result)->coordinates);
+    free(*result);
+    *result = NULL;
+}
+
+void pcoa_mat(mat_t* dm, unsigned int n_axes, unsigned int nthreads, ordination_t** result) {
+    unsigned int n = dm->n_samples;
+    n_axes = std::min(n_axes, n);
+
+    *result = (ordination_t*)malloc(sizeof(ordination_t));
+    (*result)->n_samples = n;
+    (*result)->n_axes = n_axes;
+    (*result)->sample_ids = (char**)malloc(sizeof(char*) * n);
+    for(unsigned int i = 0; i < n; i++)
+        (*result)->sample_ids[i] = strdup(dm->sample_ids[i]);
+    (*result)->eigvals = (double*)malloc(sizeof(double) * n_axes);
+    (*result)->proportion_explained = (double*)malloc(sizeof(double) * n_axes);
+    (*result)->coordinates = (double*)malloc(sizeof(double) * n * n_axes);
+
+    su::pcoa(dm->condensed_form, n, n_axes, nthreads, (*result)->eigvals, (*result)->coordinates,
+             (*result)->proportion_explained);
+}
+
+compute_status one_off_pcoa(const char* biom_filename, const char* tree_filename,
+                            const char* unifrac_method, bool variance_adjust, double alpha,
+                            bool bypass_tips, unsigned int nthreads, unsigned int n_axes,
+                            ordination_t** result) {
+    mat_t* dm = NULL;
+    compute_status status = one_off(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha,
+                                    bypass_tips, nthreads, &dm);
+    if(status != okay)
+        return status;
+
+    pcoa_mat(dm, n_axes, nthreads, result);
+    destroy_mat(&dm);
+
+    return okay;
+}
+
+// the groups must each have a sample, and there must be at least two, and
+// fewer than there are samples, for a test to be defined
+static bool valid_grouping(const unsigned int* grouping, unsigned int n_samples, unsigned int n_groups) {
+    if(n_groups < 2 || n_groups >= n_samples)
+        return false;
+
+    std::vector<bool> seen(n_groups, false);
+    for(unsigned int i = 0; i < n_samples; i++) {
+        if(grouping[i] >= n_groups)
+            return false;
+        seen[grouping[i]] = true;
+    }
+    return std::find(seen.begin(), seen.end(), false) == seen.end();
+}
+
+compute_status permanova_mat(mat_t* dm, const unsigned int* grouping, unsigned int n_groups,
+                             unsigned int permutations, uint64_t seed, unsigned int nthreads,
+                             permutation_test_t* result) {
+    if(!valid_grouping(grouping, dm->n_samples, n_groups))
+        return grouping_invalid;
+
+    result->method_name = "PERMANOVA";
+    result->statistic_name = "pseudo-F";
+    result->n_samples = dm->n_samples;
+    result->n_groups = n_groups;
+    result->permutations = permutations;
+    su::permanova(dm->condensed_form, dm->n_samples, grouping, n_groups, permutations, seed, nthreads,
+                  &result->statistic, &result->p_value);
+    return okay;
+}
+
+compute_status permdisp_mat(mat_t* dm, const unsigned int* grouping, unsigned int n_groups,
+                            unsigned int permutations, uint64_t seed, unsigned int nthreads,
+                            permutation_test_t* result) {
+    if(!valid_grouping(grouping, dm->n_samples, n_groups))
+        return grouping_invalid;
+
+    result->method_name = "PERMDISP";
+    result->statistic_name = "F-value";
+    result->n_samples = dm->n_samples;
+    result->n_groups = n_groups;
+    result->permutations = permutations;
+    su::permdisp(dm->condensed_form, dm->n_samples, grouping, n_groups, permutations, seed, nthreads,
+                 &result->statistic, &result->p_value);
+    return okay;
+}
+
 compute_status partial(const char* biom_filename, const char* tree_filename,
                        const char* unifrac_method, bool variance_adjust, double alpha, bool bypass_tips,
                        unsigned int nthreads, unsigned int stripe_start, unsigned int stripe_stop,
                        partial_mat_t** result) {
+    return partial_stats(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha,
+                         bypass_tips, nthreads, stripe_start, stripe_stop, result, NULL);
+}
+
+compute_status partial_stats(const char* biom_filename, const char* tree_filename,
+                             const char* unifrac_method, bool variance_adjust, double alpha, bool bypass_tips,
+                             unsigned int nthreads, unsigned int stripe_start, unsigned int stripe_stop,
+                             partial_mat_t** result, run_stats_t** stats) {
+    return compute_partial(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha,
+                           bypass_tips, nthreads, stripe_start, stripe_stop, NULL, result, stats,
+                           NULL, 0, false);
+}
+
+compute_status partial_subset(const char* biom_filename, const char* tree_filename,
+                              const char* unifrac_method, bool variance_adjust, double alpha, bool bypass_tips,
+                              unsigned int nthreads, unsigned int stripe_start, unsigned int stripe_stop,
+                              const table_subset_t* subset, partial_mat_t** result) {
+    return compute_partial(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha,
+                           bypass_tips, nthreads, stripe_start, stripe_stop, subset, result, NULL,
+                           NULL, 0, false);
+}
+
+compute_status partial_checkpoint(const char* biom_filename, const char* tree_filename,
+                                  const char* unifrac_method, bool variance_adjust, double alpha, bool bypass_tips,
+                                  unsigned int nthreads, unsigned int stripe_start, unsigned int stripe_stop,
+                                  const char* checkpoint_prefix, double checkpoint_interval, bool resume,
+                                  partial_mat_t** result) {
+    return compute_partial(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha,
+                           bypass_tips, nthreads, stripe_start, stripe_stop, NULL, result, NULL,
+                           checkpoint_prefix, checkpoint_interval, resume);
+}
+
+compute_status faith_pd_one_off(const char* biom_filename, const char* tree_filename,
+                                r_vec** result){
+    return faith_pd_one_off_stats(biom_filename, tree_filename, result, NULL);
+}
 
+compute_status faith_pd_one_off_stats(const char* biom_filename, const char* tree_filename,
+                                      r_vec** result, run_stats_t** stats){
+    return faith_pd_subset(biom_filename, tree_filename, NULL, result, stats);
+}
+
+compute_status faith_pd_subset(const char* biom_filename, const char* tree_filename,
+                               const table_subset_t* subset, r_vec** result, run_stats_t** stats){
     CHECK_FILE(biom_filename, table_missing)
     CHECK_FILE(tree_filename, tree_missing)
-    SET_METHOD(unifrac_method, unknown_method)
-    PARSE_SYNC_TREE_TABLE(tree_filename, table_filename)
+    PARSE_SYNC_TREE_TABLE_SUBSET(tree_filename, table_filename, stats, subset)
+
+    initialize_results_vec(*result, table);
+
+    // compute faithpd
+    su::faith_pd(table, tree_sheared, std::ref((*result)->values));
+    phases.stop("compute", sample_ids_bytes(table) + table.n_samples * sizeof(double));
+    phases.finish();
 
+    return okay;
+}
+
+// compute the full matrix of table into result, which is initialized here
+void compute_condensed(biom &table, BPTree &tree_sheared, Method method, bool variance_adjust,
+                       double alpha, bool bypass_tips, unsigned int nthreads, matrix_result result,
+                       PhaseRecorder *phases = NULL, const su::checkpoint_parameters* checkpoint = NULL) {
     // we resize to the largest number of possible stripes even if only computing
     // partial, however we do not allocate arrays for non-computed stripes so
     // there is a little memory waste here but should be on the order of
@@ -245,82 +891,895 @@ compute_status partial(const char* biom_filename, const char* tree_filename,
     std::vector<double*> dm_stripes_total((table.n_samples + 1) / 2);
 
     if(nthreads > dm_stripes.size()) {
-        fprintf(stderr, "More threads were requested than stripes. Using %d threads.\n");
+        fprintf(stderr, "More threads were requested than stripes. Using %zu threads.\n", dm_stripes.size());
         nthreads = dm_stripes.size();
     }
 
     std::vector<su::task_parameters> tasks(nthreads);
-    std::vector<std::thread> threads(nthreads);
 
-    if(((table.n_samples + 1) / 2) < stripe_stop) {
-        fprintf(stderr, "Stopping stripe is out-of-bounds, max %d\n", (table.n_samples + 1) / 2);
-        exit(EXIT_FAILURE);
+    set_tasks(tasks, alpha, table.n_samples, 0, 0, bypass_tips, nthreads);
+    try {
+        su::process_stripes(table, tree_sheared, method, variance_adjust, dm_stripes, dm_stripes_total, tasks,
+                            checkpoint);
+    } catch(const std::bad_alloc &e) {
+        destroy_stripes(dm_stripes, dm_stripes_total, table.n_samples, 0, 0);
+        throw;
+    }
+    remove_checkpoints(checkpoint, tasks);
+    if(phases != NULL) {
+        phases->threads(tasks);
+        phases->stop("compute", stripes_bytes(dm_stripes, dm_stripes_total, table.n_samples));
     }
 
-    set_tasks(tasks, alpha, table.n_samples, stripe_start, stripe_stop, bypass_tips, nthreads);
-    su::process_stripes(table, tree_sheared, method, variance_adjust, dm_stripes, dm_stripes_total, threads, tasks);
+    // each stripe is freed once written, so the stripes and the result are not all held
+    result.initialize(table);
+    su::stripes_to_matrix(dm_stripes, table.n_samples, result.values(), result.square(), 0, dm_stripes.size(),
+                          nthreads, true);
 
-    initialize_partial_mat(*result, table, dm_stripes, stripe_start, stripe_stop, true);  // true -> is_upper_triangle
-    destroy_stripes(dm_stripes, dm_stripes_total, table.n_samples, stripe_start, stripe_stop);
+    destroy_stripes(dm_stripes, dm_stripes_total, table.n_samples, 0, 0);
+    if(phases != NULL)
+        phases->stop("condense", sample_ids_bytes(table) + result.bytes(table.n_samples));
+}
+
+// write the rows [tid, tid + nthreads, ...) of the condensed or square form of n
+// samples from the condensed form of the m distinct columns of profile, and the
+// distances of the columns to themselves
+void expand_rows(const double* unique_cf, const std::vector<uint64_t> &unique_rows,
+                 const std::vector<double> &self, const std::vector<uint32_t> &profile,
+                 double* out, bool square, unsigned int tid, unsigned int nthreads) {
+    uint32_t n = profile.size();
+    for(uint32_t i = tid; i < n; i += nthreads) {
+        // the pair (i, j) is at row + j, as is the pair (a, b) at unique_rows[a] + b
+        double* row = out + (square ? (uint64_t)i * n : (uint64_t)i * n - (uint64_t)i * (i + 1) / 2 - i - 1);
+        uint32_t a = profile[i];
+        if(square)
+            row[i] = 0.0;
+        for(uint32_t j = square ? 0 : i + 1; j < n; j++) {
+            uint32_t b = profile[j];
+            if(j == i)
+                continue;
+            else if(a == b)
+                row[j] = self[a];
+            else if(a < b)
+                row[j] = unique_cf[unique_rows[a] + b];
+            else
+                row[j] = unique_cf[unique_rows[b] + a];
+        }
+    }
+}
+
+// the distance of each of columns of table to itself, from the first stripe
+// of a table of each column followed by a copy of it. this is zero, unless
+// the method is not defined for the column
+void self_distances(biom &table, BPTree &tree_sheared, Method method, bool variance_adjust, double alpha,
+                    bool bypass_tips, const std::vector<uint32_t> &columns, std::vector<double> &distances) {
+    std::vector<uint32_t> paired_columns;
+    for(auto column : columns) {
+        paired_columns.push_back(column);
+        paired_columns.push_back(column);
+    }
+    su::biom paired(table, paired_columns);
+
+    std::vector<double*> dm_stripes((paired.n_samples + 1) / 2, NULL);
+    std::vector<double*> dm_stripes_total((paired.n_samples + 1) / 2, NULL);
+    std::vector<su::task_parameters> tasks(1);
+    set_tasks(tasks, alpha, paired.n_samples, 0, 1, bypass_tips, 1);
+    try {
+        su::process_stripes(paired, tree_sheared, method, variance_adjust, dm_stripes, dm_stripes_total, tasks);
+    } catch(const std::bad_alloc &e) {
+        destroy_stripes(dm_stripes, dm_stripes_total, paired.n_samples, 0, 0);
+        throw;
+    }
+
+    // the first stripe pairs each sample with the next
+    distances.resize(columns.size());
+    for(unsigned int i = 0; i < columns.size(); i++)
+        distances[i] = dm_stripes[0][2 * i];
+    free(dm_stripes[0]);
+    destroy_stripes(dm_stripes, dm_stripes_total, paired.n_samples, 0, 1);
+}
+
+// compute the condensed form of table by computing that of its distinct
+// columns, and copying the distances of the samples which repeat a column
+compute_status compute_deduplicated(biom &table, BPTree &tree_sheared, Method method, bool variance_adjust,
+                                    double alpha, bool bypass_tips, unsigned int nthreads, matrix_result result,
+                                    PhaseRecorder *phases,
+                                    std::function<compute_status(biom&, uint64_t, matrix_result)> compute) {
+    std::vector<uint32_t> unique;
+    std::vector<uint32_t> profile;
+    table.unique_samples(unique, profile);
+    if(unique.size() == table.n_samples)
+        return compute(table, 0, result);
+
+    // a single distinct column has no distances to the others
+    mat_t* unique_result = NULL;
+    uint32_t m = unique.size();
+    if(m > 1) {
+        su::biom unique_table(table, unique);
+        compute_status status = compute(unique_table, table.memory_bytes() + result.bytes(table.n_samples),
+                                        matrix_result(&unique_result));
+        if(status != okay)
+            return status;
+    }
 
+    std::vector<uint32_t> repeats(m, 0);
+    for(auto u : profile)
+        repeats[u]++;
+    std::vector<uint32_t> repeated;
+    std::vector<uint32_t> repeated_columns;
+    for(uint32_t u = 0; u < m; u++) {
+        if(repeats[u] > 1) {
+            repeated.push_back(u);
+            repeated_columns.push_back(unique[u]);
+        }
+    }
+    std::vector<double> repeated_self;
+    try {
+        self_distances(table, tree_sheared, method, variance_adjust, alpha, bypass_tips, repeated_columns,
+                       repeated_self);
+    } catch(const std::bad_alloc &e) {
+        if(unique_result != NULL)
+            destroy_mat(&unique_result);
+        throw;
+    }
+    std::vector<double> self(m, 0.0);
+    for(unsigned int i = 0; i < repeated.size(); i++)
+        self[repeated[i]] = repeated_self[i];
+
+    std::vector<uint64_t> unique_rows(m);
+    for(uint32_t a = 0; a < m; a++)
+        unique_rows[a] = (uint64_t)a * m - (uint64_t)a * (a + 1) / 2 - a - 1;
+
+    result.initialize(table);
+    nthreads = std::max(1U, std::min(nthreads, table.n_samples));
+    const double* unique_cf = unique_result != NULL ? unique_result->condensed_form : NULL;
+    su::run_tasks(nthreads, [&](unsigned int tid) {
+        expand_rows(unique_cf, unique_rows, self, profile, result.values(), result.square(), tid, nthreads);
+    });
+    if(unique_result != NULL)
+        destroy_mat(&unique_result);
+
+    if(phases != NULL) {
+        phases->duplicates(table.n_samples - m);
+        phases->stop("expand", sample_ids_bytes(table) + result.bytes(table.n_samples));
+    }
     return okay;
 }
 
-compute_status faith_pd_one_off(const char* biom_filename, const char* tree_filename,
-                                r_vec** result){
+compute_status one_off(const char* biom_filename, const char* tree_filename,
+                       const char* unifrac_method, bool variance_adjust, double alpha,
+                       bool bypass_tips, unsigned int nthreads, mat_t** result) {
+    return one_off_stats(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha,
+                         bypass_tips, nthreads, result, NULL);
+}
+
+compute_status one_off_stats(const char* biom_filename, const char* tree_filename,
+                             const char* unifrac_method, bool variance_adjust, double alpha,
+                             bool bypass_tips, unsigned int nthreads, mat_t** result,
+                             run_stats_t** stats) {
+    return one_off_subset(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha,
+                          bypass_tips, nthreads, 0, NULL, result, stats);
+}
+
+// compute the condensed form, periodically checkpointing the stripes computed
+compute_status one_off_checkpoint(const char* biom_filename, const char* tree_filename,
+                                  const char* unifrac_method, bool variance_adjust, double alpha,
+                                  bool bypass_tips, unsigned int nthreads, const char* checkpoint_prefix,
+                                  double checkpoint_interval, bool resume, mat_t** result) {
+    if(checkpoint_prefix == NULL)
+        return one_off(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha,
+                       bypass_tips, nthreads, result);
+
     CHECK_FILE(biom_filename, table_missing)
     CHECK_FILE(tree_filename, tree_missing)
+    SET_METHOD(unifrac_method, unknown_method)
     PARSE_SYNC_TREE_TABLE(tree_filename, table_filename)
 
-    initialize_results_vec(*result, table);
+    std::unique_ptr<su::checkpoint_parameters> checkpoint =
+        make_checkpoint(checkpoint_prefix, checkpoint_interval, resume,
+                        checkpoint_fingerprint(biom_filename, content, method, variance_adjust,
+                                               alpha, bypass_tips));
+    try {
+        return compute_deduplicated(table, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                                    matrix_result(result), NULL,
+                                    [&](biom &unique, uint64_t, matrix_result unique_result) {
+            compute_condensed(unique, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                              unique_result, NULL, checkpoint.get());
+            return okay;
+        });
+    } catch(const std::bad_alloc &e) {
+        return memory_limit_exceeded;
+    }
+}
 
-    // compute faithpd
-    su::faith_pd(table, tree_sheared, std::ref((*result)->values));
+// compute the condensed form in rounds of stripes which fit in max_memory
+compute_status compute_condensed_rounds(biom &table, BPTree &tree, BPTree &tree_sheared, Method method,
+                                        bool variance_adjust, double alpha, bool bypass_tips,
+                                        unsigned int nthreads, uint64_t max_memory, uint64_t held,
+                                        matrix_result result, PhaseRecorder &phases) {
+    unsigned int n_stripes = (table.n_samples + 1) / 2;
+    bool need_total = needs_stripe_totals(method, variance_adjust);
+    uint64_t per_stripe = (uint64_t)table.n_samples * sizeof(double) * (need_total ? 2 : 1);
+    uint64_t per_thread = thread_working_bytes(PropStack::max_live(tree_sheared), table.n_samples,
+                                               variance_adjust);
+    uint64_t fixed = table.memory_bytes() + tree.memory_bytes() + tree_sheared.memory_bytes() +
+                     sample_ids_bytes(table) + result.bytes(table.n_samples) + held;
+
+    // each thread needs its working memory and at least a stripe per round
+    if(max_memory < fixed + per_thread + per_stripe)
+        return memory_limit_exceeded;
+    uint64_t available = max_memory - fixed;
+    nthreads = std::min(std::max(nthreads, 1U), n_stripes);
+    while(nthreads > 1 && nthreads * (per_thread + per_stripe) > available)
+        nthreads--;
+    unsigned int round = std::min((uint64_t)n_stripes, (available - nthreads * per_thread) / per_stripe);
+
+    std::vector<double*> buffers(round, NULL);
+    std::vector<double*> buffers_total(need_total ? round : 0, NULL);
+    bool allocated = true;
+    for(unsigned int i = 0; i < round && allocated; i++) {
+        allocated = posix_memalign((void **)&buffers[i], 32, sizeof(double) * table.n_samples) == 0;
+        if(allocated && need_total)
+            allocated = posix_memalign((void **)&buffers_total[i], 32, sizeof(double) * table.n_samples) == 0;
+    }
+    if(!allocated) {
+        for(auto &buffer : buffers)
+            free(buffer);
+        for(auto &buffer : buffers_total)
+            free(buffer);
+        return memory_limit_exceeded;
+    }
+
+    result.initialize(table);
+
+    std::vector<double*> dm_stripes(n_stripes, NULL);
+    std::vector<double*> dm_stripes_total(n_stripes, NULL);
+    std::vector<su::task_parameters> tasks(nthreads);
+    std::vector<double> thread_cpu(nthreads, 0.0);
+
+    for(unsigned int start = 0; start < n_stripes; start += round) {
+        unsigned int stop = std::min(start + round, n_stripes);
+        unsigned int round_threads = std::min(nthreads, stop - start);
+        tasks.resize(round_threads);
+
+        // lend the buffers to this round's stripes
+        for(unsigned int i = start; i < stop; i++) {
+            dm_stripes[i] = buffers[i - start];
+            if(need_total)
+                dm_stripes_total[i] = buffers_total[i - start];
+        }
+
+        set_tasks(tasks, alpha, table.n_samples, start, stop, bypass_tips, round_threads);
+        try {
+            su::process_stripes(table, tree_sheared, method, variance_adjust, dm_stripes, dm_stripes_total,
+                                tasks);
+        } catch(const std::bad_alloc &e) {
+            // the working memory of the threads did not fit after all
+            for(auto &buffer : buffers)
+                free(buffer);
+            for(auto &buffer : buffers_total)
+                free(buffer);
+            result.destroy();
+            return memory_limit_exceeded;
+        }
+        for(unsigned int tid = 0; tid < round_threads; tid++)
+            thread_cpu[tid] += tasks[tid].cpu_seconds;
+        // the buffers are kept for the next round
+        su::stripes_to_matrix(dm_stripes, table.n_samples, result.values(), result.square(), start, stop,
+                              round_threads, false);
+
+        for(unsigned int i = start; i < stop; i++) {
+            dm_stripes[i] = NULL;
+            dm_stripes_total[i] = NULL;
+        }
+    }
+
+    for(auto &buffer : buffers)
+        free(buffer);
+    for(auto &buffer : buffers_total)
+        free(buffer);
+
+    tasks.resize(nthreads);
+    for(unsigned int tid = 0; tid < nthreads; tid++)
+        tasks[tid].cpu_seconds = thread_cpu[tid];
+    phases.threads(tasks);
+    phases.stop("compute", round * per_stripe + sample_ids_bytes(table) + result.bytes(table.n_samples));
 
     return okay;
 }
 
-compute_status one_off(const char* biom_filename, const char* tree_filename,
-                       const char* unifrac_method, bool variance_adjust, double alpha,
-                       bool bypass_tips, unsigned int nthreads, mat_t** result) {
+compute_status one_off_budgeted(const char* biom_filename, const char* tree_filename,
+                                const char* unifrac_method, bool variance_adjust, double alpha,
+                                bool bypass_tips, unsigned int nthreads, uint64_t max_memory,
+                                mat_t** result, run_stats_t** stats) {
+    return one_off_subset(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha,
+                          bypass_tips, nthreads, max_memory, NULL, result, stats);
+}
+
+// compute the matrix of a loaded table, in rounds if max_memory is not 0
+compute_status compute_one_off(biom &table, BPTree &tree, BPTree &tree_sheared, Method method,
+                               bool variance_adjust, double alpha, bool bypass_tips, unsigned int nthreads,
+                               uint64_t max_memory, matrix_result result, PhaseRecorder &phases) {
+    compute_status status;
+    try {
+        status = compute_deduplicated(table, tree_sheared, method, variance_adjust, alpha,
+                                      bypass_tips, nthreads, result, &phases,
+                                      [&](biom &unique, uint64_t held, matrix_result unique_result) {
+            if(max_memory == 0) {
+                compute_condensed(unique, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                                  unique_result, &phases);
+                return okay;
+            }
+            return compute_condensed_rounds(unique, tree, tree_sheared, method, variance_adjust, alpha,
+                                            bypass_tips, nthreads, max_memory, held, unique_result, phases);
+        });
+    } catch(const std::bad_alloc &e) {
+        return memory_limit_exceeded;
+    }
+    if(status == okay)
+        phases.finish();
+    return status;
+}
+
+compute_status one_off_into(const char* biom_filename, const char* tree_filename,
+                            const char* unifrac_method, bool variance_adjust, double alpha,
+                            bool bypass_tips, unsigned int nthreads, uint64_t max_memory,
+                            const table_subset_t* subset, matrix_result result, run_stats_t** stats) {
+    CHECK_FILE(biom_filename, table_missing)
+    CHECK_FILE(tree_filename, tree_missing)
+    SET_METHOD(unifrac_method, unknown_method)
+    PARSE_SYNC_TREE_TABLE_SUBSET(tree_filename, table_filename, stats, subset)
+
+    return compute_one_off(table, tree, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                           max_memory, result, phases);
+}
+
+compute_status one_off_subset(const char* biom_filename, const char* tree_filename,
+                              const char* unifrac_method, bool variance_adjust, double alpha,
+                              bool bypass_tips, unsigned int nthreads, uint64_t max_memory,
+                              const table_subset_t* subset, mat_t** result, run_stats_t** stats) {
+    return one_off_into(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha, bypass_tips,
+                        nthreads, max_memory, subset, matrix_result(result), stats);
+}
+
+compute_status one_off_matrix(const char* biom_filename, const char* tree_filename,
+                              const char* unifrac_method, bool variance_adjust, double alpha,
+                              bool bypass_tips, unsigned int nthreads, uint64_t max_memory,
+                              const table_subset_t* subset, mat_full_t** result, run_stats_t** stats) {
+    return one_off_into(biom_filename, tree_filename, unifrac_method, variance_adjust, alpha, bypass_tips,
+                        nthreads, max_memory, subset, matrix_result(result), stats);
+}
+
+compute_status load_tree(const char* tree_filename, loaded_tree_t** result) {
+    CHECK_FILE(tree_filename, tree_missing)
+    PARSE_TREE(tree_filename, NULL)
+
+    // indexed and fingerprinted now, so that the calls which share the tree
+    // only read it, and shear it in time proportional to their tables
+    tree.index_tips();
+    tree.fingerprint();
+
+    *result = (loaded_tree_t*)malloc(sizeof(loaded_tree_t));
+    (*result)->n_nodes = tree.nparens / 2;
+    (*result)->state = tree_ptr.release();
+    return okay;
+}
+
+void destroy_loaded_tree(loaded_tree_t** tree) {
+    if(*tree == NULL)
+        return;
+    delete (su::BPTree*)(*tree)->state;
+    free(*tree);
+    *tree = NULL;
+}
+
+compute_status one_off_loaded(const char* biom_filename, loaded_tree_t* loaded,
+                              const char* unifrac_method, bool variance_adjust, double alpha,
+                              bool bypass_tips, unsigned int nthreads, uint64_t max_memory,
+                              mat_t** result, run_stats_t** stats) {
+    CHECK_FILE(biom_filename, table_missing)
+    SET_METHOD(unifrac_method, unknown_method)
+    PhaseRecorder phases(stats);
+    su::BPTree &tree = *(su::BPTree*)loaded->state;
+    SYNC_TABLE_SUBSET(table_filename, NULL, &sheared_trees)
+
+    return compute_one_off(table, tree, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                           max_memory, matrix_result(result), phases);
+}
+
+// the names and descriptions of the compute statuses, in the order of ComputeStatus
+static const char* compute_status_names[][2] = {
+    {"okay", "No error."},
+    {"tree_missing", "The tree file cannot be found."},
+    {"table_missing", "The table file cannot be found."},
+    {"table_empty", "The table file contains an empty table."},
+    {"unknown_method", "An unknown method was requested."},
+    {"table_and_tree_do_not_overlap", "Table observation IDs are not a subset of the tree tips. This error can also be triggered if a node name contains a single quote (this is unlikely)."},
+    {"table_bad_format_version", "The table does not appear to be a BIOM-Format v2.1 file."},
+    {"tree_malformed", "The tree does not appear to be newick."},
+    {"sample_missing", "A requested sample ID is not in the table."},
+    {"existing_result_mismatch", "The existing result does not agree with the table and parameters."},
+    {"memory_limit_exceeded", "The memory limit is too small to compute a single stripe."},
+    {"stripes_out_of_bounds", "The requested stripes are out of bounds."},
+    {"grouping_invalid", "The grouping must have at least two groups, and not a group for each sample."}
+};
+
+const char* compute_status_name(ComputeStatus status) {
+    if((unsigned int)status >= sizeof(compute_status_names) / sizeof(compute_status_names[0]))
+        return "unknown_status";
+    return compute_status_names[status][0];
+}
+
+const char* compute_status_message(ComputeStatus status) {
+    if((unsigned int)status >= sizeof(compute_status_names) / sizeof(compute_status_names[0]))
+        return "An unknown error occurred.";
+    return compute_status_names[status][1];
+}
+
+static su::Fields serve_error(const std::string &error, const std::string &message) {
+    su::Fields response;
+    response["status"] = "error";
+    response["error"] = error;
+    response["message"] = message;
+    return response;
+}
+
+// the compute of a request of serve
+static su::Fields serve_compute(std::unordered_map<std::string, loaded_tree_t*> &trees,
+                                const su::Fields &request, unsigned int nthreads) {
+    for(const char* required : {"tree", "table", "output"}) {
+        if(request.count(required) == 0)
+            return serve_error("bad_request", std::string("the request has no ") + required);
+    }
+    auto loaded = trees.find(request.at("tree"));
+    if(loaded == trees.end())
+        return serve_error("unknown_tree", "the tree " + request.at("tree") + " is not loaded");
+
+    auto option = [&request](const char* name, const char* missing) -> std::string {
+        auto field = request.find(name);
+        return field == request.end() ? missing : field->second;
+    };
+    std::string method = option("method", "unweighted");
+    bool variance_adjust = option("variance_adjusted", "0") == "1";
+    bool bypass_tips = option("bypass_tips", "0") == "1";
+    char* end;
+    std::string alpha_arg = option("alpha", "1");
+    double alpha = strtod(alpha_arg.c_str(), &end);
+    if(alpha_arg.empty() || *end != '\0')
+        return serve_error("bad_request", "alpha must be a number");
+    std::string max_memory_arg = option("max_memory", "0");
+    uint64_t max_memory = strtoull(max_memory_arg.c_str(), &end, 10);
+    if(max_memory_arg.empty() || *end != '\0')
+        return serve_error("bad_request", "max_memory must be a number of bytes");
+
+    mat_t* result = NULL;
+    compute_status status = one_off_loaded(request.at("table").c_str(), loaded->second, method.c_str(),
+                                           variance_adjust, alpha, bypass_tips, nthreads, max_memory,
+                                           &result, NULL);
+    if(status != okay)
+        return serve_error(compute_status_name(status), compute_status_message(status));
+
+    su::Fields response;
+    IOStatus written = write_mat(request.at("output").c_str(), result);
+    if(written == write_okay) {
+        response["status"] = "okay";
+        response["n_samples"] = std::to_string(result->n_samples);
+    } else {
+        response = serve_error("open_error", "The output file cannot be written.");
+    }
+    destroy_mat(&result);
+    return response;
+}
+
+int serve(const char* socket_path, const char** tree_names, loaded_tree_t** trees,
+          unsigned int n_trees, unsigned int nthreads) {
+    std::unordered_map<std::string, loaded_tree_t*> by_name;
+    std::string names;
+    for(unsigned int i = 0; i < n_trees; i++) {
+        by_name[tree_names[i]] = trees[i];
+        names += (i == 0 ? "" : ",") + std::string(tree_names[i]);
+    }
+    su::Fields description;
+    description["trees"] = names;
+
+    int err = su::serve(socket_path, nthreads,
+                        [&by_name](const su::Fields &request, unsigned int threads) {
+                            return serve_compute(by_name, request, threads);
+                        }, description);
+    return err == 0 ? 0 : errno;
+}
+
+compute_status one_off_rarefied(const char* biom_filename, const char* tree_filename,
+                                const char* unifrac_method, bool variance_adjust, double alpha,
+                                bool bypass_tips, unsigned int nthreads, unsigned int depth,
+                                unsigned int iterations, uint64_t seed, mat_t** mean,
+                                mat_t** variance, mat_t** replicates) {
 
     CHECK_FILE(biom_filename, table_missing)
     CHECK_FILE(tree_filename, tree_missing)
     SET_METHOD(unifrac_method, unknown_method)
     PARSE_SYNC_TREE_TABLE(tree_filename, table_filename)
 
-    // we resize to the largest number of possible stripes even if only computing
-    // partial, however we do not allocate arrays for non-computed stripes so
-    // there is a little memory waste here but should be on the order of
-    // 8 bytes * N samples per vector.
-    std::vector<double*> dm_stripes((table.n_samples + 1) / 2);
-    std::vector<double*> dm_stripes_total((table.n_samples + 1) / 2);
+    if(depth == 0 || iterations == 0)
+        return table_empty;
+
+    // the retained samples depend only on the depth, so are shared by the
+    // replicates. the mean and variance are accumulated with Welford's method.
+    double *m2 = NULL;
+    for(unsigned int r = 0; r < iterations; r++) {
+        su::biom rarefied(table, depth, seed + r);
+        if(rarefied.n_samples < 2) {
+            // only possible on the first replicate
+            return table_empty;
+        }
 
-    if(nthreads > dm_stripes.size()) {
-        fprintf(stderr, "More threads were requested than stripes. Using %d threads.\n");
-        nthreads = dm_stripes.size();
+        mat_t *replicate = NULL;
+        compute_condensed(rarefied, tree_sheared, method, variance_adjust, alpha, bypass_tips,
+                          nthreads, &replicate);
+
+        if(r == 0) {
+            initialize_mat(*mean, rarefied, true);
+            initialize_mat(*variance, rarefied, true);
+            m2 = (*variance)->condensed_form;
+            for(unsigned int i = 0; i < replicate->cf_size; i++) {
+                (*mean)->condensed_form[i] = 0.0;
+                m2[i] = 0.0;
+            }
+        }
+
+        double *mu = (*mean)->condensed_form;
+        double *x = replicate->condensed_form;
+        for(unsigned int i = 0; i < replicate->cf_size; i++) {
+            double delta = x[i] - mu[i];
+            mu[i] += delta / (r + 1);
+            m2[i] += delta * (x[i] - mu[i]);
+        }
+
+        if(replicates != NULL)
+            replicates[r] = replicate;
+        else
+            destroy_mat(&replicate);
+    }
+
+    // the sample variance
+    for(unsigned int i = 0; i < (*variance)->cf_size; i++)
+        m2[i] = iterations > 1 ? m2[i] / (iterations - 1) : 0.0;
+
+    return okay;
+}
+
+// the table indices of ids, false if an ID is not in the table
+bool lookup_samples(std::unordered_map<std::string, uint32_t> &sample_index,
+                    const char** ids, unsigned int n, std::vector<uint32_t> &indices) {
+    indices.resize(n);
+    for(unsigned int i = 0; i < n; i++) {
+        auto hit = sample_index.find(ids[i]);
+        if(hit == sample_index.end())
+            return false;
+        indices[i] = hit->second;
+    }
+    return true;
+}
+
+std::unordered_map<std::string, uint32_t> index_samples(biom &table) {
+    std::unordered_map<std::string, uint32_t> sample_index;
+    for(unsigned int i = 0; i < table.n_samples; i++)
+        sample_index[table.sample_ids[i]] = i;
+    return sample_index;
+}
+
+// compute the rows by cols block into dm, partitioning the rows over the threads
+void compute_cross(biom &table, BPTree &tree_sheared, Method method, bool variance_adjust,
+                   double alpha, bool bypass_tips, unsigned int nthreads,
+                   std::vector<uint32_t> &rows, std::vector<uint32_t> &cols, double* dm) {
+    if(rows.size() == 0 || cols.size() == 0)
+        return;
+
+    if(nthreads > rows.size()) {
+        fprintf(stderr, "More threads were requested than rows. Using %zu threads.\n", rows.size());
+        nthreads = rows.size();
     }
 
     std::vector<su::task_parameters> tasks(nthreads);
-    std::vector<std::thread> threads(nthreads);
 
-    set_tasks(tasks, alpha, table.n_samples, 0, 0, bypass_tips, nthreads);
-    su::process_stripes(table, tree_sheared, method, variance_adjust, dm_stripes, dm_stripes_total, threads, tasks);
+    set_tasks(tasks, alpha, table.n_samples, 0, rows.size(), bypass_tips, nthreads);
+    su::process_cross(table, tree_sheared, method, variance_adjust, rows, cols, dm, tasks);
+}
+
+compute_status one_off_cross(const char* biom_filename, const char* tree_filename,
+                             const char* unifrac_method, bool variance_adjust, double alpha,
+                             bool bypass_tips, unsigned int nthreads,
+                             const char** row_ids, unsigned int n_rows,
+                             const char** col_ids, unsigned int n_cols,
+                             rect_mat_t** result) {
+
+    CHECK_FILE(biom_filename, table_missing)
+    CHECK_FILE(tree_filename, tree_missing)
+    SET_METHOD(unifrac_method, unknown_method)
+    PARSE_SYNC_TREE_TABLE(tree_filename, table_filename)
+
+    std::unordered_map<std::string, uint32_t> sample_index = index_samples(table);
+    std::vector<uint32_t> rows;
+    std::vector<uint32_t> cols;
+    if(!lookup_samples(sample_index, row_ids, n_rows, rows) ||
+       !lookup_samples(sample_index, col_ids, n_cols, cols))
+        return sample_missing;
+
+    initialize_rect_mat(*result, row_ids, n_rows, col_ids, n_cols);
+    compute_cross(table, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                  rows, cols, (*result)->values);
+
+    return okay;
+}
+
+compute_status append_samples(const char* biom_filename, const char* tree_filename,
+                              const char* unifrac_method, bool variance_adjust, double alpha,
+                              bool bypass_tips, unsigned int nthreads, mat_t* existing,
+                              mat_t** result) {
+
+    CHECK_FILE(biom_filename, table_missing)
+    CHECK_FILE(tree_filename, tree_missing)
+    SET_METHOD(unifrac_method, unknown_method)
+    PARSE_SYNC_TREE_TABLE(tree_filename, table_filename)
 
-    initialize_mat(*result, table, true);  // true -> is_upper_triangle
-    for(unsigned int tid = 0; tid < threads.size(); tid++) {
-        threads[tid] = std::thread(su::stripes_to_condensed_form,
-                                   std::ref(dm_stripes),
-                                   table.n_samples,
-                                   std::ref((*result)->condensed_form),
-                                   tasks[tid].start,
-                                   tasks[tid].stop);
+    std::unordered_map<std::string, uint32_t> sample_index = index_samples(table);
+    std::vector<uint32_t> cols;
+    if(!lookup_samples(sample_index, (const char**)existing->sample_ids, existing->n_samples, cols))
+        return sample_missing;
+
+    // the existing samples retain their order, and the new samples follow
+    // in the order of the table
+    unsigned int n_old = existing->n_samples;
+    std::vector<bool> is_old(table.n_samples, false);
+    for(auto i : cols)
+        is_old[i] = true;
+    std::vector<uint32_t> rows;
+    for(unsigned int i = 0; i < table.n_samples; i++)
+        if(!is_old[i])
+            cols.push_back(i);
+    rows.assign(cols.begin() + n_old, cols.end());
+    unsigned int n_new = rows.size();
+    unsigned int n_total = cols.size();
+
+    // a few existing samples are computed against the other existing
+    // samples to verify that the existing result is consistent with the
+    // table, tree and parameters
+    std::vector<uint32_t> verify;
+    unsigned int n_verify = std::min(n_old, (unsigned int)APPEND_VERIFY_SAMPLES);
+    for(unsigned int i = 0; i < n_verify; i++)
+        verify.push_back((uint64_t)i * n_old / n_verify);
+    for(auto v : verify)
+        rows.push_back(cols[v]);
+
+    std::vector<double> block((uint64_t)rows.size() * n_total);
+    compute_cross(table, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                  rows, cols, block.data());
+
+    uint64_t comb_N_old = su::comb_2(n_old);
+    for(unsigned int v = 0; v < n_verify; v++) {
+        unsigned int i = verify[v];
+        double *row = &block[(uint64_t)(n_new + v) * n_total];
+        for(unsigned int j = 0; j < n_old; j++) {
+            if(i == j)
+                continue;
+            uint64_t lo = std::min(i, j);
+            uint64_t hi = std::max(i, j);
+            double exp = existing->condensed_form[comb_N_old - su::comb_2(n_old - lo) + (hi - lo - 1)];
+            double obs = row[j];
+            if(std::isnan(exp) && std::isnan(obs))
+                continue;
+            if(!(fabs(exp - obs) <= APPEND_TOLERANCE * std::max(1.0, fabs(exp))))
+                return existing_result_mismatch;
+        }
     }
-    for(unsigned int tid = 0; tid < threads.size(); tid++) {
-        threads[tid].join();
+
+    char** ids = (char**)malloc(sizeof(char*) * n_total);
+    for(unsigned int i = 0; i < n_old; i++)
+        ids[i] = existing->sample_ids[i];
+    for(unsigned int i = n_old; i < n_total; i++)
+        ids[i] = (char*)table.sample_ids[cols[i]].c_str();
+    initialize_mat_no_biom(*result, ids, n_total, true);
+    free(ids);
+
+    // the existing pairs are in the same relative order, and the new
+    // samples fill in the remaining rows of each upper triangle row
+    double *cf = (*result)->condensed_form;
+    uint64_t comb_N = su::comb_2(n_total);
+    for(unsigned int i = 0; i < n_total; i++) {
+        uint64_t offset = comb_N - su::comb_2(n_total - i);
+        for(unsigned int j = i + 1; j < n_total; j++) {
+            double v;
+            if(j < n_old)
+                v = existing->condensed_form[comb_N_old - su::comb_2(n_old - i) + (j - i - 1)];
+            else
+                v = block[(uint64_t)(j - n_old) * n_total + i];
+            cf[offset + (j - i - 1)] = v;
+        }
     }
 
-    destroy_stripes(dm_stripes, dm_stripes_total, table.n_samples, 0, 0);
+    return okay;
+}
+
+struct knn_candidate {
+    double distance;
+    uint32_t index;
+};
+
+// orders by distance with NaN last, and then by index
+inline bool knn_less(const knn_candidate &a, const knn_candidate &b) {
+    if(std::isnan(a.distance) || std::isnan(b.distance)) {
+        if(std::isnan(a.distance) != std::isnan(b.distance))
+            return std::isnan(b.distance);
+    } else if(a.distance != b.distance) {
+        return a.distance < b.distance;
+    }
+    return a.index < b.index;
+}
+
+struct knn_farthest_first {
+    bool operator()(const knn_candidate &a, const knn_candidate &b) const {
+        return knn_less(a, b);
+    }
+};
+
+// a bounded heap, where the top is the farthest of the k nearest so far
+typedef std::priority_queue<knn_candidate, std::vector<knn_candidate>, knn_farthest_first> knn_heap;
+
+inline void knn_push(knn_heap &heap, unsigned int k, knn_candidate c) {
+    if(heap.size() < k) {
+        heap.push(c);
+    } else if(knn_less(c, heap.top())) {
+        heap.pop();
+        heap.push(c);
+    }
+}
+
+// a lower bound on the distance between samples with totals a and b, see su::sample_totals
+inline double knn_lower_bound(Method method, double a, double b) {
+    double lo = std::min(a, b);
+    double hi = std::max(a, b);
+    switch(method) {
+        case unweighted:
+            // the shared branch length is at most lo, and the union at least hi
+            return hi > 0 ? 1.0 - lo / hi : 0.0;
+        case weighted_normalized:
+            return hi > 0 ? (hi - lo) / (hi + lo) : 0.0;
+        case weighted_unnormalized:
+            return hi - lo;
+        default:
+            return 0.0;
+    }
+}
+
+// compute rows against cols, and offer the results to the heaps of the rows
+void knn_evaluate(biom &table, BPTree &tree_sheared, Method method, bool variance_adjust,
+                  double alpha, bool bypass_tips, unsigned int nthreads,
+                  std::vector<uint32_t> &rows, std::vector<uint32_t> &cols,
+                  std::vector<knn_heap> &heaps, unsigned int k, uint64_t &n_evaluated) {
+    if(cols.size() == 0)
+        return;
+
+    std::vector<double> block((uint64_t)rows.size() * cols.size());
+    compute_cross(table, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                  rows, cols, block.data());
+
+    for(unsigned int i = 0; i < rows.size(); i++) {
+        double *row = &block[(uint64_t)i * cols.size()];
+        for(unsigned int j = 0; j < cols.size(); j++) {
+            if(cols[j] == rows[i])
+                continue;
+            knn_push(heaps[i], k, {row[j], cols[j]});
+            n_evaluated++;
+        }
+    }
+}
+
+compute_status knn_query(const char* biom_filename, const char* tree_filename,
+                         const char* unifrac_method, bool variance_adjust, double alpha,
+                         bool bypass_tips, unsigned int nthreads,
+                         const char** query_ids, unsigned int n_queries,
+                         unsigned int k, bool prune, knn_result_t** result) {
+
+    CHECK_FILE(biom_filename, table_missing)
+    CHECK_FILE(tree_filename, tree_missing)
+    SET_METHOD(unifrac_method, unknown_method)
+    PARSE_SYNC_TREE_TABLE(tree_filename, table_filename)
+
+    std::unordered_map<std::string, uint32_t> sample_index = index_samples(table);
+    std::vector<uint32_t> queries;
+    if(!lookup_samples(sample_index, query_ids, n_queries, queries))
+        return sample_missing;
+
+    unsigned int n_samples = table.n_samples;
+    k = std::min(k, n_samples - 1);
+
+    knn_result_t *res = (knn_result_t*)malloc(sizeof(knn_result));
+    res->n_queries = n_queries;
+    res->k = k;
+    res->n_samples = n_samples;
+    res->n_evaluated = 0;
+    res->indices = (uint32_t*)malloc(sizeof(uint32_t) * n_queries * k);
+    res->distances = (double*)malloc(sizeof(double) * n_queries * k);
+    res->query_ids = (char**)malloc(sizeof(char*) * n_queries);
+    res->sample_ids = (char**)malloc(sizeof(char*) * n_samples);
+    for(unsigned int i = 0; i < n_queries; i++)
+        res->query_ids[i] = strdup(query_ids[i]);
+    for(unsigned int i = 0; i < n_samples; i++)
+        res->sample_ids[i] = strdup(table.sample_ids[i].c_str());
+    *result = res;
+
+    if(k == 0 || n_queries == 0)
+        return okay;
+
+    prune = prune && !variance_adjust && method != generalized;
+    std::vector<double> totals;
+    if(prune) {
+        totals.resize(n_samples);
+        su::sample_totals(table, tree_sheared, method == unweighted, bypass_tips, totals.data());
+    }
+
+    std::vector<uint32_t> all_samples(n_samples);
+    for(unsigned int i = 0; i < n_samples; i++)
+        all_samples[i] = i;
+
+    unsigned int batch_size = std::max(1u, (unsigned int)(KNN_BLOCK_CELLS / n_samples));
+    for(unsigned int batch_start = 0; batch_start < n_queries; batch_start += batch_size) {
+        unsigned int batch_stop = std::min(n_queries, batch_start + batch_size);
+        std::vector<uint32_t> rows(queries.begin() + batch_start, queries.begin() + batch_stop);
+        std::vector<knn_heap> heaps(rows.size());
+
+        if(!prune) {
+            knn_evaluate(table, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                         rows, all_samples, heaps, k, res->n_evaluated);
+        } else {
+            // first, the samples with the smallest bounds for each query,
+            // which bound the distance of the kth neighbour
+            std::vector<bool> evaluated(n_samples, false);
+            std::vector<knn_candidate> bounds(n_samples - 1);
+            for(unsigned int i = 0; i < rows.size(); i++) {
+                unsigned int n = 0;
+                for(unsigned int j = 0; j < n_samples; j++)
+                    if(j != rows[i])
+                        bounds[n++] = {knn_lower_bound(method, totals[rows[i]], totals[j]), j};
+                std::nth_element(bounds.begin(), bounds.begin() + (k - 1), bounds.end(), knn_less);
+                for(unsigned int j = 0; j < k; j++)
+                    evaluated[bounds[j].index] = true;
+            }
+
+            std::vector<uint32_t> cols;
+            for(unsigned int j = 0; j < n_samples; j++)
+                if(evaluated[j])
+                    cols.push_back(j);
+            knn_evaluate(table, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                         rows, cols, heaps, k, res->n_evaluated);
+
+            // then, the samples whose bound does not exclude them for some query
+            cols.clear();
+            for(unsigned int j = 0; j < n_samples; j++) {
+                if(evaluated[j])
+                    continue;
+                for(unsigned int i = 0; i < rows.size(); i++) {
+                    double kth = heaps[i].top().distance;
+                    double bound = knn_lower_bound(method, totals[rows[i]], totals[j]);
+                    if(j != rows[i] && !(bound - KNN_PRUNE_SLACK * fabs(kth) > kth)) {
+                        cols.push_back(j);
+                        break;
+                    }
+                }
+            }
+            knn_evaluate(table, tree_sheared, method, variance_adjust, alpha, bypass_tips, nthreads,
+                         rows, cols, heaps, k, res->n_evaluated);
+        }
+
+        for(unsigned int i = 0; i < rows.size(); i++) {
+            uint64_t offset = (uint64_t)(batch_start + i) * k;
+            for(unsigned int j = k; j > 0; j--) {
+                res->indices[offset + j - 1] = heaps[i].top().index;
+                res->distances[offset + j - 1] = heaps[i].top().distance;
+                heaps[i].pop();
+            }
+        }
+    }
 
     return okay;
 }
@@ -328,6 +1787,8 @@ compute_status one_off(const char* biom_filename, const char* tree_filename,
 IOStatus write_mat(const char* output_filename, mat_t* result) {
     std::ofstream output;
     output.open(output_filename);
+    if(!output.is_open())
+        return open_error;
 
     uint64_t comb_N = su::comb_2(result->n_samples);
     uint64_t comb_N_minus = 0;
@@ -358,6 +1819,84 @@ IOStatus write_mat(const char* output_filename, mat_t* result) {
     return write_okay;
 }
 
+IOStatus read_mat(const char* input_filename, mat_t** result) {
+    std::ifstream input;
+    input.open(input_filename);
+    if(!input.is_open())
+        return open_error;
+
+    std::string line;
+    std::string field;
+    std::vector<std::string> ids;
+
+    std::getline(input, line);
+    std::istringstream header(line);
+    std::getline(header, field, '\t');  // the corner is empty
+    while(std::getline(header, field, '\t'))
+        ids.push_back(field);
+    if(ids.size() < 1)
+        return bad_header;
+
+    unsigned int n = ids.size();
+    std::vector<const char*> c_ids(n);
+    for(unsigned int i = 0; i < n; i++)
+        c_ids[i] = ids[i].c_str();
+    initialize_mat_no_biom(*result, (char**)c_ids.data(), n, true);
+
+    uint64_t comb_N = su::comb_2(n);
+    IOStatus err = read_okay;
+    for(unsigned int i = 0; i < n && err == read_okay; i++) {
+        if(!std::getline(input, line)) {
+            err = unexpected_end;
+            break;
+        }
+        std::istringstream row(line);
+        std::getline(row, field, '\t');
+        if(field != ids[i]) {
+            err = read_error;
+            break;
+        }
+
+        uint64_t offset = comb_N - su::comb_2(n - i);
+        for(unsigned int j = 0; j < n; j++) {
+            if(!std::getline(row, field, '\t')) {
+                err = read_error;
+                break;
+            }
+            // the upper triangle is sufficient
+            if(j > i)
+                (*result)->condensed_form[offset + (j - i - 1)] = strtod(field.c_str(), NULL);
+        }
+    }
+
+    if(err != read_okay) {
+        destroy_mat(result);
+        *result = NULL;
+    }
+    return err;
+}
+
+IOStatus write_rect_mat(const char* output_filename, rect_mat_t* result) {
+    std::ofstream output;
+    output.open(output_filename);
+    if(!output.is_open())
+        return open_error;
+
+    for(unsigned int j = 0; j < result->n_cols; j++)
+        output << "\t" << result->col_ids[j];
+    output << std::endl;
+
+    for(unsigned int i = 0; i < result->n_rows; i++) {
+        output << result->row_ids[i];
+        for(unsigned int j = 0; j < result->n_cols; j++)
+            output << std::setprecision(16) << "\t" << result->values[(uint64_t)i * result->n_cols + j];
+        output << std::endl;
+    }
+    output.close();
+
+    return write_okay;
+}
+
 IOStatus write_vec(const char* output_filename, r_vec* result) {
     std::ofstream output;
     output.open(output_filename);
@@ -374,6 +1913,41 @@ IOStatus write_vec(const char* output_filename, r_vec* result) {
     return write_okay;
 }
 
+IOStatus write_ordination(const char* output_filename, ordination_t* result) {
+    std::ofstream output;
+    output.open(output_filename);
+    if(!output.is_open())
+        return open_error;
+
+    output << std::setprecision(16);
+    output << "Eigvals\t" << result->n_axes << std::endl;
+    for(unsigned int k = 0; k < result->n_axes; k++)
+        output << (k ? "\t" : "") << result->eigvals[k];
+    output << std::endl << std::endl;
+
+    output << "Proportion explained\t" << result->n_axes << std::endl;
+    for(unsigned int k = 0; k < result->n_axes; k++)
+        output << (k ? "\t" : "") << result->proportion_explained[k];
+    output << std::endl << std::endl;
+
+    output << "Species\t0\t0" << std::endl << std::endl;
+
+    output << "Site\t" << result->n_samples << "\t" << result->n_axes << std::endl;
+    for(unsigned int i = 0; i < result->n_samples; i++) {
+        output << result->sample_ids[i];
+        for(unsigned int k = 0; k < result->n_axes; k++)
+            output << "\t" << result->coordinates[(uint64_t)i * result->n_axes + k];
+        output << std::endl;
+    }
+    output << std::endl;
+
+    output << "Biplot\t0\t0" << std::endl << std::endl;
+    output << "Site constraints\t0\t0" << std::endl;
+    output.close();
+
+    return write_okay;
+}
+
 IOStatus write_partial(const char* output_filename, partial_mat_t* result) {
     std::ofstream output;
     output.open(output_filename, std::ios::binary);
@@ -523,7 +2097,9 @@ IOStatus read_partial(const char* input_filename, partial_mat_t** result_out) {
     return read_okay;
 }
 
-MergeStatus merge_partial(partial_mat_t** partial_mats, int n_partials, unsigned int nthreads, mat_t** result) {
+// merge the partials into result, freeing each stripe once written if release
+MergeStatus merge_partial_into(partial_mat_t** partial_mats, int n_partials, unsigned int nthreads,
+                               matrix_result result, bool release) {
     if(n_partials <= 0) {
         fprintf(stderr, "Zero or less partials.\n");
         exit(EXIT_FAILURE);
@@ -569,28 +2145,222 @@ MergeStatus merge_partial(partial_mat_t** partial_mats, int n_partials, unsigned
         return incomplete_stripe_set;
     }
 
+    // the stripes are adopted rather than copied, as they are potentially a large amount of memory
     std::vector<double*> stripes(partial_mats[0]->stripe_total);
-    std::vector<double*> stripes_totals(partial_mats[0]->stripe_total);  // not actually used but destroy_stripes needs this to "exist"
     for(int i = 0; i < n_partials; i++) {
         int n_stripes = partial_mats[i]->stripe_stop - partial_mats[i]->stripe_start;
-        for(int j = 0; j < n_stripes; j++) {
-            // as this is potentially a large amount of memory, don't copy, just adopt
-            *&(stripes[j + partial_mats[i]->stripe_start]) = partial_mats[i]->stripes[j];
-        }
+        for(int j = 0; j < n_stripes; j++)
+            stripes[j + partial_mats[i]->stripe_start] = partial_mats[i]->stripes[j];
     }
 
     if(nthreads > stripes.size()) {
-        fprintf(stderr, "More threads were requested than stripes. Using %d threads.\n");
+        fprintf(stderr, "More threads were requested than stripes. Using %zu threads.\n", stripes.size());
         nthreads = stripes.size();
     }
 
-    std::vector<su::task_parameters> tasks(nthreads);
-    std::vector<std::thread> threads(nthreads);
-
-    initialize_mat_no_biom(*result, partial_mats[0]->sample_ids, n_samples, partial_mats[0]->is_upper_triangle);
-    su::stripes_to_condensed_form(stripes, n_samples, (*result)->condensed_form, 0, partial_mats[0]->stripe_total);
+    if(result.square()) {
+        initialize_mat_full(*result.full, partial_mats[0]->sample_ids, n_samples);
+    } else {
+        initialize_mat_no_biom(*result.condensed, partial_mats[0]->sample_ids, n_samples,
+                               partial_mats[0]->is_upper_triangle);
+    }
+    su::stripes_to_matrix(stripes, n_samples, result.values(), result.square(), 0, stripes.size(), nthreads,
+                          release);
 
-    destroy_stripes(stripes, stripes_totals, n_samples, 0, n_partials);
+    if(release) {
+        for(int i = 0; i < n_partials; i++) {
+            for(unsigned int j = 0; j < partial_mats[i]->stripe_stop - partial_mats[i]->stripe_start; j++)
+                partial_mats[i]->stripes[j] = NULL;
+        }
+    }
 
     return merge_okay;
 }
+
+MergeStatus merge_partial(partial_mat_t** partial_mats, int n_partials, unsigned int nthreads, mat_t** result) {
+    return merge_partial_into(partial_mats, n_partials, nthreads, matrix_result(result), false);
+}
+
+MergeStatus merge_partial_matrix(partial_mat_t** partial_mats, int n_partials, unsigned int nthreads,
+                                 mat_full_t** result) {
+    return merge_partial_into(partial_mats, n_partials, nthreads, matrix_result(result), true);
+}
+
+void destroy_partial_plan(partial_plan_t** plan) {
+    free((*plan)->starts);
+    free((*plan)->stops);
+    free((*plan)->stripe_bytes);
+    free((*plan)->peak_bytes);
+    free((*plan)->seconds);
+    free(*plan);
+    *plan = NULL;
+}
+
+// the seconds of a single threaded compute of stripes [start, stop)
+double time_stripes(biom &table, BPTree &tree_sheared, Method method, bool variance_adjust,
+                    bool bypass_tips, unsigned int start, unsigned int stop) {
+    std::vector<double*> dm_stripes((table.n_samples + 1) / 2);
+    std::vector<double*> dm_stripes_total((table.n_samples + 1) / 2);
+    std::vector<su::task_parameters> tasks(1);
+
+    set_tasks(tasks, 1.0, table.n_samples, start, stop, bypass_tips, 1);
+    double began = su::wall_seconds();
+    su::process_stripes(table, tree_sheared, method, variance_adjust, dm_stripes, dm_stripes_total, tasks);
+    double elapsed = su::wall_seconds() - began;
+    destroy_stripes(dm_stripes, dm_stripes_total, table.n_samples, start, stop);
+    return elapsed;
+}
+
+compute_status calibrate_cost_model(const char* biom_filename, const char* tree_filename,
+                                    const char* unifrac_method, bool variance_adjust,
+                                    bool bypass_tips, cost_model_t* model) {
+    CHECK_FILE(biom_filename, table_missing)
+    CHECK_FILE(tree_filename, tree_missing)
+    SET_METHOD(unifrac_method, unknown_method)
+    PARSE_SYNC_TREE_TABLE(tree_filename, table_filename)
+
+    unsigned int n_stripes = (table.n_samples + 1) / 2;
+    unsigned int k = std::min(n_stripes, (unsigned int)PLAN_CALIBRATION_STRIPES);
+    double units = (double)((tree_sheared.nparens / 2) - 1) * table.n_samples;
+
+    // the fastest of a few runs, as the others are slowed by noise
+    double one = INFINITY;
+    double many = INFINITY;
+    for(unsigned int r = 0; r < PLAN_CALIBRATION_REPEATS; r++) {
+        one = std::min(one, time_stripes(table, tree_sheared, method, variance_adjust, bypass_tips, 0, 1));
+        if(k > 1)
+            many = std::min(many, time_stripes(table, tree_sheared, method, variance_adjust, bypass_tips, 0, k));
+    }
+
+    // one = node + stripe, many = node + k * stripe
+    double stripe = k > 1 ? std::max(0.0, (many - one) / (k - 1)) : one;
+    double node = std::max(0.0, one - stripe);
+    model->node_seconds = node / units;
+    model->stripe_seconds = stripe / units;
+
+    return okay;
+}
+
+// the estimated bytes of a BPTree from its shape
+uint64_t bptree_bytes(uint64_t n_nodes, uint64_t n_tips, uint64_t name_bytes) {
+    // a length and name for each of the open and close parentheses, plus
+    // the tip index as in BPTree::memory_bytes
+    return n_nodes * 2 * (sizeof(double) + sizeof(std::string)) +
+           n_tips * (sizeof(std::string) + sizeof(uint32_t) + 2 * sizeof(void*)) +
+           2 * name_bytes;
+}
+
+compute_status plan_partials(const char* biom_filename, const char* tree_filename,
+                             const char* unifrac_method, bool variance_adjust,
+                             const cost_model_t* model, uint64_t memory_limit,
+                             double time_limit, unsigned int max_threads,
+                             unsigned int n_partials, partial_plan_t** result) {
+    CHECK_FILE(biom_filename, table_missing)
+    CHECK_FILE(tree_filename, tree_missing)
+    SET_METHOD(unifrac_method, unknown_method)
+
+    uint32_t n_obs, n_samples, nnz;
+    try {
+        su::biom::read_shape(biom_filename, n_obs, n_samples, nnz);
+    } catch(const std::invalid_argument &e) {
+        return table_bad_format_version;
+    }
+    if(n_samples == 0 || n_obs == 0)
+        return table_empty;
+
+    std::ifstream ifs(tree_filename);
+    std::string content = std::string(std::istreambuf_iterator<char>(ifs),
+                                      std::istreambuf_iterator<char>());
+    uint32_t n_nodes, n_tips, max_live;
+    su::newick_shape(content, n_nodes, n_tips, max_live);
+    if(n_nodes == 0)
+        return tree_malformed;
+
+    cost_model_t default_model = {PLAN_NODE_SECONDS, PLAN_STRIPE_SECONDS};
+    if(model == NULL)
+        model = &default_model;
+    if(max_threads == 0)
+        max_threads = 1;
+
+    unsigned int n_stripes = (n_samples + 1) / 2;
+
+    // the table is not read, so the shear is bounded rather than known: a
+    // collapsed tree over n_obs tips has at most 2 * n_obs - 1 nodes
+    uint64_t sheared_nodes = std::min((uint64_t)n_nodes, 2 * (uint64_t)n_obs - 1);
+    uint64_t n_compute_nodes = std::max((uint64_t)1, sheared_nodes - 1);
+    uint64_t live = std::min((uint64_t)max_live, n_compute_nodes);
+
+    uint64_t table_bytes = (uint64_t)nnz * 2 * (sizeof(uint32_t) + sizeof(double)) +
+                           ((uint64_t)n_obs + n_samples + 2) * 2 * sizeof(uint32_t) +
+                           (uint64_t)n_samples * sizeof(double) +
+                           ((uint64_t)n_obs + n_samples) * PLAN_ID_BYTES;
+    uint64_t tree_bytes = content.size() +
+                          bptree_bytes(n_nodes, n_tips, content.size()) +
+                          bptree_bytes(sheared_nodes, std::min(n_tips, n_obs), content.size());
+    uint64_t thread_bytes = thread_working_bytes(live, n_samples, variance_adjust);
+    uint64_t per_stripe = (uint64_t)n_samples * sizeof(double) * (needs_stripe_totals(method, variance_adjust) ? 2 : 1);
+
+    double units = (double)n_compute_nodes * n_samples;
+    auto job_seconds = [&](unsigned int stripes, unsigned int threads) {
+        return units * (model->node_seconds +
+                        ((stripes + threads - 1) / threads) * model->stripe_seconds);
+    };
+    auto job_bytes = [&](unsigned int stripes, unsigned int threads) {
+        return table_bytes + tree_bytes + threads * thread_bytes + stripes * per_stripe;
+    };
+
+    // the fewest partitions within the limits, each with as many threads
+    // as memory allows
+    unsigned int first = n_partials > 0 ? std::min(n_partials, n_stripes) : 1;
+    unsigned int last = n_partials > 0 ? first : n_stripes;
+    unsigned int chosen_partials = last;
+    unsigned int chosen_threads = 1;
+    bool feasible = false;
+    for(unsigned int p = first; p <= last && !feasible; p++) {
+        unsigned int largest = (n_stripes + p - 1) / p;
+        unsigned int t = std::min(max_threads, largest);
+        while(t > 1 && memory_limit > 0 && job_bytes(largest, t) > memory_limit)
+            t--;
+
+        chosen_partials = p;
+        chosen_threads = t;
+        feasible = (memory_limit == 0 || job_bytes(largest, t) <= memory_limit) &&
+                   (time_limit <= 0 || job_seconds(largest, t) <= time_limit);
+    }
+
+    partial_plan_t* plan = (partial_plan_t*)malloc(sizeof(partial_plan_t));
+    plan->n_samples = n_samples;
+    plan->n_obs = n_obs;
+    plan->nnz = nnz;
+    plan->n_tree_nodes = n_nodes;
+    plan->n_compute_nodes = n_compute_nodes;
+    plan->n_stripes = n_stripes;
+    plan->threads = chosen_threads;
+    plan->n_partials = chosen_partials;
+    plan->feasible = feasible;
+    plan->model = *model;
+    plan->table_bytes = table_bytes;
+    plan->tree_bytes = tree_bytes;
+    plan->thread_bytes = thread_bytes;
+    plan->starts = (unsigned int*)malloc(sizeof(unsigned int) * chosen_partials);
+    plan->stops = (unsigned int*)malloc(sizeof(unsigned int) * chosen_partials);
+    plan->stripe_bytes = (uint64_t*)malloc(sizeof(uint64_t) * chosen_partials);
+    plan->peak_bytes = (uint64_t*)malloc(sizeof(uint64_t) * chosen_partials);
+    plan->seconds = (double*)malloc(sizeof(double) * chosen_partials);
+
+    // the same balanced partitions as partial-report
+    std::vector<su::task_parameters> partitions(chosen_partials);
+    set_tasks(partitions, 1.0, n_samples, 0, n_stripes, false, chosen_partials);
+    for(unsigned int p = 0; p < chosen_partials; p++) {
+        unsigned int stripes = partitions[p].stop - partitions[p].start;
+        unsigned int threads = std::min(chosen_threads, stripes);
+        plan->starts[p] = partitions[p].start;
+        plan->stops[p] = partitions[p].stop;
+        plan->stripe_bytes[p] = stripes * per_stripe;
+        plan->peak_bytes[p] = job_bytes(stripes, threads);
+        plan->seconds[p] = job_seconds(stripes, threads);
+    }
+
+    *result = plan;
+    return okay;
+}
@@ -12,7 +12,7 @@
 
 #define PARTIAL_MAGIC "SSU-PARTIAL-01"
 
-typedef enum compute_status {okay=0, tree_missing, table_missing, table_empty, unknown_method, table_and_tree_do_not_overlap} ComputeStatus;
+typedef enum compute_status {okay=0, tree_missing, table_missing, table_empty, unknown_method, table_and_tree_do_not_overlap, table_bad_format_version, tree_malformed, sample_missing, existing_result_mismatch, memory_limit_exceeded, stripes_out_of_bounds, grouping_invalid} ComputeStatus;
 typedef enum io_status {read_okay=0, write_okay, open_error, read_error, magic_incompatible, bad_header, unexpected_end} IOStatus;
 typedef enum merge_status {merge_okay=0, incomplete_stripe_set, sample_id_consistency, square_mismatch, partials_mismatch, stripes_overlap} MergeStatus;
 
@@ -34,6 +34,19 @@ typedef struct mat {
     char** sample_ids;
 } mat_t;
 
+/* a result matrix in square form
+ *
+ * n_samples <uint> the number of samples.
+ * matrix <double*> the symmetric matrix, row-major of n_samples x n_samples, with a
+ *      zero diagonal.
+ * sample_ids <char**> the sample IDs of length n_samples.
+ */
+typedef struct mat_full {
+    unsigned int n_samples;
+    double* matrix;
+    char** sample_ids;
+} mat_full_t;
+
 /* a result vector
  *
  * n_samples <uint> the number of samples.
@@ -67,9 +80,229 @@ typedef struct partial_mat {
     bool is_upper_triangle;
 } partial_mat_t;
 
+/* the principal coordinates of a distance matrix
+ *
+ * n_samples <uint> the number of samples.
+ * n_axes <uint> the number of axes.
+ * sample_ids <char**> the sample IDs of length n_samples.
+ * eigvals <double*> the eigenvalues of the axes of length n_axes, in descending order.
+ * proportion_explained <double*> the eigenvalues relative to the sum of the eigenvalues
+ *      of all axes, of length n_axes.
+ * coordinates <double*> the coordinates of the samples, row-major of n_samples x n_axes.
+ */
+typedef struct ordination {
+    unsigned int n_samples;
+    unsigned int n_axes;
+    char** sample_ids;
+    double* eigvals;
+    double* proportion_explained;
+    double* coordinates;
+} ordination_t;
+
+/* the result of a permutation test of a grouping of the samples
+ *
+ * method_name <const char*> the test, "PERMANOVA" or "PERMDISP".
+ * statistic_name <const char*> the name of the test statistic.
+ * n_samples <uint> the number of samples.
+ * n_groups <uint> the number of groups.
+ * statistic <double> the test statistic of the grouping.
+ * p_value <double> the p-value, or NaN if there are no permutations.
+ * permutations <uint> the number of permutations.
+ */
+typedef struct permutation_test {
+    const char* method_name;
+    const char* statistic_name;
+    unsigned int n_samples;
+    unsigned int n_groups;
+    double statistic;
+    double p_value;
+    unsigned int permutations;
+} permutation_test_t;
+
+/* a table and tree loaded once, from which ranges of stripes are computed on demand
+ *
+ * n_samples <uint> the number of samples.
+ * n_stripes <uint> the number of stripes of the full matrix.
+ * sample_ids <char**> the sample IDs of length n_samples.
+ * state <void*> the loaded table, the sheared tree and the parameters, which are
+ *      private to the API.
+ */
+typedef struct stripe_stream {
+    uint32_t n_samples;
+    uint32_t n_stripes;
+    char** sample_ids;
+    void* state;
+} stripe_stream_t;
+
+/* a phylogeny parsed once, for use by many computations
+ *
+ * n_nodes <uint> the number of nodes of the tree.
+ * state <void*> the parsed tree, which is private to the API.
+ */
+typedef struct loaded_tree {
+    uint32_t n_nodes;
+    void* state;
+} loaded_tree_t;
+
+/* a rectangular result matrix, between two sets of samples
+ *
+ * n_rows <uint> the number of row samples.
+ * n_cols <uint> the number of column samples.
+ * values <double*> the matrix values in row-major order, of length n_rows * n_cols.
+ * row_ids <char**> the row sample IDs of length n_rows.
+ * col_ids <char**> the column sample IDs of length n_cols.
+ */
+typedef struct rect_mat {
+    unsigned int n_rows;
+    unsigned int n_cols;
+    double* values;
+    char** row_ids;
+    char** col_ids;
+} rect_mat_t;
+
+/* the nearest neighbours of a set of query samples
+ *
+ * n_queries <uint> the number of query samples.
+ * k <uint> the number of neighbours of each query.
+ * indices <uint32_t*> the neighbours as indices into sample_ids, row-major of
+ *      dimension (n_queries, k), and ordered by increasing distance.
+ * distances <double*> the distances to the neighbours, of the same dimension as indices.
+ * query_ids <char**> the query sample IDs of length n_queries.
+ * n_samples <uint> the number of samples neighbours were drawn from.
+ * sample_ids <char**> the sample IDs of length n_samples.
+ * n_evaluated <uint64_t> the number of query-sample pairs whose distance was computed.
+ */
+typedef struct knn_result {
+    unsigned int n_queries;
+    unsigned int k;
+    uint32_t* indices;
+    double* distances;
+    char** query_ids;
+    unsigned int n_samples;
+    char** sample_ids;
+    uint64_t n_evaluated;
+} knn_result_t;
+
+#define RUN_STATS_MAX_PHASES 8
+
+/* instrumentation of the phases of a computation
+ *
+ * n_phases <uint> the number of phases recorded, in the order they ran.
+ * phase_names <const char*> the name of each phase. names are static strings,
+ *      of load, parse, shear, compute, condense, expand and partial.
+ * wall_seconds <double> the elapsed time of each phase.
+ * cpu_seconds <double> the user and system time of the process during each
+ *      phase, summed over its threads.
+ * bytes_allocated <uint64_t> an estimate of the bytes of the principal
+ *      structures allocated by each phase: the table, the trees, the stripes
+ *      and the result.
+ * peak_rss_kb <uint64_t> the peak resident set size of the process at the end
+ *      of each phase, in kilobytes.
+ * n_threads <uint> the number of threads of the compute phase.
+ * thread_cpu_seconds <double*> the CPU time of each thread of the compute
+ *      phase, of length n_threads.
+ * n_duplicates <uint> the number of samples whose column repeats that of an
+ *      earlier sample, and whose distances were copied rather than computed.
+ */
+typedef struct run_stats {
+    unsigned int n_phases;
+    const char* phase_names[RUN_STATS_MAX_PHASES];
+    double wall_seconds[RUN_STATS_MAX_PHASES];
+    double cpu_seconds[RUN_STATS_MAX_PHASES];
+    uint64_t bytes_allocated[RUN_STATS_MAX_PHASES];
+    uint64_t peak_rss_kb[RUN_STATS_MAX_PHASES];
+    unsigned int n_threads;
+    double* thread_cpu_seconds;
+    unsigned int n_duplicates;
+} run_stats_t;
+
+/* a cost model of the UniFrac compute, see calibrate_cost_model
+ *
+ * node_seconds <double> the time to compute the proportions of a node, per
+ *      sample. this is incurred by every thread.
+ * stripe_seconds <double> the time to accumulate a node into a stripe, per
+ *      sample.
+ */
+typedef struct cost_model {
+    double node_seconds;
+    double stripe_seconds;
+} cost_model_t;
+
+/* a plan for computing a distance matrix as partial results
+ *
+ * n_samples <uint> the number of samples of the table.
+ * n_obs <uint> the number of observations of the table.
+ * nnz <uint> the number of nonzero entries of the table.
+ * n_tree_nodes <uint> the number of nodes of the tree.
+ * n_compute_nodes <uint> the estimated number of nodes of the tree once sheared to the table.
+ * n_stripes <uint> the total number of stripes.
+ * threads <uint> the number of threads of each job.
+ * n_partials <uint> the number of partitions, each computed by one job.
+ * feasible <bool> whether every partition is within the memory and time limits.
+ * model <cost_model_t> the cost model of the estimates.
+ * table_bytes <uint64_t> the estimated memory of the loaded table.
+ * tree_bytes <uint64_t> the estimated memory of the parsed and sheared trees.
+ * thread_bytes <uint64_t> the estimated working memory of each thread.
+ * starts <uint*> the starting stripe of each partition, of length n_partials.
+ * stops <uint*> the stopping stripe of each partition, of length n_partials.
+ * stripe_bytes <uint64_t*> the memory of the stripes of each partition.
+ * peak_bytes <uint64_t*> the estimated peak memory of the job of each partition.
+ * seconds <double*> the estimated compute time of the job of each partition.
+ */
+typedef struct partial_plan {
+    unsigned int n_samples;
+    unsigned int n_obs;
+    unsigned int nnz;
+    unsigned int n_tree_nodes;
+    unsigned int n_compute_nodes;
+    unsigned int n_stripes;
+    unsigned int threads;
+    unsigned int n_partials;
+    bool feasible;
+    cost_model_t model;
+    uint64_t table_bytes;
+    uint64_t tree_bytes;
+    uint64_t thread_bytes;
+    unsigned int* starts;
+    unsigned int* stops;
+    uint64_t* stripe_bytes;
+    uint64_t* peak_bytes;
+    double* seconds;
+} partial_plan_t;
+
+/* the samples and features of a table to compute over
+ *
+ * sample_ids <const char**> the IDs of the samples to keep, of length n_sample_ids,
+ *      or NULL to keep every sample. the samples are kept in the order of the table.
+ * n_sample_ids <uint> the number of sample IDs.
+ * feature_ids <const char**> the IDs of the features to keep, of length n_feature_ids,
+ *      or NULL to keep every feature. IDs which are not in the table are ignored.
+ * n_feature_ids <uint> the number of feature IDs.
+ */
+typedef struct table_subset {
+    const char** sample_ids;
+    unsigned int n_sample_ids;
+    const char** feature_ids;
+    unsigned int n_feature_ids;
+} table_subset_t;
+
 void destroy_mat(mat_t** result);
+void destroy_mat_full(mat_full_t** result);
 void destroy_partial_mat(partial_mat_t** result);
 void destroy_results_vec(r_vec** result);
+void destroy_rect_mat(rect_mat_t** result);
+void destroy_knn_result(knn_result_t** result);
+void destroy_run_stats(run_stats_t** stats);
+void destroy_partial_plan(partial_plan_t** plan);
+void destroy_stripe_stream(stripe_stream_t** stream);
+void destroy_loaded_tree(loaded_tree_t** tree);
+void destroy_ordination(ordination_t** result);
+
+/* The name of a ComputeStatus, as in the enum, e.g. "tree_missing" */
+EXTERN const char* compute_status_name(ComputeStatus status);
+
+/* A description of a ComputeStatus, e.g. "The tree file cannot be found." */
+EXTERN const char* compute_status_message(ComputeStatus status);
 
 /* Compute UniFrac
  *
@@ -89,11 +322,354 @@ void destroy_results_vec(r_vec** result);
  * tree_missing   : the filename for the tree does not exist
  * unknown_method : the requested method is unknown.
  * table_empty    : the table does not have any entries
+ * table_and_tree_do_not_overlap : the table observations are not a subset of the tree tips
+ * table_bad_format_version      : the table is not a BIOM-Format 2.1 file
+ * tree_malformed                : the tree could not be parsed as newick
+ * memory_limit_exceeded         : the working memory of a thread, or a stripe, could not be allocated
+ *
+ * Samples whose columns are identical are computed once: the distances are
+ * computed among the distinct columns and expanded to every sample. The
+ * distance between the samples of a column is that of the column to itself,
+ * which is zero unless the method is not defined for the column, and is
+ * computed from a single stripe. Samples without any entries are always
+ * computed.
  */
 EXTERN ComputeStatus one_off(const char* biom_filename, const char* tree_filename,
                              const char* unifrac_method, bool variance_adjust, double alpha,
                              bool bypass_tips, unsigned int threads, mat_t** result);
 
+/* Compute UniFrac, recording the phases of the computation
+ *
+ * The parameters and error codes are as for one_off, with the addition of
+ *
+ * stats <run_stats_t**> if not NULL, the phase statistics, which are initialized
+ *      within the method if okay is returned. if NULL, nothing is recorded.
+ *
+ * The phases are load, parse, shear, compute and condense, followed by expand
+ * if any samples are identical, in which case n_duplicates is the number of
+ * samples which were not computed.
+ */
+EXTERN ComputeStatus one_off_stats(const char* biom_filename, const char* tree_filename,
+                                   const char* unifrac_method, bool variance_adjust, double alpha,
+                                   bool bypass_tips, unsigned int threads, mat_t** result,
+                                   run_stats_t** stats);
+
+/* Compute UniFrac within a memory budget
+ *
+ * The parameters and error codes are as for one_off_stats, with the addition of
+ *
+ * max_memory <uint64_t> the bytes the computation may hold, or 0 for no limit.
+ *
+ * The loaded table and trees, and the result, are counted against the budget.
+ * The stripes are computed in as many rounds as the remainder requires, each
+ * round reusing the same stripe buffers and condensing its stripes into the
+ * result before the next, and the threads are reduced if their working
+ * memory does not fit. The phases are load, parse, shear and compute, as
+ * the stripes are condensed during the compute, and expand as for one_off_stats.
+ * If any samples are identical, the table of the distinct columns and the
+ * expanded result are also counted.
+ *
+ * memory_limit_exceeded : a round of a single stripe on a single thread
+ *      does not fit, or the stripe buffers or the working memory of the
+ *      threads could not be allocated
+ */
+EXTERN ComputeStatus one_off_budgeted(const char* biom_filename, const char* tree_filename,
+                                      const char* unifrac_method, bool variance_adjust, double alpha,
+                                      bool bypass_tips, unsigned int threads, uint64_t max_memory,
+                                      mat_t** result, run_stats_t** stats);
+
+/* Compute UniFrac over a subset of the samples and features of a table
+ *
+ * The parameters and error codes are as for one_off_budgeted, with the addition of
+ *
+ * subset <const table_subset_t*> the samples and features to compute over, or NULL
+ *      for the whole table.
+ *
+ * Only the columns of the subset samples are read from the table, and the features
+ * which are not observed in them are dropped before the tree is sheared, so the
+ * result is that of a table filtered to the subset without one being written.
+ *
+ * sample_missing : a sample of the subset is not in the table
+ */
+EXTERN ComputeStatus one_off_subset(const char* biom_filename, const char* tree_filename,
+                                    const char* unifrac_method, bool variance_adjust, double alpha,
+                                    bool bypass_tips, unsigned int threads, uint64_t max_memory,
+                                    const table_subset_t* subset, mat_t** result, run_stats_t** stats);
+
+/* Compute UniFrac into a square matrix
+ *
+ * The parameters and error codes are as for one_off_subset, except that
+ *
+ * result <mat_full_t**> the resulting distance matrix in square form, which is
+ *      initialized within the method if okay is returned.
+ *
+ * The stripes are written straight into the square matrix, so the condensed form
+ * is not formed.
+ */
+EXTERN ComputeStatus one_off_matrix(const char* biom_filename, const char* tree_filename,
+                                    const char* unifrac_method, bool variance_adjust, double alpha,
+                                    bool bypass_tips, unsigned int threads, uint64_t max_memory,
+                                    const table_subset_t* subset, mat_full_t** result,
+                                    run_stats_t** stats);
+
+/* Parse a phylogeny for use by many computations
+ *
+ * tree_filename <const char*> the filename of the tree in newick.
+ * result <loaded_tree_t**> the parsed tree, which is initialized within the method
+ *      if okay is returned.
+ *
+ * The following error codes are returned:
+ *
+ * okay           : no problems encountered
+ * tree_missing   : the filename for the tree does not exist
+ * tree_malformed : the tree does not appear to be newick
+ *
+ * The tips of a loaded tree are indexed, so that it is sheared in time
+ * proportional to the features of a table rather than the size of the tree.
+ * A loaded tree may be used by several calls at once.
+ */
+EXTERN ComputeStatus load_tree(const char* tree_filename, loaded_tree_t** result);
+
+/* Compute UniFrac against a loaded tree
+ *
+ * The parameters and error codes are as for one_off_budgeted, except that
+ *
+ * tree <loaded_tree_t*> the tree, as by load_tree, in place of tree_filename.
+ *
+ * The tree is sheared to each table, and the sheared trees of recent calls are
+ * reused, so repeated calls on a large tree skip its parse. The phases are as
+ * for one_off_stats, without parse.
+ */
+EXTERN ComputeStatus one_off_loaded(const char* biom_filename, loaded_tree_t* tree,
+                                    const char* unifrac_method, bool variance_adjust, double alpha,
+                                    bool bypass_tips, unsigned int threads, uint64_t max_memory,
+                                    mat_t** result, run_stats_t** stats);
+
+/* Serve UniFrac computations against loaded trees over a UNIX socket
+ *
+ * socket_path <const char*> the path of the socket, which is replaced if it is a
+ *      stale socket, and is removed on return.
+ * tree_names <const char**> the names by which the trees are requested.
+ * trees <loaded_tree_t**> the trees, as by load_tree, which are used but not
+ *      destroyed.
+ * n_trees <uint> the number of trees.
+ * threads <uint> the most threads used by the computations at once.
+ *
+ * Each connection carries a request of a line of tab separated name=value fields,
+ * and is answered with a line of fields. A compute request has
+ *
+ *      tree              : the name of a loaded tree.
+ *      table             : the filename of the biom table.
+ *      output            : the filename of the distance matrix, as by write_mat.
+ *      method            : [OPTIONAL] the unifrac method, default is unweighted.
+ *      threads           : [OPTIONAL] the threads of the request, default is 1.
+ *      variance_adjusted : [OPTIONAL] 1 to apply variance adjustment.
+ *      alpha             : [OPTIONAL] GUniFrac alpha, default is 1.
+ *      bypass_tips       : [OPTIONAL] 1 to disregard tips.
+ *      max_memory        : [OPTIONAL] the memory of the compute in bytes, as for
+ *                          one_off_budgeted.
+ *
+ * and is answered with a status of okay and n_samples, or error with the name of
+ * a ComputeStatus, bad_request, unknown_tree or open_error, and a message. The
+ * requests are queued so that their threads are within the budget, and
+ * command=metrics and command=shutdown report on and stop the server, as
+ * described by su::serve. A connection which does not send its request within
+ * 30 seconds is closed without a response.
+ *
+ * Returns 0 once the server is stopped by a shutdown request, or the errno of the
+ * failure if the socket could not be created, such as EADDRINUSE if it is served
+ * by another process.
+ */
+EXTERN int serve(const char* socket_path, const char** tree_names, loaded_tree_t** trees,
+                 unsigned int n_trees, unsigned int threads);
+
+/* Compute UniFrac, checkpointing the stripes so that an interrupted computation can resume
+ *
+ * The parameters and error codes are as for one_off, with the addition of
+ *
+ * checkpoint_prefix <const char*> the path prefix of the checkpoint files. each
+ *      thread writes <prefix>.<start>-<stop>.ckpt for the stripes it computes.
+ *      if NULL, nothing is checkpointed.
+ * checkpoint_interval <double> the least seconds between the checkpoints of a thread.
+ * resume <bool> continue each thread from its checkpoint if there is one.
+ *
+ * A checkpoint holds the stripes, their totals and the position in the tree
+ * reached. It is written under a fingerprint of the table file, the tree and
+ * the method, variance adjustment, alpha and tip bypass, and is only resumed
+ * under the same fingerprint and the same stripes per thread, so resuming
+ * requires the same inputs, parameters and number of threads. A checkpoint
+ * which does not match is ignored, and that thread starts over. The
+ * checkpoints are removed once the stripes are complete.
+ */
+EXTERN ComputeStatus one_off_checkpoint(const char* biom_filename, const char* tree_filename,
+                                        const char* unifrac_method, bool variance_adjust, double alpha,
+                                        bool bypass_tips, unsigned int threads, const char* checkpoint_prefix,
+                                        double checkpoint_interval, bool resume, mat_t** result);
+
+/* Compute UniFrac over rarefied replicates of a table
+ *
+ * biom_filename <const char*> the filename to the biom table.
+ * tree_filename <const char*> the filename to the correspodning tree.
+ * unifrac_method <const char*> the requested unifrac method.
+ * variance_adjust <bool> whether to apply variance adjustment.
+ * alpha <double> GUniFrac alpha, only relevant if method == generalized.
+ * bypass_tips <bool> disregard tips, reduces compute by about 50%
+ * threads <uint> the number of threads to use.
+ * depth <uint> the number of counts drawn without replacement from each
+ *      sample. samples with fewer counts are omitted.
+ * iterations <uint> the number of replicates.
+ * seed <uint64_t> the random seed, replicate r is drawn with seed + r.
+ * mean <mat_t**> the mean of the replicates, this is initialized within the method so using **
+ * variance <mat_t**> the sample variance of the replicates, or zero for a single replicate.
+ * replicates <mat_t**> if not NULL, an array of length iterations, which
+ *      receives each replicate. if NULL, the replicates are discarded as
+ *      they are accumulated into the mean and variance.
+ *
+ * The table is read and the tree parsed and sheared once for all of the
+ * replicates.
+ *
+ * one_off_rarefied returns the following error codes:
+ *
+ * okay           : no problems encountered
+ * table_missing  : the filename for the table does not exist
+ * tree_missing   : the filename for the tree does not exist
+ * unknown_method : the requested method is unknown.
+ * table_empty    : the table does not have any entries, fewer than two
+ *      samples have at least depth counts, or depth or iterations is zero
+ * table_and_tree_do_not_overlap : the table observations are not a subset of the tree tips
+ * table_bad_format_version      : the table is not a BIOM-Format 2.1 file
+ * tree_malformed                : the tree could not be parsed as newick
+ */
+EXTERN ComputeStatus one_off_rarefied(const char* biom_filename, const char* tree_filename,
+                                      const char* unifrac_method, bool variance_adjust, double alpha,
+                                      bool bypass_tips, unsigned int threads, unsigned int depth,
+                                      unsigned int iterations, uint64_t seed, mat_t** mean,
+                                      mat_t** variance, mat_t** replicates);
+
+/* Compute UniFrac between two sets of samples
+ *
+ * biom_filename <const char*> the filename to the biom table.
+ * tree_filename <const char*> the filename to the correspodning tree.
+ * unifrac_method <const char*> the requested unifrac method.
+ * variance_adjust <bool> whether to apply variance adjustment.
+ * alpha <double> GUniFrac alpha, only relevant if method == generalized.
+ * bypass_tips <bool> disregard tips, reduces compute by about 50%
+ * threads <uint> the number of threads to use.
+ * row_ids <const char**> the IDs of the samples for the rows of the result.
+ * n_rows <uint> the number of row IDs.
+ * col_ids <const char**> the IDs of the samples for the columns of the result.
+ * n_cols <uint> the number of column IDs.
+ * result <rect_mat_t**> the resulting distances, this is initialized within the method so using **
+ *
+ * The compute scales with n_rows * n_cols rather than with the square of the
+ * number of samples in the table. The sample sets may overlap.
+ *
+ * one_off_cross returns the following error codes:
+ *
+ * okay           : no problems encountered
+ * table_missing  : the filename for the table does not exist
+ * tree_missing   : the filename for the tree does not exist
+ * unknown_method : the requested method is unknown.
+ * table_empty    : the table does not have any entries
+ * table_and_tree_do_not_overlap : the table observations are not a subset of the tree tips
+ * table_bad_format_version      : the table is not a BIOM-Format 2.1 file
+ * tree_malformed                : the tree could not be parsed as newick
+ * sample_missing                : a requested sample ID is not in the table
+ */
+EXTERN ComputeStatus one_off_cross(const char* biom_filename, const char* tree_filename,
+                                   const char* unifrac_method, bool variance_adjust, double alpha,
+                                   bool bypass_tips, unsigned int threads,
+                                   const char** row_ids, unsigned int n_rows,
+                                   const char** col_ids, unsigned int n_cols,
+                                   rect_mat_t** result);
+
+/* Extend a UniFrac distance matrix with the new samples of a table
+ *
+ * biom_filename <const char*> the filename to the biom table, containing the existing and new samples.
+ * tree_filename <const char*> the filename to the correspodning tree.
+ * unifrac_method <const char*> the requested unifrac method.
+ * variance_adjust <bool> whether to apply variance adjustment.
+ * alpha <double> GUniFrac alpha, only relevant if method == generalized.
+ * bypass_tips <bool> disregard tips, reduces compute by about 50%
+ * threads <uint> the number of threads to use.
+ * existing <mat_t*> the existing distance matrix, computed with the same parameters.
+ * result <mat_t**> the enlarged distance matrix in condensed form, this is initialized within the method so using **
+ *
+ * The samples of the table which are not in existing are new. Only the
+ * distances from the new samples to all samples are computed, and the
+ * existing distances are carried over. The existing samples retain their
+ * order in result, and the new samples follow in the order of the table.
+ *
+ * To guard against an existing result computed from different data or
+ * parameters, a few of the existing samples are recomputed against the other
+ * existing samples and compared.
+ *
+ * append_samples returns the following error codes:
+ *
+ * okay           : no problems encountered
+ * table_missing  : the filename for the table does not exist
+ * tree_missing   : the filename for the tree does not exist
+ * unknown_method : the requested method is unknown.
+ * table_empty    : the table does not have any entries
+ * table_and_tree_do_not_overlap : the table observations are not a subset of the tree tips
+ * table_bad_format_version      : the table is not a BIOM-Format 2.1 file
+ * tree_malformed                : the tree could not be parsed as newick
+ * sample_missing                : an existing sample ID is not in the table
+ * existing_result_mismatch      : the existing distances do not agree with the table and parameters
+ */
+EXTERN ComputeStatus append_samples(const char* biom_filename, const char* tree_filename,
+                                    const char* unifrac_method, bool variance_adjust, double alpha,
+                                    bool bypass_tips, unsigned int threads, mat_t* existing,
+                                    mat_t** result);
+
+/* Find the nearest neighbours of samples by UniFrac
+ *
+ * biom_filename <const char*> the filename to the biom table.
+ * tree_filename <const char*> the filename to the correspodning tree.
+ * unifrac_method <const char*> the requested unifrac method.
+ * variance_adjust <bool> whether to apply variance adjustment.
+ * alpha <double> GUniFrac alpha, only relevant if method == generalized.
+ * bypass_tips <bool> disregard tips, reduces compute by about 50%
+ * threads <uint> the number of threads to use.
+ * query_ids <const char**> the IDs of the query samples.
+ * n_queries <uint> the number of query IDs.
+ * k <uint> the number of neighbours to find. this is reduced if the table
+ *      has fewer than k other samples.
+ * prune <bool> whether to skip samples which cannot be among the neighbours.
+ * result <knn_result_t**> the neighbours, this is initialized within the method so using **
+ *
+ * The neighbours of a query are drawn from all other samples in the table.
+ * The queries are processed in batches, and only the distances of a batch
+ * are held at any time.
+ *
+ * If prune is true, a lower bound on each distance is formed from the
+ * branch length weighted total of each sample. A small set of likely
+ * neighbours is computed first, and only those samples whose bound does not
+ * exclude them are computed after. The result is the same as without
+ * pruning. The bounds exist for unweighted, weighted_normalized and
+ * weighted_unnormalized without variance adjustment, and prune is ignored
+ * otherwise.
+ *
+ * Distances which are not a number are ordered last, and ties are ordered
+ * by sample index.
+ *
+ * knn_query returns the following error codes:
+ *
+ * okay           : no problems encountered
+ * table_missing  : the filename for the table does not exist
+ * tree_missing   : the filename for the tree does not exist
+ * unknown_method : the requested method is unknown.
+ * table_empty    : the table does not have any entries
+ * table_and_tree_do_not_overlap : the table observations are not a subset of the tree tips
+ * table_bad_format_version      : the table is not a BIOM-Format 2.1 file
+ * tree_malformed                : the tree could not be parsed as newick
+ * sample_missing                : a query sample ID is not in the table
+ */
+EXTERN ComputeStatus knn_query(const char* biom_filename, const char* tree_filename,
+                               const char* unifrac_method, bool variance_adjust, double alpha,
+                               bool bypass_tips, unsigned int threads,
+                               const char** query_ids, unsigned int n_queries,
+                               unsigned int k, bool prune, knn_result_t** result);
 
 /* compute Faith PD
  * biom_filename <const char*> the filename to the biom table.
@@ -106,10 +682,33 @@ EXTERN ComputeStatus one_off(const char* biom_filename, const char* tree_filenam
  * table_missing  : the filename for the table does not exist
  * tree_missing   : the filename for the tree does not exist
  * table_empty    : the table does not have any entries
+ * table_and_tree_do_not_overlap : the table observations are not a subset of the tree tips
+ * table_bad_format_version      : the table is not a BIOM-Format 2.1 file
+ * tree_malformed                : the tree could not be parsed as newick
  */
 EXTERN ComputeStatus faith_pd_one_off(const char* biom_filename, const char* tree_filename,
                                       r_vec** result);
 
+/* compute Faith PD, recording the phases of the computation
+ *
+ * The parameters and error codes are as for faith_pd_one_off, with the addition of
+ *
+ * stats <run_stats_t**> if not NULL, the phase statistics, which are initialized
+ *      within the method if okay is returned. if NULL, nothing is recorded.
+ *
+ * The phases are load, parse, shear and compute.
+ */
+EXTERN ComputeStatus faith_pd_one_off_stats(const char* biom_filename, const char* tree_filename,
+                                            r_vec** result, run_stats_t** stats);
+
+/* compute Faith PD over a subset of the samples and features of a table
+ *
+ * The parameters and error codes are as for faith_pd_one_off_stats, with the
+ * addition of subset and sample_missing as for one_off_subset.
+ */
+EXTERN ComputeStatus faith_pd_subset(const char* biom_filename, const char* tree_filename,
+                                     const table_subset_t* subset, r_vec** result, run_stats_t** stats);
+
 /* Write a matrix object
  *
  * filename <const char*> the file to write into
@@ -118,10 +717,26 @@ EXTERN ComputeStatus faith_pd_one_off(const char* biom_filename, const char* tre
  * The following error codes are returned:
  *
  * write_okay : no problems
+ * open_error : could not open the file
  */
 EXTERN IOStatus write_mat(const char* filename, mat_t* result);
 
 
+/* Write a rectangular matrix object
+ *
+ * filename <const char*> the file to write into
+ * result <rect_mat_t*> the results object
+ *
+ * The matrix is written as tab delimited text, with the column IDs in the
+ * header and the row IDs in the first column.
+ *
+ * The following error codes are returned:
+ *
+ * write_okay : no problems
+ * open_error : could not open the file
+ */
+EXTERN IOStatus write_rect_mat(const char* filename, rect_mat_t* result);
+
 /* Write a series
  *
  * filename <const char*> the file to write into
@@ -133,19 +748,35 @@ EXTERN IOStatus write_mat(const char* filename, mat_t* result);
  */
 EXTERN IOStatus write_vec(const char* filename, r_vec* result);
 
-/* Read a matrix object
+/* Write principal coordinates
  *
  * filename <const char*> the file to write into
- * result <mat_t**> the results object
+ * result <ordination_t*> the principal coordinates
+ *
+ * The file is in the ordination format of scikit-bio, which
+ * skbio.OrdinationResults.read reads.
  *
  * The following error codes are returned:
  *
- * read_okay : no problems
+ * write_okay : no problems
  * open_error : could not open the file
- * magic_incompatible : format magic not found or incompatible
- * unexpected_end     : format end not found in expected location
  */
-//EXTERN IOStatus read_mat(const char* filename, mat_t** result);
+EXTERN IOStatus write_ordination(const char* filename, ordination_t* result);
+
+/* Read a matrix object
+ *
+ * filename <const char*> the file to read from, as written by write_mat
+ * result <mat_t**> the results object, output parameter
+ *
+ * The following error codes are returned:
+ *
+ * read_okay      : no problems
+ * open_error     : could not open the file
+ * bad_header     : the header does not contain sample IDs
+ * read_error     : a row is malformed or does not correspond to the header
+ * unexpected_end : fewer rows than samples were found
+ */
+EXTERN IOStatus read_mat(const char* filename, mat_t** result);
 
 /* Compute a subset of a UniFrac distance matrix
  *
@@ -170,6 +801,12 @@ EXTERN IOStatus write_vec(const char* filename, r_vec* result);
  * table_missing  : the filename for the table does not exist
  * tree_missing   : the filename for the tree does not exist
  * unknown_method : the requested method is unknown.
+ * table_empty    : the table does not have any entries
+ * table_and_tree_do_not_overlap : the table observations are not a subset of the tree tips
+ * table_bad_format_version      : the table is not a BIOM-Format 2.1 file
+ * tree_malformed                : the tree could not be parsed as newick
+ * stripes_out_of_bounds         : the stop stripe is not after the start, or is past the last stripe
+ * memory_limit_exceeded         : the working memory of a thread, or a stripe, could not be allocated
  */
 
 EXTERN ComputeStatus partial(const char* biom_filename, const char* tree_filename,
@@ -177,6 +814,164 @@ EXTERN ComputeStatus partial(const char* biom_filename, const char* tree_filenam
                              bool bypass_tips, unsigned int threads, unsigned int stripe_start,
                              unsigned int stripe_stop, partial_mat_t** result);
 
+/* Compute a subset of a UniFrac distance matrix, recording the phases of the computation
+ *
+ * The parameters and error codes are as for partial, with the addition of
+ *
+ * stats <run_stats_t**> if not NULL, the phase statistics, which are initialized
+ *      within the method if okay is returned. if NULL, nothing is recorded.
+ *
+ * The phases are load, parse, shear, compute and partial.
+ */
+EXTERN ComputeStatus partial_stats(const char* biom_filename, const char* tree_filename,
+                                   const char* unifrac_method, bool variance_adjust, double alpha,
+                                   bool bypass_tips, unsigned int threads, unsigned int stripe_start,
+                                   unsigned int stripe_stop, partial_mat_t** result,
+                                   run_stats_t** stats);
+
+/* Compute a subset of a UniFrac distance matrix over a subset of a table
+ *
+ * The parameters and error codes are as for partial, with the addition of
+ * subset and sample_missing as for one_off_subset. The stripes are those of
+ * the subset table, so every partial of a matrix requires the same subset.
+ */
+EXTERN ComputeStatus partial_subset(const char* biom_filename, const char* tree_filename,
+                                    const char* unifrac_method, bool variance_adjust, double alpha,
+                                    bool bypass_tips, unsigned int threads, unsigned int stripe_start,
+                                    unsigned int stripe_stop, const table_subset_t* subset,
+                                    partial_mat_t** result);
+
+/* Compute a subset of a UniFrac distance matrix, checkpointing the stripes
+ *
+ * The parameters and error codes are as for partial, with the addition of
+ * checkpoint_prefix, checkpoint_interval and resume as for one_off_checkpoint.
+ * Resuming requires the same stripe range and number of threads.
+ */
+EXTERN ComputeStatus partial_checkpoint(const char* biom_filename, const char* tree_filename,
+                                        const char* unifrac_method, bool variance_adjust, double alpha,
+                                        bool bypass_tips, unsigned int threads, unsigned int stripe_start,
+                                        unsigned int stripe_stop, const char* checkpoint_prefix,
+                                        double checkpoint_interval, bool resume, partial_mat_t** result);
+
+/* Compute the principal coordinates of a distance matrix
+ *
+ * dm <mat_t*> an upper triangle distance matrix, as from one_off.
+ * n_axes <uint> the number of axes, which is reduced to the number of samples if more.
+ * threads <uint> the number of threads to use.
+ * result <ordination_t**> the principal coordinates, which are initialized within the method.
+ *
+ * The axes are computed from the condensed form, so the square matrix is not formed,
+ * and only the requested axes are found rather than a full eigendecomposition. As
+ * by scikit-bio, negative eigenvalues are reported as zero with zero coordinates,
+ * and the proportion explained is relative to the trace of the centered matrix.
+ */
+EXTERN void pcoa_mat(mat_t* dm, unsigned int n_axes, unsigned int threads, ordination_t** result);
+
+/* Compute UniFrac and its principal coordinates
+ *
+ * The parameters and error codes are as for one_off, with n_axes as for pcoa_mat, and
+ *
+ * result <ordination_t**> the principal coordinates, which are initialized within the
+ *      method if okay is returned.
+ *
+ * The distance matrix is not kept.
+ */
+EXTERN ComputeStatus one_off_pcoa(const char* biom_filename, const char* tree_filename,
+                                  const char* unifrac_method, bool variance_adjust, double alpha,
+                                  bool bypass_tips, unsigned int threads, unsigned int n_axes,
+                                  ordination_t** result);
+
+/* Test for differences among groups of samples by PERMANOVA
+ *
+ * dm <mat_t*> an upper triangle distance matrix, as from one_off or merge_partial.
+ * grouping <const unsigned int*> the group of each sample of dm, in [0, n_groups).
+ * n_groups <uint> the number of groups.
+ * permutations <uint> the number of permutations of the grouping.
+ * seed <uint64_t> the random seed. Permutation p is drawn with seed + p, so the
+ *      result does not depend on the number of threads.
+ * threads <uint> the number of threads, over which the permutations are divided.
+ * result <permutation_test_t*> the test result, an output.
+ *
+ * The statistic is the pseudo-F of scikit-bio's permanova. Each permutation is
+ * a pass over the condensed form, so the square matrix is not formed.
+ *
+ * The following error codes are returned:
+ *
+ * okay             : no problems encountered
+ * grouping_invalid : a group is outside of [0, n_groups) or has no samples, or
+ *                    there are fewer than two groups, or each sample is its
+ *                    own group
+ */
+EXTERN ComputeStatus permanova_mat(mat_t* dm, const unsigned int* grouping, unsigned int n_groups,
+                                   unsigned int permutations, uint64_t seed, unsigned int threads,
+                                   permutation_test_t* result);
+
+/* Test for differences in dispersion among groups of samples by PERMDISP
+ *
+ * The parameters and error codes are as for permanova_mat.
+ *
+ * The statistic is the F of the distances of the samples to the centroids of
+ * their groups, as by scikit-bio's permdisp with test="centroid". The distances
+ * are from the condensed form, rather than a principal coordinates analysis. Where
+ * the matrix is not Euclidean, they are of the positive axes less the negative,
+ * as by vegan's betadisper, whereas scikit-bio drops the negative axes.
+ */
+EXTERN ComputeStatus permdisp_mat(mat_t* dm, const unsigned int* grouping, unsigned int n_groups,
+                                  unsigned int permutations, uint64_t seed, unsigned int threads,
+                                  permutation_test_t* result);
+
+/* Load a table and tree from which ranges of stripes can be computed
+ *
+ * The parameters and error codes are as for partial, without the threads and
+ * stripes, and with
+ *
+ * result <stripe_stream_t**> the stream, which is initialized within the method
+ *      if okay is returned, and must be destroyed with destroy_stripe_stream.
+ *
+ * Computing each range with stream_stripes, rather than partial, reads the
+ * inputs once, so a matrix can be computed, and consumed, a block of stripes
+ * at a time.
+ */
+EXTERN ComputeStatus open_stripe_stream(const char* biom_filename, const char* tree_filename,
+                                        const char* unifrac_method, bool variance_adjust, double alpha,
+                                        bool bypass_tips, stripe_stream_t** result);
+
+/* Compute a range of stripes of a stream
+ *
+ * stream <stripe_stream_t*> an open stream.
+ * threads <uint> the number of threads to use.
+ * stripe_start <uint> the first stripe to compute.
+ * stripe_stop <uint> the stripe after the last to compute.
+ * result <partial_mat_t**> the stripes, as for partial.
+ *
+ * The following error codes are returned:
+ *
+ * okay                  : no problems encountered
+ * stripes_out_of_bounds : the stop stripe is not after the start, or is past the last stripe
+ *
+ * A stream may be used by one call at a time.
+ */
+EXTERN ComputeStatus stream_stripes(stripe_stream_t* stream, unsigned int threads, unsigned int stripe_start,
+                                    unsigned int stripe_stop, partial_mat_t** result);
+
+/* Configure the worker pool of the library
+ *
+ * size <uint> the number of workers, or 0 for the number of processors
+ *      available to the process.
+ * bind_to_cores <bool> bind each worker to a processor, wrapping around if
+ *      there are more workers than processors.
+ *
+ * The computations of all calls run on a pool of workers which is created on
+ * first use, by default with a worker bound to each processor. The threads of
+ * a call are the most of its tasks which run at once, and calls made from
+ * several threads share the workers. If the pool exists, its workers finish
+ * their current tasks and are replaced.
+ */
+EXTERN void configure_worker_pool(unsigned int size, bool bind_to_cores);
+
+/* The number of workers of the pool, which is created if it does not exist */
+EXTERN unsigned int worker_pool_size();
+
 /* Write a partial matrix object
  *
  * filename <const char*> the file to write into
@@ -250,6 +1045,75 @@ EXTERN IOStatus read_partial(const char* filename, partial_mat_t** result);
  */
 EXTERN MergeStatus merge_partial(partial_mat_t** partial_mats, int n_partials, unsigned int nthreads, mat_t** result);
 
+/* Merge partial results into a square matrix
+ *
+ * The parameters and error codes are as for merge_partial, except that
+ *
+ * result <mat_full_t**> the full matrix in square form, which is initialized within
+ *      the method if merge_okay is returned.
+ *
+ * The partial results are consumed: each stripe is freed once it has been written,
+ * and its pointer set to NULL, so that the stripes and the matrix are not all held
+ * at once. The partials must still be destroyed.
+ */
+EXTERN MergeStatus merge_partial_matrix(partial_mat_t** partial_mats, int n_partials, unsigned int nthreads,
+                                        mat_full_t** result);
+
+/* Measure the cost model of a computation
+ *
+ * biom_filename <const char*> the filename to the biom table.
+ * tree_filename <const char*> the filename to the correspodning tree.
+ * unifrac_method <const char*> the requested unifrac method.
+ * variance_adjust <bool> whether to apply variance adjustment.
+ * bypass_tips <bool> disregard tips, reduces compute by about 50%
+ * model <cost_model_t*> the measured model, an output.
+ *
+ * The table and tree are loaded, and a few stripes are computed on a single
+ * thread to separate the per node and per stripe costs.
+ *
+ * calibrate_cost_model returns the error codes of one_off.
+ */
+EXTERN ComputeStatus calibrate_cost_model(const char* biom_filename, const char* tree_filename,
+                                          const char* unifrac_method, bool variance_adjust,
+                                          bool bypass_tips, cost_model_t* model);
+
+/* Plan the partitions and threads of a computation
+ *
+ * biom_filename <const char*> the filename to the biom table.
+ * tree_filename <const char*> the filename to the correspodning tree.
+ * unifrac_method <const char*> the requested unifrac method.
+ * variance_adjust <bool> whether to apply variance adjustment.
+ * model <const cost_model_t*> the cost model, or NULL for a default model
+ *      measured on a contemporary x86-64 core.
+ * memory_limit <uint64_t> the memory of each job in bytes, or 0 for no limit.
+ * time_limit <double> the compute time of each job in seconds, or 0 for no limit.
+ * max_threads <uint> the most threads a job may use.
+ * n_partials <uint> the number of partitions, or 0 to choose the fewest
+ *      within the limits.
+ * result <partial_plan_t**> the plan, this is initialized within the method so using **
+ *
+ * Only the shape of the table is read, and the tree is scanned rather than
+ * parsed, so planning is quick and light even for inputs too large to
+ * compute in one job. Each job is given as many threads as memory allows.
+ * If no plan is within the limits, the plan with the most partitions is
+ * returned, and is marked as not feasible.
+ *
+ * plan_partials returns the following error codes:
+ *
+ * okay           : no problems encountered
+ * table_missing  : the filename for the table does not exist
+ * tree_missing   : the filename for the tree does not exist
+ * unknown_method : the requested method is unknown.
+ * table_empty    : the table does not have any entries
+ * table_bad_format_version      : the table is not a BIOM-Format 2.1 file
+ * tree_malformed                : the tree does not have any nodes
+ */
+EXTERN ComputeStatus plan_partials(const char* biom_filename, const char* tree_filename,
+                                   const char* unifrac_method, bool variance_adjust,
+                                   const cost_model_t* model, uint64_t memory_limit,
+                                   double time_limit, unsigned int max_threads,
+                                   unsigned int n_partials, partial_plan_t** result);
+
 #ifdef __cplusplus
 // TODO: only needed for testing, should be encased in a macro
 void set_tasks(std::vector<su::task_parameters> &tasks,
@@ -0,0 +1,216 @@
+#include <iostream>
+#include <fstream>
+#include <string>
+#include <vector>
+#include <chrono>
+#include <unordered_set>
+#include <sys/resource.h>
+#include <unistd.h>
+#include "api.hpp"
+#include "cmd.hpp"
+#include "tree.hpp"
+#include "biom.hpp"
+
+
+void usage() {
+    std::cout << "usage: ssu_bench -i <biom> -t <newick> -m [METHOD] [-n threads] [-a alpha] [-f] [--vaw]" << std::endl;
+    std::cout << "    [--repeats number_of_repeats] [--n-partials number_of_partitions] [--tmp <dir>]" << std::endl;
+    std::cout << std::endl;
+    std::cout << "    -i\t\tThe input BIOM table." << std::endl;
+    std::cout << "    -t\t\tThe input phylogeny in newick." << std::endl;
+    std::cout << "    -m\t\tThe method, [unweighted | weighted_normalized | weighted_unnormalized | generalized]." << std::endl;
+    std::cout << "    -n\t\t[OPTIONAL] The number of threads, default is 1." << std::endl;
+    std::cout << "    -a\t\t[OPTIONAL] Generalized UniFrac alpha, default is 1." << std::endl;
+    std::cout << "    -f\t\t[OPTIONAL] Bypass tips, reduces compute by about 50%." << std::endl;
+    std::cout << "    --vaw\t[OPTIONAL] Variance adjusted, default is to not adjust for variance." << std::endl;
+    std::cout << "    --repeats\t[OPTIONAL] The number of times each phase is timed, default is 3." << std::endl;
+    std::cout << "    --n-partials\t[OPTIONAL] The number of partitions merged in the merge phase, default is 4." << std::endl;
+    std::cout << "    --tmp\t[OPTIONAL] The directory for the output of the write phase, default is /tmp." << std::endl;
+    std::cout << std::endl;
+    std::cout << "The wall clock seconds of each repeat of each phase, and the peak resident set size," << std::endl;
+    std::cout << "are written to standard output as JSON. The phases are:" << std::endl;
+    std::cout << std::endl;
+    std::cout << "    load    : read the table." << std::endl;
+    std::cout << "    parse   : parse the tree." << std::endl;
+    std::cout << "    shear   : shear the tree to the table observations." << std::endl;
+    std::cout << "    one_off : compute the distance matrix from the files." << std::endl;
+    std::cout << "    partial : compute the stripes of the matrix in --n-partials partitions." << std::endl;
+    std::cout << "    merge   : merge the partitions into a distance matrix." << std::endl;
+    std::cout << "    write   : write the distance matrix." << std::endl;
+    std::cout << std::endl;
+}
+
+double seconds_since(std::chrono::steady_clock::time_point start) {
+    std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - start;
+    return elapsed.count();
+}
+
+// peak resident set size of this process in kilobytes
+long max_rss_kb() {
+    struct rusage usage;
+    getrusage(RUSAGE_SELF, &usage);
+#ifdef __APPLE__
+    return usage.ru_maxrss / 1024;  // reported in bytes
+#else
+    return usage.ru_maxrss;
+#endif
+}
+
+std::string json_string(const std::string &s) {
+    std::string out = "\"";
+    for(char c : s) {
+        if(c == '"' || c == '\\')
+            out += '\\';
+        out += c;
+    }
+    return out + "\"";
+}
+
+void write_phase(const std::string &name, const std::vector<double> &timings, bool last) {
+    std::cout << "    " << json_string(name) << ": [";
+    for(unsigned int i = 0; i < timings.size(); i++)
+        std::cout << (i ? ", " : "") << timings[i];
+    std::cout << "]" << (last ? "" : ",") << std::endl;
+}
+
+int fail(const std::string &phase, int status) {
+    std::cerr << "The " << phase << " phase failed with status " << status << "." << std::endl;
+    return EXIT_FAILURE;
+}
+
+int main(int argc, char **argv) {
+    InputParser input(argc, argv);
+    if(input.cmdOptionExists("-h") || input.cmdOptionExists("--help") || argc == 1) {
+        usage();
+        return EXIT_SUCCESS;
+    }
+
+    const std::string &table_filename = input.getCmdOption("-i");
+    const std::string &tree_filename = input.getCmdOption("-t");
+    const std::string &method_string = input.getCmdOption("-m");
+    const std::string &nthreads_arg = input.getCmdOption("-n");
+    const std::string &gunifrac_arg = input.getCmdOption("-a");
+    const std::string &repeats_arg = input.getCmdOption("--repeats");
+    const std::string &n_partials_arg = input.getCmdOption("--n-partials");
+    const std::string &tmp_arg = input.getCmdOption("--tmp");
+    bool vaw = input.cmdOptionExists("--vaw");
+    bool bypass_tips = input.cmdOptionExists("-f");
+
+    if(table_filename.empty() || tree_filename.empty() || method_string.empty()) {
+        std::cerr << "The table, tree and method must be specified." << std::endl;
+        usage();
+        return EXIT_FAILURE;
+    }
+
+    unsigned int nthreads = nthreads_arg.empty() ? 1 : atoi(nthreads_arg.c_str());
+    double alpha = gunifrac_arg.empty() ? 1.0 : atof(gunifrac_arg.c_str());
+    unsigned int repeats = repeats_arg.empty() ? 3 : atoi(repeats_arg.c_str());
+    unsigned int n_partials = n_partials_arg.empty() ? 4 : atoi(n_partials_arg.c_str());
+    std::string tmp = tmp_arg.empty() ? "/tmp" : tmp_arg;
+    std::string output_filename = tmp + "/ssu_bench." + std::to_string(getpid()) + ".dm";
+
+    if(repeats == 0 || n_partials == 0 || nthreads == 0) {
+        std::cerr << "The threads, repeats and partitions must be positive." << std::endl;
+        return EXIT_FAILURE;
+    }
+
+    std::vector<double> load, parse, shear, one_off_, partial_, merge, write;
+    unsigned int n_samples = 0;
+    unsigned int n_obs = 0;
+    uint32_t n_tips = 0;
+
+    for(unsigned int r = 0; r < repeats; r++) {
+        auto start = std::chrono::steady_clock::now();
+        su::biom table(table_filename);
+        load.push_back(seconds_since(start));
+        n_samples = table.n_samples;
+        n_obs = table.n_obs;
+
+        start = std::chrono::steady_clock::now();
+        std::ifstream ifs(tree_filename.c_str());
+        std::string content = std::string(std::istreambuf_iterator<char>(ifs),
+                                           std::istreambuf_iterator<char>());
+        su::BPTree tree(content);
+        parse.push_back(seconds_since(start));
+
+        n_tips = 0;
+        for(uint32_t i = 0; i < tree.nparens; i++)
+            if(tree.isleaf(i))
+                n_tips++;
+
+        start = std::chrono::steady_clock::now();
+        std::unordered_set<std::string> to_keep(table.obs_ids.begin(), table.obs_ids.end());
+        su::BPTree tree_sheared = tree.shear_collapse(to_keep);
+        shear.push_back(seconds_since(start));
+    }
+
+    unsigned int n_stripes = (n_samples + 1) / 2;
+    if(n_partials > n_stripes)
+        n_partials = n_stripes;
+
+    for(unsigned int r = 0; r < repeats; r++) {
+        mat_t *result = NULL;
+        auto start = std::chrono::steady_clock::now();
+        int status = one_off(table_filename.c_str(), tree_filename.c_str(), method_string.c_str(),
+                             vaw, alpha, bypass_tips, nthreads, &result);
+        if(status != okay)
+            return fail("one_off", status);
+        one_off_.push_back(seconds_since(start));
+        destroy_mat(&result);
+
+        std::vector<partial_mat_t*> partials(n_partials);
+        start = std::chrono::steady_clock::now();
+        for(unsigned int p = 0; p < n_partials; p++) {
+            unsigned int stripe_start = (n_stripes * p) / n_partials;
+            unsigned int stripe_stop = (n_stripes * (p + 1)) / n_partials;
+            status = partial(table_filename.c_str(), tree_filename.c_str(), method_string.c_str(),
+                             vaw, alpha, bypass_tips, nthreads, stripe_start, stripe_stop, &partials[p]);
+            if(status != okay)
+                return fail("partial", status);
+        }
+        partial_.push_back(seconds_since(start));
+
+        start = std::chrono::steady_clock::now();
+        status = merge_partial(partials.data(), n_partials, nthreads, &result);
+        if(status != merge_okay)
+            return fail("merge", status);
+        merge.push_back(seconds_since(start));
+        for(unsigned int p = 0; p < n_partials; p++)
+            destroy_partial_mat(&partials[p]);
+
+        start = std::chrono::steady_clock::now();
+        status = write_mat(output_filename.c_str(), result);
+        if(status != write_okay)
+            return fail("write", status);
+        write.push_back(seconds_since(start));
+        destroy_mat(&result);
+        unlink(output_filename.c_str());
+    }
+
+    std::cout << "{" << std::endl;
+    std::cout << "  \"table\": " << json_string(table_filename) << "," << std::endl;
+    std::cout << "  \"tree\": " << json_string(tree_filename) << "," << std::endl;
+    std::cout << "  \"n_samples\": " << n_samples << "," << std::endl;
+    std::cout << "  \"n_obs\": " << n_obs << "," << std::endl;
+    std::cout << "  \"n_tips\": " << n_tips << "," << std::endl;
+    std::cout << "  \"method\": " << json_string(method_string) << "," << std::endl;
+    std::cout << "  \"variance_adjusted\": " << (vaw ? "true" : "false") << "," << std::endl;
+    std::cout << "  \"bypass_tips\": " << (bypass_tips ? "true" : "false") << "," << std::endl;
+    std::cout << "  \"alpha\": " << alpha << "," << std::endl;
+    std::cout << "  \"threads\": " << nthreads << "," << std::endl;
+    std::cout << "  \"n_partials\": " << n_partials << "," << std::endl;
+    std::cout << "  \"max_rss_kb\": " << max_rss_kb() << "," << std::endl;
+    std::cout << "  \"phases\": {" << std::endl;
+    std::cout.precision(9);
+    write_phase("load", load, false);
+    write_phase("parse", parse, false);
+    write_phase("shear", shear, false);
+    write_phase("one_off", one_off_, false);
+    write_phase("partial", partial_, false);
+    write_phase("merge", merge, false);
+    write_phase("write", write, true);
+    std::cout << "  }" << std::endl;
+    std::cout << "}" << std::endl;
+
+    return EXIT_SUCCESS;
+}
@@ -1,6 +1,11 @@
 #include <cstdlib>
 #include <iostream>
 #include <stdio.h>
+#include <algorithm>
+#include <cstring>
+#include <stdexcept>
+#include <random>
+#include <unordered_set>
 #include "biom.hpp"
 
 using namespace H5;
@@ -17,30 +22,45 @@ const std::string SAMPLE_INDICES = std::string("/sample/matrix/indices");
 const std::string SAMPLE_DATA = std::string("/sample/matrix/data");
 const std::string SAMPLE_IDS = std::string("/sample/ids");
 
-biom::biom(std::string filename) {
-    file = H5File(filename.c_str(), H5F_ACC_RDONLY);
+/* the number of entries transferred per read of the observation matrix */
+const hsize_t OBS_READ_BLOCK = 1 << 22;
+/* the most entries between two requested sample columns which are read
+ * through, rather than starting a new read
+ */
+const hsize_t SUBSET_READ_GAP = 1 << 16;
 
-    /* establish the datasets */
-    obs_indices = file.openDataSet(OBS_INDICES.c_str());
-    obs_data = file.openDataSet(OBS_DATA.c_str());
-    sample_indices = file.openDataSet(SAMPLE_INDICES.c_str());
-    sample_data = file.openDataSet(SAMPLE_DATA.c_str());
-    
-    /* cache IDs and indptr */
-    sample_ids = std::vector<std::string>();
-    obs_ids = std::vector<std::string>();
-    sample_indptr = std::vector<uint32_t>();
-    obs_indptr = std::vector<uint32_t>();
-
-    load_ids(OBS_IDS.c_str(), obs_ids);
-    load_ids(SAMPLE_IDS.c_str(), sample_ids);
-    load_indptr(OBS_INDPTR.c_str(), obs_indptr);    
-    load_indptr(SAMPLE_INDPTR.c_str(), sample_indptr);    
-
-    /* cache shape and nnz info */
-    n_samples = sample_ids.size();
-    n_obs = obs_ids.size();
-    set_nnz();
+biom::biom(std::string filename) {
+    // failures are reported to the caller rather than printed by HDF5
+    Exception::dontPrint();
+    sample_counts = NULL;
+
+    try {
+        file = H5File(filename.c_str(), H5F_ACC_RDONLY);
+        check_format_version();
+
+        /* cache IDs and indptr */
+        sample_ids = std::vector<std::string>();
+        obs_ids = std::vector<std::string>();
+        sample_indptr = std::vector<uint32_t>();
+        obs_indptr = std::vector<uint32_t>();
+
+        load_ids(OBS_IDS.c_str(), obs_ids);
+        load_ids(SAMPLE_IDS.c_str(), sample_ids);
+        load_indptr(OBS_INDPTR.c_str(), obs_indptr);    
+        load_indptr(SAMPLE_INDPTR.c_str(), sample_indptr);    
+
+        /* cache shape and nnz info */
+        n_samples = sample_ids.size();
+        n_obs = obs_ids.size();
+        set_nnz();
+
+        /* load obs sparse data */
+        load_obs_matrix();
+    } catch(Exception &e) {
+        // not HDF5, or missing a required dataset
+        free(sample_counts);
+        throw std::invalid_argument("Table does not appear to be a BIOM-Format v2.1");
+    }
 
     /* define a mapping between an ID and its corresponding offset */
     obs_id_index = std::unordered_map<std::string, uint32_t>();
@@ -49,51 +69,452 @@ biom::biom(std::string filename) {
     create_id_index(obs_ids, obs_id_index);
     create_id_index(sample_ids, sample_id_index);
 
-    /* load obs sparse data */
-    obs_indices_resident = (uint32_t**)malloc(sizeof(uint32_t**) * n_obs);
-    if(obs_indices_resident == NULL) {
-        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n", 
-                sizeof(uint32_t**) * n_obs, __FILE__, __LINE__);
+    /* everything needed is resident */
+    file.close();
+}
+
+// splitmix64, to derive well mixed seeds from correlated ones
+static inline uint64_t mix_seed(uint64_t x) {
+    x += 0x9e3779b97f4a7c15ULL;
+    x = (x ^ (x >> 30)) * 0xbf58476d1ce4e5b9ULL;
+    x = (x ^ (x >> 27)) * 0x94d049bb133111ebULL;
+    return x ^ (x >> 31);
+}
+
+// a uniform integer in [0, n), without the modulo bias
+static inline uint64_t uniform_below(std::mt19937_64 &rng, uint64_t n) {
+    uint64_t threshold = (0 - n) % n;
+    uint64_t x = rng();
+    while(x < threshold)
+        x = rng();
+    return x % n;
+}
+
+biom::biom(const biom &source, uint32_t depth, uint64_t seed) {
+    n_obs = source.n_obs;
+    obs_ids = source.obs_ids;
+    obs_id_index = source.obs_id_index;
+
+    // the counts of each sample, from the observation axis
+    std::vector<uint32_t> sample_nnz(source.n_samples + 1, 0);
+    for(uint32_t i = 0; i < source.nnz; i++)
+        sample_nnz[source.obs_indices_resident[i] + 1]++;
+    for(uint32_t i = 0; i < source.n_samples; i++)
+        sample_nnz[i + 1] += sample_nnz[i];
+
+    std::vector<uint32_t> entry_obs(source.nnz);
+    std::vector<uint64_t> entry_counts(source.nnz);
+    std::vector<uint32_t> fill(sample_nnz.begin(), sample_nnz.end() - 1);
+    for(uint32_t obs = 0; obs < source.n_obs; obs++) {
+        for(uint32_t i = source.obs_indptr[obs]; i < source.obs_indptr[obs + 1]; i++) {
+            uint32_t pos = fill[source.obs_indices_resident[i]]++;
+            double v = source.obs_data_resident[i];
+            entry_obs[pos] = obs;
+            entry_counts[pos] = v > 0 ? (uint64_t)v : 0;
+        }
+    }
+
+    // draw depth positions of the sample's counts without replacement
+    // (Floyd), and attribute them to observations
+    std::vector<uint32_t> kept;
+    std::vector<uint32_t> drawn_obs;
+    std::vector<double> drawn_counts;
+    std::vector<uint32_t> drawn_indptr(1, 0);
+    std::unordered_set<uint64_t> chosen;
+    std::vector<uint64_t> positions;
+    for(uint32_t s = 0; s < source.n_samples; s++) {
+        uint64_t total = 0;
+        for(uint32_t i = sample_nnz[s]; i < sample_nnz[s + 1]; i++)
+            total += entry_counts[i];
+        if(total < depth)
+            continue;
+
+        std::mt19937_64 rng(mix_seed(seed ^ mix_seed(s)));
+        chosen.clear();
+        for(uint64_t j = total - depth; j < total; j++) {
+            uint64_t t = uniform_below(rng, j + 1);
+            if(!chosen.insert(t).second)
+                chosen.insert(j);
+        }
+        positions.assign(chosen.begin(), chosen.end());
+        std::sort(positions.begin(), positions.end());
+
+        uint64_t upper = 0;
+        auto position = positions.begin();
+        for(uint32_t i = sample_nnz[s]; i < sample_nnz[s + 1]; i++) {
+            upper += entry_counts[i];
+            uint64_t taken = 0;
+            while(position != positions.end() && *position < upper) {
+                taken++;
+                position++;
+            }
+            if(taken > 0) {
+                drawn_obs.push_back(entry_obs[i]);
+                drawn_counts.push_back(taken);
+            }
+        }
+        drawn_indptr.push_back(drawn_obs.size());
+        kept.push_back(s);
+    }
+
+    n_samples = kept.size();
+    nnz = drawn_obs.size();
+    for(auto s : kept)
+        sample_ids.push_back(source.sample_ids[s]);
+    sample_indptr = drawn_indptr;
+
+    // and back to the observation axis
+    obs_indptr.assign(n_obs + 1, 0);
+    for(auto obs : drawn_obs)
+        obs_indptr[obs + 1]++;
+    for(uint32_t i = 0; i < n_obs; i++)
+        obs_indptr[i + 1] += obs_indptr[i];
+
+    obs_indices_resident.resize(nnz);
+    obs_data_resident.resize(nnz);
+    fill.assign(obs_indptr.begin(), obs_indptr.end() - 1);
+    for(uint32_t s = 0; s < n_samples; s++) {
+        for(uint32_t i = drawn_indptr[s]; i < drawn_indptr[s + 1]; i++) {
+            uint32_t pos = fill[drawn_obs[i]]++;
+            obs_indices_resident[pos] = s;
+            obs_data_resident[pos] = drawn_counts[i];
+        }
+    }
+
+    sample_counts = (double*)calloc(sizeof(double), n_samples);
+    if(sample_counts == NULL) {
+        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n",
+                sizeof(double) * n_samples, __FILE__, __LINE__);
         exit(EXIT_FAILURE);
     }
-    obs_data_resident = (double**)malloc(sizeof(double**) * n_obs);
-    if(obs_data_resident == NULL) {
-        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n", 
-                sizeof(double**) * n_obs, __FILE__, __LINE__);
+    for(uint32_t s = 0; s < n_samples; s++)
+        sample_counts[s] = depth;
+
+    create_id_index(sample_ids, sample_id_index);
+}
+
+biom::biom(const biom &source, const std::vector<uint32_t> &samples) {
+    n_obs = source.n_obs;
+    obs_ids = source.obs_ids;
+    obs_id_index = source.obs_id_index;
+    n_samples = samples.size();
+
+    sample_counts = (double*)calloc(sizeof(double), std::max(n_samples, 1U));
+    if(sample_counts == NULL) {
+        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n",
+                sizeof(double) * n_samples, __FILE__, __LINE__);
         exit(EXIT_FAILURE);
     }
-    obs_counts_resident = (unsigned int*)malloc(sizeof(unsigned int) * n_obs);
-    if(obs_counts_resident == NULL) {
+
+    // the positions of each sample of source, as a sample may be selected
+    // more than once
+    std::vector<uint32_t> positions_indptr(source.n_samples + 1, 0);
+    for(auto s : samples)
+        positions_indptr[s + 1]++;
+    for(uint32_t i = 0; i < source.n_samples; i++)
+        positions_indptr[i + 1] += positions_indptr[i];
+    std::vector<uint32_t> positions(n_samples);
+    std::vector<uint32_t> fill(positions_indptr.begin(), positions_indptr.end() - 1);
+    for(uint32_t i = 0; i < n_samples; i++) {
+        positions[fill[samples[i]]++] = i;
+        sample_ids.push_back(source.sample_ids[samples[i]]);
+        sample_counts[i] = source.sample_counts[samples[i]];
+    }
+
+    std::vector<uint32_t> sample_nnz(n_samples + 1, 0);
+    obs_indptr.push_back(0);
+    for(uint32_t obs = 0; obs < n_obs; obs++) {
+        for(uint32_t i = source.obs_indptr[obs]; i < source.obs_indptr[obs + 1]; i++) {
+            uint32_t s = source.obs_indices_resident[i];
+            for(uint32_t p = positions_indptr[s]; p < positions_indptr[s + 1]; p++) {
+                obs_indices_resident.push_back(positions[p]);
+                obs_data_resident.push_back(source.obs_data_resident[i]);
+                sample_nnz[positions[p] + 1]++;
+            }
+        }
+        obs_indptr.push_back(obs_indices_resident.size());
+    }
+    nnz = obs_indices_resident.size();
+
+    for(uint32_t i = 0; i < n_samples; i++)
+        sample_nnz[i + 1] += sample_nnz[i];
+    sample_indptr = sample_nnz;
+
+    create_id_index(sample_ids, sample_id_index);
+}
+
+biom::~biom() {
+    free(sample_counts);
+}
+
+void biom::load_obs_matrix() {
+    sample_counts = (double*)calloc(sizeof(double), n_samples);
+    if(sample_counts == NULL) {
         fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n", 
-                sizeof(unsigned int) * n_obs, __FILE__, __LINE__);
+                sizeof(double) * n_samples, __FILE__, __LINE__);
         exit(EXIT_FAILURE);
     }
 
-    uint32_t *current_indices = NULL;
-    double *current_data = NULL;
-    for(unsigned int i = 0; i < obs_ids.size(); i++)  {
-        std::string id_ = obs_ids[i];
-        unsigned int n = get_obs_data_direct(id_, current_indices, current_data);
-        obs_counts_resident[i] = n;
-        obs_indices_resident[i] = current_indices;
-        obs_data_resident[i] = current_data;
+    obs_indices_resident.resize(nnz);
+    obs_data_resident.resize(nnz);
+    if(nnz == 0)
+        return;
+
+    DataSet obs_indices = file.openDataSet(OBS_INDICES.c_str());
+    DataSet obs_data = file.openDataSet(OBS_DATA.c_str());
+    DataSpace indices_dataspace = obs_indices.getSpace();
+    DataSpace data_dataspace = obs_data.getSpace();
+
+    for(hsize_t start = 0; start < nnz; start += OBS_READ_BLOCK) {
+        hsize_t count[1] = {std::min((hsize_t)nnz - start, OBS_READ_BLOCK)};
+        hsize_t offset[1] = {start};
+        DataSpace memspace(1, count, NULL);
+
+        indices_dataspace.selectHyperslab(H5S_SELECT_SET, count, offset); 
+        data_dataspace.selectHyperslab(H5S_SELECT_SET, count, offset); 
+
+        // let HDF5 convert from the stored types to our native types
+        uint32_t *indices = obs_indices_resident.data() + start;
+        double *data = obs_data_resident.data() + start;
+        obs_indices.read((void*)indices, PredType::NATIVE_UINT32, memspace, indices_dataspace);
+        obs_data.read((void*)data, PredType::NATIVE_DOUBLE, memspace, data_dataspace);
+
+        for(hsize_t j = 0; j < count[0]; j++)
+            sample_counts[indices[j]] += data[j];
     }
-    sample_counts = get_sample_counts();
 }
 
-biom::~biom() {
-    for(unsigned int i = 0; i < n_obs; i++) {
-        free(obs_indices_resident[i]);
-        free(obs_data_resident[i]);
+// the number of entries of a one dimensional dataset
+static uint32_t dataset_length(H5File &file, const std::string &path) {
+    DataSet ds = file.openDataSet(path.c_str());
+    hsize_t dims[1];
+    ds.getSpace().getSimpleExtentDims(dims, NULL);
+    return dims[0];
+}
+
+static void check_version(H5File &file) {
+    if(!file.attrExists("format-version"))
+        throw std::invalid_argument("Table does not appear to be a BIOM-Format v2.1");
+
+    Attribute attr = file.openAttribute("format-version");
+    hsize_t dims[1] = {0};
+    attr.getSpace().getSimpleExtentDims(dims, NULL);
+    if(dims[0] != 2)
+        throw std::invalid_argument("Table does not appear to be a BIOM-Format v2.1");
+
+    uint32_t version[2];
+    attr.read(PredType::NATIVE_UINT32, version);
+    if(version[0] != 2 || version[1] != 1)
+        throw std::invalid_argument("Table does not appear to be a BIOM-Format v2.1");
+}
+
+void biom::check_format_version() {
+    check_version(file);
+}
+
+void biom::read_shape(const std::string &filename, uint32_t &n_obs,
+                      uint32_t &n_samples, uint32_t &nnz) {
+    Exception::dontPrint();
+    try {
+        H5File file(filename.c_str(), H5F_ACC_RDONLY);
+        check_version(file);
+        n_obs = dataset_length(file, OBS_IDS);
+        n_samples = dataset_length(file, SAMPLE_IDS);
+        nnz = dataset_length(file, OBS_DATA);
+        file.close();
+    } catch(Exception &e) {
+        throw std::invalid_argument("Table does not appear to be a BIOM-Format v2.1");
+    }
+}
+
+
+biom::biom(std::string filename, const std::vector<std::string> *sample_subset,
+           const std::vector<std::string> *obs_subset) {
+    Exception::dontPrint();
+    sample_counts = NULL;
+
+    std::vector<std::string> all_obs_ids;
+    std::vector<std::string> all_sample_ids;
+    std::vector<uint32_t> all_sample_indptr;
+    std::vector<uint32_t> columns;
+    std::vector<uint32_t> entry_obs;
+    std::vector<double> entry_data;
+
+    try {
+        file = H5File(filename.c_str(), H5F_ACC_RDONLY);
+        check_format_version();
+
+        load_ids(OBS_IDS.c_str(), all_obs_ids);
+        load_ids(SAMPLE_IDS.c_str(), all_sample_ids);
+        load_indptr(SAMPLE_INDPTR.c_str(), all_sample_indptr);
+        if(all_sample_indptr.size() != all_sample_ids.size() + 1)
+            throw std::invalid_argument("Table does not appear to be a BIOM-Format v2.1");
+
+        if(sample_subset == NULL) {
+            columns.resize(all_sample_ids.size());
+            for(uint32_t i = 0; i < columns.size(); i++)
+                columns[i] = i;
+        } else {
+            std::unordered_map<std::string, uint32_t> all_sample_index;
+            create_id_index(all_sample_ids, all_sample_index);
+            std::vector<bool> selected(all_sample_ids.size(), false);
+            for(auto &id : *sample_subset) {
+                auto found = all_sample_index.find(id);
+                if(found == all_sample_index.end())
+                    throw std::out_of_range("Sample not in the table: " + id);
+                selected[found->second] = true;
+            }
+            for(uint32_t i = 0; i < selected.size(); i++)
+                if(selected[i])
+                    columns.push_back(i);
+        }
+
+        load_sample_columns(all_sample_indptr, columns, entry_obs, entry_data);
+    } catch(Exception &e) {
+        throw std::invalid_argument("Table does not appear to be a BIOM-Format v2.1");
+    }
+    file.close();
+
+    uint32_t all_n_obs = all_obs_ids.size();
+    std::vector<bool> obs_selected(all_n_obs, obs_subset == NULL);
+    if(obs_subset != NULL) {
+        std::unordered_map<std::string, uint32_t> all_obs_index;
+        create_id_index(all_obs_ids, all_obs_index);
+        for(auto &id : *obs_subset) {
+            auto found = all_obs_index.find(id);
+            if(found != all_obs_index.end())
+                obs_selected[found->second] = true;
+        }
+    }
+
+    // the kept entries of each observation, where zeros are not kept
+    std::vector<uint32_t> obs_nnz(all_n_obs, 0);
+    for(uint32_t i = 0; i < entry_obs.size(); i++) {
+        if(entry_obs[i] >= all_n_obs)
+            throw std::invalid_argument("Table does not appear to be a BIOM-Format v2.1");
+        if(obs_selected[entry_obs[i]] && entry_data[i] != 0.0)
+            obs_nnz[entry_obs[i]]++;
+    }
+
+    // drop the observations without any kept entry, and renumber the rest
+    std::vector<uint32_t> obs_position(all_n_obs, 0);
+    obs_indptr.push_back(0);
+    for(uint32_t obs = 0; obs < all_n_obs; obs++) {
+        if(obs_nnz[obs] == 0)
+            continue;
+        obs_position[obs] = obs_ids.size();
+        obs_ids.push_back(all_obs_ids[obs]);
+        obs_indptr.push_back(obs_indptr.back() + obs_nnz[obs]);
+    }
+
+    n_obs = obs_ids.size();
+    n_samples = columns.size();
+    nnz = obs_indptr.back();
+    for(auto column : columns)
+        sample_ids.push_back(all_sample_ids[column]);
+
+    sample_counts = (double*)calloc(sizeof(double), n_samples);
+    if(sample_counts == NULL) {
+        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n",
+                sizeof(double) * n_samples, __FILE__, __LINE__);
+        exit(EXIT_FAILURE);
+    }
+
+    // and transpose to the observation axis
+    obs_indices_resident.resize(nnz);
+    obs_data_resident.resize(nnz);
+    sample_indptr.assign(1, 0);
+    std::vector<uint32_t> fill(obs_indptr.begin(), obs_indptr.end() - 1);
+    uint32_t entry = 0;
+    for(uint32_t s = 0; s < n_samples; s++) {
+        uint32_t column = columns[s];
+        uint32_t stop = entry + all_sample_indptr[column + 1] - all_sample_indptr[column];
+        uint32_t kept = 0;
+        for(; entry < stop; entry++) {
+            uint32_t obs = entry_obs[entry];
+            if(!obs_selected[obs] || entry_data[entry] == 0.0)
+                continue;
+            uint32_t pos = fill[obs_position[obs]]++;
+            obs_indices_resident[pos] = s;
+            obs_data_resident[pos] = entry_data[entry];
+            sample_counts[s] += entry_data[entry];
+            kept++;
+        }
+        sample_indptr.push_back(sample_indptr.back() + kept);
+    }
+
+    create_id_index(obs_ids, obs_id_index);
+    create_id_index(sample_ids, sample_id_index);
+}
+
+void biom::load_sample_columns(const std::vector<uint32_t> &indptr,
+                               const std::vector<uint32_t> &columns,
+                               std::vector<uint32_t> &indices,
+                               std::vector<double> &data) {
+    uint64_t total = 0;
+    for(auto column : columns) {
+        if(indptr[column + 1] < indptr[column])
+            throw std::invalid_argument("Table does not appear to be a BIOM-Format v2.1");
+        total += indptr[column + 1] - indptr[column];
+    }
+    indices.reserve(total);
+    data.reserve(total);
+    if(total == 0)
+        return;
+
+    DataSet sample_indices = file.openDataSet(SAMPLE_INDICES.c_str());
+    DataSet sample_data = file.openDataSet(SAMPLE_DATA.c_str());
+    DataSpace indices_dataspace = sample_indices.getSpace();
+    DataSpace data_dataspace = sample_data.getSpace();
+    hsize_t dims[1];
+    data_dataspace.getSimpleExtentDims(dims, NULL);
+
+    std::vector<uint32_t> indices_block;
+    std::vector<double> data_block;
+    size_t next = 0;
+    while(next < columns.size()) {
+        // the columns up to last are read as one span
+        size_t last = next;
+        while(last + 1 < columns.size() &&
+              indptr[columns[last + 1]] <= (hsize_t)indptr[columns[last] + 1] + SUBSET_READ_GAP)
+            last++;
+
+        hsize_t span_start = indptr[columns[next]];
+        hsize_t span_stop = indptr[columns[last] + 1];
+        if(span_stop > dims[0])
+            throw std::invalid_argument("Table does not appear to be a BIOM-Format v2.1");
+
+        for(hsize_t start = span_start; start < span_stop; start += OBS_READ_BLOCK) {
+            hsize_t count[1] = {std::min(span_stop - start, OBS_READ_BLOCK)};
+            hsize_t offset[1] = {start};
+            DataSpace memspace(1, count, NULL);
+            indices_block.resize(count[0]);
+            data_block.resize(count[0]);
+
+            indices_dataspace.selectHyperslab(H5S_SELECT_SET, count, offset);
+            data_dataspace.selectHyperslab(H5S_SELECT_SET, count, offset);
+            sample_indices.read((void*)indices_block.data(), PredType::NATIVE_UINT32, memspace,
+                                indices_dataspace);
+            sample_data.read((void*)data_block.data(), PredType::NATIVE_DOUBLE, memspace,
+                             data_dataspace);
+
+            // a column which continues into the next block is completed
+            // by it, so the entries are appended in column order
+            for(size_t c = next; c <= last; c++) {
+                hsize_t lo = std::max((hsize_t)indptr[columns[c]], start);
+                hsize_t hi = std::min((hsize_t)indptr[columns[c] + 1], start + count[0]);
+                for(hsize_t i = lo; i < hi; i++) {
+                    indices.push_back(indices_block[i - start]);
+                    data.push_back(data_block[i - start]);
+                }
+            }
+        }
+        next = last + 1;
     }
-    free(obs_indices_resident);
-    free(obs_data_resident);
-    free(obs_counts_resident);
 }
 
 void biom::set_nnz() {
-    // should these be cached?
-    DataType dtype = obs_data.getDataType();
+    DataSet obs_data = file.openDataSet(OBS_DATA.c_str());
     DataSpace dataspace = obs_data.getSpace();
 
     hsize_t dims[1];
@@ -108,8 +529,26 @@ void biom::load_ids(const char *path, std::vector<std::string> &ids) {
 
     hsize_t dims[1];
     dataspace.getSimpleExtentDims(dims, NULL);
+    ids.reserve(dims[0]);
+    if(dims[0] == 0)
+        return;
+
+    /* the IDs are normally a dataset of variable length strings, but fixed
+     * length strings are read as a single buffer as well
+     */
+    StrType stype = ds_ids.getStrType();
+    if(!stype.isVariableStr()) {
+        size_t width = stype.getSize();
+        std::vector<char> buffer(width * dims[0]);
+        ds_ids.read((void*)buffer.data(), stype);
+
+        for(hsize_t i = 0; i < dims[0]; i++) {
+            const char *start = buffer.data() + i * width;
+            ids.emplace_back(start, strnlen(start, width));
+        }
+        return;
+    }
 
-    /* the IDs are a dataset of variable length strings */
     char **dataout = (char**)malloc(sizeof(char*) * dims[0]);
     if(dataout == NULL) {
         fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n", 
@@ -118,36 +557,24 @@ void biom::load_ids(const char *path, std::vector<std::string> &ids) {
     }
     ds_ids.read((void*)dataout, dtype);
 
-    ids.reserve(dims[0]);
-    for(unsigned int i = 0; i < dims[0]; i++) {
-        ids.push_back(dataout[i]);
-    }
-    
-    for(unsigned int i = 0; i < dims[0]; i++) 
-        free(dataout[i]);
+    for(hsize_t i = 0; i < dims[0]; i++)
+        ids.emplace_back(dataout[i]);
+
+    /* release the strings allocated by HDF5 in one call */
+    DataSet::vlenReclaim((void*)dataout, dtype, dataspace);
     free(dataout);
 }
 
 void biom::load_indptr(const char *path, std::vector<uint32_t> &indptr) {
     DataSet ds = file.openDataSet(path);
-    DataType dtype = ds.getDataType();
     DataSpace dataspace = ds.getSpace();
 
     hsize_t dims[1];
     dataspace.getSimpleExtentDims(dims, NULL);
     
-    uint32_t *dataout = (uint32_t*)malloc(sizeof(uint32_t) * dims[0]);
-    if(dataout == NULL) {
-        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n", 
-                sizeof(uint32_t) * dims[0], __FILE__, __LINE__);
-        exit(EXIT_FAILURE);
-    }
-    ds.read((void*)dataout, dtype);
-
-    indptr.reserve(dims[0]);
-    for(unsigned int i = 0; i < dims[0]; i++)
-        indptr.push_back(dataout[i]);
-    free(dataout);
+    indptr.resize(dims[0]);
+    if(dims[0] > 0)
+        ds.read((void*)indptr.data(), PredType::NATIVE_UINT32);
 }
 
 void biom::create_id_index(std::vector<std::string> &ids, 
@@ -159,50 +586,97 @@ void biom::create_id_index(std::vector<std::string> &ids,
     }
 }
 
-unsigned int biom::get_obs_data_direct(std::string id, uint32_t *& current_indices_out, double *& current_data_out) {
-    uint32_t idx = obs_id_index.at(id);
-    uint32_t start = obs_indptr[idx];
-    uint32_t end = obs_indptr[idx + 1];
-    
-    hsize_t count[1] = {end - start};
-    hsize_t offset[1] = {start};
-
-    DataType indices_dtype = obs_indices.getDataType();
-    DataType data_dtype = obs_data.getDataType();
-
-    DataSpace indices_dataspace = obs_indices.getSpace();
-    DataSpace data_dataspace = obs_data.getSpace();
-    
-    DataSpace indices_memspace(1, count, NULL);
-    DataSpace data_memspace(1, count, NULL);
+// the bytes of a list of IDs, and of a hash map over them
+static uint64_t ids_bytes(const std::vector<std::string> &ids, size_t n_indexed) {
+    uint64_t total = 0;
+    for(auto &id : ids)
+        total += sizeof(std::string) + id.capacity();
+    // each map entry holds a copy of the key, the value and a chain pointer
+    return total * (n_indexed ? 2 : 1) + n_indexed * (sizeof(uint32_t) + 2 * sizeof(void*));
+}
 
-    indices_dataspace.selectHyperslab(H5S_SELECT_SET, count, offset); 
-    data_dataspace.selectHyperslab(H5S_SELECT_SET, count, offset); 
+uint64_t biom::memory_bytes() const {
+    return ids_bytes(sample_ids, sample_id_index.size()) +
+           ids_bytes(obs_ids, obs_id_index.size()) +
+           (sample_indptr.capacity() + obs_indptr.capacity() + obs_indices_resident.capacity()) * sizeof(uint32_t) +
+           (obs_data_resident.capacity() + n_samples) * sizeof(double);
+}
 
-    current_indices_out = (uint32_t*)malloc(sizeof(uint32_t) * count[0]);
-    if(current_indices_out == NULL) {
-        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n", 
-                sizeof(uint32_t) * count[0], __FILE__, __LINE__);
-        exit(EXIT_FAILURE);
-    }
-    current_data_out = (double*)malloc(sizeof(double) * count[0]);
-    if(current_data_out == NULL) {
-        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n", 
-                sizeof(double) * count[0], __FILE__, __LINE__);
-        exit(EXIT_FAILURE);
+void biom::unique_samples(std::vector<uint32_t> &unique, std::vector<uint32_t> &profile) const {
+    // the hash of each column, accumulated in the order of the observations
+    std::vector<uint64_t> hashes(n_samples, 0);
+    std::vector<uint32_t> counts(n_samples, 0);
+    for(uint32_t obs = 0; obs < n_obs; obs++) {
+        for(uint32_t i = obs_indptr[obs]; i < obs_indptr[obs + 1]; i++) {
+            uint32_t s = obs_indices_resident[i];
+            uint64_t bits;
+            memcpy(&bits, &obs_data_resident[i], sizeof(bits));
+            hashes[s] = mix_seed(mix_seed(hashes[s] ^ obs) ^ bits);
+            counts[s]++;
+        }
     }
 
-    obs_indices.read((void*)current_indices_out, indices_dtype, indices_memspace, indices_dataspace);
-    obs_data.read((void*)current_data_out, data_dtype, data_memspace, data_dataspace);
-    
-    return count[0];
+    // the columns, which are only formed once two hashes agree
+    std::vector<uint32_t> column_indptr;
+    std::vector<uint32_t> column_obs;
+    std::vector<double> column_data;
+    auto same_column = [&](uint32_t a, uint32_t b) {
+        if(counts[a] != counts[b])
+            return false;
+        if(column_indptr.empty()) {
+            column_indptr.assign(n_samples + 1, 0);
+            for(uint32_t s = 0; s < n_samples; s++)
+                column_indptr[s + 1] = column_indptr[s] + counts[s];
+            column_obs.resize(nnz);
+            column_data.resize(nnz);
+            std::vector<uint32_t> fill(column_indptr.begin(), column_indptr.end() - 1);
+            for(uint32_t obs = 0; obs < n_obs; obs++) {
+                for(uint32_t i = obs_indptr[obs]; i < obs_indptr[obs + 1]; i++) {
+                    uint32_t pos = fill[obs_indices_resident[i]]++;
+                    column_obs[pos] = obs;
+                    column_data[pos] = obs_data_resident[i];
+                }
+            }
+        }
+        for(uint32_t i = 0; i < counts[a]; i++) {
+            uint32_t pa = column_indptr[a] + i;
+            uint32_t pb = column_indptr[b] + i;
+            if(column_obs[pa] != column_obs[pb] || column_data[pa] != column_data[pb])
+                return false;
+        }
+        return true;
+    };
+
+    // the positions in unique of the columns of each hash
+    std::unordered_map<uint64_t, std::vector<uint32_t>> seen;
+    unique.clear();
+    profile.assign(n_samples, 0);
+    for(uint32_t s = 0; s < n_samples; s++) {
+        if(counts[s] > 0) {
+            std::vector<uint32_t> &candidates = seen[hashes[s]];
+            bool found = false;
+            for(auto u : candidates) {
+                if(same_column(unique[u], s)) {
+                    profile[s] = u;
+                    found = true;
+                    break;
+                }
+            }
+            if(found)
+                continue;
+            candidates.push_back(unique.size());
+        }
+        profile[s] = unique.size();
+        unique.push_back(s);
+    }
 }
 
 void biom::get_obs_data(std::string id, double* out) {
     uint32_t idx = obs_id_index.at(id);
-    unsigned int count = obs_counts_resident[idx];
-    uint32_t *indices = obs_indices_resident[idx];
-    double *data = obs_data_resident[idx];
+    uint32_t start = obs_indptr[idx];
+    unsigned int count = obs_indptr[idx + 1] - start;
+    const uint32_t *indices = obs_indices_resident.data() + start;
+    const double *data = obs_data_resident.data() + start;
 
     // reset our output buffer
     for(unsigned int i = 0; i < n_samples; i++)
@@ -212,57 +686,3 @@ void biom::get_obs_data(std::string id, double* out) {
         out[indices[i]] = data[i];
     }
 }
-
-unsigned int biom::get_sample_data_direct(std::string id, uint32_t *& current_indices_out, double *& current_data_out) {
-    uint32_t idx = sample_id_index.at(id);
-    uint32_t start = sample_indptr[idx];
-    uint32_t end = sample_indptr[idx + 1];
-
-    hsize_t count[1] = {end - start};
-    hsize_t offset[1] = {start};
-
-    DataType indices_dtype = sample_indices.getDataType();
-    DataType data_dtype = sample_data.getDataType();
-
-    DataSpace indices_dataspace = sample_indices.getSpace();
-    DataSpace data_dataspace = sample_data.getSpace();
-    
-    DataSpace indices_memspace(1, count, NULL);
-    DataSpace data_memspace(1, count, NULL);
-
-    indices_dataspace.selectHyperslab(H5S_SELECT_SET, count, offset); 
-    data_dataspace.selectHyperslab(H5S_SELECT_SET, count, offset); 
-
-    current_indices_out = (uint32_t*)malloc(sizeof(uint32_t) * count[0]);
-    if(current_indices_out == NULL) {
-        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n", 
-                sizeof(uint32_t) * count[0], __FILE__, __LINE__);
-        exit(EXIT_FAILURE);
-    }
-    current_data_out = (double*)malloc(sizeof(double) * count[0]);
-    if(current_data_out == NULL) {
-        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n", 
-                sizeof(double) * count[0], __FILE__, __LINE__);
-        exit(EXIT_FAILURE);
-    }
-
-    sample_indices.read((void*)current_indices_out, indices_dtype, indices_memspace, indices_dataspace);
-    sample_data.read((void*)current_data_out, data_dtype, data_memspace, data_dataspace);
-
-    return count[0];
-}
-
-double* biom::get_sample_counts() {
-    double *sample_counts = (double*)calloc(sizeof(double), n_samples);
-    for(unsigned int i = 0; i < n_obs; i++) {
-        unsigned int count = obs_counts_resident[i];
-        uint32_t *indices = obs_indices_resident[i];
-        double *data = obs_data_resident[i];
-        for(unsigned int j = 0; j < count; j++) {
-            uint32_t index = indices[j];
-            double datum = data[j];
-            sample_counts[index] += datum;
-        }
-    }
-    return sample_counts;
-}
@@ -22,12 +22,64 @@ namespace su {
             /* default constructor
              *
              * @param filename The path to the BIOM table to read
+             *
+             * std::invalid_argument is thrown if the file is not a
+             * BIOM-Format 2.1 table
              */
             biom(std::string filename);
 
+            /* rarefied constructor
+             *
+             * @param source The table to subsample
+             * @param depth The number of counts to draw without replacement
+             *      from each sample. Counts are taken as integers, and
+             *      samples with fewer than depth counts are omitted.
+             * @param seed The random seed. A seed yields the same table
+             *      on any platform.
+             *
+             * The observations of source are retained, including those
+             * which are no longer observed, so a tree sheared to the
+             * source is also valid for the rarefied table.
+             */
+            biom(const biom &source, uint32_t depth, uint64_t seed);
+
+            /* subset constructor
+             *
+             * @param filename The path to the BIOM table to read
+             * @param sample_subset The IDs of the samples to keep, or NULL
+             *      to keep every sample. The samples are kept in the order
+             *      of the table, and a repeated ID is kept once.
+             * @param obs_subset The IDs of the observations to keep, or
+             *      NULL to keep every observation. IDs which are not in the
+             *      table are ignored.
+             *
+             * Only the columns of the kept samples are read, from the
+             * sample axis of the file, and observations without a nonzero
+             * value among the kept samples are dropped, so that a tree
+             * sheared to the table omits them.
+             *
+             * std::invalid_argument is thrown if the file is not a
+             * BIOM-Format 2.1 table, and std::out_of_range if a sample of
+             * sample_subset is not in the table.
+             */
+            biom(std::string filename, const std::vector<std::string> *sample_subset,
+                 const std::vector<std::string> *obs_subset);
+
+            /* sample selection constructor
+             *
+             * @param source The table to select from
+             * @param samples The indices of the samples of source to keep,
+             *      in the order given. A sample may be given more than once,
+             *      and each is a separate sample of the table.
+             *
+             * The observations of source are retained, as by the rarefied
+             * constructor.
+             */
+            biom(const biom &source, const std::vector<uint32_t> &samples);
+
             /* default destructor
              *
-             * Temporary arrays are freed
+             * The sample counts are freed
              */
             ~biom();
 
@@ -39,20 +91,74 @@ namespace su {
              *      have data will be zero'd.
              */
             void get_obs_data(std::string id, double* out);
+
+            /* read the shape of a table without loading it
+             *
+             * @param filename The path to the BIOM-Format 2.1 table
+             * @param n_obs The number of observations, an output
+             * @param n_samples The number of samples, an output
+             * @param nnz The number of nonzero entries, an output
+             *
+             * Only the metadata of the file is read. std::invalid_argument
+             * is thrown if the file is not a BIOM-Format 2.1 table.
+             */
+            static void read_shape(const std::string &filename, uint32_t &n_obs,
+                                   uint32_t &n_samples, uint32_t &nnz);
+
+            /* an estimate of the bytes held by the table
+             *
+             * The IDs, indices, values and ID lookups are counted.
+             */
+            uint64_t memory_bytes() const;
+
+            /* find the samples with identical columns
+             *
+             * @param unique The indices of the first sample of each distinct
+             *      column, in ascending order, an output
+             * @param profile The position in unique of the column of each
+             *      sample, of length n_samples, an output
+             *
+             * The columns are hashed over their observation indices and
+             * values, and the samples of a hash are compared entry by
+             * entry, so unequal columns are never merged. Samples without
+             * any entries are not merged with each other, as the distance
+             * between them is not defined by every method.
+             */
+            void unique_samples(std::vector<uint32_t> &unique, std::vector<uint32_t> &profile) const;
         private:
-            /* retain DataSet handles within the HDF5 file */
-            H5::DataSet obs_indices;
-            H5::DataSet sample_indices;
-            H5::DataSet obs_data;
-            H5::DataSet sample_data;
             H5::H5File file;
-            uint32_t **obs_indices_resident;
-            double **obs_data_resident;
-            unsigned int *obs_counts_resident;
 
-            unsigned int get_obs_data_direct(std::string id, uint32_t *& current_indices_out, double *& current_data_out);
-            unsigned int get_sample_data_direct(std::string id, uint32_t *& current_indices_out, double *& current_data_out);
-            double* get_sample_counts();
+            /* the observation axis in CSR form. the data for observation i
+             * reside in [obs_indptr[i], obs_indptr[i + 1]).
+             */
+            std::vector<uint32_t> obs_indices_resident;
+            std::vector<double> obs_data_resident;
+
+            /* read the observation matrix in bulk and compute sample_counts
+             *
+             * The indices and data are read in large contiguous blocks, and
+             * the per-sample sums are accumulated from each block while it
+             * is still resident in cache.
+             */
+            void load_obs_matrix();
+
+            /* read the columns of the sample matrix
+             *
+             * @param indptr The index pointer of the sample axis
+             * @param columns The columns to read, in ascending order
+             * @param indices The observation indices of the columns, an output
+             * @param data The values of the columns, an output
+             *
+             * The entries of the columns are appended in order. Columns
+             * separated by few entries are read through in a single read.
+             */
+            void load_sample_columns(const std::vector<uint32_t> &indptr,
+                                     const std::vector<uint32_t> &columns,
+                                     std::vector<uint32_t> &indices,
+                                     std::vector<double> &data);
+
+            /* verify the format-version attribute denotes BIOM 2.1 */
+            void check_format_version();
 
             /* At construction, lookups mapping IDs -> index position within an
              * axis are defined
@@ -23,13 +23,6 @@ void usage() {
 
 }
 
-const char* compute_status_messages[6] = {"No error.",
-                                          "The tree file cannot be found.",
-                                          "The table file cannot be found.",
-                                          "The table file contains an empty table."
-                                          "An unknown method was requested.",
-                                          "Table observation IDs are not a subset of the tree tips. This error can also be triggered if a node name contains a single quote (this is unlikely)."};
-
 void err(std::string msg) {
     std::cerr << "ERROR: " << msg << std::endl << std::endl;
     usage();
@@ -56,7 +49,7 @@ int faith_cli_one_off(std::string table_filename, std::string tree_filename,
     compute_status status;
     status = faith_pd_one_off(table_filename.c_str(), tree_filename.c_str(), &result);
     if(status != okay || result == NULL) {
-        fprintf(stderr, "Compute failed in faith_pd_one_off: %s\n", compute_status_messages[status]);
+        fprintf(stderr, "Compute failed in faith_pd_one_off: %s\n", compute_status_message(status));
         exit(EXIT_FAILURE);
     }
 
@@ -0,0 +1,345 @@
+#include "ordination.hpp"
+#include "pool.hpp"
+#include <algorithm>
+#include <cmath>
+#include <numeric>
+#include <random>
+#include <vector>
+
+// the extra vectors of each block, beyond the axes requested, which speed
+// the convergence of the last of the axes
+#define PCOA_OVERSAMPLE 10
+// the blocks of the Krylov basis, each the product of the centered matrix
+// with the one before it
+#define PCOA_KRYLOV_BLOCKS 4
+// the residual of an eigenpair, relative to the largest eigenvalue, at which
+// it is converged
+#define PCOA_TOLERANCE 1e-9
+#define PCOA_MAX_ITERATIONS 1000
+// the seed of the starting block, so that results are reproducible
+#define PCOA_SEED 42
+// the Jacobi sweeps of a projected matrix, which converge quadratically
+#define JACOBI_MAX_SWEEPS 100
+
+// the offset of row i in the condensed form of n samples, that is of the
+// pair (i, i + 1)
+static inline uint64_t condensed_row(uint32_t n, uint64_t i) {
+    return i * n - i * (i + 1) / 2;
+}
+
+// accumulate y += A x over the pairs of the rows [row_start, row_stop), where
+// A = -0.5 D^2 and x and y are row-major of n x m. as A is symmetric, each
+// pair adds to both of its rows, so y is written over all rows
+static void condensed_product(const double* condensed, uint32_t n, const double* x, double* y,
+                              unsigned int m, uint32_t row_start, uint32_t row_stop) {
+    std::vector<double> acc(m);
+    for(uint32_t i = row_start; i < row_stop; i++) {
+        const double* row = condensed + condensed_row(n, i);
+        const double* xi = x + (uint64_t)i * m;
+        std::fill(acc.begin(), acc.end(), 0.0);
+
+        for(uint32_t j = i + 1; j < n; j++) {
+            double d = row[j - i - 1];
+            double a = -0.5 * d * d;
+            const double* xj = x + (uint64_t)j * m;
+            double* yj = y + (uint64_t)j * m;
+            for(unsigned int c = 0; c < m; c++) {
+                acc[c] += a * xj[c];
+                yj[c] += a * xi[c];
+            }
+        }
+
+        double* yi = y + (uint64_t)i * m;
+        for(unsigned int c = 0; c < m; c++)
+            yi[c] += acc[c];
+    }
+}
+
+// subtract the mean of each column of the row-major n x m block x
+static void center_columns(std::vector<double> &x, uint32_t n, unsigned int m) {
+    std::vector<double> mean(m, 0.0);
+    for(uint32_t i = 0; i < n; i++)
+        for(unsigned int c = 0; c < m; c++)
+            mean[c] += x[(uint64_t)i * m + c];
+    for(unsigned int c = 0; c < m; c++)
+        mean[c] /= n;
+    for(uint32_t i = 0; i < n; i++)
+        for(unsigned int c = 0; c < m; c++)
+            x[(uint64_t)i * m + c] -= mean[c];
+}
+
+// y = B x, where B = -0.5 J D^2 J is the centered matrix
+//
+// each thread takes a range of rows of about the same number of pairs, and
+// accumulates into its own block, which are then summed
+static void centered_product(const double* condensed, uint32_t n, const std::vector<double> &x,
+                             std::vector<double> &y, unsigned int m, unsigned int threads) {
+    std::vector<double> xc(x);
+    center_columns(xc, n, m);
+
+    uint64_t n_pairs = (uint64_t)n * (n - 1) / 2;
+    threads = std::max(1u, std::min<unsigned int>(threads, n / 2));
+
+    std::vector<uint32_t> bounds(threads + 1, n);
+    bounds[0] = 0;
+    uint64_t pairs = 0;
+    unsigned int t = 1;
+    for(uint32_t i = 0; i < n && t < threads; i++) {
+        pairs += n - 1 - i;
+        if(pairs >= n_pairs * t / threads)
+            bounds[t++] = i + 1;
+    }
+
+    std::vector<std::vector<double>> partials(threads - 1);
+    std::fill(y.begin(), y.end(), 0.0);
+    su::run_tasks(threads, [&](unsigned int tid) {
+        if(tid == 0) {
+            condensed_product(condensed, n, xc.data(), y.data(), m, bounds[0], bounds[1]);
+        } else {
+            partials[tid - 1].assign((uint64_t)n * m, 0.0);
+            condensed_product(condensed, n, xc.data(), partials[tid - 1].data(), m,
+                              bounds[tid], bounds[tid + 1]);
+        }
+    });
+
+    for(auto &partial : partials)
+        for(uint64_t k = 0; k < y.size(); k++)
+            y[k] += partial[k];
+
+    center_columns(y, n, m);
+}
+
+// orthonormalize the columns [first, stop) of the row-major n x m block x
+// against those before them, and each other, by modified Gram-Schmidt applied
+// twice for stability. a column which is dependent on those before it is
+// replaced by a random one
+static void orthonormalize(std::vector<double> &x, uint32_t n, unsigned int m, unsigned int first,
+                           unsigned int stop, std::mt19937_64 &rng) {
+    std::normal_distribution<double> normal;
+
+    for(unsigned int c = first; c < stop; c++) {
+        for(unsigned int attempt = 0; ; attempt++) {
+            double before = 0.0;
+            for(uint32_t i = 0; i < n; i++)
+                before += x[(uint64_t)i * m + c] * x[(uint64_t)i * m + c];
+
+            for(unsigned int pass = 0; pass < 2; pass++) {
+                for(unsigned int p = 0; p < c; p++) {
+                    double dot = 0.0;
+                    for(uint32_t i = 0; i < n; i++)
+                        dot += x[(uint64_t)i * m + c] * x[(uint64_t)i * m + p];
+                    for(uint32_t i = 0; i < n; i++)
+                        x[(uint64_t)i * m + c] -= dot * x[(uint64_t)i * m + p];
+                }
+            }
+
+            double norm = 0.0;
+            for(uint32_t i = 0; i < n; i++)
+                norm += x[(uint64_t)i * m + c] * x[(uint64_t)i * m + c];
+
+            // more than n columns cannot be independent, so stop
+            // retrying, and leave the column zero
+            if(norm > 1e-20 * before && norm > 0) {
+                norm = sqrt(norm);
+                for(uint32_t i = 0; i < n; i++)
+                    x[(uint64_t)i * m + c] /= norm;
+                break;
+            }
+            if(attempt == 3) {
+                for(uint32_t i = 0; i < n; i++)
+                    x[(uint64_t)i * m + c] = 0.0;
+                break;
+            }
+            for(uint32_t i = 0; i < n; i++)
+                x[(uint64_t)i * m + c] = normal(rng);
+        }
+    }
+}
+
+// the eigendecomposition of the symmetric m x m row-major matrix a by cyclic
+// Jacobi rotations. a is overwritten, the eigenvalues are unordered, and the
+// eigenvectors are the columns of v
+static void jacobi_eigen(std::vector<double> &a, unsigned int m, std::vector<double> &values,
+                         std::vector<double> &v) {
+    v.assign(m * m, 0.0);
+    for(unsigned int i = 0; i < m; i++)
+        v[i * m + i] = 1.0;
+
+    for(unsigned int sweep = 0; sweep < JACOBI_MAX_SWEEPS; sweep++) {
+        double off = 0.0, total = 0.0;
+        for(unsigned int p = 0; p < m; p++) {
+            for(unsigned int q = 0; q < m; q++) {
+                total += a[p * m + q] * a[p * m + q];
+                if(p != q)
+                    off += a[p * m + q] * a[p * m + q];
+            }
+        }
+        if(off <= 1e-30 * total)
+            break;
+
+        for(unsigned int p = 0; p < m; p++) {
+            for(unsigned int q = p + 1; q < m; q++) {
+                double apq = a[p * m + q];
+                if(apq == 0.0)
+                    continue;
+
+                // the rotation which zeroes a[p][q]
+                double theta = (a[q * m + q] - a[p * m + p]) / (2.0 * apq);
+                double t = (theta >= 0 ? 1.0 : -1.0) / (fabs(theta) + sqrt(theta * theta + 1.0));
+                double c = 1.0 / sqrt(t * t + 1.0);
+                double s = t * c;
+
+                for(unsigned int k = 0; k < m; k++) {
+                    double akp = a[k * m + p], akq = a[k * m + q];
+                    a[k * m + p] = c * akp - s * akq;
+                    a[k * m + q] = s * akp + c * akq;
+                }
+                for(unsigned int k = 0; k < m; k++) {
+                    double apk = a[p * m + k], aqk = a[q * m + k];
+                    a[p * m + k] = c * apk - s * aqk;
+                    a[q * m + k] = s * apk + c * aqk;
+                }
+                for(unsigned int k = 0; k < m; k++) {
+                    double vkp = v[k * m + p], vkq = v[k * m + q];
+                    v[k * m + p] = c * vkp - s * vkq;
+                    v[k * m + q] = s * vkp + c * vkq;
+                }
+            }
+        }
+    }
+
+    values.resize(m);
+    for(unsigned int i = 0; i < m; i++)
+        values[i] = a[i * m + i];
+}
+
+// copy the columns [first, first + b) of the row-major n x w block from
+// into the columns [to_first, to_first + b) of the n x w_to block to
+static void copy_columns(const std::vector<double> &from, unsigned int w, unsigned int first,
+                         std::vector<double> &to, unsigned int w_to, unsigned int to_first,
+                         uint32_t n, unsigned int b) {
+    for(uint32_t i = 0; i < n; i++)
+        for(unsigned int c = 0; c < b; c++)
+            to[(uint64_t)i * w_to + to_first + c] = from[(uint64_t)i * w + first + c];
+}
+
+// y = x u over the columns of u in order, where x is row-major n x w, and u
+// is the row-major w x w matrix of which the columns order[0, b) are taken
+static void rotate(const std::vector<double> &x, unsigned int w, const std::vector<double> &u,
+                   const std::vector<unsigned int> &order, unsigned int b, std::vector<double> &y,
+                   uint32_t n) {
+    for(uint32_t i = 0; i < n; i++) {
+        const double* xi = x.data() + (uint64_t)i * w;
+        for(unsigned int k = 0; k < b; k++) {
+            double sum = 0.0;
+            for(unsigned int c = 0; c < w; c++)
+                sum += xi[c] * u[c * w + order[k]];
+            y[(uint64_t)i * b + k] = sum;
+        }
+    }
+}
+
+unsigned int su::pcoa(const double* condensed, uint32_t n, unsigned int n_axes, unsigned int threads,
+                      double* eigvals, double* coordinates, double* proportion_explained) {
+    n_axes = std::min<unsigned int>(n_axes, n);
+
+    // a block, and the blocks of the basis. a basis of all of the samples
+    // is complete, so is of a single block
+    unsigned int b = std::min<unsigned int>(n_axes + PCOA_OVERSAMPLE, n);
+    unsigned int n_blocks = std::min<unsigned int>(PCOA_KRYLOV_BLOCKS, n / b);
+    if(n_blocks < 2) {
+        b = n;
+        n_blocks = 1;
+    }
+    unsigned int w = b * n_blocks;
+
+    std::mt19937_64 rng(PCOA_SEED);
+    std::normal_distribution<double> normal;
+    std::vector<double> x((uint64_t)n * b);
+    for(auto &value : x)
+        value = normal(rng);
+    orthonormalize(x, n, b, 0, b, rng);
+
+    std::vector<double> bx((uint64_t)n * b);
+    centered_product(condensed, n, x, bx, b, threads);
+
+    std::vector<double> q((uint64_t)n * w), bq((uint64_t)n * w);
+    std::vector<double> block((uint64_t)n * b), product((uint64_t)n * b);
+    std::vector<double> projected(w * w);
+    std::vector<double> values, vectors;
+    std::vector<unsigned int> order(w);
+
+    // each iteration extends the Ritz vectors of the last, x, to the basis
+    // [x, Bx, B^2 x, ...], orthonormalized, of which the products are kept,
+    // so each block costs one product. the Ritz vectors of the basis, and
+    // their products, are then those of the next iteration
+    unsigned int iteration = 0;
+    while(true) {
+        iteration++;
+        copy_columns(x, b, 0, q, w, 0, n, b);
+        copy_columns(bx, b, 0, bq, w, 0, n, b);
+        for(unsigned int j = 1; j < n_blocks; j++) {
+            copy_columns(bq, w, (j - 1) * b, q, w, j * b, n, b);
+            orthonormalize(q, n, w, j * b, (j + 1) * b, rng);
+            copy_columns(q, w, j * b, block, b, 0, n, b);
+            centered_product(condensed, n, block, product, b, threads);
+            copy_columns(product, b, 0, bq, w, j * b, n, b);
+        }
+
+        // the Rayleigh-Ritz projection q' B q, which is symmetric but for
+        // rounding
+        for(unsigned int p = 0; p < w; p++) {
+            for(unsigned int r = p; r < w; r++) {
+                double pr = 0.0, rp = 0.0;
+                for(uint32_t i = 0; i < n; i++) {
+                    pr += q[(uint64_t)i * w + p] * bq[(uint64_t)i * w + r];
+                    rp += q[(uint64_t)i * w + r] * bq[(uint64_t)i * w + p];
+                }
+                projected[p * w + r] = projected[r * w + p] = 0.5 * (pr + rp);
+            }
+        }
+
+        jacobi_eigen(projected, w, values, vectors);
+        std::iota(order.begin(), order.end(), 0);
+        std::sort(order.begin(), order.end(),
+                  [&values](unsigned int a, unsigned int c) { return values[a] > values[c]; });
+
+        rotate(q, w, vectors, order, b, x, n);
+        rotate(bq, w, vectors, order, b, bx, n);
+
+        // the residual of each Ritz pair, |B x - lambda x|
+        double scale = fabs(values[order[0]]);
+        double worst = 0.0;
+        for(unsigned int k = 0; k < n_axes; k++) {
+            double residual = 0.0;
+            for(uint32_t i = 0; i < n; i++) {
+                double r = bx[(uint64_t)i * b + k] - values[order[k]] * x[(uint64_t)i * b + k];
+                residual += r * r;
+            }
+            worst = std::max(worst, sqrt(residual));
+        }
+
+        if(worst <= PCOA_TOLERANCE * scale || scale == 0.0 || iteration >= PCOA_MAX_ITERATIONS)
+            break;
+    }
+
+    double trace = 0.0;
+    uint64_t n_pairs = (uint64_t)n * (n - 1) / 2;
+    for(uint64_t k = 0; k < n_pairs; k++)
+        trace += condensed[k] * condensed[k];
+    trace /= n;
+
+    for(unsigned int k = 0; k < n_axes; k++) {
+        // as by skbio, negative eigenvalues, and those within rounding of
+        // zero, and their coordinates, are zero
+        double value = values[order[k]];
+        value = value > PCOA_TOLERANCE * fabs(values[order[0]]) ? value : 0.0;
+        double length = sqrt(value);
+        eigvals[k] = value;
+        proportion_explained[k] = trace > 0 ? value / trace : 0.0;
+        for(uint32_t i = 0; i < n; i++)
+            coordinates[(uint64_t)i * n_axes + k] = x[(uint64_t)i * b + k] * length;
+    }
+
+    return iteration;
+}
@@ -0,0 +1,35 @@
+#include <stdint.h>
+
+#ifndef __su_ordination
+namespace su {
+    /* principal coordinates analysis of a condensed distance matrix
+     *
+     * condensed <const double*> the upper triangle of the distance matrix, row by row, as
+     *      by stripes_to_condensed_form.
+     * n <uint32_t> the number of samples.
+     * n_axes <uint> the number of axes to compute, at most n.
+     * threads <uint> the number of threads of the matrix products.
+     * eigvals <double*> the output n_axes largest eigenvalues of the centered matrix, in
+     *      descending order. negative eigenvalues are reported as zero.
+     * coordinates <double*> the output coordinates, row-major of n x n_axes. the
+     *      coordinates of the axes of negative eigenvalues are zero.
+     * proportion_explained <double*> the output eigenvalues of length n_axes, relative
+     *      to the sum of all of the eigenvalues.
+     *
+     * The centered matrix, -0.5 J D^2 J where J = I - 11'/n, is not formed. Its
+     * products with a block of vectors are taken over the condensed form, centering
+     * the vectors before and after, and its largest eigenpairs are found by block
+     * Krylov iteration from a random block: each iteration extends the Ritz vectors
+     * of the last to a basis of their products with the centered matrix, and takes
+     * the Ritz vectors of the basis by a Rayleigh-Ritz step. The iteration stops
+     * once the residual of each computed eigenpair is within PCOA_TOLERANCE of the
+     * largest eigenvalue. The sum of all of the eigenvalues is
+     * the trace of the centered matrix, the sum of d_ij^2 / n over i < j.
+     *
+     * Returns the number of iterations taken.
+     */
+    unsigned int pcoa(const double* condensed, uint32_t n, unsigned int n_axes, unsigned int threads,
+                      double* eigvals, double* coordinates, double* proportion_explained);
+}
+#define __su_ordination
+#endif
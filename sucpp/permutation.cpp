@@ -0,0 +1,138 @@
+#include "permutation.hpp"
+#include "pool.hpp"
+#include <algorithm>
+#include <cmath>
+#include <limits>
+#include <random>
+#include <vector>
+
+// the sums of the squared distances of each sample to the others of its
+// group, in one pass over the pairs
+static void within_group_sums(const double* condensed, uint32_t n, const uint32_t* grouping,
+                              std::vector<double> &sums) {
+    std::fill(sums.begin(), sums.end(), 0.0);
+    const double* row = condensed;
+    for(uint32_t i = 0; i < n; i++) {
+        uint32_t group = grouping[i];
+        double sum = 0.0;
+        for(uint32_t j = i + 1; j < n; j++) {
+            if(grouping[j] == group) {
+                double d = row[j - i - 1];
+                sum += d * d;
+                sums[j] += d * d;
+            }
+        }
+        sums[i] += sum;
+        row += n - i - 1;
+    }
+}
+
+// the constants of a test, which do not change under permutation
+struct test_parameters {
+    uint32_t n;
+    uint32_t n_groups;
+    std::vector<uint32_t> sizes;
+    // the sum of the squared distances over n
+    double total;
+};
+
+typedef double (*group_statistic)(const std::vector<double> &sums, const uint32_t* grouping,
+                                  const test_parameters &params);
+
+static double permanova_statistic(const std::vector<double> &sums, const uint32_t* grouping,
+                                  const test_parameters &params) {
+    // each pair is in the sums of both of its samples
+    double within = 0.0;
+    for(uint32_t i = 0; i < params.n; i++)
+        within += sums[i] / (2.0 * params.sizes[grouping[i]]);
+    double among = params.total - within;
+    return (among / (params.n_groups - 1)) / (within / (params.n - params.n_groups));
+}
+
+static double permdisp_statistic(const std::vector<double> &sums, const uint32_t* grouping,
+                                 const test_parameters &params) {
+    std::vector<double> pair_sums(params.n_groups, 0.0);
+    for(uint32_t i = 0; i < params.n; i++)
+        pair_sums[grouping[i]] += sums[i] / 2.0;
+
+    std::vector<double> distances(params.n);
+    std::vector<double> means(params.n_groups, 0.0);
+    double grand_mean = 0.0;
+    for(uint32_t i = 0; i < params.n; i++) {
+        double size = params.sizes[grouping[i]];
+        double squared = sums[i] / size - pair_sums[grouping[i]] / (size * size);
+        distances[i] = sqrt(fabs(squared));
+        means[grouping[i]] += distances[i];
+        grand_mean += distances[i];
+    }
+    grand_mean /= params.n;
+    for(uint32_t g = 0; g < params.n_groups; g++)
+        means[g] /= params.sizes[g];
+
+    double among = 0.0, within = 0.0;
+    for(uint32_t g = 0; g < params.n_groups; g++)
+        among += params.sizes[g] * (means[g] - grand_mean) * (means[g] - grand_mean);
+    for(uint32_t i = 0; i < params.n; i++)
+        within += (distances[i] - means[grouping[i]]) * (distances[i] - means[grouping[i]]);
+    return (among / (params.n_groups - 1)) / (within / (params.n - params.n_groups));
+}
+
+static void permutation_test(const double* condensed, uint32_t n, const uint32_t* grouping,
+                             uint32_t n_groups, group_statistic compute, unsigned int permutations,
+                             uint64_t seed, unsigned int threads, double* statistic, double* p_value) {
+    test_parameters params;
+    params.n = n;
+    params.n_groups = n_groups;
+    params.sizes.assign(n_groups, 0);
+    for(uint32_t i = 0; i < n; i++)
+        params.sizes[grouping[i]]++;
+    params.total = 0.0;
+    uint64_t n_pairs = (uint64_t)n * (n - 1) / 2;
+    for(uint64_t k = 0; k < n_pairs; k++)
+        params.total += condensed[k] * condensed[k];
+    params.total /= n;
+
+    std::vector<double> sums(n);
+    within_group_sums(condensed, n, grouping, sums);
+    double observed = compute(sums, grouping, params);
+    *statistic = observed;
+
+    if(permutations == 0) {
+        *p_value = std::numeric_limits<double>::quiet_NaN();
+        return;
+    }
+
+    threads = std::max(1u, std::min(threads, permutations));
+    std::vector<unsigned int> at_least(threads, 0);
+    su::run_tasks(threads, [&](unsigned int tid) {
+        std::vector<uint32_t> permuted(n);
+        std::vector<double> permuted_sums(n);
+        for(unsigned int p = tid; p < permutations; p += threads) {
+            std::copy(grouping, grouping + n, permuted.begin());
+            std::mt19937_64 rng(seed + p);
+            std::shuffle(permuted.begin(), permuted.end(), rng);
+            within_group_sums(condensed, n, permuted.data(), permuted_sums);
+            if(compute(permuted_sums, permuted.data(), params) >= observed)
+                at_least[tid]++;
+        }
+    });
+
+    unsigned int total_at_least = 0;
+    for(auto count : at_least)
+        total_at_least += count;
+    *p_value = (total_at_least + 1.0) / (permutations + 1.0);
+}
+
+void su::permanova(const double* condensed, uint32_t n, const uint32_t* grouping, uint32_t n_groups,
+                   unsigned int permutations, uint64_t seed, unsigned int threads,
+                   double* statistic, double* p_value) {
+    permutation_test(condensed, n, grouping, n_groups, permanova_statistic, permutations, seed, threads,
+                     statistic, p_value);
+}
+
+void su::permdisp(const double* condensed, uint32_t n, const uint32_t* grouping, uint32_t n_groups,
+                  unsigned int permutations, uint64_t seed, unsigned int threads,
+                  double* statistic, double* p_value) {
+    permutation_test(condensed, n, grouping, n_groups, permdisp_statistic, permutations, seed, threads,
+                     statistic, p_value);
+}
@@ -0,0 +1,48 @@
+#include <stdint.h>
+
+#ifndef __su_permutation
+namespace su {
+    /* permutation tests of a grouping of the samples of a condensed distance matrix
+     *
+     * condensed <const double*> the upper triangle of the distance matrix, row by row, as
+     *      by stripes_to_condensed_form.
+     * n <uint32_t> the number of samples.
+     * grouping <const uint32_t*> the group of each sample, of length n, in [0, n_groups).
+     * n_groups <uint32_t> the number of groups, each of at least one sample.
+     * permutations <uint> the number of permutations of the grouping.
+     * seed <uint64_t> the random seed. Permutation p is drawn with seed + p, so the
+     *      result does not depend on the number of threads.
+     * threads <uint> the number of threads, each of which computes a share of the
+     *      permutations.
+     * statistic <double*> the output test statistic of the grouping.
+     * p_value <double*> the output proportion of the permutations, and the grouping, of
+     *      which the statistic is at least that of the grouping, or NaN if there are
+     *      no permutations.
+     *
+     * Both tests are of the sums of the squared distances of each sample to the others
+     * of its group, which are taken over the condensed form, so each permutation costs
+     * a pass over the pairs, and the square matrix is not formed.
+     *
+     * permanova is the pseudo-F of Anderson (2001), as by skbio's permanova.
+     *
+     * permdisp is the F of a one-way ANOVA of the distances of the samples to the
+     * centroids of their groups (Anderson 2006), as by skbio's permdisp with the
+     * centroid test. The distance of sample i to the centroid of group g is from
+     *
+     *      z_i^2 = sum_{j in g} d_ij^2 / n_g - sum_{j<k in g} d_jk^2 / n_g^2
+     *
+     * which is that of the principal coordinates of all of the axes. Where some of the
+     * eigenvalues are negative, z_i^2 is of the positive axes less the negative, and
+     * its magnitude is taken, as by vegan's betadisper, whereas skbio drops the axes
+     * of negative eigenvalues.
+     */
+    void permanova(const double* condensed, uint32_t n, const uint32_t* grouping, uint32_t n_groups,
+                   unsigned int permutations, uint64_t seed, unsigned int threads,
+                   double* statistic, double* p_value);
+
+    void permdisp(const double* condensed, uint32_t n, const uint32_t* grouping, uint32_t n_groups,
+                  unsigned int permutations, uint64_t seed, unsigned int threads,
+                  double* statistic, double* p_value);
+}
+#define __su_permutation
+#endif
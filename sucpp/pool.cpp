@@ -0,0 +1,212 @@
+#include "pool.hpp"
+#include "affinity.hpp"
+#include <algorithm>
+#include <condition_variable>
+#include <deque>
+#include <mutex>
+#include <thread>
+#include <vector>
+#include <signal.h>
+
+namespace {
+    // a call of run_tasks, whose tasks are claimed in order by the workers
+    // and the caller. next and done are guarded by the mutex of the pool
+    struct Batch {
+        const std::function<void(unsigned int)> *fn;
+        unsigned int n;
+        unsigned int next;
+        unsigned int done;
+        std::condition_variable finished;
+    };
+
+    // the processors available to the process
+    unsigned int available_cores() {
+        cpu_set_t set;
+        CPU_ZERO(&set);
+        if(sched_getaffinity(getpid(), sizeof(set), &set) != 0)
+            return std::max(1U, std::thread::hardware_concurrency());
+        return std::max(1, CPU_COUNT(&set));
+    }
+
+    class WorkerPool {
+        public:
+            std::mutex mutex;
+
+            WorkerPool(unsigned int size, su::Affinity affinity) : generation(0) {
+                start(size, affinity);
+            }
+
+            void run(unsigned int n, const std::function<void(unsigned int)> &fn) {
+                Batch batch;
+                batch.fn = &fn;
+                batch.n = n;
+                batch.next = 0;
+                batch.done = 0;
+
+                std::unique_lock<std::mutex> lock(mutex);
+                queue.push_back(&batch);
+                available.notify_all();
+                while(batch.next < batch.n) {
+                    unsigned int task = claim(&batch);
+                    lock.unlock();
+                    fn(task);
+                    lock.lock();
+                    batch.done++;
+                }
+                batch.finished.wait(lock, [&batch]() { return batch.done == batch.n; });
+            }
+
+            void configure(unsigned int size, su::Affinity affinity) {
+                std::vector<std::thread> retired;
+                {
+                    std::lock_guard<std::mutex> lock(mutex);
+                    retired.swap(workers);
+                    generation++;
+                    start(size, affinity);
+                    available.notify_all();
+                }
+                // the retired workers finish their current tasks first
+                for(auto &worker : retired)
+                    worker.join();
+            }
+
+            unsigned int size() {
+                std::lock_guard<std::mutex> lock(mutex);
+                return workers.size();
+            }
+
+        private:
+            std::condition_variable available;
+            std::deque<Batch*> queue;
+            std::vector<std::thread> workers;
+            unsigned int generation;
+
+            // under the mutex, a worker for each of size
+            void start(unsigned int size, su::Affinity affinity) {
+                unsigned int cores = available_cores();
+                if(size == 0)
+                    size = cores;
+                for(unsigned int index = 0; index < size; index++)
+                    workers.push_back(std::thread(&WorkerPool::work, this, affinity == su::affinity_core,
+                                                  index % cores, generation));
+            }
+
+            // under the mutex, the next task of batch, which leaves the queue
+            // with its last task
+            unsigned int claim(Batch* batch) {
+                unsigned int task = batch->next++;
+                if(batch->next == batch->n)
+                    queue.erase(std::find(queue.begin(), queue.end(), batch));
+                return task;
+            }
+
+            void work(bool bind, unsigned int core, unsigned int started) {
+                if(bind && bind_to_core(core) != 0)
+                    fprintf(stderr, "Unable to bind a worker to core %u, it is left unbound\n", core);
+
+                std::unique_lock<std::mutex> lock(mutex);
+                while(true) {
+                    available.wait(lock, [this, started]() { return generation != started || !queue.empty(); });
+                    if(generation != started)
+                        return;
+                    Batch* batch = queue.front();
+                    unsigned int task = claim(batch);
+                    lock.unlock();
+                    (*batch->fn)(task);
+                    lock.lock();
+                    if(++batch->done == batch->n)
+                        batch->finished.notify_all();
+                }
+            }
+    };
+
+    // the pool and its settings, which are guarded by pool_mutex. the pool is
+    // never destroyed, as a task may exit the process
+    std::mutex pool_mutex;
+    WorkerPool* instance = NULL;
+    unsigned int configured_size = 0;
+    su::Affinity configured_affinity = su::affinity_core;
+
+    // a forked child has none of the workers, so it abandons the pool of the
+    // parent and creates its own on use. the mutexes are held over the fork
+    // so that the pool is not copied mid change
+    void prepare_fork() {
+        pool_mutex.lock();
+        if(instance != NULL)
+            instance->mutex.lock();
+    }
+
+    void parent_after_fork() {
+        if(instance != NULL)
+            instance->mutex.unlock();
+        pool_mutex.unlock();
+    }
+
+    void child_after_fork() {
+        instance = NULL;
+        pool_mutex.unlock();
+    }
+
+    WorkerPool& pool() {
+        std::lock_guard<std::mutex> lock(pool_mutex);
+        if(instance == NULL) {
+            static std::once_flag registered;
+            std::call_once(registered, []() {
+                pthread_atfork(prepare_fork, parent_after_fork, child_after_fork);
+            });
+            instance = new WorkerPool(configured_size, configured_affinity);
+        }
+        return *instance;
+    }
+
+    volatile sig_atomic_t requests = 0;
+
+    void status_handler(int signo) {
+        if(signo == SIGUSR1)
+            requests = requests + 1;
+    }
+}
+
+void su::run_tasks(unsigned int n, const std::function<void(unsigned int)> &fn) {
+    if(n == 0)
+        return;
+    if(n == 1) {
+        fn(0);
+        return;
+    }
+    pool().run(n, fn);
+}
+
+void su::configure_pool(unsigned int size, Affinity affinity) {
+    WorkerPool* existing;
+    {
+        std::lock_guard<std::mutex> lock(pool_mutex);
+        configured_size = size;
+        configured_affinity = affinity;
+        existing = instance;
+    }
+    // not under pool_mutex, as the retired workers may be in tasks which use the pool
+    if(existing != NULL)
+        existing->configure(size, affinity);
+}
+
+unsigned int su::pool_size() {
+    return pool().size();
+}
+
+void su::report_status_on_signal() {
+    static std::once_flag installed;
+    std::call_once(installed, []() {
+        struct sigaction current;
+        if(sigaction(SIGUSR1, NULL, &current) != 0)
+            return;
+        if(!(current.sa_flags & SA_SIGINFO) && current.sa_handler == SIG_DFL) {
+            if(signal(SIGUSR1, status_handler) == SIG_ERR)
+                fprintf(stderr, "Can't catch SIGUSR1\n");
+        }
+    });
+}
+
+int su::status_requests() {
+    return requests;
+}
@@ -0,0 +1,54 @@
+#include <functional>
+
+#ifndef __su_pool
+namespace su {
+    /* how the workers of the pool are placed on the processors
+     *
+     * affinity_none leaves the workers to the scheduler.
+     * affinity_core binds worker i to the i-th processor available to the process,
+     *      wrapping around if there are more workers than processors, so that a
+     *      worker allocates its memory on its local NUMA node and does not hop
+     *      between cores.
+     */
+    enum Affinity {affinity_none, affinity_core};
+
+    /* Run fn(0), ..., fn(n - 1) on the worker pool, returning once all have
+     *
+     * The pool is shared by the process, and is created with the first call.
+     * The calling thread runs tasks of its own call as well, so a call never
+     * waits on workers which are busy elsewhere, and at most n tasks of a call
+     * run at once. Calls from several threads are served in the order made,
+     * a task at a time, so they share the workers rather than oversubscribing
+     * the processors. The tasks must not throw.
+     */
+    void run_tasks(unsigned int n, const std::function<void(unsigned int)> &fn);
+
+    /* Set the number of workers and their affinity
+     *
+     * size <uint> the number of workers, or 0 for the number of processors
+     *      available to the process.
+     * affinity <Affinity> the placement of the workers.
+     *
+     * If the pool exists, its workers finish their current tasks and are
+     * replaced, and calls in progress continue on the new workers. Otherwise
+     * the settings are used when it is created. The default is a worker per
+     * processor bound by affinity_core.
+     */
+    void configure_pool(unsigned int size, Affinity affinity);
+
+    // the number of workers of the pool, which is created if it does not exist
+    unsigned int pool_size();
+
+    /* Report the progress of the computations on SIGUSR1
+     *
+     * The handler is installed once, and only if SIGUSR1 has its default
+     * disposition, so a handler of the host process is kept. Each task of
+     * process_stripes prints its status the next time it completes a node.
+     */
+    void report_status_on_signal();
+
+    // the number of SIGUSR1 signals received by the handler
+    int status_requests();
+}
+#define __su_pool
+#endif
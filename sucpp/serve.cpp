@@ -0,0 +1,344 @@
+#include "serve.hpp"
+#include "stats.hpp"
+#include <algorithm>
+#include <condition_variable>
+#include <deque>
+#include <mutex>
+#include <sstream>
+#include <system_error>
+#include <thread>
+#include <cerrno>
+#include <cstdlib>
+#include <cstring>
+#include <poll.h>
+#include <sys/socket.h>
+#include <sys/stat.h>
+#include <sys/time.h>
+#include <sys/un.h>
+#include <unistd.h>
+
+// the longest request read, which bounds the memory of a connection
+#define SERVE_MAX_REQUEST_BYTES (1 << 16)
+
+namespace {
+    // the count, sum and max of a latency
+    struct Latency {
+        uint64_t count;
+        double total;
+        double max;
+
+        Latency() : count(0), total(0.0), max(0.0) {}
+
+        void add(double seconds) {
+            count++;
+            total += seconds;
+            max = std::max(max, seconds);
+        }
+
+        double mean() const {
+            return count == 0 ? 0.0 : total / count;
+        }
+    };
+
+    std::string format_number(double value) {
+        std::ostringstream out;
+        out << value;
+        return out.str();
+    }
+
+    // admits the compute requests in the order received, each once its
+    // threads are within the budget
+    class Scheduler {
+        public:
+            Scheduler(unsigned int budget) : budget(budget), in_use(0), running(0), next_ticket(0),
+                                             completed(0), failed(0) {}
+
+            // wait for the threads, returning the seconds waited
+            double acquire(unsigned int threads) {
+                double start = su::wall_seconds();
+                std::unique_lock<std::mutex> lock(mutex);
+                uint64_t ticket = next_ticket++;
+                queue.push_back(ticket);
+                changed.wait(lock, [&]() { return queue.front() == ticket && in_use + threads <= budget; });
+                queue.pop_front();
+                in_use += threads;
+                running++;
+                // the next request may fit in what is left
+                changed.notify_all();
+                return su::wall_seconds() - start;
+            }
+
+            void release(unsigned int threads, double wait_seconds, double compute_seconds, bool ok) {
+                std::lock_guard<std::mutex> lock(mutex);
+                in_use -= threads;
+                running--;
+                if(ok)
+                    completed++;
+                else
+                    failed++;
+                wait.add(wait_seconds);
+                compute.add(compute_seconds);
+                changed.notify_all();
+            }
+
+            su::Fields metrics() {
+                std::lock_guard<std::mutex> lock(mutex);
+                su::Fields fields;
+                fields["queued"] = std::to_string(queue.size());
+                fields["running"] = std::to_string(running);
+                fields["threads_in_use"] = std::to_string(in_use);
+                fields["thread_budget"] = std::to_string(budget);
+                fields["completed"] = std::to_string(completed);
+                fields["failed"] = std::to_string(failed);
+                fields["wait_seconds_mean"] = format_number(wait.mean());
+                fields["wait_seconds_max"] = format_number(wait.max);
+                fields["compute_seconds_mean"] = format_number(compute.mean());
+                fields["compute_seconds_max"] = format_number(compute.max);
+                return fields;
+            }
+
+            unsigned int threads_budget() const {
+                return budget;
+            }
+
+        private:
+            std::mutex mutex;
+            std::condition_variable changed;
+            std::deque<uint64_t> queue;
+            unsigned int budget;
+            unsigned int in_use;
+            unsigned int running;
+            uint64_t next_ticket;
+            uint64_t completed;
+            uint64_t failed;
+            Latency wait;
+            Latency compute;
+    };
+
+    su::Fields error_fields(const std::string &error, const std::string &message) {
+        su::Fields fields;
+        fields["status"] = "error";
+        fields["error"] = error;
+        fields["message"] = message;
+        return fields;
+    }
+
+    // the first line of the connection, which may end at the end of the stream.
+    // false if the connection fails or times out before the line is read
+    bool read_request(int fd, std::string &line) {
+        char buffer[4096];
+        line.clear();
+        while(line.size() <= SERVE_MAX_REQUEST_BYTES) {
+            ssize_t got = recv(fd, buffer, sizeof(buffer), 0);
+            if(got < 0 && errno == EINTR)
+                continue;
+            if(got < 0)
+                return false;
+            if(got == 0)
+                return !line.empty();
+            line.append(buffer, got);
+            size_t end = line.find('\n');
+            if(end != std::string::npos) {
+                line.resize(end);
+                return true;
+            }
+        }
+        return false;
+    }
+
+    // write all of line, without raising SIGPIPE if the client has gone
+    void send_line(int fd, std::string line) {
+        line += "\n";
+        size_t sent = 0;
+        while(sent < line.size()) {
+            ssize_t wrote = send(fd, line.data() + sent, line.size() - sent, MSG_NOSIGNAL);
+            if(wrote < 0 && errno == EINTR)
+                continue;
+            if(wrote <= 0)
+                return;
+            sent += wrote;
+        }
+    }
+
+    su::Fields run_compute(su::Fields &request, Scheduler &scheduler,
+                           const std::function<su::Fields(const su::Fields&, unsigned int)> &compute) {
+        unsigned int threads = 1;
+        su::Fields::iterator requested = request.find("threads");
+        if(requested != request.end()) {
+            char* end;
+            long value = strtol(requested->second.c_str(), &end, 10);
+            if(requested->second.empty() || *end != '\0' || value < 1)
+                return error_fields("bad_request", "threads must be a positive integer");
+            threads = std::min((unsigned long)value, (unsigned long)scheduler.threads_budget());
+        }
+
+        double wait_seconds = scheduler.acquire(threads);
+        double start = su::wall_seconds();
+        su::Fields response;
+        try {
+            response = compute(request, threads);
+        } catch(const std::exception &e) {
+            response = error_fields("exception", e.what());
+        }
+        double compute_seconds = su::wall_seconds() - start;
+        scheduler.release(threads, wait_seconds, compute_seconds, response["status"] == "okay");
+
+        response["threads"] = std::to_string(threads);
+        response["wait_seconds"] = format_number(wait_seconds);
+        response["compute_seconds"] = format_number(compute_seconds);
+        return response;
+    }
+
+    // true if a server is accepting connections on path
+    bool is_served(const sockaddr_un &address) {
+        int fd = socket(AF_UNIX, SOCK_STREAM, 0);
+        if(fd < 0)
+            return false;
+        bool served = connect(fd, (const sockaddr*)&address, sizeof(address)) == 0;
+        close(fd);
+        return served;
+    }
+}
+
+su::Fields su::parse_fields(const std::string &line) {
+    Fields fields;
+    std::istringstream stream(line);
+    std::string pair;
+    while(std::getline(stream, pair, '\t')) {
+        if(!pair.empty() && pair[pair.size() - 1] == '\r')
+            pair.resize(pair.size() - 1);
+        if(pair.empty())
+            continue;
+        size_t split = pair.find('=');
+        if(split == std::string::npos)
+            fields[pair] = "";
+        else
+            fields[pair.substr(0, split)] = pair.substr(split + 1);
+    }
+    return fields;
+}
+
+std::string su::format_fields(const Fields &fields) {
+    std::string line;
+    for(auto &field : fields) {
+        if(!line.empty())
+            line += "\t";
+        line += field.first + "=" + field.second;
+    }
+    return line;
+}
+
+int su::serve(const std::string &socket_path, unsigned int thread_budget,
+              const std::function<Fields(const Fields&, unsigned int)> &compute,
+              const Fields &description, double read_timeout) {
+    sockaddr_un address;
+    memset(&address, 0, sizeof(address));
+    address.sun_family = AF_UNIX;
+    if(socket_path.size() >= sizeof(address.sun_path)) {
+        errno = ENAMETOOLONG;
+        return -1;
+    }
+    strcpy(address.sun_path, socket_path.c_str());
+
+    // a socket left by a server which has exited is replaced, one in use is not
+    struct stat existing;
+    if(lstat(socket_path.c_str(), &existing) == 0 && S_ISSOCK(existing.st_mode)) {
+        if(is_served(address)) {
+            errno = EADDRINUSE;
+            return -1;
+        }
+        unlink(socket_path.c_str());
+    }
+
+    int listener = socket(AF_UNIX, SOCK_STREAM, 0);
+    if(listener < 0)
+        return -1;
+    int wake[2];
+    if(bind(listener, (const sockaddr*)&address, sizeof(address)) != 0 ||
+       listen(listener, SOMAXCONN) != 0 || pipe(wake) != 0) {
+        int err = errno;
+        close(listener);
+        unlink(socket_path.c_str());
+        errno = err;
+        return -1;
+    }
+
+    Scheduler scheduler(std::max(1U, thread_budget));
+    std::mutex connections_mutex;
+    std::condition_variable connections_done;
+    unsigned int connections = 0;
+
+    // an idle client is dropped, so that it cannot hold up a shutdown
+    timeval timeout;
+    timeout.tv_sec = (time_t)read_timeout;
+    timeout.tv_usec = (suseconds_t)((read_timeout - timeout.tv_sec) * 1e6);
+
+    auto handle = [&](int fd) {
+        std::string line;
+        if(setsockopt(fd, SOL_SOCKET, SO_RCVTIMEO, &timeout, sizeof(timeout)) == 0 &&
+           read_request(fd, line)) {
+            Fields request = parse_fields(line);
+            std::string command = request.count("command") ? request["command"] : "compute";
+            Fields response;
+            if(command == "compute") {
+                response = run_compute(request, scheduler, compute);
+            } else if(command == "metrics") {
+                response = scheduler.metrics();
+                for(auto &field : description)
+                    response.insert(field);
+                response["status"] = "okay";
+            } else if(command == "shutdown") {
+                response["status"] = "okay";
+                char byte = 0;
+                if(write(wake[1], &byte, 1) != 1)
+                    fprintf(stderr, "Unable to signal the shutdown of the server\n");
+            } else {
+                response = error_fields("bad_request", "unknown command " + command);
+            }
+            send_line(fd, format_fields(response));
+        }
+        close(fd);
+
+        std::lock_guard<std::mutex> lock(connections_mutex);
+        connections--;
+        connections_done.notify_all();
+    };
+
+    while(true) {
+        pollfd polled[2] = {{listener, POLLIN, 0}, {wake[0], POLLIN, 0}};
+        if(poll(polled, 2, -1) < 0) {
+            if(errno == EINTR)
+                continue;
+            break;
+        }
+        if(polled[1].revents != 0)
+            break;
+        if(polled[0].revents & POLLIN) {
+            int fd = accept(listener, NULL, NULL);
+            if(fd < 0)
+                continue;
+            {
+                std::lock_guard<std::mutex> lock(connections_mutex);
+                connections++;
+            }
+            // a thread per connection, which waits in the queue without using the budget
+            try {
+                std::thread(handle, fd).detach();
+            } catch(const std::system_error &e) {
+                close(fd);
+                std::lock_guard<std::mutex> lock(connections_mutex);
+                connections--;
+            }
+        }
+    }
+
+    close(listener);
+    unlink(socket_path.c_str());
+
+    // the requests already received are answered
+    std::unique_lock<std::mutex> lock(connections_mutex);
+    connections_done.wait(lock, [&connections]() { return connections == 0; });
+    close(wake[0]);
+    close(wake[1]);
+    return 0;
+}
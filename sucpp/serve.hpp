@@ -0,0 +1,59 @@
+#include <functional>
+#include <map>
+#include <string>
+
+#ifndef __su_serve
+// the seconds a connection may take to send its request
+#define SERVE_READ_TIMEOUT_SECONDS 30
+
+namespace su {
+    // the fields of a request or a response, by name
+    typedef std::map<std::string, std::string> Fields;
+
+    /* the fields of a line of tab separated name=value pairs
+     *
+     * A pair without an = is a name of an empty value.
+     */
+    Fields parse_fields(const std::string &line);
+
+    // a line of tab separated name=value pairs, without the newline
+    std::string format_fields(const Fields &fields);
+
+    /* Serve requests over a UNIX socket until a shutdown request
+     *
+     * socket_path <std::string> the path of the socket, which is replaced if it is
+     *      a stale socket, and is removed on return.
+     * thread_budget <uint> the most threads used by the computations at once.
+     * compute <function> the computation of a request, given its fields and the
+     *      threads it may use, which returns the fields of the response.
+     * description <Fields> fields added to the response of a metrics request.
+     * read_timeout <double> the seconds a connection may take to send its request,
+     *      after which it is closed without a response.
+     *
+     * Each connection carries a single request, a line of fields, and is answered
+     * with a line of fields before it is closed. The command field selects
+     *
+     *      compute  : [DEFAULT] queue the request for compute. threads, by default 1,
+     *                 is the threads requested, of at most thread_budget. The
+     *                 request waits until it is at the head of the queue and its
+     *                 threads are free, so that requests are computed in the order
+     *                 received and the budget is never exceeded. The response is
+     *                 that of compute, with wait_seconds and compute_seconds.
+     *      metrics  : the queued, running, threads_in_use, thread_budget,
+     *                 completed and failed requests, the mean and max of their
+     *                 wait_seconds and compute_seconds, and the description.
+     *      shutdown : stop accepting connections, and return once the requests
+     *                 which are queued or running are answered.
+     *
+     * Each response has status, okay or error, and an error has error and message.
+     * A compute response is counted as failed if its status is not okay.
+     *
+     * Returns 0 once shut down, or -1 with errno set if the socket could not be
+     * created.
+     */
+    int serve(const std::string &socket_path, unsigned int thread_budget,
+              const std::function<Fields(const Fields&, unsigned int)> &compute,
+              const Fields &description, double read_timeout = SERVE_READ_TIMEOUT_SECONDS);
+}
+#define __su_serve
+#endif
@@ -0,0 +1,48 @@
+#include <chrono>
+#include <stdint.h>
+#include <time.h>
+#include <sys/resource.h>
+
+#ifndef __su_stats
+namespace su {
+    /* Clocks and memory measures for instrumenting the phases of a computation
+     *
+     * Each is a single system call or less, so they are cheap enough to
+     * sample around every phase.
+     */
+
+    // seconds on a monotonic clock
+    inline double wall_seconds() {
+        std::chrono::duration<double> now = std::chrono::steady_clock::now().time_since_epoch();
+        return now.count();
+    }
+
+    // the user and system CPU seconds of the process, summed over its threads
+    inline double process_cpu_seconds() {
+        struct rusage usage;
+        getrusage(RUSAGE_SELF, &usage);
+        return usage.ru_utime.tv_sec + usage.ru_stime.tv_sec +
+               (usage.ru_utime.tv_usec + usage.ru_stime.tv_usec) / 1e6;
+    }
+
+    // the CPU seconds of the calling thread
+    inline double thread_cpu_seconds() {
+        struct timespec ts;
+        if(clock_gettime(CLOCK_THREAD_CPUTIME_ID, &ts) != 0)
+            return 0.0;
+        return ts.tv_sec + ts.tv_nsec / 1e9;
+    }
+
+    // the peak resident set size of the process in kilobytes
+    inline uint64_t peak_rss_kb() {
+        struct rusage usage;
+        getrusage(RUSAGE_SELF, &usage);
+#ifdef __APPLE__
+        return usage.ru_maxrss / 1024;  // reported in bytes
+#else
+        return usage.ru_maxrss;
+#endif
+    }
+}
+#define __su_stats
+#endif
@@ -2,25 +2,33 @@
 #include <fstream>
 #include <string>
 #include <iomanip>
+#include <sstream>
+#include <unordered_map>
 #include <glob.h>
-#include <signal.h>
+#include <cstring>
 #include "api.hpp"
 #include "cmd.hpp"
 #include "tree.hpp"
 #include "biom.hpp"
 #include "unifrac.hpp"
+#include "stats.hpp"
+#include "pool.hpp"
 
 
 void usage() {
     std::cout << "usage: ssu -i <biom> -o <out.dm> -m [METHOD] -t <newick> [-n threads] [-a alpha] [--vaw]" << std::endl;
     std::cout << "    [--mode [MODE]] [--start starting-stripe] [--stop stopping-stripe] [--partial-pattern <glob>]" << std::endl;
-    std::cout << "    [--n-partials number_of_partitions] [--report-bare]" << std::endl;
+    std::cout << "    [--n-partials number_of_partitions] [--report-bare] [--rows <ids>] [--cols <ids>]" << std::endl;
+    std::cout << "    [--existing <dm>] [--stats] [--memory-limit <bytes>] [--time-limit <seconds>] [--calibrate]" << std::endl;
+    std::cout << "    [--max-memory <bytes>] [--checkpoint <prefix>] [--checkpoint-interval <seconds>] [--resume]" << std::endl;
+    std::cout << "    [--pcoa-output <file>] [--pcoa-axes <k>] [--grouping <tsv>] [--grouping-column <name>]" << std::endl;
+    std::cout << "    [--permutations <n>] [--seed <n>] [--socket <path>] [--trees <tsv>]" << std::endl;
     std::cout << std::endl;
     std::cout << "    -i\t\tThe input BIOM table." << std::endl;
     std::cout << "    -t\t\tThe input phylogeny in newick." << std::endl;
     std::cout << "    -m\t\tThe method, [unweighted | weighted_normalized | weighted_unnormalized | generalized]." << std::endl;
     std::cout << "    -o\t\tThe output distance matrix." << std::endl;
-    std::cout << "    -n\t\t[OPTIONAL] The number of threads, default is 1." << std::endl;
+    std::cout << "    -n\t\t[OPTIONAL] The number of threads, default is 1. If mode==serve, the most threads of the requests at once." << std::endl;
     std::cout << "    -a\t\t[OPTIONAL] Generalized UniFrac alpha, default is 1." << std::endl;
     std::cout << "    -f\t\t[OPTIONAL] Bypass tips, reduces compute by about 50%." << std::endl;
     std::cout << "    --vaw\t[OPTIONAL] Variance adjusted, default is to not adjust for variance." << std::endl;
@@ -28,12 +36,37 @@ void usage() {
     std::cout << "    \t\t    one-off : [DEFAULT] compute UniFrac." << std::endl;
     std::cout << "    \t\t    partial : Compute UniFrac over a subset of stripes." << std::endl;
     std::cout << "    \t\t    partial-report : Start and stop suggestions for partial compute." << std::endl;
+    std::cout << "    \t\t    partial-plan : Partitions and threads within memory and time limits, as JSON." << std::endl;
     std::cout << "    \t\t    merge-partial : Merge partial UniFrac results." << std::endl;
+    std::cout << "    \t\t    cross : Compute UniFrac between the samples of --rows and of --cols." << std::endl;
+    std::cout << "    \t\t    append : Extend an existing distance matrix with the new samples of the table." << std::endl;
+    std::cout << "    \t\t    permanova : Test for differences among the groups of --grouping in a distance matrix." << std::endl;
+    std::cout << "    \t\t    permdisp : Test for differences in dispersion among the groups of --grouping in a distance matrix." << std::endl;
+    std::cout << "    \t\t    serve : Keep the trees of -t and --trees loaded, and compute requests from --socket until shut down." << std::endl;
     std::cout << "    --start\t[OPTIONAL] If mode==partial, the starting stripe." << std::endl;
     std::cout << "    --stop\t[OPTIONAL] If mode==partial, the stopping stripe." << std::endl;
-    std::cout << "    --partial-pattern\t[OPTIONAL] If mode==merge-partial, a glob pattern for partial outputs to merge." << std::endl;
-    std::cout << "    --n-partials\t[OPTIONAL] If mode==partial-report, the number of partitions to compute." << std::endl;
+    std::cout << "    --partial-pattern\t[OPTIONAL] If mode==merge-partial, mode==append, mode==permanova or mode==permdisp, a glob pattern for partial outputs to merge." << std::endl;
+    std::cout << "    --n-partials\t[OPTIONAL] If mode==partial-report or mode==partial-plan, the number of partitions to compute." << std::endl;
     std::cout << "    --report-bare\t[OPTIONAL] If mode==partial-report, produce barebones output." << std::endl;
+    std::cout << "    --rows\t[OPTIONAL] If mode==cross, a file of sample IDs, one per line, for the output rows." << std::endl;
+    std::cout << "    --cols\t[OPTIONAL] If mode==cross, a file of sample IDs, one per line, for the output columns." << std::endl;
+    std::cout << "    --existing\t[OPTIONAL] If mode==append, mode==permanova or mode==permdisp, the existing distance matrix." << std::endl;
+    std::cout << "    --stats\t[OPTIONAL] If mode==one-off or mode==partial, report the time and memory of each phase to stderr." << std::endl;
+    std::cout << "    --memory-limit\t[OPTIONAL] If mode==partial-plan, the memory of each job, in bytes or with a K, M or G suffix." << std::endl;
+    std::cout << "    --time-limit\t[OPTIONAL] If mode==partial-plan, the compute seconds of each job." << std::endl;
+    std::cout << "    --calibrate\t[OPTIONAL] If mode==partial-plan, measure the cost model on the inputs rather than use the default." << std::endl;
+    std::cout << "    --max-memory\t[OPTIONAL] If mode==one-off, the memory to compute within, in bytes or with a K, M or G suffix. The stripes are computed in as many rounds as needed." << std::endl;
+    std::cout << "    --checkpoint\t[OPTIONAL] If mode==one-off or mode==partial, periodically save the stripes of each thread to <prefix>.<start>-<stop>.ckpt." << std::endl;
+    std::cout << "    --checkpoint-interval\t[OPTIONAL] If --checkpoint, the seconds between the checkpoints of a thread, default is 600." << std::endl;
+    std::cout << "    --resume\t[OPTIONAL] If --checkpoint, continue from the checkpoints of an interrupted run with the same inputs, options and threads." << std::endl;
+    std::cout << "    --pcoa-output\t[OPTIONAL] If mode==one-off, write the principal coordinates of the distance matrix, in the ordination format of scikit-bio. -o is then optional." << std::endl;
+    std::cout << "    --pcoa-axes\t[OPTIONAL] If --pcoa-output, the number of axes, default is 10." << std::endl;
+    std::cout << "    --grouping\t[OPTIONAL] If mode==permanova or mode==permdisp, a tab-separated file with a header, of the sample IDs and their groups." << std::endl;
+    std::cout << "    --grouping-column\t[OPTIONAL] If --grouping, the column of the groups, default is the second." << std::endl;
+    std::cout << "    --permutations\t[OPTIONAL] If mode==permanova or mode==permdisp, the number of permutations, default is 999." << std::endl;
+    std::cout << "    --seed\t[OPTIONAL] If mode==permanova or mode==permdisp, the random seed, default is 0." << std::endl;
+    std::cout << "    --socket\t[OPTIONAL] If mode==serve, the path of the UNIX socket to serve requests on." << std::endl;
+    std::cout << "    --trees\t[OPTIONAL] If mode==serve, a tab-separated file of the names and newick files of the trees to load. A tree of -t is named default." << std::endl;
     std::cout << std::endl;
     std::cout << "Citations: " << std::endl;
     std::cout << "    For UniFrac, please see:" << std::endl;
@@ -47,8 +80,7 @@ void usage() {
     std::cout << "    For Variance Adjusted UniFrac, please see: " << std::endl;
     std::cout << "        Chang et al. BMC Bioinformatics 2011; DOI: 10.1186/1471-2105-12-118" << std::endl;
     std::cout << std::endl;
-    std::cout << "Runtime progress can be obtained by issuing a SIGUSR1 signal. If running with " << std::endl;
-    std::cout << "multiple threads, this signal will only be honored if issued to the master PID. " << std::endl;
+    std::cout << "Runtime progress can be obtained by issuing a SIGUSR1 signal to the process. " << std::endl;
     std::cout << "The report will yield the following information: " << std::endl;
     std::cout << std::endl;
     std::cout << "tid:<thread ID> start:<starting stripe> stop:<stopping stripe> k:<postorder node index> total:<number of nodes>" << std::endl;
@@ -57,13 +89,6 @@ void usage() {
     std::cout << std::endl;
 }
 
-const char* compute_status_messages[6] = {"No error.",
-                                          "The tree file cannot be found.", 
-                                          "The table file cannot be found.",
-                                          "The table file contains an empty table."
-                                          "An unknown method was requested.", 
-                                          "Table observation IDs are not a subset of the tree tips. This error can also be triggered if a node name contains a single quote (this is unlikely)."};
-
 
 // https://stackoverflow.com/questions/8401777/simple-glob-in-c-on-unix-system
 inline std::vector<std::string> glob(const std::string& pat){
@@ -131,24 +156,113 @@ int mode_partial_report(const std::string table_filename, int npartials, bool ba
     }
 } 
 
-int mode_merge_partial(std::string output_filename,
-                       std::string partial_pattern,
-                       unsigned int nthreads) {
-    if(output_filename.empty()) {
-        err("output filename missing");
+// bytes from a count with an optional K, M or G suffix, or 0 if malformed
+uint64_t parse_bytes(const std::string &value) {
+    char* end = NULL;
+    double count = strtod(value.c_str(), &end);
+    uint64_t scale = 1;
+    switch(*end) {
+        case 'K': case 'k': scale = 1ULL << 10; end++; break;
+        case 'M': case 'm': scale = 1ULL << 20; end++; break;
+        case 'G': case 'g': scale = 1ULL << 30; end++; break;
+    }
+    if(end == value.c_str() || *end != '\0' || count < 0)
+        return 0;
+    return (uint64_t)(count * scale);
+}
+
+int mode_partial_plan(const std::string table_filename, const std::string tree_filename,
+                      const std::string method, bool vaw, unsigned int max_threads,
+                      unsigned int n_partials, const std::string memory_arg,
+                      const std::string time_arg, bool calibrate) {
+    if(table_filename.empty()) {
+        err("table filename missing");
         return EXIT_FAILURE;
     }
 
-    if(partial_pattern.empty()) {
-        std::string msg("Partial file pattern missing. For instance, if your partial results\n" \
-                        "are named 'ssu.unweighted.start0.partial', 'ssu.unweighted.start10.partial', \n" \
-                        "etc, then a pattern of 'ssu.unweighted.start*.partial' would make sense");
-        err(msg);
+    if(tree_filename.empty()) {
+        err("tree filename missing");
         return EXIT_FAILURE;
     }
-    
-    mat_t *result = NULL;
-    
+
+    if(method.empty()) {
+        err("method missing");
+        return EXIT_FAILURE;
+    }
+
+    uint64_t memory_limit = 0;
+    if(!memory_arg.empty()) {
+        memory_limit = parse_bytes(memory_arg);
+        if(memory_limit == 0) {
+            err("--memory-limit must be a positive number of bytes");
+            return EXIT_FAILURE;
+        }
+    }
+
+    double time_limit = time_arg.empty() ? 0.0 : atof(time_arg.c_str());
+    if(time_limit < 0) {
+        err("--time-limit cannot be < 0");
+        return EXIT_FAILURE;
+    }
+
+    cost_model_t model;
+    cost_model_t* model_ptr = NULL;
+    compute_status status;
+    if(calibrate) {
+        status = calibrate_cost_model(table_filename.c_str(), tree_filename.c_str(), method.c_str(),
+                                      vaw, false, &model);
+        if(status != okay) {
+            fprintf(stderr, "Compute failed in calibrate_cost_model: %s\n", compute_status_message(status));
+            exit(EXIT_FAILURE);
+        }
+        model_ptr = &model;
+    }
+
+    partial_plan_t *plan = NULL;
+    status = plan_partials(table_filename.c_str(), tree_filename.c_str(), method.c_str(), vaw,
+                           model_ptr, memory_limit, time_limit, max_threads, n_partials, &plan);
+    if(status != okay || plan == NULL) {
+        fprintf(stderr, "Compute failed in plan_partials: %s\n", compute_status_message(status));
+        exit(EXIT_FAILURE);
+    }
+
+    std::cout << std::setprecision(6);
+    std::cout << "{" << std::endl;
+    std::cout << "  \"n_samples\": " << plan->n_samples << "," << std::endl;
+    std::cout << "  \"n_obs\": " << plan->n_obs << "," << std::endl;
+    std::cout << "  \"nnz\": " << plan->nnz << "," << std::endl;
+    std::cout << "  \"n_tree_nodes\": " << plan->n_tree_nodes << "," << std::endl;
+    std::cout << "  \"n_compute_nodes\": " << plan->n_compute_nodes << "," << std::endl;
+    std::cout << "  \"n_stripes\": " << plan->n_stripes << "," << std::endl;
+    std::cout << "  \"memory_limit\": " << memory_limit << "," << std::endl;
+    std::cout << "  \"time_limit\": " << time_limit << "," << std::endl;
+    std::cout << "  \"cost_model\": {\"node_seconds\": " << plan->model.node_seconds
+              << ", \"stripe_seconds\": " << plan->model.stripe_seconds
+              << ", \"calibrated\": " << (calibrate ? "true" : "false") << "}," << std::endl;
+    std::cout << "  \"feasible\": " << (plan->feasible ? "true" : "false") << "," << std::endl;
+    std::cout << "  \"threads\": " << plan->threads << "," << std::endl;
+    std::cout << "  \"n_partials\": " << plan->n_partials << "," << std::endl;
+    std::cout << "  \"table_bytes\": " << plan->table_bytes << "," << std::endl;
+    std::cout << "  \"tree_bytes\": " << plan->tree_bytes << "," << std::endl;
+    std::cout << "  \"thread_bytes\": " << plan->thread_bytes << "," << std::endl;
+    std::cout << "  \"partitions\": [" << std::endl;
+    for(unsigned int p = 0; p < plan->n_partials; p++) {
+        std::cout << "    {\"start\": " << plan->starts[p]
+                  << ", \"stop\": " << plan->stops[p]
+                  << ", \"stripe_bytes\": " << plan->stripe_bytes[p]
+                  << ", \"peak_bytes\": " << plan->peak_bytes[p]
+                  << ", \"seconds\": " << plan->seconds[p] << "}"
+                  << (p + 1 < plan->n_partials ? "," : "") << std::endl;
+    }
+    std::cout << "  ]" << std::endl;
+    std::cout << "}" << std::endl;
+
+    destroy_partial_plan(&plan);
+    return EXIT_SUCCESS;
+}
+
+// read and merge the partial results matching a glob pattern
+int load_merged_partials(std::string partial_pattern, unsigned int nthreads, mat_t** result) {
     std::vector<std::string> partials = glob(partial_pattern);
     partial_mat_t** partial_mats = (partial_mat_t**)malloc(sizeof(partial_mat_t*) * partials.size());
     for(size_t i = 0; i < partials.size(); i++) {
@@ -161,8 +275,8 @@ int mode_merge_partial(std::string output_filename,
         }
     }
 
-    MergeStatus status = merge_partial(partial_mats, partials.size(), nthreads, &result);
-    
+    MergeStatus status = merge_partial(partial_mats, partials.size(), nthreads, result);
+
     if(status != merge_okay) {
         std::ostringstream msg;
         msg << "Unable to complete merge; err " << status;
@@ -170,6 +284,29 @@ int mode_merge_partial(std::string output_filename,
         return EXIT_FAILURE;
     }
 
+    return EXIT_SUCCESS;
+}
+
+int mode_merge_partial(std::string output_filename,
+                       std::string partial_pattern,
+                       unsigned int nthreads) {
+    if(output_filename.empty()) {
+        err("output filename missing");
+        return EXIT_FAILURE;
+    }
+
+    if(partial_pattern.empty()) {
+        std::string msg("Partial file pattern missing. For instance, if your partial results\n" \
+                        "are named 'ssu.unweighted.start0.partial', 'ssu.unweighted.start10.partial', \n" \
+                        "etc, then a pattern of 'ssu.unweighted.start*.partial' would make sense");
+        err(msg);
+        return EXIT_FAILURE;
+    }
+    
+    mat_t *result = NULL;
+    if(load_merged_partials(partial_pattern, nthreads, &result) != EXIT_SUCCESS)
+        return EXIT_FAILURE;
+
     IOStatus io_err = write_mat(output_filename.c_str(), result);
     if(io_err != write_okay) {
         std::ostringstream msg;
@@ -183,10 +320,66 @@ int mode_merge_partial(std::string output_filename,
     return EXIT_SUCCESS;
 }
 
+// record the output of a result as the final phase of stats
+void stop_write_phase(run_stats_t *stats, double wall_start, double cpu_start, uint64_t bytes) {
+    if(stats == NULL || stats->n_phases == RUN_STATS_MAX_PHASES)
+        return;
+    unsigned int i = stats->n_phases++;
+    stats->phase_names[i] = "write";
+    stats->wall_seconds[i] = su::wall_seconds() - wall_start;
+    stats->cpu_seconds[i] = su::process_cpu_seconds() - cpu_start;
+    stats->bytes_allocated[i] = bytes;
+    stats->peak_rss_kb[i] = su::peak_rss_kb();
+}
+
+void report_stats(run_stats_t *stats) {
+    if(stats == NULL)
+        return;
+
+    double wall = 0.0;
+    double cpu = 0.0;
+    fprintf(stderr, "%-10s %12s %12s %16s %14s\n", "phase", "wall_s", "cpu_s", "bytes_allocated", "peak_rss_kb");
+    for(unsigned int i = 0; i < stats->n_phases; i++) {
+        fprintf(stderr, "%-10s %12.6f %12.6f %16llu %14llu\n", stats->phase_names[i],
+                stats->wall_seconds[i], stats->cpu_seconds[i],
+                (unsigned long long)stats->bytes_allocated[i],
+                (unsigned long long)stats->peak_rss_kb[i]);
+        wall += stats->wall_seconds[i];
+        cpu += stats->cpu_seconds[i];
+    }
+    fprintf(stderr, "%-10s %12.6f %12.6f\n", "total", wall, cpu);
+    for(unsigned int tid = 0; tid < stats->n_threads; tid++)
+        fprintf(stderr, "thread %-3u %25.6f\n", tid, stats->thread_cpu_seconds[tid]);
+    if(stats->n_duplicates > 0)
+        fprintf(stderr, "%u samples duplicate another and were not computed\n", stats->n_duplicates);
+}
+
+// validate the checkpoint options, which apply to one-off and partial
+bool check_checkpoint_args(const std::string &checkpoint_prefix, double checkpoint_interval, bool resume,
+                           bool report) {
+    if(checkpoint_prefix.empty()) {
+        if(resume) {
+            err("--resume requires --checkpoint");
+            return false;
+        }
+        return true;
+    }
+    if(checkpoint_interval < 0) {
+        err("--checkpoint-interval must not be negative");
+        return false;
+    }
+    if(report) {
+        err("--checkpoint cannot be combined with --stats");
+        return false;
+    }
+    return true;
+}
+
 int mode_partial(std::string table_filename, std::string tree_filename, 
                  std::string output_filename, std::string method_string,
                  bool vaw, double g_unifrac_alpha, bool bypass_tips, 
-                 unsigned int nthreads, int start_stripe, int stop_stripe) {
+                 unsigned int nthreads, int start_stripe, int stop_stripe, bool report,
+                 std::string checkpoint_prefix, double checkpoint_interval, bool resume) {
     if(output_filename.empty()) {
         err("output filename missing");
         return EXIT_FAILURE;
@@ -216,18 +409,36 @@ int mode_partial(std::string table_filename, std::string tree_filename,
         return EXIT_FAILURE;
     }
 
+    if(!check_checkpoint_args(checkpoint_prefix, checkpoint_interval, resume, report))
+        return EXIT_FAILURE;
+
     partial_mat_t *result = NULL;
+    run_stats_t *stats = NULL;
     compute_status status;
-    status = partial(table_filename.c_str(), tree_filename.c_str(), method_string.c_str(), 
-                     vaw, g_unifrac_alpha, bypass_tips, nthreads, start_stripe, stop_stripe, &result);
+    if(checkpoint_prefix.empty())
+        status = partial_stats(table_filename.c_str(), tree_filename.c_str(), method_string.c_str(), 
+                               vaw, g_unifrac_alpha, bypass_tips, nthreads, start_stripe, stop_stripe, &result,
+                               report ? &stats : NULL);
+    else
+        status = partial_checkpoint(table_filename.c_str(), tree_filename.c_str(), method_string.c_str(),
+                                    vaw, g_unifrac_alpha, bypass_tips, nthreads, start_stripe, stop_stripe,
+                                    checkpoint_prefix.c_str(), checkpoint_interval, resume, &result);
     if(status != okay || result == NULL) {
-        fprintf(stderr, "Compute failed in partial: %s\n", compute_status_messages[status]);
+        fprintf(stderr, "Compute failed in partial: %s\n", compute_status_message(status));
         exit(EXIT_FAILURE);
     }
    
+    double wall_start = su::wall_seconds();
+    double cpu_start = su::process_cpu_seconds();
     io_status err = write_partial(output_filename.c_str(), result);
+    stop_write_phase(stats, wall_start, cpu_start, 0);
     destroy_partial_mat(&result);
 
+    if(stats != NULL) {
+        report_stats(stats);
+        destroy_run_stats(&stats);
+    }
+
     if(err != write_okay){
         fprintf(stderr, "Write failed: %s\n", err == open_error ? "could not open output" : "unknown error");
         return EXIT_FAILURE;
@@ -239,8 +450,10 @@ int mode_partial(std::string table_filename, std::string tree_filename,
 int mode_one_off(std::string table_filename, std::string tree_filename, 
                  std::string output_filename, std::string method_string,
                  bool vaw, double g_unifrac_alpha, bool bypass_tips,
-                 unsigned int nthreads) {
-    if(output_filename.empty()) {
+                 unsigned int nthreads, bool report, std::string max_memory_arg,
+                 std::string checkpoint_prefix, double checkpoint_interval, bool resume,
+                 std::string pcoa_filename, int pcoa_axes) {
+    if(output_filename.empty() && pcoa_filename.empty()) {
         err("output filename missing");
         return EXIT_FAILURE;
     }
@@ -260,29 +473,403 @@ int mode_one_off(std::string table_filename, std::string tree_filename,
         return EXIT_FAILURE;
     }
 
+    uint64_t max_memory = 0;
+    if(!max_memory_arg.empty()) {
+        max_memory = parse_bytes(max_memory_arg);
+        if(max_memory == 0) {
+            err("--max-memory must be a positive number of bytes");
+            return EXIT_FAILURE;
+        }
+    }
+
+    if(!check_checkpoint_args(checkpoint_prefix, checkpoint_interval, resume, report))
+        return EXIT_FAILURE;
+    if(!checkpoint_prefix.empty() && max_memory != 0) {
+        err("--checkpoint cannot be combined with --max-memory");
+        return EXIT_FAILURE;
+    }
+
+    if(pcoa_axes < 1) {
+        err("--pcoa-axes must be positive");
+        return EXIT_FAILURE;
+    }
+
     mat_t *result = NULL;
+    run_stats_t *stats = NULL;
     compute_status status;
-    status = one_off(table_filename.c_str(), tree_filename.c_str(), method_string.c_str(), 
-                     vaw, g_unifrac_alpha, bypass_tips, nthreads, &result);
+    if(checkpoint_prefix.empty())
+        status = one_off_budgeted(table_filename.c_str(), tree_filename.c_str(), method_string.c_str(),
+                                  vaw, g_unifrac_alpha, bypass_tips, nthreads, max_memory, &result,
+                                  report ? &stats : NULL);
+    else
+        status = one_off_checkpoint(table_filename.c_str(), tree_filename.c_str(), method_string.c_str(),
+                                    vaw, g_unifrac_alpha, bypass_tips, nthreads, checkpoint_prefix.c_str(),
+                                    checkpoint_interval, resume, &result);
     if(status != okay || result == NULL) {
-        fprintf(stderr, "Compute failed in one_off: %s\n", compute_status_messages[status]);
+        fprintf(stderr, "Compute failed in one_off: %s\n", compute_status_message(status));
         exit(EXIT_FAILURE);
     }
    
+    double wall_start = su::wall_seconds();
+    double cpu_start = su::process_cpu_seconds();
+    if(!output_filename.empty())
+        write_mat(output_filename.c_str(), result);
+    stop_write_phase(stats, wall_start, cpu_start, 0);
+
+    if(!pcoa_filename.empty()) {
+        ordination_t *ordination = NULL;
+        pcoa_mat(result, pcoa_axes, nthreads, &ordination);
+        IOStatus io_err = write_ordination(pcoa_filename.c_str(), ordination);
+        destroy_ordination(&ordination);
+        if(io_err != write_okay) {
+            std::ostringstream msg;
+            msg << "Unable to write principal coordinates; err " << io_err;
+            err(msg.str());
+            destroy_mat(&result);
+            return EXIT_FAILURE;
+        }
+    }
+    destroy_mat(&result);
+
+    if(stats != NULL) {
+        report_stats(stats);
+        destroy_run_stats(&stats);
+    }
+
+    return EXIT_SUCCESS;
+}
+
+// read sample IDs, one per line, ignoring blank lines
+std::vector<std::string> read_ids(const std::string &filename) {
+    std::ifstream input(filename);
+    std::vector<std::string> ids;
+    std::string line;
+
+    while(std::getline(input, line)) {
+        if(!line.empty() && line[line.size() - 1] == '\r')
+            line.erase(line.size() - 1);
+        if(!line.empty())
+            ids.push_back(line);
+    }
+    return ids;
+}
+
+int mode_cross(std::string table_filename, std::string tree_filename,
+               std::string output_filename, std::string method_string,
+               bool vaw, double g_unifrac_alpha, bool bypass_tips,
+               unsigned int nthreads, std::string rows_filename,
+               std::string cols_filename) {
+    if(output_filename.empty()) {
+        err("output filename missing");
+        return EXIT_FAILURE;
+    }
+
+    if(table_filename.empty()) {
+        err("table filename missing");
+        return EXIT_FAILURE;
+    }
+
+    if(tree_filename.empty()) {
+        err("tree filename missing");
+        return EXIT_FAILURE;
+    }
+
+    if(method_string.empty()) {
+        err("method missing");
+        return EXIT_FAILURE;
+    }
+
+    if(rows_filename.empty() || cols_filename.empty()) {
+        err("--rows and --cols are required");
+        return EXIT_FAILURE;
+    }
+
+    std::vector<std::string> rows = read_ids(rows_filename);
+    std::vector<std::string> cols = read_ids(cols_filename);
+    std::vector<const char*> row_ids;
+    std::vector<const char*> col_ids;
+    for(auto &id : rows)
+        row_ids.push_back(id.c_str());
+    for(auto &id : cols)
+        col_ids.push_back(id.c_str());
+
+    rect_mat_t *result = NULL;
+    compute_status status;
+    status = one_off_cross(table_filename.c_str(), tree_filename.c_str(), method_string.c_str(),
+                           vaw, g_unifrac_alpha, bypass_tips, nthreads,
+                           row_ids.data(), row_ids.size(), col_ids.data(), col_ids.size(),
+                           &result);
+    if(status != okay || result == NULL) {
+        fprintf(stderr, "Compute failed in one_off_cross: %s\n", compute_status_message(status));
+        exit(EXIT_FAILURE);
+    }
+
+    io_status err = write_rect_mat(output_filename.c_str(), result);
+    destroy_rect_mat(&result);
+
+    if(err != write_okay){
+        fprintf(stderr, "Write failed: %s\n", err == open_error ? "could not open output" : "unknown error");
+        return EXIT_FAILURE;
+    }
+
+    return EXIT_SUCCESS;
+}
+
+int mode_append(std::string table_filename, std::string tree_filename,
+                std::string output_filename, std::string method_string,
+                bool vaw, double g_unifrac_alpha, bool bypass_tips,
+                unsigned int nthreads, std::string existing_filename,
+                std::string partial_pattern) {
+    if(output_filename.empty()) {
+        err("output filename missing");
+        return EXIT_FAILURE;
+    }
+
+    if(table_filename.empty()) {
+        err("table filename missing");
+        return EXIT_FAILURE;
+    }
+
+    if(tree_filename.empty()) {
+        err("tree filename missing");
+        return EXIT_FAILURE;
+    }
+
+    if(method_string.empty()) {
+        err("method missing");
+        return EXIT_FAILURE;
+    }
+
+    if(existing_filename.empty() == partial_pattern.empty()) {
+        err("one of --existing or --partial-pattern is required");
+        return EXIT_FAILURE;
+    }
+
+    mat_t *existing = NULL;
+    if(!existing_filename.empty()) {
+        IOStatus io_err = read_mat(existing_filename.c_str(), &existing);
+        if(io_err != read_okay) {
+            std::ostringstream msg;
+            msg << "Unable to parse file (" << existing_filename << "); err " << io_err;
+            err(msg.str());
+            return EXIT_FAILURE;
+        }
+    } else if(load_merged_partials(partial_pattern, nthreads, &existing) != EXIT_SUCCESS) {
+        return EXIT_FAILURE;
+    }
+
+    mat_t *result = NULL;
+    compute_status status;
+    status = append_samples(table_filename.c_str(), tree_filename.c_str(), method_string.c_str(),
+                            vaw, g_unifrac_alpha, bypass_tips, nthreads, existing, &result);
+    destroy_mat(&existing);
+    if(status != okay || result == NULL) {
+        fprintf(stderr, "Compute failed in append_samples: %s\n", compute_status_message(status));
+        exit(EXIT_FAILURE);
+    }
+
     write_mat(output_filename.c_str(), result);
     destroy_mat(&result);
 
     return EXIT_SUCCESS;
 }
 
-void ssu_sig_handler(int signo) {
-    if (signo == SIGUSR1) {
-        printf("Status cannot be reported.\n");
+// read the group of each sample from a tab-separated file with a header, of
+// which the first column is the sample IDs. the header may start with '#', as
+// of a QIIME mapping file, and the lines after it starting with '#' are
+// comments. returns false, having reported why, if the file or column is bad
+bool read_grouping(const std::string &filename, const std::string &column,
+                   std::unordered_map<std::string, std::string> &groups) {
+    std::ifstream input(filename);
+    if(!input.is_open()) {
+        err("Unable to open the grouping (" + filename + ")");
+        return false;
     }
+
+    auto split = [](std::string line) {
+        if(!line.empty() && line[line.size() - 1] == '\r')
+            line.erase(line.size() - 1);
+        std::vector<std::string> fields;
+        std::stringstream fields_stream(line);
+        std::string field;
+        while(std::getline(fields_stream, field, '\t'))
+            fields.push_back(field);
+        return fields;
+    };
+
+    std::string line;
+    std::vector<std::string> header;
+    while(header.empty() && std::getline(input, line))
+        if(!line.empty())
+            header = split(line);
+
+    unsigned int index = 1;
+    if(!column.empty()) {
+        auto found = std::find(header.begin(), header.end(), column);
+        if(found == header.end() || found == header.begin()) {
+            err("The grouping column (" + column + ") is not in the grouping");
+            return false;
+        }
+        index = found - header.begin();
+    } else if(header.size() < 2) {
+        err("The grouping must have a column of groups");
+        return false;
+    }
+
+    while(std::getline(input, line)) {
+        if(line.empty() || line[0] == '#')
+            continue;
+        std::vector<std::string> fields = split(line);
+        if(fields.size() > index)
+            groups[fields[0]] = fields[index];
+    }
+    return true;
+}
+
+int mode_permutation_test(std::string mode, std::string existing_filename, std::string partial_pattern,
+                          std::string grouping_filename, std::string grouping_column,
+                          std::string permutations_arg, std::string seed_arg, unsigned int nthreads) {
+    if(existing_filename.empty() == partial_pattern.empty()) {
+        err("one of --existing or --partial-pattern is required");
+        return EXIT_FAILURE;
+    }
+
+    if(grouping_filename.empty()) {
+        err("grouping filename missing");
+        return EXIT_FAILURE;
+    }
+
+    int permutations = permutations_arg.empty() ? 999 : atoi(permutations_arg.c_str());
+    if(permutations < 0) {
+        err("--permutations cannot be < 0");
+        return EXIT_FAILURE;
+    }
+    uint64_t seed = seed_arg.empty() ? 0 : strtoull(seed_arg.c_str(), NULL, 10);
+
+    std::unordered_map<std::string, std::string> groups;
+    if(!read_grouping(grouping_filename, grouping_column, groups))
+        return EXIT_FAILURE;
+
+    mat_t *dm = NULL;
+    if(!existing_filename.empty()) {
+        IOStatus io_err = read_mat(existing_filename.c_str(), &dm);
+        if(io_err != read_okay) {
+            std::ostringstream msg;
+            msg << "Unable to parse file (" << existing_filename << "); err " << io_err;
+            err(msg.str());
+            return EXIT_FAILURE;
+        }
+    } else if(load_merged_partials(partial_pattern, nthreads, &dm) != EXIT_SUCCESS) {
+        return EXIT_FAILURE;
+    }
+
+    // the groups are numbered in the order they are first seen
+    std::unordered_map<std::string, unsigned int> group_index;
+    std::vector<unsigned int> grouping(dm->n_samples);
+    for(unsigned int i = 0; i < dm->n_samples; i++) {
+        auto found = groups.find(dm->sample_ids[i]);
+        if(found == groups.end()) {
+            err(std::string("The sample (") + dm->sample_ids[i] + ") is not in the grouping");
+            destroy_mat(&dm);
+            return EXIT_FAILURE;
+        }
+        auto inserted = group_index.insert({found->second, (unsigned int)group_index.size()});
+        grouping[i] = inserted.first->second;
+    }
+
+    permutation_test_t result;
+    compute_status status;
+    if(mode == "permanova")
+        status = permanova_mat(dm, grouping.data(), group_index.size(), permutations, seed, nthreads, &result);
+    else
+        status = permdisp_mat(dm, grouping.data(), group_index.size(), permutations, seed, nthreads, &result);
+    destroy_mat(&dm);
+    if(status != okay) {
+        fprintf(stderr, "Compute failed in %s: %s\n", mode.c_str(), compute_status_message(status));
+        exit(EXIT_FAILURE);
+    }
+
+    std::cout << std::setprecision(16);
+    std::cout << "method name\t" << result.method_name << std::endl;
+    std::cout << "test statistic name\t" << result.statistic_name << std::endl;
+    std::cout << "sample size\t" << result.n_samples << std::endl;
+    std::cout << "number of groups\t" << result.n_groups << std::endl;
+    std::cout << "test statistic\t" << result.statistic << std::endl;
+    std::cout << "p-value\t" << result.p_value << std::endl;
+    std::cout << "number of permutations\t" << result.permutations << std::endl;
+
+    return EXIT_SUCCESS;
+}
+
+int mode_serve(std::string socket_path, std::string tree_filename, std::string trees_filename,
+               unsigned int nthreads) {
+    if(socket_path.empty()) {
+        err("--socket is required");
+        return EXIT_FAILURE;
+    }
+
+    if(tree_filename.empty() && trees_filename.empty()) {
+        err("tree filename missing");
+        return EXIT_FAILURE;
+    }
+
+    std::vector<std::string> names;
+    std::vector<std::string> paths;
+    if(!tree_filename.empty()) {
+        names.push_back("default");
+        paths.push_back(tree_filename);
+    }
+    if(!trees_filename.empty()) {
+        std::ifstream input(trees_filename.c_str());
+        if(!input.is_open()) {
+            fprintf(stderr, "Cannot open %s\n", trees_filename.c_str());
+            return EXIT_FAILURE;
+        }
+        std::string line;
+        while(std::getline(input, line)) {
+            if(!line.empty() && line[line.size() - 1] == '\r')
+                line.erase(line.size() - 1);
+            if(line.empty())
+                continue;
+            size_t tab = line.find('\t');
+            if(tab == std::string::npos || tab == 0 || tab == line.size() - 1) {
+                fprintf(stderr, "Malformed line of %s: %s\n", trees_filename.c_str(), line.c_str());
+                return EXIT_FAILURE;
+            }
+            names.push_back(line.substr(0, tab));
+            paths.push_back(line.substr(tab + 1));
+        }
+    }
+
+    std::vector<loaded_tree_t*> trees(names.size(), NULL);
+    std::vector<const char*> tree_names;
+    int result = EXIT_SUCCESS;
+    for(unsigned int i = 0; i < names.size(); i++) {
+        compute_status status = load_tree(paths[i].c_str(), &trees[i]);
+        if(status != okay) {
+            fprintf(stderr, "Load failed for tree %s: %s\n", names[i].c_str(), compute_status_message(status));
+            result = EXIT_FAILURE;
+            break;
+        }
+        tree_names.push_back(names[i].c_str());
+    }
+
+    if(result == EXIT_SUCCESS) {
+        fprintf(stderr, "Serving %u trees on %s\n", (unsigned int)names.size(), socket_path.c_str());
+        int error = serve(socket_path.c_str(), tree_names.data(), trees.data(), trees.size(), nthreads);
+        if(error != 0) {
+            fprintf(stderr, "Serve failed: could not listen on %s: %s\n", socket_path.c_str(), strerror(error));
+            result = EXIT_FAILURE;
+        }
+    }
+
+    for(auto &tree : trees)
+        destroy_loaded_tree(&tree);
+    return result;
 }
 
 int main(int argc, char **argv){
-    signal(SIGUSR1, ssu_sig_handler);
+    su::report_status_on_signal();
     InputParser input(argc, argv);
     if(input.cmdOptionExists("-h") || input.cmdOptionExists("--help") || argc == 1) {
         usage();
@@ -302,6 +889,22 @@ int main(int argc, char **argv){
     const std::string &partial_pattern = input.getCmdOption("--partial-pattern");
     const std::string &npartials = input.getCmdOption("--n-partials");
     const std::string &report_bare = input.getCmdOption("--report-bare");
+    const std::string &rows_filename = input.getCmdOption("--rows");
+    const std::string &cols_filename = input.getCmdOption("--cols");
+    const std::string &existing_filename = input.getCmdOption("--existing");
+    const std::string &memory_limit_arg = input.getCmdOption("--memory-limit");
+    const std::string &time_limit_arg = input.getCmdOption("--time-limit");
+    const std::string &max_memory_arg = input.getCmdOption("--max-memory");
+    const std::string &checkpoint_prefix = input.getCmdOption("--checkpoint");
+    const std::string &checkpoint_interval_arg = input.getCmdOption("--checkpoint-interval");
+    const std::string &pcoa_filename = input.getCmdOption("--pcoa-output");
+    const std::string &pcoa_axes_arg = input.getCmdOption("--pcoa-axes");
+    const std::string &grouping_filename = input.getCmdOption("--grouping");
+    const std::string &grouping_column = input.getCmdOption("--grouping-column");
+    const std::string &permutations_arg = input.getCmdOption("--permutations");
+    const std::string &seed_arg = input.getCmdOption("--seed");
+    const std::string &socket_path = input.getCmdOption("--socket");
+    const std::string &trees_filename = input.getCmdOption("--trees");
 
     if(nthreads_arg.empty()) {
         nthreads = 1;
@@ -312,6 +915,9 @@ int main(int argc, char **argv){
     bool vaw = input.cmdOptionExists("--vaw"); 
     bool bare = input.cmdOptionExists("--report-bare"); 
     bool bypass_tips = input.cmdOptionExists("-f");
+    bool report = input.cmdOptionExists("--stats");
+    bool calibrate = input.cmdOptionExists("--calibrate");
+    bool resume = input.cmdOptionExists("--resume");
     double g_unifrac_alpha;
 
     if(gunifrac_arg.empty()) {
@@ -332,6 +938,18 @@ int main(int argc, char **argv){
     else
         stop_stripe = atoi(stop_arg.c_str());
 
+    double checkpoint_interval;
+    if(checkpoint_interval_arg.empty())
+        checkpoint_interval = 600;
+    else
+        checkpoint_interval = atof(checkpoint_interval_arg.c_str());
+
+    int pcoa_axes;
+    if(pcoa_axes_arg.empty())
+        pcoa_axes = 10;
+    else
+        pcoa_axes = atoi(pcoa_axes_arg.c_str());
+
     int n_partials;
     if(npartials.empty()) 
         n_partials = 1;
@@ -339,15 +957,28 @@ int main(int argc, char **argv){
         n_partials = atoi(npartials.c_str());
    
     if(mode_arg.empty() || mode_arg == "one-off")
-        return mode_one_off(table_filename, tree_filename, output_filename, method_string, vaw, g_unifrac_alpha, bypass_tips, nthreads);
+        return mode_one_off(table_filename, tree_filename, output_filename, method_string, vaw, g_unifrac_alpha, bypass_tips, nthreads, report, max_memory_arg, checkpoint_prefix, checkpoint_interval, resume, pcoa_filename, pcoa_axes);
     else if(mode_arg == "partial")
-        return mode_partial(table_filename, tree_filename, output_filename, method_string, vaw, g_unifrac_alpha, bypass_tips, nthreads, start_stripe, stop_stripe);
+        return mode_partial(table_filename, tree_filename, output_filename, method_string, vaw, g_unifrac_alpha, bypass_tips, nthreads, start_stripe, stop_stripe, report, checkpoint_prefix, checkpoint_interval, resume);
     else if(mode_arg == "merge-partial")
         return mode_merge_partial(output_filename, partial_pattern, nthreads);
     else if(mode_arg == "partial-report")
         return mode_partial_report(table_filename, n_partials, bare);
+    else if(mode_arg == "partial-plan")
+        return mode_partial_plan(table_filename, tree_filename, method_string, vaw, nthreads,
+                                 npartials.empty() ? 0 : n_partials, memory_limit_arg,
+                                 time_limit_arg, calibrate);
+    else if(mode_arg == "append")
+        return mode_append(table_filename, tree_filename, output_filename, method_string, vaw, g_unifrac_alpha, bypass_tips, nthreads, existing_filename, partial_pattern);
+    else if(mode_arg == "cross")
+        return mode_cross(table_filename, tree_filename, output_filename, method_string, vaw, g_unifrac_alpha, bypass_tips, nthreads, rows_filename, cols_filename);
+    else if(mode_arg == "permanova" || mode_arg == "permdisp")
+        return mode_permutation_test(mode_arg, existing_filename, partial_pattern, grouping_filename, grouping_column,
+                                     permutations_arg, seed_arg, nthreads);
+    else if(mode_arg == "serve")
+        return mode_serve(socket_path, tree_filename, trees_filename, nthreads);
     else 
-        err("Unknown mode. Valid options are: one-off, partial, merge-partial");
+        err("Unknown mode. Valid options are: one-off, partial, merge-partial, partial-report, partial-plan, cross, append, permanova, permdisp, serve");
 
     return EXIT_SUCCESS;
 }
@@ -14,6 +14,8 @@
          * tid <uint> the thread identifier
          * bypass_tips <bool> ignore tips on compute, reduces compute by ~50%
          * g_unifrac_alpha <double> an alpha value for generalized unifrac
+         * cpu_seconds <double> the CPU time of the thread which processed the
+         *      task, set on completion by su::process_stripes
          */
         struct task_parameters {
            uint32_t n_samples;          // number of samples
@@ -24,6 +26,8 @@
            
            // task specific arguments below
            double g_unifrac_alpha;      // generalized unifrac alpha
+
+           double cpu_seconds;          // thread CPU time, set on completion
         };
     
     #ifdef __cplusplus
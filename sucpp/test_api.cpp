@@ -3,6 +3,12 @@
 #include <cmath>
 #include <unordered_set>
 #include <string.h>
+#include <fstream>
+#include <vector>
+#include <thread>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <unistd.h>
 
 /*
  * test harness adapted from 
@@ -38,16 +44,6 @@ void SUITE_END() {
  */
 
 
-//void test_write_mat() {
-//    SUITE_START("test write mat_t");
-//    SUITE_END();
-//}
-//
-//void test_read_mat() {
-//    SUITE_START("test read mat_t");
-//    SUITE_END();
-//}
-//
 partial_mat_t* make_test_pm() {
     partial_mat_t* pm = (partial_mat_t*)malloc(sizeof(partial_mat_t));
     pm->n_samples = 6;
@@ -105,6 +101,44 @@ mat_t* mat_three_rep() {
     return res;
 }
 
+void test_read_write_mat() {
+    SUITE_START("test read/write mat_t");
+
+    mat_t* exp = mat_three_rep();
+    IOStatus err = write_mat("/tmp/ssu_io.dm", exp);
+    ASSERT(err == write_okay);
+
+    mat_t* obs = NULL;
+    err = read_mat("/tmp/ssu_io.dm", &obs);
+    ASSERT(err == read_okay);
+    ASSERT(obs->n_samples == exp->n_samples);
+    ASSERT(obs->cf_size == exp->cf_size);
+    ASSERT(obs->is_upper_triangle == exp->is_upper_triangle);
+    for(unsigned int i = 0; i < obs->cf_size; i++)
+        ASSERT(obs->condensed_form[i] == exp->condensed_form[i]);
+    for(unsigned int i = 0; i < obs->n_samples; i++)
+        ASSERT(strcmp(obs->sample_ids[i], exp->sample_ids[i]) == 0);
+    destroy_mat(&obs);
+
+    err = read_mat("/tmp/does-not-exist.dm", &obs);
+    ASSERT(err == open_error);
+
+    FILE *fp = fopen("/tmp/ssu_io.dm", "w");
+    fprintf(fp, "\tA\tB\nA\t0\t1\n");
+    fclose(fp);
+    err = read_mat("/tmp/ssu_io.dm", &obs);
+    ASSERT(err == unexpected_end);
+
+    fp = fopen("/tmp/ssu_io.dm", "w");
+    fprintf(fp, "\tA\tB\nA\t0\t1\nX\t1\t0\n");
+    fclose(fp);
+    err = read_mat("/tmp/ssu_io.dm", &obs);
+    ASSERT(err == read_error);
+
+    destroy_mat(&exp);
+    SUITE_END();
+}
+
 void test_read_write_partial_mat() {
     SUITE_START("test read/write partial_mat_t");
 
@@ -284,13 +318,989 @@ void test_merge_partial_mat() {
     SUITE_END();
 }
 
+// the value for (i, j) from a condensed form
+double cf_value(mat_t* m, unsigned int i, unsigned int j) {
+    if(i == j)
+        return 0.0;
+    if(i > j) {
+        unsigned int tmp = i;
+        i = j;
+        j = tmp;
+    }
+    uint64_t n = m->n_samples;
+    uint64_t comb_N = (n * (n - 1)) / 2;
+    uint64_t comb_N_minus_i = ((n - i) * (n - i - 1)) / 2;
+    return m->condensed_form[comb_N - comb_N_minus_i + (j - i - 1)];
+}
+
+void test_one_off_cross() {
+    SUITE_START("test one_off_cross");
+
+    const char* methods[4] = {"unweighted", "weighted_normalized", "weighted_unnormalized", "generalized"};
+    // overlapping, unordered and repeated sample sets
+    unsigned int rows[3] = {4, 0, 2};
+    unsigned int cols[4] = {1, 2, 5, 1};
+
+    for(unsigned int m = 0; m < 4; m++) {
+        for(unsigned int vaw = 0; vaw < 2; vaw++) {
+            mat_t* exp = NULL;
+            compute_status err = one_off("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1, &exp);
+            ASSERT(err == okay);
+
+            const char* row_ids[3];
+            const char* col_ids[4];
+            for(unsigned int i = 0; i < 3; i++)
+                row_ids[i] = exp->sample_ids[rows[i]];
+            for(unsigned int i = 0; i < 4; i++)
+                col_ids[i] = exp->sample_ids[cols[i]];
+
+            rect_mat_t* obs = NULL;
+            err = one_off_cross("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1,
+                                row_ids, 3, col_ids, 4, &obs);
+            ASSERT(err == okay);
+            ASSERT(obs->n_rows == 3);
+            ASSERT(obs->n_cols == 4);
+            for(unsigned int i = 0; i < 3; i++) {
+                ASSERT(strcmp(obs->row_ids[i], row_ids[i]) == 0);
+                for(unsigned int j = 0; j < 4; j++) {
+                    double e = cf_value(exp, rows[i], cols[j]);
+                    ASSERT(fabs(obs->values[i * 4 + j] - e) < 0.000001);
+                }
+            }
+            for(unsigned int j = 0; j < 4; j++)
+                ASSERT(strcmp(obs->col_ids[j], col_ids[j]) == 0);
+
+            destroy_rect_mat(&obs);
+            destroy_mat(&exp);
+        }
+    }
+
+    const char* known[1] = {"Sample1"};
+    const char* unknown[2] = {"Sample1", "does-not-exist"};
+    rect_mat_t* obs = NULL;
+    compute_status err = one_off_cross("test.biom", "test.tre", "unweighted", false, 1.0, false, 1,
+                                       known, 1, unknown, 2, &obs);
+    ASSERT(err == sample_missing);
+    err = one_off_cross("test.biom", "test.tre", "unweighted", false, 1.0, false, 1,
+                        unknown, 2, known, 1, &obs);
+    ASSERT(err == sample_missing);
+
+    SUITE_END();
+}
+
+void test_append_samples() {
+    SUITE_START("test append_samples");
+
+    const char* methods[4] = {"unweighted", "weighted_normalized", "weighted_unnormalized", "generalized"};
+    // samples 1 and 4 of the table are new
+    unsigned int old_samples[4] = {0, 2, 3, 5};
+    unsigned int exp_order[6] = {0, 2, 3, 5, 1, 4};
+
+    for(unsigned int m = 0; m < 4; m++) {
+        for(unsigned int vaw = 0; vaw < 2; vaw++) {
+            mat_t* full = NULL;
+            compute_status err = one_off("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1, &full);
+            ASSERT(err == okay);
+
+            mat_t* existing = (mat_t*)malloc(sizeof(mat_t));
+            existing->n_samples = 4;
+            existing->cf_size = 6;
+            existing->is_upper_triangle = true;
+            existing->condensed_form = (double*)malloc(sizeof(double) * 6);
+            existing->sample_ids = (char**)malloc(sizeof(char*) * 4);
+            for(unsigned int i = 0, k = 0; i < 4; i++) {
+                existing->sample_ids[i] = strdup(full->sample_ids[old_samples[i]]);
+                for(unsigned int j = i + 1; j < 4; j++, k++)
+                    existing->condensed_form[k] = cf_value(full, old_samples[i], old_samples[j]);
+            }
+
+            mat_t* obs = NULL;
+            err = append_samples("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1, existing, &obs);
+            ASSERT(err == okay);
+            ASSERT(obs->n_samples == 6);
+            ASSERT(obs->cf_size == 15);
+            for(unsigned int i = 0; i < 6; i++) {
+                ASSERT(strcmp(obs->sample_ids[i], full->sample_ids[exp_order[i]]) == 0);
+                for(unsigned int j = 0; j < 6; j++)
+                    ASSERT(fabs(cf_value(obs, i, j) - cf_value(full, exp_order[i], exp_order[j])) < 0.000001);
+            }
+            destroy_mat(&obs);
+
+            // an existing result which disagrees with the table
+            existing->condensed_form[4] += 0.01;
+            err = append_samples("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1, existing, &obs);
+            ASSERT(err == existing_result_mismatch);
+
+            destroy_mat(&existing);
+            destroy_mat(&full);
+        }
+    }
+
+    mat_t* existing = mat_three_rep();
+    mat_t* obs = NULL;
+    compute_status err = append_samples("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, existing, &obs);
+    ASSERT(err == sample_missing);
+    destroy_mat(&existing);
+
+    SUITE_END();
+}
+
+void test_knn_query() {
+    SUITE_START("test knn_query");
+
+    const char* methods[4] = {"unweighted", "weighted_normalized", "weighted_unnormalized", "generalized"};
+    unsigned int queries[3] = {4, 0, 2};
+
+    for(unsigned int m = 0; m < 4; m++) {
+        for(unsigned int vaw = 0; vaw < 2; vaw++) {
+            mat_t* full = NULL;
+            compute_status err = one_off("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1, &full);
+            ASSERT(err == okay);
+
+            const char* query_ids[3];
+            for(unsigned int i = 0; i < 3; i++)
+                query_ids[i] = full->sample_ids[queries[i]];
+
+            for(unsigned int prune = 0; prune < 2; prune++) {
+                for(unsigned int k = 1; k < 7; k++) {
+                    knn_result_t* obs = NULL;
+                    err = knn_query("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1,
+                                    query_ids, 3, k, prune, &obs);
+                    ASSERT(err == okay);
+                    // there are only 5 other samples
+                    unsigned int exp_k = k < 5 ? k : 5;
+                    ASSERT(obs->k == exp_k);
+                    ASSERT(obs->n_queries == 3);
+                    ASSERT(obs->n_samples == 6);
+                    if(!prune)
+                        ASSERT(obs->n_evaluated == 15);
+                    ASSERT(obs->n_evaluated <= 15);
+
+                    for(unsigned int i = 0; i < 3; i++) {
+                        ASSERT(strcmp(obs->query_ids[i], query_ids[i]) == 0);
+
+                        // the kth nearest by brute force, ties broken by index
+                        bool used[6] = {false, false, false, false, false, false};
+                        used[queries[i]] = true;
+                        for(unsigned int j = 0; j < exp_k; j++) {
+                            int best = -1;
+                            for(unsigned int c = 0; c < 6; c++)
+                                if(!used[c] && (best < 0 || cf_value(full, queries[i], c) < cf_value(full, queries[i], best)))
+                                    best = c;
+                            used[best] = true;
+                            ASSERT(obs->indices[i * exp_k + j] == (unsigned int)best);
+                            ASSERT(fabs(obs->distances[i * exp_k + j] - cf_value(full, queries[i], best)) < 0.000001);
+                        }
+                    }
+                    destroy_knn_result(&obs);
+                }
+            }
+            destroy_mat(&full);
+        }
+    }
+
+    const char* unknown[1] = {"does-not-exist"};
+    knn_result_t* obs = NULL;
+    compute_status err = knn_query("test.biom", "test.tre", "unweighted", false, 1.0, false, 1,
+                                   unknown, 1, 2, true, &obs);
+    ASSERT(err == sample_missing);
+
+    SUITE_END();
+}
+
+void test_one_off_rarefied() {
+    SUITE_START("test one_off_rarefied");
+
+    // the sample totals of the test table are 7, 3, 4, 6, 3 and 4
+    mat_t* mean = NULL;
+    mat_t* variance = NULL;
+    mat_t* replicates[5];
+    compute_status err = one_off_rarefied("test.biom", "test.tre", "unweighted", false, 1.0, false, 1,
+                                          4, 5, 7, &mean, &variance, replicates);
+    ASSERT(err == okay);
+    ASSERT(mean->n_samples == 4);
+    ASSERT(variance->n_samples == 4);
+    ASSERT(strcmp(mean->sample_ids[0], "Sample1") == 0);
+    ASSERT(strcmp(mean->sample_ids[3], "Sample6") == 0);
+
+    for(unsigned int i = 0; i < mean->cf_size; i++) {
+        double sum = 0.0;
+        for(unsigned int r = 0; r < 5; r++)
+            sum += replicates[r]->condensed_form[i];
+        double mu = sum / 5;
+        double ss = 0.0;
+        for(unsigned int r = 0; r < 5; r++)
+            ss += (replicates[r]->condensed_form[i] - mu) * (replicates[r]->condensed_form[i] - mu);
+        ASSERT(fabs(mean->condensed_form[i] - mu) < 0.000001);
+        ASSERT(fabs(variance->condensed_form[i] - ss / 4) < 0.000001);
+    }
+
+    // the samples with exactly depth counts are unchanged by rarefaction,
+    // so their distance is as for the table itself
+    mat_t* full = NULL;
+    err = one_off("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, &full);
+    ASSERT(err == okay);
+    ASSERT(fabs(cf_value(mean, 1, 3) - cf_value(full, 2, 5)) < 0.000001);
+    ASSERT(fabs(cf_value(variance, 1, 3)) < 0.000001);
+
+    // without keeping the replicates, and the same seed
+    mat_t* streamed_mean = NULL;
+    mat_t* streamed_variance = NULL;
+    err = one_off_rarefied("test.biom", "test.tre", "unweighted", false, 1.0, false, 1,
+                           4, 5, 7, &streamed_mean, &streamed_variance, NULL);
+    ASSERT(err == okay);
+    for(unsigned int i = 0; i < mean->cf_size; i++) {
+        ASSERT(streamed_mean->condensed_form[i] == mean->condensed_form[i]);
+        ASSERT(streamed_variance->condensed_form[i] == variance->condensed_form[i]);
+    }
+
+    mat_t* unused_mean = NULL;
+    mat_t* unused_variance = NULL;
+    err = one_off_rarefied("test.biom", "test.tre", "unweighted", false, 1.0, false, 1,
+                           7, 5, 7, &unused_mean, &unused_variance, NULL);
+    ASSERT(err == table_empty);
+
+    for(unsigned int r = 0; r < 5; r++)
+        destroy_mat(&replicates[r]);
+    destroy_mat(&mean);
+    destroy_mat(&variance);
+    destroy_mat(&streamed_mean);
+    destroy_mat(&streamed_variance);
+    destroy_mat(&full);
+
+    SUITE_END();
+}
+
+void test_one_off_stats() {
+    SUITE_START("test one_off_stats, partial_stats and faith_pd_one_off_stats");
+
+    mat_t* exp = NULL;
+    mat_t* obs = NULL;
+    run_stats_t* stats = NULL;
+    compute_status err = one_off("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, &exp);
+    ASSERT(err == okay);
+    err = one_off_stats("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, &obs, &stats);
+    ASSERT(err == okay);
+    for(unsigned int i = 0; i < exp->cf_size; i++)
+        ASSERT(obs->condensed_form[i] == exp->condensed_form[i]);
+
+    const char* one_off_phases[] = {"parse", "load", "shear", "compute", "condense"};
+    ASSERT(stats->n_phases == 5);
+    for(unsigned int i = 0; i < stats->n_phases; i++) {
+        ASSERT(strcmp(stats->phase_names[i], one_off_phases[i]) == 0);
+        ASSERT(stats->wall_seconds[i] >= 0.0);
+        ASSERT(stats->cpu_seconds[i] >= 0.0);
+        ASSERT(stats->bytes_allocated[i] > 0);
+        ASSERT(stats->peak_rss_kb[i] > 0);
+    }
+    // 3 stripes of 6 samples, and their totals for unweighted
+    ASSERT(stats->bytes_allocated[3] == 2 * 3 * 6 * sizeof(double));
+    ASSERT(stats->n_threads == 1);
+    ASSERT(stats->thread_cpu_seconds[0] >= 0.0);
+    destroy_run_stats(&stats);
+    ASSERT(stats == NULL);
+    destroy_mat(&obs);
+
+    // nothing is recorded if not requested
+    err = one_off_stats("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, &obs, NULL);
+    ASSERT(err == okay);
+    destroy_mat(&obs);
+
+    // nor on an error
+    err = one_off_stats("test.biom", "test.tre", "foo", false, 1.0, false, 1, &obs, &stats);
+    ASSERT(err == unknown_method);
+    ASSERT(stats == NULL);
+    err = one_off_stats("test.biom", "does-not-exist", "unweighted", false, 1.0, false, 1, &obs, &stats);
+    ASSERT(err == tree_missing);
+    ASSERT(stats == NULL);
+
+    partial_mat_t* partial_obs = NULL;
+    err = partial_stats("test.biom", "test.tre", "weighted_normalized", false, 1.0, false, 1, 1, 3,
+                        &partial_obs, &stats);
+    ASSERT(err == okay);
+    const char* partial_phases[] = {"parse", "load", "shear", "compute", "partial"};
+    ASSERT(stats->n_phases == 5);
+    for(unsigned int i = 0; i < stats->n_phases; i++)
+        ASSERT(strcmp(stats->phase_names[i], partial_phases[i]) == 0);
+    ASSERT(stats->n_threads == 1);
+    destroy_run_stats(&stats);
+    destroy_partial_mat(&partial_obs);
+
+    r_vec* faith_obs = NULL;
+    err = faith_pd_one_off_stats("test.biom", "test.tre", &faith_obs, &stats);
+    ASSERT(err == okay);
+    const char* faith_phases[] = {"parse", "load", "shear", "compute"};
+    ASSERT(stats->n_phases == 4);
+    for(unsigned int i = 0; i < stats->n_phases; i++)
+        ASSERT(strcmp(stats->phase_names[i], faith_phases[i]) == 0);
+    ASSERT(stats->n_threads == 0);
+    destroy_run_stats(&stats);
+    destroy_results_vec(&faith_obs);
+    destroy_mat(&exp);
+
+    SUITE_END();
+}
+
+void test_one_off_subset() {
+    SUITE_START("test one_off_subset, partial_subset and faith_pd_subset");
+
+    const char* methods[4] = {"unweighted", "weighted_normalized", "weighted_unnormalized", "generalized"};
+    // kept in the order of the table, as Sample2, Sample4 and Sample5
+    const char* sample_ids[4] = {"Sample5", "Sample2", "Sample4", "Sample2"};
+    unsigned int kept[3] = {1, 3, 4};
+    table_subset_t subset = {sample_ids, 4, NULL, 0};
+
+    for(unsigned int m = 0; m < 4; m++) {
+        for(unsigned int vaw = 0; vaw < 2; vaw++) {
+            mat_t* exp = NULL;
+            compute_status err = one_off("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1, &exp);
+            ASSERT(err == okay);
+
+            // and within a memory budget, which is computed in rounds
+            for(uint64_t max_memory : {(uint64_t)0, (uint64_t)1 << 30}) {
+                mat_t* obs = NULL;
+                err = one_off_subset("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1, max_memory,
+                                     &subset, &obs, NULL);
+                ASSERT(err == okay);
+                ASSERT(obs->n_samples == 3);
+                for(unsigned int i = 0; i < 3; i++) {
+                    ASSERT(strcmp(obs->sample_ids[i], exp->sample_ids[kept[i]]) == 0);
+                    for(unsigned int j = i + 1; j < 3; j++)
+                        ASSERT(fabs(cf_value(obs, i, j) - cf_value(exp, kept[i], kept[j])) < 0.000001);
+                }
+                destroy_mat(&obs);
+            }
+
+            partial_mat_t* partials[2] = {NULL, NULL};
+            err = partial_subset("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1, 0, 1, &subset,
+                                 &partials[0]);
+            ASSERT(err == okay);
+            err = partial_subset("test.biom", "test.tre", methods[m], vaw, 0.5, false, 1, 1, 2, &subset,
+                                 &partials[1]);
+            ASSERT(err == okay);
+            mat_t* merged = NULL;
+            ASSERT(merge_partial(partials, 2, 1, &merged) == merge_okay);
+            ASSERT(merged->n_samples == 3);
+            for(unsigned int i = 0; i < 3; i++)
+                for(unsigned int j = i + 1; j < 3; j++)
+                    ASSERT(fabs(cf_value(merged, i, j) - cf_value(exp, kept[i], kept[j])) < 0.000001);
+            destroy_mat(&merged);
+            destroy_partial_mat(&partials[0]);
+            destroy_partial_mat(&partials[1]);
+            destroy_mat(&exp);
+        }
+    }
+
+    r_vec* faith_exp = NULL;
+    r_vec* faith_obs = NULL;
+    ASSERT(faith_pd_one_off("test.biom", "test.tre", &faith_exp) == okay);
+    ASSERT(faith_pd_subset("test.biom", "test.tre", &subset, &faith_obs, NULL) == okay);
+    ASSERT(faith_obs->n_samples == 3);
+    for(unsigned int i = 0; i < 3; i++) {
+        ASSERT(strcmp(faith_obs->sample_ids[i], faith_exp->sample_ids[kept[i]]) == 0);
+        ASSERT(fabs(faith_obs->values[i] - faith_exp->values[kept[i]]) < 0.000001);
+    }
+    destroy_results_vec(&faith_obs);
+
+    // a feature subset only reduces the phylogenetic diversity
+    const char* feature_ids[2] = {"GG_OTU_2", "not-a-feature"};
+    table_subset_t features = {NULL, 0, feature_ids, 2};
+    ASSERT(faith_pd_subset("test.biom", "test.tre", &features, &faith_obs, NULL) == okay);
+    ASSERT(faith_obs->n_samples == 6);
+    for(unsigned int i = 0; i < 6; i++)
+        ASSERT(faith_obs->values[i] <= faith_exp->values[i]);
+    // Sample3 does not observe GG_OTU_2
+    ASSERT(faith_obs->values[2] == 0.0);
+    destroy_results_vec(&faith_obs);
+    destroy_results_vec(&faith_exp);
+
+    const char* unknown[2] = {"Sample1", "does-not-exist"};
+    table_subset_t missing = {unknown, 2, NULL, 0};
+    mat_t* obs = NULL;
+    ASSERT(one_off_subset("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, 0, &missing,
+                          &obs, NULL) == sample_missing);
+    table_subset_t empty = {sample_ids, 0, NULL, 0};
+    ASSERT(one_off_subset("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, 0, &empty,
+                          &obs, NULL) == table_empty);
+
+    SUITE_END();
+}
+
+void test_one_off_duplicates() {
+    SUITE_START("test one_off over repeated samples");
+
+    const char* methods[4] = {"unweighted", "weighted_normalized", "weighted_unnormalized", "generalized"};
+    // Sample7 and Sample10 repeat Sample2, Sample8 repeats Sample5, and
+    // Sample9 and Sample11 are empty
+    const char* ids[11] = {"Sample1", "Sample2", "Sample3", "Sample4", "Sample5", "Sample6",
+                           "Sample7", "Sample8", "Sample9", "Sample10", "Sample11"};
+
+    for(unsigned int m = 0; m < 4; m++) {
+        for(unsigned int vaw = 0; vaw < 2; vaw++) {
+            // the cross computation does not collapse repeats
+            rect_mat_t* exp = NULL;
+            compute_status err = one_off_cross("test_duplicates.biom", "test.tre", methods[m], vaw, 0.5, false,
+                                               1, ids, 11, ids, 11, &exp);
+            ASSERT(err == okay);
+
+            for(uint64_t max_memory : {(uint64_t)0, (uint64_t)1 << 30}) {
+                mat_t* obs = NULL;
+                run_stats_t* stats = NULL;
+                err = one_off_budgeted("test_duplicates.biom", "test.tre", methods[m], vaw, 0.5, false, 1,
+                                       max_memory, &obs, &stats);
+                ASSERT(err == okay);
+                ASSERT(obs->n_samples == 11);
+                ASSERT(stats->n_duplicates == 3);
+                ASSERT(strcmp(stats->phase_names[stats->n_phases - 1], "expand") == 0);
+                for(unsigned int i = 0; i < 11; i++) {
+                    ASSERT(strcmp(obs->sample_ids[i], ids[i]) == 0);
+                    for(unsigned int j = i + 1; j < 11; j++) {
+                        double e = exp->values[i * 11 + j];
+                        double o = cf_value(obs, i, j);
+                        ASSERT((std::isnan(e) && std::isnan(o)) || fabs(o - e) < 0.000001);
+                    }
+                }
+                destroy_run_stats(&stats);
+                destroy_mat(&obs);
+            }
+            destroy_rect_mat(&exp);
+        }
+    }
+
+    // the distinct samples of a table are computed as before
+    mat_t* obs = NULL;
+    run_stats_t* stats = NULL;
+    ASSERT(one_off_stats("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, &obs, &stats) == okay);
+    ASSERT(stats->n_duplicates == 0);
+    ASSERT(strcmp(stats->phase_names[stats->n_phases - 1], "condense") == 0);
+    destroy_run_stats(&stats);
+    destroy_mat(&obs);
+
+    SUITE_END();
+}
+
+void test_one_off_matrix() {
+    SUITE_START("test one_off_matrix and merge_partial_matrix");
+
+    const char* methods[4] = {"unweighted", "weighted_normalized", "weighted_unnormalized", "generalized"};
+    for(auto table : {"test.biom", "test_duplicates.biom"}) {
+        for(unsigned int m = 0; m < 4; m++) {
+            for(bool vaw : {false, true}) {
+                for(uint64_t max_memory : {(uint64_t)0, (uint64_t)1 << 30}) {
+                    mat_t* exp = NULL;
+                    compute_status err = one_off_budgeted(table, "test.tre", methods[m], vaw, 0.5, false, 1,
+                                                          max_memory, &exp, NULL);
+                    ASSERT(err == okay);
+
+                    mat_full_t* obs = NULL;
+                    err = one_off_matrix(table, "test.tre", methods[m], vaw, 0.5, false, 1, max_memory, NULL,
+                                         &obs, NULL);
+                    ASSERT(err == okay);
+                    unsigned int n = exp->n_samples;
+                    ASSERT(obs->n_samples == n);
+                    for(unsigned int i = 0; i < n; i++) {
+                        ASSERT(strcmp(obs->sample_ids[i], exp->sample_ids[i]) == 0);
+                        for(unsigned int j = 0; j < n; j++) {
+                            double e = cf_value(exp, i, j);
+                            double o = obs->matrix[i * n + j];
+                            ASSERT((std::isnan(e) && std::isnan(o)) || o == e);
+                        }
+                    }
+                    destroy_mat_full(&obs);
+                    destroy_mat(&exp);
+                }
+            }
+        }
+    }
+
+    // the merged stripes are consumed
+    mat_t* exp = NULL;
+    ASSERT(one_off("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, &exp) == okay);
+    partial_mat_t* partials[2] = {NULL, NULL};
+    ASSERT(partial("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, 0, 1, &partials[0]) == okay);
+    ASSERT(partial("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, 1, 3, &partials[1]) == okay);
+    mat_full_t* merged = NULL;
+    ASSERT(merge_partial_matrix(partials, 2, 2, &merged) == merge_okay);
+    ASSERT(partials[0]->stripes[0] == NULL);
+    ASSERT(partials[1]->stripes[0] == NULL && partials[1]->stripes[1] == NULL);
+    for(unsigned int i = 0; i < 6; i++) {
+        ASSERT(strcmp(merged->sample_ids[i], exp->sample_ids[i]) == 0);
+        for(unsigned int j = 0; j < 6; j++)
+            ASSERT(merged->matrix[i * 6 + j] == cf_value(exp, i, j));
+    }
+    destroy_mat_full(&merged);
+    destroy_partial_mat(&partials[0]);
+    destroy_partial_mat(&partials[1]);
+    destroy_mat(&exp);
+
+    SUITE_END();
+}
+
+void test_one_off_budgeted() {
+    SUITE_START("test one_off_budgeted");
+
+    const char* methods[] = {"unweighted", "weighted_normalized", "weighted_unnormalized", "generalized"};
+    for(auto method : methods) {
+        for(bool vaw : {false, true}) {
+            mat_t* exp = NULL;
+            compute_status err = one_off("test.biom", "test.tre", method, vaw, 0.5, false, 1, &exp);
+            ASSERT(err == okay);
+
+            // from too small, through rounds of one and two stripes, to a
+            // single round of the 3 stripes
+            uint64_t smallest = 0;
+            for(uint64_t max_memory = 1024; max_memory < 8192; max_memory += 32) {
+                mat_t* obs = NULL;
+                err = one_off_budgeted("test.biom", "test.tre", method, vaw, 0.5, false, 1, max_memory,
+                                       &obs, NULL);
+                if(err == memory_limit_exceeded) {
+                    ASSERT(smallest == 0);
+                    ASSERT(obs == NULL);
+                    continue;
+                }
+                ASSERT(err == okay);
+                if(smallest == 0)
+                    smallest = max_memory;
+                for(unsigned int i = 0; i < exp->cf_size; i++)
+                    ASSERT(obs->condensed_form[i] == exp->condensed_form[i]);
+                destroy_mat(&obs);
+            }
+            ASSERT(smallest > 1024);
+            destroy_mat(&exp);
+        }
+    }
+
+    // 0 is no limit, and the rounds are reported as a single compute phase
+    mat_t* obs = NULL;
+    run_stats_t* stats = NULL;
+    compute_status err = one_off_budgeted("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, 0,
+                                          &obs, NULL);
+    ASSERT(err == okay);
+    destroy_mat(&obs);
+    err = one_off_budgeted("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, 1 << 20, &obs, &stats);
+    ASSERT(err == okay);
+    const char* phases[] = {"parse", "load", "shear", "compute"};
+    ASSERT(stats->n_phases == 4);
+    for(unsigned int i = 0; i < stats->n_phases; i++)
+        ASSERT(strcmp(stats->phase_names[i], phases[i]) == 0);
+    destroy_run_stats(&stats);
+    destroy_mat(&obs);
+
+    obs = NULL;
+    err = one_off_budgeted("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, 1, &obs, &stats);
+    ASSERT(err == memory_limit_exceeded);
+    ASSERT(obs == NULL);
+    ASSERT(stats == NULL);
+
+    SUITE_END();
+}
+
+void test_one_off_checkpoint() {
+    SUITE_START("test one_off_checkpoint and partial_checkpoint");
+
+    const char* methods[] = {"unweighted", "weighted_normalized", "weighted_unnormalized", "generalized"};
+    for(auto method : methods) {
+        for(bool vaw : {false, true}) {
+            mat_t* exp = NULL;
+            compute_status err = one_off("test.biom", "test.tre", method, vaw, 0.5, false, 1, &exp);
+            ASSERT(err == okay);
+
+            // a checkpoint after every node, which is removed on completion
+            mat_t* obs = NULL;
+            err = one_off_checkpoint("test.biom", "test.tre", method, vaw, 0.5, false, 1, "test_checkpoint",
+                                     0, true, &obs);
+            ASSERT(err == okay);
+            for(unsigned int i = 0; i < exp->cf_size; i++)
+                ASSERT(obs->condensed_form[i] == exp->condensed_form[i]);
+            ASSERT(!std::ifstream("test_checkpoint.0-3.ckpt").good());
+            destroy_mat(&obs);
+
+            partial_mat_t* exp_partial = NULL;
+            partial_mat_t* obs_partial = NULL;
+            err = partial("test.biom", "test.tre", method, vaw, 0.5, false, 1, 1, 3, &exp_partial);
+            ASSERT(err == okay);
+            err = partial_checkpoint("test.biom", "test.tre", method, vaw, 0.5, false, 1, 1, 3,
+                                     "test_checkpoint", 0, false, &obs_partial);
+            ASSERT(err == okay);
+            for(unsigned int i = 0; i < 2; i++)
+                for(unsigned int j = 0; j < 6; j++)
+                    ASSERT(obs_partial->stripes[i][j] == exp_partial->stripes[i][j]);
+            ASSERT(!std::ifstream("test_checkpoint.1-3.ckpt").good());
+            destroy_partial_mat(&exp_partial);
+            destroy_partial_mat(&obs_partial);
+            destroy_mat(&exp);
+        }
+    }
+
+    // a NULL prefix does not checkpoint
+    mat_t* obs = NULL;
+    compute_status err = one_off_checkpoint("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, NULL,
+                                            0, false, &obs);
+    ASSERT(err == okay);
+    destroy_mat(&obs);
+
+    partial_mat_t* obs_partial = NULL;
+    err = partial_checkpoint("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, 2, 2,
+                             "test_checkpoint", 0, false, &obs_partial);
+    ASSERT(err == stripes_out_of_bounds);
+
+    SUITE_END();
+}
+
+void test_plan_partials() {
+    SUITE_START("test plan_partials and calibrate_cost_model");
+
+    // without limits, a single partition of the 3 stripes
+    partial_plan_t* plan = NULL;
+    compute_status err = plan_partials("test.biom", "test.tre", "unweighted", false, NULL, 0, 0.0, 4, 0, &plan);
+    ASSERT(err == okay);
+    ASSERT(plan->n_samples == 6);
+    ASSERT(plan->n_obs == 5);
+    ASSERT(plan->n_stripes == 3);
+    ASSERT(plan->n_partials == 1);
+    ASSERT(plan->threads == 3);
+    ASSERT(plan->feasible);
+    ASSERT(plan->starts[0] == 0);
+    ASSERT(plan->stops[0] == 3);
+    // 3 stripes of 6 samples, and their totals for unweighted
+    ASSERT(plan->stripe_bytes[0] == 2 * 3 * 6 * sizeof(double));
+    ASSERT(plan->peak_bytes[0] == plan->table_bytes + plan->tree_bytes + 3 * plan->thread_bytes +
+                                  plan->stripe_bytes[0]);
+    uint64_t whole = plan->peak_bytes[0];
+    uint64_t single = whole - 2 * plan->thread_bytes;
+    destroy_partial_plan(&plan);
+    ASSERT(plan == NULL);
+
+    // memory is first taken from the threads, then the stripes are split
+    err = plan_partials("test.biom", "test.tre", "unweighted", false, NULL, whole - 1, 0.0, 4, 0, &plan);
+    ASSERT(err == okay);
+    ASSERT(plan->feasible);
+    ASSERT(plan->n_partials == 1);
+    ASSERT(plan->threads == 2);
+    ASSERT(plan->peak_bytes[0] < whole);
+    destroy_partial_plan(&plan);
+
+    err = plan_partials("test.biom", "test.tre", "unweighted", false, NULL, single - 1, 0.0, 1, 0, &plan);
+    ASSERT(err == okay);
+    ASSERT(plan->feasible);
+    ASSERT(plan->n_partials == 2);
+    ASSERT(plan->threads == 1);
+    unsigned int exp_starts[] = {0, 2};
+    unsigned int exp_stops[] = {2, 3};
+    for(unsigned int p = 0; p < plan->n_partials; p++) {
+        ASSERT(plan->starts[p] == exp_starts[p]);
+        ASSERT(plan->stops[p] == exp_stops[p]);
+        ASSERT(plan->peak_bytes[p] < single);
+    }
+    destroy_partial_plan(&plan);
+
+    // an impossible limit gives the most partitions, marked as not feasible
+    err = plan_partials("test.biom", "test.tre", "unweighted", false, NULL, 1, 0.0, 1, 0, &plan);
+    ASSERT(err == okay);
+    ASSERT(!plan->feasible);
+    ASSERT(plan->n_partials == 3);
+    destroy_partial_plan(&plan);
+
+    // with only a stripe cost, of 1 second per node and sample, each
+    // stripe is 7 nodes * 6 samples = 42 seconds
+    cost_model_t model = {0.0, 1.0};
+    err = plan_partials("test.biom", "test.tre", "unweighted", false, &model, 0, 90.0, 1, 0, &plan);
+    ASSERT(err == okay);
+    ASSERT(plan->feasible);
+    ASSERT(plan->n_partials == 2);
+    ASSERT(plan->seconds[0] == 84.0);
+    ASSERT(plan->seconds[1] == 42.0);
+    ASSERT(plan->model.stripe_seconds == 1.0);
+    destroy_partial_plan(&plan);
+
+    // a requested number of partitions is kept
+    err = plan_partials("test.biom", "test.tre", "weighted_unnormalized", false, NULL, 0, 0.0, 1, 3, &plan);
+    ASSERT(err == okay);
+    ASSERT(plan->n_partials == 3);
+    // without totals for weighted unnormalized
+    ASSERT(plan->stripe_bytes[0] == 6 * sizeof(double));
+    destroy_partial_plan(&plan);
+
+    err = plan_partials("test.biom", "test.tre", "foo", false, NULL, 0, 0.0, 1, 0, &plan);
+    ASSERT(err == unknown_method);
+    err = plan_partials("test.tre", "test.tre", "unweighted", false, NULL, 0, 0.0, 1, 0, &plan);
+    ASSERT(err == table_bad_format_version);
+
+    err = calibrate_cost_model("test.biom", "test.tre", "unweighted", false, false, &model);
+    ASSERT(err == okay);
+    ASSERT(model.node_seconds >= 0.0);
+    ASSERT(model.stripe_seconds >= 0.0);
+    ASSERT(model.node_seconds + model.stripe_seconds > 0.0);
+
+    SUITE_END();
+}
+
+void test_pcoa_mat() {
+    SUITE_START("test pcoa_mat and write_ordination");
+
+    mat_t* dm = NULL;
+    compute_status err = one_off("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, &dm);
+    ASSERT(err == okay);
+
+    // more axes than samples are reduced
+    ordination_t* obs = NULL;
+    pcoa_mat(dm, 10, 2, &obs);
+    ASSERT(obs->n_samples == 6);
+    ASSERT(obs->n_axes == 6);
+    for(unsigned int i = 0; i < 6; i++)
+        ASSERT(strcmp(obs->sample_ids[i], dm->sample_ids[i]) == 0);
+
+    // the eigenvalues of all of the axes sum to the trace of the centered
+    // matrix, or more where negative eigenvalues are reported as zero
+    double trace = 0.0;
+    for(unsigned int i = 0; i < dm->cf_size; i++)
+        trace += dm->condensed_form[i] * dm->condensed_form[i] / 6;
+    double total = 0.0;
+    for(unsigned int k = 0; k < 6; k++) {
+        ASSERT(obs->eigvals[k] >= 0);
+        if(k > 0)
+            ASSERT(obs->eigvals[k] <= obs->eigvals[k - 1]);
+        ASSERT(fabs(obs->proportion_explained[k] - obs->eigvals[k] / trace) < 1e-12);
+        total += obs->proportion_explained[k];
+    }
+    ASSERT(total >= 1.0 - 1e-9);
+
+    ordination_t* obs_one_off = NULL;
+    err = one_off_pcoa("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, 3, &obs_one_off);
+    ASSERT(err == okay);
+    ASSERT(obs_one_off->n_axes == 3);
+    for(unsigned int k = 0; k < 3; k++) {
+        ASSERT(fabs(obs_one_off->eigvals[k] - obs->eigvals[k]) < 1e-9);
+        for(unsigned int i = 0; i < 6; i++)
+            ASSERT(fabs(fabs(obs_one_off->coordinates[i * 3 + k]) - fabs(obs->coordinates[i * 6 + k])) < 1e-6);
+    }
+
+    IOStatus io_err = write_ordination("test_pcoa.txt", obs_one_off);
+    ASSERT(io_err == write_okay);
+    std::ifstream input("test_pcoa.txt");
+    std::string line;
+    std::getline(input, line);
+    ASSERT(line == "Eigvals\t3");
+    std::vector<std::string> headers;
+    while(std::getline(input, line))
+        if(line.find('\t') != std::string::npos && line.compare(0, 4, "Site") == 0)
+            headers.push_back(line);
+    ASSERT(headers.size() == 2);
+    ASSERT(headers[0] == "Site\t6\t3");
+    ASSERT(headers[1] == "Site constraints\t0\t0");
+    input.close();
+    remove("test_pcoa.txt");
+
+    io_err = write_ordination("/does/not/exist/test_pcoa.txt", obs_one_off);
+    ASSERT(io_err == open_error);
+
+    err = one_off_pcoa("test.biom", "does-not-exist.tre", "unweighted", false, 1.0, false, 1, 3, &obs_one_off);
+    ASSERT(err == tree_missing);
+
+    destroy_ordination(&obs);
+    destroy_ordination(&obs_one_off);
+    destroy_mat(&dm);
+
+    SUITE_END();
+}
+
+void test_permutation_tests_mat() {
+    SUITE_START("test permanova_mat and permdisp_mat");
+
+    mat_t* dm = NULL;
+    compute_status err = one_off("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, &dm);
+    ASSERT(err == okay);
+
+    unsigned int grouping[] = {0, 0, 0, 1, 1, 1};
+    permutation_test_t result;
+    err = permanova_mat(dm, grouping, 2, 99, 0, 2, &result);
+    ASSERT(err == okay);
+    ASSERT(strcmp(result.method_name, "PERMANOVA") == 0);
+    ASSERT(strcmp(result.statistic_name, "pseudo-F") == 0);
+    ASSERT(result.n_samples == 6);
+    ASSERT(result.n_groups == 2);
+    ASSERT(result.permutations == 99);
+    ASSERT(result.p_value > 0 && result.p_value <= 1);
+
+    err = permdisp_mat(dm, grouping, 2, 0, 0, 1, &result);
+    ASSERT(err == okay);
+    ASSERT(strcmp(result.method_name, "PERMDISP") == 0);
+    ASSERT(result.statistic >= 0);
+    ASSERT(std::isnan(result.p_value));
+
+    // a single group, a group for each sample, an empty group and a group
+    // out of range are not tests
+    unsigned int single[] = {0, 0, 0, 0, 0, 0};
+    unsigned int unique[] = {0, 1, 2, 3, 4, 5};
+    unsigned int out_of_range[] = {0, 0, 0, 1, 1, 2};
+    ASSERT(permanova_mat(dm, single, 1, 9, 0, 1, &result) == grouping_invalid);
+    ASSERT(permanova_mat(dm, unique, 6, 9, 0, 1, &result) == grouping_invalid);
+    ASSERT(permanova_mat(dm, grouping, 3, 9, 0, 1, &result) == grouping_invalid);
+    ASSERT(permdisp_mat(dm, out_of_range, 2, 9, 0, 1, &result) == grouping_invalid);
+
+    destroy_mat(&dm);
+
+    SUITE_END();
+}
+
+// send a request line to the server on path, and return its response line
+std::string request_line(const char* path, const std::string &line) {
+    sockaddr_un address;
+    memset(&address, 0, sizeof(address));
+    address.sun_family = AF_UNIX;
+    strcpy(address.sun_path, path);
+
+    // the server may not be listening yet
+    int fd = -1;
+    for(unsigned int attempt = 0; attempt < 500; attempt++) {
+        fd = socket(AF_UNIX, SOCK_STREAM, 0);
+        if(connect(fd, (const sockaddr*)&address, sizeof(address)) == 0)
+            break;
+        close(fd);
+        fd = -1;
+        usleep(10000);
+    }
+    if(fd < 0)
+        return "";
+
+    std::string request = line + "\n";
+    if(send(fd, request.data(), request.size(), 0) != (ssize_t)request.size()) {
+        close(fd);
+        return "";
+    }
+    std::string response;
+    char buffer[1024];
+    ssize_t got;
+    while((got = recv(fd, buffer, sizeof(buffer), 0)) > 0)
+        response.append(buffer, got);
+    close(fd);
+    if(!response.empty() && response[response.size() - 1] == '\n')
+        response.erase(response.size() - 1);
+    return response;
+}
+
+void test_one_off_loaded() {
+    SUITE_START("test load_tree, one_off_loaded and serve");
+
+    loaded_tree_t* tree = NULL;
+    ASSERT(load_tree("does-not-exist.tre", &tree) == tree_missing);
+    ASSERT(tree == NULL);
+    ASSERT(load_tree("test.tre", &tree) == okay);
+
+    // the loaded tree is reused over tables and methods
+    const char* methods[4] = {"unweighted", "weighted_normalized", "weighted_unnormalized", "generalized"};
+    for(auto table : {"test.biom", "test_duplicates.biom"}) {
+        for(unsigned int m = 0; m < 4; m++) {
+            mat_t* exp = NULL;
+            ASSERT(one_off(table, "test.tre", methods[m], false, 0.5, false, 2, &exp) == okay);
+            mat_t* obs = NULL;
+            ASSERT(one_off_loaded(table, tree, methods[m], false, 0.5, false, 2, 0, &obs, NULL) == okay);
+            ASSERT(obs->n_samples == exp->n_samples);
+            for(unsigned int i = 0; i < exp->cf_size; i++) {
+                double e = exp->condensed_form[i];
+                double o = obs->condensed_form[i];
+                ASSERT((std::isnan(e) && std::isnan(o)) || o == e);
+            }
+            destroy_mat(&obs);
+            destroy_mat(&exp);
+        }
+    }
+    mat_t* missing = NULL;
+    ASSERT(one_off_loaded("does-not-exist.biom", tree, "unweighted", false, 1.0, false, 1, 0, &missing,
+                          NULL) == table_missing);
+
+    // the features of the table are checked against the indexed tips
+    const char* partial_tree = "test_loaded_partial.tre";
+    std::ofstream partial_out(partial_tree);
+    partial_out << "(GG_OTU_1:1,(GG_OTU_2:1,GG_OTU_3:1):1,GG_OTU_4:1);" << std::endl;
+    partial_out.close();
+    loaded_tree_t* partial = NULL;
+    ASSERT(load_tree(partial_tree, &partial) == okay);
+    ASSERT(one_off_loaded("test.biom", partial, "unweighted", false, 1.0, false, 1, 0, &missing,
+                          NULL) == table_and_tree_do_not_overlap);
+    destroy_loaded_tree(&partial);
+    remove(partial_tree);
+
+    const char* socket_path = "test_serve.sock";
+    const char* names[1] = {"test"};
+    int served = -1;
+    std::thread server([&]() { served = serve(socket_path, names, &tree, 1, 2); });
+
+    std::string response = request_line(socket_path, "tree=test\ttable=test.biom\toutput=test_serve.dm\tthreads=2");
+    ASSERT(response.find("status=okay") != std::string::npos);
+    ASSERT(response.find("n_samples=6") != std::string::npos);
+    mat_t* exp = NULL;
+    ASSERT(one_off("test.biom", "test.tre", "unweighted", false, 1.0, false, 1, &exp) == okay);
+    mat_t* obs = NULL;
+    ASSERT(read_mat("test_serve.dm", &obs) == read_okay);
+    for(unsigned int i = 0; i < exp->cf_size; i++)
+        ASSERT(fabs(obs->condensed_form[i] - exp->condensed_form[i]) < 1e-12);
+    destroy_mat(&obs);
+    destroy_mat(&exp);
+    remove("test_serve.dm");
+
+    response = request_line(socket_path, "tree=other\ttable=test.biom\toutput=test_serve.dm");
+    ASSERT(response.find("error=unknown_tree") != std::string::npos);
+    response = request_line(socket_path, "tree=test\ttable=does-not-exist.biom\toutput=test_serve.dm");
+    ASSERT(response.find("error=table_missing") != std::string::npos);
+    response = request_line(socket_path, "tree=test\ttable=test.biom");
+    ASSERT(response.find("error=bad_request") != std::string::npos);
+
+    response = request_line(socket_path, "command=metrics");
+    ASSERT(response.find("completed=1") != std::string::npos);
+    ASSERT(response.find("failed=3") != std::string::npos);
+    ASSERT(response.find("thread_budget=2") != std::string::npos);
+    ASSERT(response.find("trees=test") != std::string::npos);
+
+    response = request_line(socket_path, "command=shutdown");
+    ASSERT(response == "status=okay");
+    server.join();
+    ASSERT(served == 0);
+    std::ifstream removed(socket_path);
+    ASSERT(!removed.good());
+
+    destroy_loaded_tree(&tree);
+    ASSERT(tree == NULL);
+
+    SUITE_END();
+}
+
+void test_compute_status_names() {
+    SUITE_START("test compute_status_name and compute_status_message");
+
+    ASSERT(strcmp(compute_status_name(okay), "okay") == 0);
+    ASSERT(strcmp(compute_status_name(tree_missing), "tree_missing") == 0);
+    ASSERT(strcmp(compute_status_name(grouping_invalid), "grouping_invalid") == 0);
+    ASSERT(strcmp(compute_status_message(table_missing), "The table file cannot be found.") == 0);
+    for(int status = okay; status <= grouping_invalid; status++) {
+        ASSERT(strlen(compute_status_name((ComputeStatus)status)) > 0);
+        ASSERT(strlen(compute_status_message((ComputeStatus)status)) > 0);
+    }
+
+    SUITE_END();
+}
+
 int main(int argc, char** argv) {
     /* one_off and partial are executed as integration tests */    
 
-    //test_write_mat();
-    //test_read_mat();
+    test_read_write_mat();
     test_read_write_partial_mat();
     test_merge_partial_mat();
+    test_one_off_cross();
+    test_append_samples();
+    test_knn_query();
+    test_one_off_rarefied();
+    test_one_off_stats();
+    test_plan_partials();
+    test_one_off_subset();
+    test_one_off_duplicates();
+    test_one_off_budgeted();
+    test_one_off_matrix();
+    test_one_off_checkpoint();
+    test_pcoa_mat();
+    test_permutation_tests_mat();
+    test_one_off_loaded();
+    test_compute_status_names();
 
     printf("\n");
     printf(" %i / %i suites failed\n", suites_failed, suites_run);
@@ -1,11 +1,21 @@
 #include <iostream>
+#include <fstream>
 #include "api.hpp"
 #include "tree.hpp"
 #include "biom.hpp"
 #include "unifrac.hpp"
+#include "ordination.hpp"
+#include "permutation.hpp"
+#include "pool.hpp"
+#include "serve.hpp"
 #include <cmath>
 #include <unordered_set>
 #include <string.h>
+#include <stack>
+#include <thread>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <unistd.h>
 
 /*
  * test harness adapted from
@@ -508,6 +518,281 @@ void test_biom_get_obs_data() {
     SUITE_END();
 }
 
+void test_bptree_constructor_malformed() {
+    SUITE_START("bptree constructor malformed newick");
+
+    std::vector<std::string> malformed = {"((a:1,b:2):3;",
+                                          "(a:1,b:2)r;)",
+                                          "(a:1)(b:2);",
+                                          "a:1,(b:2);",
+                                          "('a:1,b:2);",
+                                          "(a:1,b:x)r;",
+                                          ""};
+    for(auto &newick : malformed) {
+        bool raised = false;
+        try {
+            su::BPTree tree = su::BPTree(newick);
+        } catch(const std::invalid_argument &e) {
+            raised = true;
+        }
+        ASSERT(raised);
+    }
+    SUITE_END();
+}
+
+void test_biom_not_biom() {
+    SUITE_START("biom constructor on a file which is not BIOM 2.1");
+
+    bool raised = false;
+    try {
+        su::biom table = su::biom("test.tre");
+    } catch(const std::invalid_argument &e) {
+        raised = true;
+    }
+    ASSERT(raised);
+    SUITE_END();
+}
+
+void test_biom_read_shape() {
+    SUITE_START("biom read shape");
+
+    su::biom table = su::biom("test.biom");
+    uint32_t n_obs, n_samples, nnz;
+    su::biom::read_shape("test.biom", n_obs, n_samples, nnz);
+    ASSERT(n_obs == table.n_obs);
+    ASSERT(n_samples == table.n_samples);
+    ASSERT(nnz == table.nnz);
+
+    bool raised = false;
+    try {
+        su::biom::read_shape("test.tre", n_obs, n_samples, nnz);
+    } catch(const std::invalid_argument &e) {
+        raised = true;
+    }
+    ASSERT(raised);
+    SUITE_END();
+}
+
+void test_biom_rarefied() {
+    SUITE_START("biom rarefied constructor");
+
+    su::biom table = su::biom("test.biom");
+    // sample totals are 7, 3, 4, 6, 3 and 4
+    su::biom obs = su::biom(table, 4, 42);
+
+    std::string sids[] = {"Sample1", "Sample3", "Sample4", "Sample6"};
+    std::vector<std::string> exp_sids = _string_array_to_vector(sids, 4);
+    unsigned int source_index[] = {0, 2, 3, 5};
+
+    ASSERT(obs.n_samples == 4);
+    ASSERT(obs.n_obs == table.n_obs);
+    ASSERT(obs.sample_ids == exp_sids);
+    ASSERT(obs.obs_ids == table.obs_ids);
+    ASSERT(obs.sample_indptr.size() == 5);
+    ASSERT(obs.obs_indptr.size() == table.n_obs + 1);
+    ASSERT(obs.nnz == obs.obs_indptr[table.n_obs]);
+
+    double sums[4] = {0, 0, 0, 0};
+    double obs_vec[4];
+    double src_vec[6];
+    for(auto id : table.obs_ids) {
+        obs.get_obs_data(id, obs_vec);
+        table.get_obs_data(id, src_vec);
+        for(unsigned int i = 0; i < 4; i++) {
+            sums[i] += obs_vec[i];
+            ASSERT(obs_vec[i] <= src_vec[source_index[i]]);
+        }
+        // samples with exactly depth counts are unchanged
+        ASSERT(obs_vec[1] == src_vec[2]);
+        ASSERT(obs_vec[3] == src_vec[5]);
+    }
+    for(unsigned int i = 0; i < 4; i++) {
+        ASSERT(sums[i] == 4);
+        ASSERT(obs.sample_counts[i] == 4);
+    }
+
+    // a seed is reproducible
+    su::biom again = su::biom(table, 4, 42);
+    double again_vec[4];
+    for(auto id : table.obs_ids) {
+        obs.get_obs_data(id, obs_vec);
+        again.get_obs_data(id, again_vec);
+        for(unsigned int i = 0; i < 4; i++)
+            ASSERT(obs_vec[i] == again_vec[i]);
+    }
+
+    su::biom deepest = su::biom(table, 7, 42);
+    ASSERT(deepest.n_samples == 1);
+    ASSERT(deepest.sample_ids[0] == "Sample1");
+
+    su::biom none = su::biom(table, 8, 42);
+    ASSERT(none.n_samples == 0);
+    ASSERT(none.nnz == 0);
+
+    SUITE_END();
+}
+
+void test_biom_subset() {
+    SUITE_START("biom subset constructor");
+
+    su::biom exp = su::biom("test.biom");
+    su::biom all = su::biom("test.biom", NULL, NULL);
+    ASSERT(all.sample_ids == exp.sample_ids);
+    ASSERT(all.obs_ids == exp.obs_ids);
+    ASSERT(all.nnz == exp.nnz);
+    ASSERT(all.sample_indptr == exp.sample_indptr);
+    ASSERT(all.obs_indptr == exp.obs_indptr);
+    double all_out[6];
+    double exp_out[6];
+    for(auto &id : exp.obs_ids) {
+        all.get_obs_data(id, all_out);
+        exp.get_obs_data(id, exp_out);
+        ASSERT(vec_almost_equal(_double_array_to_vector(all_out, 6), _double_array_to_vector(exp_out, 6)));
+    }
+
+    // kept in the order of the table, and GG_OTU_1 and GG_OTU_3 are not
+    // observed in either sample
+    std::vector<std::string> samples = {"Sample5", "Sample2", "Sample5"};
+    su::biom table = su::biom("test.biom", &samples, NULL);
+    std::string sids[] = {"Sample2", "Sample5"};
+    std::string oids[] = {"GG_OTU_2", "GG_OTU_4", "GG_OTU_5"};
+    uint32_t o_indptr[] = {0, 2, 3, 4};
+    uint32_t s_indptr[] = {0, 3, 4};
+    ASSERT(table.n_samples == 2);
+    ASSERT(table.n_obs == 3);
+    ASSERT(table.nnz == 4);
+    ASSERT(table.sample_ids == _string_array_to_vector(sids, 2));
+    ASSERT(table.obs_ids == _string_array_to_vector(oids, 3));
+    ASSERT(table.obs_indptr == _uint32_array_to_vector(o_indptr, 4));
+    ASSERT(table.sample_indptr == _uint32_array_to_vector(s_indptr, 3));
+    ASSERT(table.sample_counts[0] == 3);
+    ASSERT(table.sample_counts[1] == 3);
+    double out[2];
+    table.get_obs_data("GG_OTU_2", out);
+    ASSERT(out[0] == 1 && out[1] == 3);
+
+    // unknown features are ignored
+    std::vector<std::string> features = {"GG_OTU_3", "GG_OTU_2", "not-a-feature"};
+    su::biom features_table = su::biom("test_fixed_width.biom", NULL, &features);
+    std::string feature_oids[] = {"GG_OTU_2", "GG_OTU_3"};
+    ASSERT(features_table.n_samples == 6);
+    ASSERT(features_table.obs_ids == _string_array_to_vector(feature_oids, 2));
+    ASSERT(features_table.nnz == 8);
+    double counts[] = {5, 1, 1, 6, 3, 3};
+    ASSERT(vec_almost_equal(_double_array_to_vector(features_table.sample_counts, 6),
+                            _double_array_to_vector(counts, 6)));
+
+    std::vector<std::string> missing = {"Sample1", "not-a-sample"};
+    bool raised = false;
+    try {
+        su::biom missing_table = su::biom("test.biom", &missing, NULL);
+    } catch(const std::out_of_range &e) {
+        raised = true;
+    }
+    ASSERT(raised);
+
+    raised = false;
+    try {
+        su::biom not_biom = su::biom("test.tre", &samples, NULL);
+    } catch(const std::invalid_argument &e) {
+        raised = true;
+    }
+    ASSERT(raised);
+    SUITE_END();
+}
+
+void test_biom_unique_samples() {
+    SUITE_START("biom unique samples and sample selection");
+
+    // Sample7 and Sample10 repeat Sample2, Sample8 repeats Sample5, and
+    // Sample9 and Sample11 are empty
+    su::biom table = su::biom("test_duplicates.biom");
+    std::vector<uint32_t> unique;
+    std::vector<uint32_t> profile;
+    table.unique_samples(unique, profile);
+
+    uint32_t exp_unique[] = {0, 1, 2, 3, 4, 5, 8, 10};
+    uint32_t exp_profile[] = {0, 1, 2, 3, 4, 5, 1, 4, 6, 1, 7};
+    ASSERT(unique == _uint32_array_to_vector(exp_unique, 8));
+    ASSERT(profile == _uint32_array_to_vector(exp_profile, 11));
+
+    su::biom selected = su::biom(table, unique);
+    ASSERT(selected.n_samples == 8);
+    ASSERT(selected.n_obs == table.n_obs);
+    ASSERT(selected.obs_ids == table.obs_ids);
+    ASSERT(selected.nnz == 15);
+    ASSERT(selected.sample_indptr.size() == 9);
+    ASSERT(selected.sample_indptr[8] == 15);
+    double selected_out[8];
+    double table_out[11];
+    for(auto &id : table.obs_ids) {
+        selected.get_obs_data(id, selected_out);
+        table.get_obs_data(id, table_out);
+        for(unsigned int i = 0; i < 8; i++)
+            ASSERT(selected_out[i] == table_out[unique[i]]);
+    }
+    for(unsigned int i = 0; i < 8; i++) {
+        ASSERT(selected.sample_ids[i] == table.sample_ids[unique[i]]);
+        ASSERT(selected.sample_counts[i] == table.sample_counts[unique[i]]);
+    }
+
+    // a sample selected twice is two samples
+    std::vector<uint32_t> twice = {4, 1, 4};
+    su::biom repeated = su::biom(table, twice);
+    ASSERT(repeated.n_samples == 3);
+    ASSERT(repeated.nnz == 5);
+    ASSERT(repeated.sample_ids[0] == "Sample5" && repeated.sample_ids[2] == "Sample5");
+    double repeated_out[3];
+    for(auto &id : table.obs_ids) {
+        repeated.get_obs_data(id, repeated_out);
+        table.get_obs_data(id, table_out);
+        ASSERT(repeated_out[0] == table_out[4] && repeated_out[1] == table_out[1] &&
+               repeated_out[2] == table_out[4]);
+    }
+
+    // without repeats, every sample is its own profile
+    su::biom distinct = su::biom("test.biom");
+    distinct.unique_samples(unique, profile);
+    ASSERT(unique.size() == 6);
+    for(unsigned int i = 0; i < 6; i++)
+        ASSERT(unique[i] == i && profile[i] == i);
+
+    SUITE_END();
+}
+
+void test_biom_fixed_width_and_types() {
+    SUITE_START("biom fixed width ids and non-native types");
+
+    // the same table as test.biom, with fixed width IDs, float32 data and
+    // int64 indices and indptr
+    su::biom table = su::biom("test_fixed_width.biom");
+    su::biom exp = su::biom("test.biom");
+
+    ASSERT(table.n_samples == exp.n_samples);
+    ASSERT(table.n_obs == exp.n_obs);
+    ASSERT(table.nnz == exp.nnz);
+    ASSERT(table.sample_ids == exp.sample_ids);
+    ASSERT(table.obs_ids == exp.obs_ids);
+    ASSERT(table.sample_indptr == exp.sample_indptr);
+    ASSERT(table.obs_indptr == exp.obs_indptr);
+
+    double *obs_out = (double*)malloc(sizeof(double) * 6);
+    double *exp_out = (double*)malloc(sizeof(double) * 6);
+    bool data_ok = true;
+    for(auto &id : exp.obs_ids) {
+        table.get_obs_data(id, obs_out);
+        exp.get_obs_data(id, exp_out);
+        data_ok &= vec_almost_equal(_double_array_to_vector(obs_out, 6), _double_array_to_vector(exp_out, 6));
+    }
+    ASSERT(data_ok);
+    ASSERT(vec_almost_equal(_double_array_to_vector(table.sample_counts, 6),
+                            _double_array_to_vector(exp.sample_counts, 6)));
+
+    free(obs_out);
+    free(exp_out);
+    SUITE_END();
+}
+
 void test_bptree_leftchild() {
     SUITE_START("test bptree left child");
     su::BPTree tree = su::BPTree("((3,4,(6)5)2,7,((10,100)9)8)1;");
@@ -555,51 +840,109 @@ void test_bptree_rightsibling() {
 
 void test_propstack_constructor() {
     SUITE_START("test propstack constructor");
-    su::PropStack ps = su::PropStack(10);
-    // nothing to test directly...
+    su::PropStack ps = su::PropStack(10, 3);
+    ASSERT(ps.size() == 0);
     SUITE_END();
 }
 
-void test_propstack_push_and_pop() {
-    SUITE_START("test propstack push and pop");
-    su::PropStack ps = su::PropStack(10);
-
-    double *vec1 = ps.pop(1);
-    double *vec2 = ps.pop(2);
-    double *vec3 = ps.pop(3);
-    double *vec1_obs;
-    double *vec2_obs;
-    double *vec3_obs;
-
-    ps.push(1);
-    ps.push(2);
-    ps.push(3);
-
-    vec3_obs = ps.pop(4);
-    vec2_obs = ps.pop(5);
-    vec1_obs = ps.pop(6);
-
-    ASSERT(vec1 == vec1_obs);
-    ASSERT(vec2 == vec2_obs);
-    ASSERT(vec3 == vec3_obs);
+void test_propstack_next_and_reduce() {
+    SUITE_START("test propstack next and reduce");
+    su::PropStack ps = su::PropStack(10, 4);
+
+    // three completed leaves
+    double *vec1 = ps.next();
+    ps.reduce(0);
+    double *vec2 = ps.next();
+    ps.reduce(0);
+    double *vec3 = ps.next();
+    ps.reduce(0);
+    ASSERT(vec1 != vec2);
+    ASSERT(vec2 != vec3);
+    ASSERT(ps.size() == 3);
+
+    // the most recently completed is on top
+    ASSERT(ps.get(0) == vec3);
+    ASSERT(ps.get(1) == vec2);
+    ASSERT(ps.get(2) == vec1);
+
+    // a node with the last two as children replaces them
+    double *vec4 = ps.next();
+    ps.reduce(2);
+    ASSERT(ps.size() == 2);
+    ASSERT(ps.get(0) == vec4);
+    ASSERT(ps.get(1) == vec1);
+
+    // the buffers of the children are reused
+    double *vec5 = ps.next();
+    ASSERT(vec5 == vec2 || vec5 == vec3);
     SUITE_END();
 }
 
-void test_propstack_get() {
-    SUITE_START("test propstack get");
-    su::PropStack ps = su::PropStack(10);
-
-    double *vec1 = ps.pop(1);
-    double *vec2 = ps.pop(2);
-    double *vec3 = ps.pop(3);
+void test_propstack_max_live() {
+    SUITE_START("test propstack max live");
+
+    // a caterpillar leaning right keeps every left tip live
+    su::BPTree right = su::BPTree("(a,(b,(c,(d,e))));");
+    ASSERT(su::PropStack::max_live(right) == 6);
+
+    // whereas leaning left, each internal node consumes as it goes
+    su::BPTree left = su::BPTree("((((a,b),c),d),e);");
+    ASSERT(su::PropStack::max_live(left) == 3);
+
+    // the children of the root, which is not traversed, stay live
+    su::BPTree star = su::BPTree("(a,b,c,d,e);");
+    ASSERT(su::PropStack::max_live(star) == 5);
+
+    // and every node completed in postorder must fit
+    su::BPTree tree = su::BPTree("(((a,b),(c,d)),((e,f),(g,h)));");
+    su::PropStack ps = su::PropStack(1, su::PropStack::max_live(tree));
+    uint32_t peak = 0;
+    for(unsigned int k = 0; k < (tree.nparens / 2) - 1; k++) {
+        uint32_t node = tree.postorderselect(k);
+        uint32_t n_children = 0;
+        if(!tree.isleaf(node)) {
+            uint32_t current = tree.leftchild(node);
+            while(current != 0) {
+                n_children++;
+                current = tree.rightsibling(current);
+            }
+        }
+        ps.next();
+        peak = std::max(peak, ps.size() + 1);
+        ps.reduce(n_children);
+    }
+    ASSERT(peak == su::PropStack::max_live(tree));
+    SUITE_END();
+}
 
-    double *vec1_obs = ps.get(1);
-    double *vec2_obs = ps.get(2);
-    double *vec3_obs = ps.get(3);
+void test_newick_shape() {
+    SUITE_START("test newick shape");
+
+    std::string newicks[] = {"(a,(b,(c,(d,e))));",
+                             "((((a,b),c),d),e);",
+                             "(a,b,c,d,e);",
+                             "(((a,b),(c,d)),((e,f),(g,h)));",
+                             "((a:1,b:2)x:3,'c,(d)':4)root;",
+                             "(GG_OTU_1:1,(GG_OTU_2:1,GG_OTU_3:1):1,(GG_OTU_5:1,GG_OTU_4:1):1);\n",
+                             "((a)b,(c,d))e;"};
+    for(auto &newick : newicks) {
+        su::BPTree tree = su::BPTree(newick);
+        uint32_t n_nodes, n_tips, max_live;
+        su::newick_shape(newick, n_nodes, n_tips, max_live);
+        ASSERT(n_nodes == tree.nparens / 2);
+        ASSERT(n_tips == tree.get_tip_names().size());
+        ASSERT(max_live == su::PropStack::max_live(tree));
+    }
 
-    ASSERT(vec1 == vec1_obs);
-    ASSERT(vec2 == vec2_obs);
-    ASSERT(vec3 == vec3_obs);
+    std::ifstream ifs("test.tre");
+    std::string content = std::string(std::istreambuf_iterator<char>(ifs),
+                                      std::istreambuf_iterator<char>());
+    su::BPTree tree = su::BPTree(content);
+    uint32_t n_nodes, n_tips, max_live;
+    su::newick_shape(content, n_nodes, n_tips, max_live);
+    ASSERT(n_nodes == tree.nparens / 2);
+    ASSERT(n_tips == tree.get_tip_names().size());
+    ASSERT(max_live == su::PropStack::max_live(tree));
     SUITE_END();
 }
 
@@ -609,22 +952,22 @@ void test_unifrac_set_proportions() {
     //                           ( ( ) ( ( ) ( ) ) ( ( ) ( ) ) )
     su::BPTree tree = su::BPTree("(GG_OTU_1,(GG_OTU_2,GG_OTU_3),(GG_OTU_5,GG_OTU_4));");
     su::biom table = su::biom("test.biom");
-    su::PropStack ps = su::PropStack(table.n_samples);
+    su::PropStack ps = su::PropStack(table.n_samples, su::PropStack::max_live(tree));
 
     double sample_counts[] = {7, 3, 4, 6, 3, 4};
-    double *obs = ps.pop(4); // GG_OTU_2
+    double *obs = ps.next(); // GG_OTU_2
     double exp4[] = {0.714285714286, 0.333333333333, 0.0, 0.333333333333, 1.0, 0.25};
     set_proportions(obs, tree, 4, table, ps);
     for(unsigned int i = 0; i < table.n_samples; i++)
         ASSERT(fabs(obs[i] - exp4[i]) < 0.000001);
 
-    obs = ps.pop(6); // GG_OTU_3
+    obs = ps.next(); // GG_OTU_3
     double exp6[] = {0.0, 0.0, 0.25, 0.666666666667, 0.0, 0.5};
     set_proportions(obs, tree, 6, table, ps);
     for(unsigned int i = 0; i < table.n_samples; i++)
         ASSERT(fabs(obs[i] - exp6[i]) < 0.000001);
 
-    obs = ps.pop(3); // node containing GG_OTU_2 and GG_OTU_3
+    obs = ps.next(); // node containing GG_OTU_2 and GG_OTU_3
     double exp3[] = {0.71428571, 0.33333333, 0.25, 1.0, 1.0, 0.75};
     set_proportions(obs, tree, 3, table, ps);
     for(unsigned int i = 0; i < table.n_samples; i++)
@@ -712,10 +1055,255 @@ void test_unifrac_stripes_to_condensed_form_odd() {
     SUITE_END();
 }
 
+void test_unifrac_stripes_to_matrix() {
+    SUITE_START("test stripes_to_matrix");
+
+    for(uint32_t n : {2U, 6U, 7U, 130U, 203U}) {
+        uint32_t n_stripes = (n + 1) / 2;
+        // distinct values, so that the element of a pair which is kept is seen
+        std::vector<double*> values(n_stripes);
+        for(unsigned int s = 0; s < n_stripes; s++) {
+            values[s] = (double*)malloc(sizeof(double) * n);
+            for(unsigned int k = 0; k < n; k++)
+                values[s][k] = s * n + k + 1;
+        }
+
+        // the stripes written one at a time, in order
+        uint64_t cf_size = su::comb_2(n);
+        double *exp = (double*)malloc(sizeof(double) * cf_size);
+        for(unsigned int s = 0; s < n_stripes; s++)
+            su::stripes_to_condensed_form(values, n, exp, s, s + 1);
+
+        for(unsigned int threads : {1U, 3U}) {
+            for(bool square : {false, true}) {
+                std::vector<double*> stripes(n_stripes);
+                for(unsigned int s = 0; s < n_stripes; s++) {
+                    stripes[s] = (double*)malloc(sizeof(double) * n);
+                    memcpy(stripes[s], values[s], sizeof(double) * n);
+                }
+                double *obs = (double*)malloc(sizeof(double) * (square ? n * n : cf_size));
+                su::stripes_to_matrix(stripes, n, obs, square, 0, n_stripes, threads, true);
+                for(unsigned int s = 0; s < n_stripes; s++)
+                    ASSERT(stripes[s] == NULL);
+
+                uint64_t k = 0;
+                for(unsigned int i = 0; i < n; i++) {
+                    if(square)
+                        ASSERT(obs[i * n + i] == 0.0);
+                    for(unsigned int j = i + 1; j < n; j++, k++) {
+                        if(square) {
+                            ASSERT(obs[i * n + j] == exp[k]);
+                            ASSERT(obs[j * n + i] == exp[k]);
+                        } else {
+                            ASSERT(obs[k] == exp[k]);
+                        }
+                    }
+                }
+                free(obs);
+            }
+        }
+
+        // successive ranges, keeping the stripes
+        double *obs = (double*)malloc(sizeof(double) * cf_size);
+        su::stripes_to_matrix(values, n, obs, false, 0, n_stripes / 2, 2, false);
+        su::stripes_to_matrix(values, n, obs, false, n_stripes / 2, n_stripes, 2, false);
+        for(uint64_t k = 0; k < cf_size; k++)
+            ASSERT(obs[k] == exp[k]);
+        free(obs);
+
+        for(auto stripe : values)
+            free(stripe);
+        free(exp);
+    }
+    SUITE_END();
+}
+
+void test_run_tasks() {
+    SUITE_START("test run_tasks");
+
+    // each task of each call runs once, with calls from several host threads
+    // and more tasks than workers
+    for(unsigned int size : {1U, 3U}) {
+        su::configure_pool(size, su::affinity_none);
+        ASSERT(su::pool_size() == size);
+
+        const unsigned int callers = 4;
+        const unsigned int n = 37;
+        std::vector<std::vector<int> > counts(callers, std::vector<int>(n, 0));
+        std::vector<std::thread> hosts;
+        for(unsigned int c = 0; c < callers; c++) {
+            hosts.push_back(std::thread([&counts, c]() {
+                for(unsigned int repeat = 0; repeat < 10; repeat++)
+                    su::run_tasks(n, [&counts, c](unsigned int task) { counts[c][task]++; });
+            }));
+        }
+        for(auto &host : hosts)
+            host.join();
+        for(unsigned int c = 0; c < callers; c++)
+            for(unsigned int task = 0; task < n; task++)
+                ASSERT(counts[c][task] == 10);
+    }
+
+    // tasks may use the pool themselves
+    std::vector<int> nested(6, 0);
+    su::run_tasks(3, [&nested](unsigned int outer) {
+        su::run_tasks(2, [&nested, outer](unsigned int inner) { nested[outer * 2 + inner]++; });
+    });
+    for(unsigned int i = 0; i < 6; i++)
+        ASSERT(nested[i] == 1);
+
+    su::run_tasks(0, [](unsigned int task) { ASSERT(false); });
+
+    su::configure_pool(0, su::affinity_core);
+    ASSERT(su::pool_size() >= 1);
+
+    SUITE_END();
+}
+
+// send a request line to the server on path, and return its response line
+std::string request_line(const char* path, const std::string &line) {
+    sockaddr_un address;
+    memset(&address, 0, sizeof(address));
+    address.sun_family = AF_UNIX;
+    strcpy(address.sun_path, path);
+
+    // the server may not be listening yet
+    int fd = -1;
+    for(unsigned int attempt = 0; attempt < 500; attempt++) {
+        fd = socket(AF_UNIX, SOCK_STREAM, 0);
+        if(connect(fd, (const sockaddr*)&address, sizeof(address)) == 0)
+            break;
+        close(fd);
+        fd = -1;
+        usleep(10000);
+    }
+    if(fd < 0)
+        return "";
+
+    std::string request = line + "\n";
+    if(send(fd, request.data(), request.size(), 0) != (ssize_t)request.size()) {
+        close(fd);
+        return "";
+    }
+    std::string response;
+    char buffer[1024];
+    ssize_t got;
+    while((got = recv(fd, buffer, sizeof(buffer), 0)) > 0)
+        response.append(buffer, got);
+    close(fd);
+    if(!response.empty() && response[response.size() - 1] == '\n')
+        response.erase(response.size() - 1);
+    return response;
+}
+
+void test_serve() {
+    SUITE_START("test serve");
+
+    su::Fields fields = su::parse_fields("a=1\tb=x=y\tflag\t\tc=\r");
+    ASSERT(fields.size() == 4);
+    ASSERT(fields["a"] == "1");
+    ASSERT(fields["b"] == "x=y");
+    ASSERT(fields["flag"] == "");
+    ASSERT(fields["c"] == "");
+    ASSERT(su::parse_fields(su::format_fields(fields)) == fields);
+
+    // the requests are computed in turn within the budget of 3 threads
+    const char* socket_path = "test_serve_su.sock";
+    std::mutex mutex;
+    unsigned int in_use = 0;
+    unsigned int most = 0;
+    auto compute = [&](const su::Fields &request, unsigned int threads) {
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            in_use += threads;
+            most = std::max(most, in_use);
+        }
+        usleep(20000);
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            in_use -= threads;
+        }
+        su::Fields response;
+        response["status"] = request.count("fail") ? "error" : "okay";
+        response["id"] = request.at("id");
+        return response;
+    };
+    su::Fields description;
+    description["trees"] = "a,b";
+    int served = -1;
+    std::thread server([&]() { served = su::serve(socket_path, 3, compute, description); });
+
+    std::vector<std::string> responses(8);
+    std::vector<std::thread> clients;
+    for(unsigned int i = 0; i < responses.size(); i++) {
+        clients.push_back(std::thread([&responses, socket_path, i]() {
+            std::string line = "id=" + std::to_string(i) + "\tthreads=" + std::to_string(i % 4 + 1);
+            if(i == 5)
+                line += "\tfail";
+            responses[i] = request_line(socket_path, line);
+        }));
+    }
+    for(auto &client : clients)
+        client.join();
+    ASSERT(most >= 1 && most <= 3);
+    for(unsigned int i = 0; i < responses.size(); i++) {
+        su::Fields response = su::parse_fields(responses[i]);
+        ASSERT(response["id"] == std::to_string(i));
+        ASSERT(response["status"] == (i == 5 ? "error" : "okay"));
+        // the threads requested are capped by the budget
+        ASSERT(response["threads"] == std::to_string(std::min(i % 4 + 1, 3U)));
+        ASSERT(response.count("wait_seconds") == 1 && response.count("compute_seconds") == 1);
+    }
+
+    su::Fields metrics = su::parse_fields(request_line(socket_path, "command=metrics"));
+    ASSERT(metrics["status"] == "okay");
+    ASSERT(metrics["completed"] == "7");
+    ASSERT(metrics["failed"] == "1");
+    ASSERT(metrics["queued"] == "0");
+    ASSERT(metrics["running"] == "0");
+    ASSERT(metrics["thread_budget"] == "3");
+    ASSERT(metrics["trees"] == "a,b");
+    ASSERT(atof(metrics["compute_seconds_max"].c_str()) >= 0.02);
+
+    su::Fields bad = su::parse_fields(request_line(socket_path, "id=9\tthreads=none"));
+    ASSERT(bad["status"] == "error" && bad["error"] == "bad_request");
+    bad = su::parse_fields(request_line(socket_path, "command=unknown"));
+    ASSERT(bad["error"] == "bad_request");
+
+    // a second server cannot take over the socket
+    ASSERT(su::serve(socket_path, 1, compute, description) == -1);
+
+    ASSERT(request_line(socket_path, "command=shutdown") == "status=okay");
+    server.join();
+    ASSERT(served == 0);
+
+    // a client which never sends its request is dropped, and does not hold up the shutdown
+    served = -1;
+    server = std::thread([&]() { served = su::serve(socket_path, 1, compute, description, 0.1); });
+    ASSERT(request_line(socket_path, "command=metrics") != "");
+    sockaddr_un address;
+    memset(&address, 0, sizeof(address));
+    address.sun_family = AF_UNIX;
+    strcpy(address.sun_path, socket_path);
+    int idle = socket(AF_UNIX, SOCK_STREAM, 0);
+    ASSERT(connect(idle, (const sockaddr*)&address, sizeof(address)) == 0);
+    ASSERT(send(idle, "id=10", 5, 0) == 5);
+    // the server closes the connection, rather than the wait of the client expiring
+    timeval wait = {5, 0};
+    setsockopt(idle, SOL_SOCKET, SO_RCVTIMEO, &wait, sizeof(wait));
+    char byte;
+    ASSERT(recv(idle, &byte, 1, 0) == 0);
+    close(idle);
+    ASSERT(request_line(socket_path, "command=shutdown") == "status=okay");
+    server.join();
+    ASSERT(served == 0);
+
+    SUITE_END();
+}
+
 void test_unnormalized_weighted_unifrac() {
     SUITE_START("test unnormalized weighted unifrac");
 
-    std::vector<std::thread> threads(1);
     su::BPTree tree = su::BPTree("(GG_OTU_1:1,(GG_OTU_2:1,GG_OTU_3:1):1,(GG_OTU_5:1,GG_OTU_4:1):1);");
     su::biom table = su::biom("test.biom");
 
@@ -740,7 +1328,6 @@ void test_unnormalized_weighted_unifrac() {
                         false,
                         std::ref(strides),
                         std::ref(strides_total),
-                        std::ref(threads),
                         std::ref(tasks));
 
     for(unsigned int i = 0; i < 3; i++) {
@@ -755,7 +1342,6 @@ void test_unnormalized_weighted_unifrac() {
 void test_generalized_unifrac() {
     SUITE_START("test generalized unifrac");
 
-    std::vector<std::thread> threads(1);
     su::BPTree tree = su::BPTree("(GG_OTU_1:1,(GG_OTU_2:1,GG_OTU_3:1):1,(GG_OTU_5:1,GG_OTU_4:1):1);");
     su::biom table = su::biom("test.biom");
 
@@ -781,7 +1367,6 @@ void test_generalized_unifrac() {
                         false,
                         std::ref(w_strides),
                         std::ref(w_strides_total),
-                        std::ref(threads),
                         std::ref(tasks));
 
     // as computed by GUniFrac v1.0
@@ -813,7 +1398,6 @@ void test_generalized_unifrac() {
                         false,
                         std::ref(d0_strides),
                         std::ref(d0_strides_total),
-                        std::ref(threads),
                         std::ref(tasks));
 
     // as computed by GUniFrac v1.0
@@ -845,7 +1429,6 @@ void test_generalized_unifrac() {
                         false,
                         std::ref(d05_strides),
                         std::ref(d05_strides_total),
-                        std::ref(threads),
                         std::ref(tasks));
 
     for(unsigned int i = 0; i < 3; i++) {
@@ -864,7 +1447,6 @@ void test_generalized_unifrac() {
 void test_vaw_unifrac_weighted_normalized() {
     SUITE_START("test vaw weighted normalized unifrac");
 
-    std::vector<std::thread> threads(1);
     su::BPTree tree = su::BPTree("(GG_OTU_1:1,(GG_OTU_2:1,GG_OTU_3:1):1,(GG_OTU_5:1,GG_OTU_4:1):1);");
     su::biom table = su::biom("test.biom");
 
@@ -900,7 +1482,6 @@ void test_vaw_unifrac_weighted_normalized() {
                         true,
                         std::ref(w_strides),
                         std::ref(w_strides_total),
-                        std::ref(threads),
                         std::ref(tasks));
 
     for(unsigned int i = 0; i < 3; i++) {
@@ -930,6 +1511,71 @@ void test_make_strides() {
     }
 }
 
+void test_unifrac_checkpoint() {
+    SUITE_START("test unifrac checkpoint and resume");
+
+    su::BPTree tree = su::BPTree("(GG_OTU_1:1,(GG_OTU_2:1,GG_OTU_3:1):1,(GG_OTU_5:1,GG_OTU_4:1):1);");
+    su::biom table = su::biom("test.biom");
+    uint32_t n_nodes = (tree.nparens / 2) - 1;
+
+    su::task_parameters task_p;
+    task_p.start = 0; task_p.stop = 3; task_p.tid = 0; task_p.n_samples = 6; task_p.bypass_tips = false;
+    task_p.g_unifrac_alpha = 0.5;
+
+    su::Method methods[] = {su::unweighted, su::weighted_normalized, su::weighted_unnormalized, su::generalized};
+    for(auto method : methods) {
+        for(bool vaw : {false, true}) {
+            auto compute = [&](std::vector<double*> &strides, const su::checkpoint_parameters* checkpoint) {
+                std::vector<double*> strides_total = su::make_strides(6);
+                std::vector<su::task_parameters> tasks(1, task_p);
+                su::process_stripes(table, tree, method, vaw, strides, strides_total, tasks, checkpoint);
+                for(unsigned int i = 0; i < 3; i++)
+                    free(strides_total[i]);
+            };
+
+            std::vector<double*> exp = su::make_strides(6);
+            compute(exp, NULL);
+
+            // stop at each node, then resume from the checkpoint written there
+            for(uint32_t stop_node = 1; stop_node < n_nodes; stop_node++) {
+                su::checkpoint_parameters checkpoint = {"test_checkpoint", 1e9, 42, false, stop_node};
+                std::string path = su::checkpoint_path(checkpoint, &task_p);
+                std::vector<double*> obs = su::make_strides(6);
+                compute(obs, &checkpoint);
+                ASSERT(std::ifstream(path).good());
+
+                checkpoint.resume = true;
+                checkpoint.stop_node = 0;
+                compute(obs, &checkpoint);
+                for(unsigned int i = 0; i < 3; i++) {
+                    for(unsigned int j = 0; j < 6; j++)
+                        ASSERT(fabs(obs[i][j] - exp[i][j]) < 0.000001);
+                    free(obs[i]);
+                }
+                remove(path.c_str());
+            }
+
+            // a checkpoint of other inputs is ignored, and the stripes are
+            // computed from the start
+            su::checkpoint_parameters checkpoint = {"test_checkpoint", 0, 42, false, n_nodes / 2};
+            std::vector<double*> obs = su::make_strides(6);
+            compute(obs, &checkpoint);
+            checkpoint.fingerprint = 43;
+            checkpoint.resume = true;
+            checkpoint.stop_node = 0;
+            compute(obs, &checkpoint);
+            for(unsigned int i = 0; i < 3; i++) {
+                for(unsigned int j = 0; j < 6; j++)
+                    ASSERT(fabs(obs[i][j] - exp[i][j]) < 0.000001);
+                free(obs[i]);
+                free(exp[i]);
+            }
+            remove(su::checkpoint_path(checkpoint, &task_p).c_str());
+        }
+    }
+    SUITE_END();
+}
+
 void test_faith_pd() {
     SUITE_START("test faith PD");
 
@@ -979,7 +1625,6 @@ void test_faith_pd_shear(){
 void test_unweighted_unifrac() {
     SUITE_START("test unweighted unifrac");
     double **obs;
-    std::vector<std::thread> threads(1);
     su::BPTree tree = su::BPTree("(GG_OTU_1:1,(GG_OTU_2:1,GG_OTU_3:1):1,(GG_OTU_5:1,GG_OTU_4:1):1);");
     su::biom table = su::biom("test.biom");
 
@@ -1004,7 +1649,6 @@ void test_unweighted_unifrac() {
                         false,
                         std::ref(strides),
                         std::ref(strides_total),
-                        std::ref(threads),
                         std::ref(tasks));
 
     for(unsigned int i = 0; i < 3; i++) {
@@ -1019,7 +1663,6 @@ void test_unweighted_unifrac() {
 void test_unweighted_unifrac_fast() {
     SUITE_START("test unweighted unifrac no tips");
     double **obs;
-    std::vector<std::thread> threads(1);
     su::BPTree tree = su::BPTree("(GG_OTU_1:1,(GG_OTU_2:1,GG_OTU_3:1):1,(GG_OTU_5:1,GG_OTU_4:1):1);");
     su::biom table = su::biom("test.biom");
 
@@ -1044,7 +1687,6 @@ void test_unweighted_unifrac_fast() {
                         false,
                         std::ref(strides),
                         std::ref(strides_total),
-                        std::ref(threads),
                         std::ref(tasks));
 
     for(unsigned int i = 0; i < 3; i++) {
@@ -1059,7 +1701,6 @@ void test_unweighted_unifrac_fast() {
 void test_normalized_weighted_unifrac() {
     SUITE_START("test normalized weighted unifrac");
     double **obs;
-    std::vector<std::thread> threads(1);
     su::BPTree tree = su::BPTree("(GG_OTU_1:1,(GG_OTU_2:1,GG_OTU_3:1):1,(GG_OTU_5:1,GG_OTU_4:1):1);");
     su::biom table = su::biom("test.biom");
 
@@ -1085,7 +1726,6 @@ void test_normalized_weighted_unifrac() {
                         false,
                         std::ref(strides),
                         std::ref(strides_total),
-                        std::ref(threads),
                         std::ref(tasks));
 
     for(unsigned int i = 0; i < 3; i++) {
@@ -1097,6 +1737,69 @@ void test_normalized_weighted_unifrac() {
     SUITE_END();
 }
 
+void test_weighted_normalized_unifrac_pairwise_reference() {
+    SUITE_START("test weighted normalized unifrac against pairwise totals");
+    su::BPTree tree = su::BPTree("(GG_OTU_1:1,(GG_OTU_2:0.5,GG_OTU_3:1.5):1.25,(GG_OTU_5:0.75,GG_OTU_4:2):0.5);");
+    su::biom table = su::biom("test.biom");
+    unsigned int n = table.n_samples;
+    std::vector<bool> structure = tree.get_structure();
+
+    // proportions below each node, accumulated by walking up from the tips
+    std::vector<std::vector<double> > node_props(tree.nparens, std::vector<double>(n, 0.0));
+    double *tip = (double*)malloc(sizeof(double) * n);
+    for(unsigned int i = 0; i < tree.nparens; i++) {
+        if(!structure[i] || !tree.isleaf(i))
+            continue;
+        table.get_obs_data(tree.names[i], tip);
+        uint32_t node = i;
+        while(node != 0) {
+            for(unsigned int s = 0; s < n; s++)
+                node_props[node][s] += tip[s] / table.sample_counts[s];
+            node = tree.parent(node);
+        }
+    }
+    free(tip);
+
+    for(bool bypass_tips : {false, true}) {
+        std::vector<double*> strides = su::make_strides(n);
+        std::vector<double*> strides_total((n + 1) / 2);
+
+        su::task_parameters task_p;
+        task_p.start = 0; task_p.stop = (n + 1) / 2; task_p.tid = 0; task_p.n_samples = n;
+        task_p.bypass_tips = bypass_tips;
+        std::vector<su::task_parameters> tasks;
+        tasks.push_back(task_p);
+
+        su::process_stripes(std::ref(table),
+                            std::ref(tree),
+                            su::weighted_normalized,
+                            false,
+                            std::ref(strides),
+                            std::ref(strides_total),
+                            std::ref(tasks));
+
+        bool equal = true;
+        for(unsigned int i = 0; i < (n + 1) / 2; i++) {
+            equal &= strides_total[i] == NULL;
+            for(unsigned int j = 0; j < n; j++) {
+                unsigned int k = (j + i + 1) % n;
+                double num = 0.0;
+                double denom = 0.0;
+                for(unsigned int node = 1; node < tree.nparens; node++) {
+                    if(!structure[node] || (bypass_tips && tree.isleaf(node)))
+                        continue;
+                    num += tree.lengths[node] * fabs(node_props[node][j] - node_props[node][k]);
+                    denom += tree.lengths[node] * (node_props[node][j] + node_props[node][k]);
+                }
+                equal &= fabs(strides[i][j] - num / denom) < 0.000001;
+            }
+            free(strides[i]);
+        }
+        ASSERT(equal);
+    }
+    SUITE_END();
+}
+
 void test_bptree_shear_simple() {
     SUITE_START("test bptree shear simple");
     su::BPTree tree = su::BPTree("((3:2,4:3,(6:5)5:4)2:1,7:6,((10:9,11:10)9:8)8:7)r");
@@ -1332,6 +2035,257 @@ void test_bptree_constructor_newline_bug() {
     SUITE_END();
 }
 
+void test_bptree_succinct_large() {
+    SUITE_START("test bptree succinct navigation over many words");
+
+    // a deterministic, unbalanced tree spanning many words and superblocks
+    std::string newick = "";
+    uint32_t state = 42;
+    uint32_t tip = 0;
+    std::stack<unsigned int> open_nodes;
+    newick += "(";
+    open_nodes.push(0);
+    while(tip < 3000) {
+        state = state * 1103515245 + 12345;
+        unsigned int r = (state >> 16) % 10;
+        if(r < 3) {
+            newick += "(";
+            open_nodes.push(0);
+        } else if(r < 5 && open_nodes.size() > 1 && open_nodes.top() > 0) {
+            newick += "):1,";
+            open_nodes.pop();
+            open_nodes.top()++;
+        } else {
+            newick += "t" + std::to_string(tip++) + ":1,";
+            open_nodes.top()++;
+        }
+    }
+    while(!open_nodes.empty()) {
+        newick += "t" + std::to_string(tip++) + ":1)";
+        open_nodes.pop();
+        if(!open_nodes.empty())
+            newick += ":1,";
+    }
+    newick += ";";
+
+    su::BPTree tree = su::BPTree(newick);
+    std::vector<bool> structure = tree.get_structure();
+    std::vector<uint32_t> openclose = tree.get_openclose();
+    ASSERT(tree.nparens > 4096);
+
+    // naive expectations derived with a stack
+    std::vector<uint32_t> exp_parent(tree.nparens, 0);
+    std::vector<uint32_t> exp_preorder;
+    std::vector<uint32_t> exp_postorder;
+    std::stack<uint32_t> oc;
+    for(uint32_t i = 0; i < tree.nparens; i++) {
+        if(structure[i]) {
+            exp_parent[i] = oc.empty() ? 0 : oc.top();
+            exp_preorder.push_back(i);
+            oc.push(i);
+        } else {
+            exp_parent[i] = exp_parent[oc.top()];
+            exp_postorder.push_back(oc.top());
+            oc.pop();
+        }
+    }
+
+    bool parent_ok = true;
+    for(uint32_t i = 1; i < tree.nparens - 1; i++)
+        parent_ok &= (uint32_t)tree.parent(i) == exp_parent[i];
+    ASSERT(parent_ok);
+
+    bool order_ok = true;
+    for(uint32_t k = 0; k < tree.nparens / 2; k++) {
+        order_ok &= tree.preorderselect(k) == exp_preorder[k];
+        order_ok &= tree.postorderselect(k) == exp_postorder[k];
+    }
+    ASSERT(order_ok);
+
+    bool nav_ok = true;
+    for(uint32_t i = 0; i < tree.nparens; i++) {
+        if(!structure[i])
+            continue;
+        uint32_t sibling = openclose[i] + 1;
+        uint32_t exp_sibling = (sibling < tree.nparens && structure[sibling]) ? sibling : 0;
+        nav_ok &= tree.rightsibling(i) == exp_sibling;
+        if(!tree.isleaf(i))
+            nav_ok &= tree.rightchild(i) == openclose[openclose[i] - 1];
+    }
+    ASSERT(nav_ok);
+
+    SUITE_END();
+}
+
+void test_bptree_shear_collapse() {
+    SUITE_START("test bptree shear_collapse matches shear then collapse");
+    su::BPTree tree = su::BPTree("((3:2,4:3,(6:5)5:4)2:1,7:6,((10:9,11:10)9:8)8:7)r");
+
+    std::vector<std::unordered_set<std::string> > subsets = {{"4", "6", "7", "10", "11"},
+                                                             {"10", "11"},
+                                                             {"6"},
+                                                             {"3", "10"},
+                                                             {"3", "4", "6", "7", "10", "11", "missing"}};
+
+    // only the last subset has a name which is not a tip
+    bool scan_ok = true;
+    bool index_ok = true;
+    std::string missing;
+    for(auto &to_keep : subsets) {
+        su::BPTree exp = tree.shear(to_keep).collapse();
+        su::BPTree obs = tree.shear_collapse(to_keep, missing);
+        scan_ok &= missing == (to_keep.count("missing") ? "missing" : "");
+        scan_ok &= exp.nparens == obs.nparens;
+        scan_ok &= exp.get_structure() == obs.get_structure();
+        scan_ok &= vec_almost_equal(exp.lengths, obs.lengths);
+        scan_ok &= exp.names == obs.names;
+    }
+
+    tree.index_tips();
+    for(auto &to_keep : subsets) {
+        su::BPTree exp = tree.shear(to_keep).collapse();
+        su::BPTree obs = tree.shear_collapse(to_keep, missing);
+        index_ok &= missing == (to_keep.count("missing") ? "missing" : "");
+        index_ok &= exp.nparens == obs.nparens;
+        index_ok &= exp.get_structure() == obs.get_structure();
+        index_ok &= vec_almost_equal(exp.lengths, obs.lengths);
+        index_ok &= exp.names == obs.names;
+    }
+    ASSERT(scan_ok);
+    ASSERT(index_ok);
+
+    // a single tip retains the root and the tip, with the length of the
+    // collapsed chain carried to the tip
+    su::BPTree obs = tree.shear_collapse({"6"});
+    std::vector<bool> exp_structure = {true, true, false, false};
+    std::vector<double> exp_lengths = {0, 10, 0, 0};
+    ASSERT(obs.get_structure() == exp_structure);
+    ASSERT(vec_almost_equal(exp_lengths, obs.lengths));
+    SUITE_END();
+}
+
+void test_shear_cache() {
+    SUITE_START("test shear cache");
+    su::BPTree tree = su::BPTree("((3:2,4:3,(6:5)5:4)2:1,7:6,((10:9,11:10)9:8)8:7)r");
+    su::BPTree other = su::BPTree("((3:2,4:3,(6:5)5:4)2:1,7:6,((10:9,11:10)9:8)8:1)r");
+    su::ShearCache cache(2);
+
+    std::unordered_set<std::string> a = {"4", "6", "7"};
+    std::unordered_set<std::string> a_reordered = {"7", "6", "4"};
+    std::unordered_set<std::string> b = {"10", "11"};
+
+    std::string missing;
+    std::shared_ptr<su::BPTree> first = cache.get(tree, a, missing);
+    std::shared_ptr<su::BPTree> second = cache.get(tree, a_reordered, missing);
+    ASSERT(missing == "");
+    ASSERT(first == second);
+    ASSERT(cache.size() == 1);
+    ASSERT(first->get_structure() == tree.shear_collapse(a).get_structure());
+
+    // a different tree with the same feature set is a distinct entry
+    ASSERT(tree.fingerprint() != other.fingerprint());
+    std::shared_ptr<su::BPTree> third = cache.get(other, b, missing);
+    std::shared_ptr<su::BPTree> fourth = cache.get(tree, b, missing);
+    ASSERT(third != fourth);
+    ASSERT(vec_almost_equal(third->lengths, other.shear_collapse(b).lengths));
+    ASSERT(vec_almost_equal(fourth->lengths, tree.shear_collapse(b).lengths));
+
+    // the capacity bounds the number of entries, evicting the oldest
+    ASSERT(cache.size() == 2);
+    ASSERT(cache.get(tree, a, missing) != first);
+
+    // a feature set with a name which is not a tip is reported, and not cached
+    ASSERT(cache.get(tree, {"4", "missing"}, missing) != NULL);
+    ASSERT(missing == "missing");
+    ASSERT(cache.size() == 2);
+    ASSERT(cache.get(tree, a, missing) == cache.get(tree, a, missing));
+
+    cache.clear();
+    ASSERT(cache.size() == 0);
+    SUITE_END();
+}
+
+void test_pcoa() {
+    SUITE_START("test pcoa");
+
+    // the corners of a 3 x 4 rectangle, whose centered coordinates are
+    // (+-1.5, +-2), so the eigenvalues are 4 * 2^2 and 4 * 1.5^2
+    double condensed[] = {3, 4, 5,
+                             5, 4,
+                                3};
+    double exp_eigvals[] = {16, 9, 0, 0};
+    double exp_axes[2][4] = {{-2, -2, 2, 2}, {-1.5, 1.5, -1.5, 1.5}};
+
+    for(unsigned int threads : {1, 2, 3}) {
+        double eigvals[4], proportion_explained[4], coordinates[16];
+        unsigned int iterations = su::pcoa(condensed, 4, 4, threads, eigvals, coordinates, proportion_explained);
+        ASSERT(iterations > 0);
+
+        for(unsigned int k = 0; k < 4; k++) {
+            ASSERT(fabs(eigvals[k] - exp_eigvals[k]) < 1e-9);
+            ASSERT(fabs(proportion_explained[k] - exp_eigvals[k] / 25.0) < 1e-9);
+        }
+
+        // the sign of an axis is arbitrary
+        for(unsigned int k = 0; k < 2; k++) {
+            double sign = coordinates[k] * exp_axes[k][0] > 0 ? 1.0 : -1.0;
+            for(unsigned int i = 0; i < 4; i++)
+                ASSERT(fabs(sign * coordinates[i * 4 + k] - exp_axes[k][i]) < 1e-9);
+        }
+        for(unsigned int i = 0; i < 4; i++)
+            for(unsigned int k = 2; k < 4; k++)
+                ASSERT(coordinates[i * 4 + k] == 0.0);
+    }
+
+    // fewer axes than samples
+    double eigvals[1], proportion_explained[1], coordinates[4];
+    su::pcoa(condensed, 4, 1, 1, eigvals, coordinates, proportion_explained);
+    ASSERT(fabs(eigvals[0] - 16) < 1e-9);
+    ASSERT(fabs(proportion_explained[0] - 0.64) < 1e-9);
+    for(unsigned int i = 0; i < 4; i++)
+        ASSERT(fabs(fabs(coordinates[i]) - 2) < 1e-9);
+
+    SUITE_END();
+}
+
+void test_permutation_tests() {
+    SUITE_START("test permanova and permdisp");
+
+    // the Euclidean distances of points in the plane, of which the centroid
+    // distances are those of the points, so are as by skbio
+    double points[7][2] = {{0, 0}, {1, 0}, {0, 2}, {5, 5}, {6, 4}, {7, 7}, {3, 1}};
+    uint32_t grouping[] = {0, 0, 0, 1, 1, 1, 0};
+    std::vector<double> condensed;
+    for(unsigned int i = 0; i < 7; i++)
+        for(unsigned int j = i + 1; j < 7; j++)
+            condensed.push_back(sqrt(pow(points[i][0] - points[j][0], 2) + pow(points[i][1] - points[j][1], 2)));
+
+    double statistic, p_value;
+    su::permanova(condensed.data(), 7, grouping, 2, 0, 0, 1, &statistic, &p_value);
+    ASSERT(fabs(statistic - 25.579150579150575) < 1e-9);
+    ASSERT(std::isnan(p_value));
+
+    su::permdisp(condensed.data(), 7, grouping, 2, 0, 0, 1, &statistic, &p_value);
+    ASSERT(fabs(statistic - 0.010519834611886) < 1e-12);
+    ASSERT(std::isnan(p_value));
+
+    // the permutations are of the seed, not of the threads
+    double exp_p_value;
+    su::permanova(condensed.data(), 7, grouping, 2, 99, 42, 1, &statistic, &exp_p_value);
+    ASSERT(exp_p_value > 0 && exp_p_value < 0.1);
+    for(unsigned int threads : {2, 3, 200}) {
+        su::permanova(condensed.data(), 7, grouping, 2, 99, 42, threads, &statistic, &p_value);
+        ASSERT(p_value == exp_p_value);
+    }
+
+    su::permdisp(condensed.data(), 7, grouping, 2, 99, 42, 1, &statistic, &exp_p_value);
+    ASSERT(exp_p_value > 0.5 && exp_p_value <= 1);
+    su::permdisp(condensed.data(), 7, grouping, 2, 99, 42, 4, &statistic, &p_value);
+    ASSERT(p_value == exp_p_value);
+
+    SUITE_END();
+}
+
 int main(int argc, char** argv) {
     test_bptree_constructor_simple();
     test_bptree_constructor_newline_bug();
@@ -1354,25 +2308,43 @@ int main(int argc, char** argv) {
     test_bptree_shear_deep();
     test_bptree_collapse_simple();
     test_bptree_collapse_edge();
+    test_bptree_succinct_large();
+    test_bptree_shear_collapse();
+    test_shear_cache();
 
     test_biom_constructor();
     test_biom_get_obs_data();
+    test_biom_fixed_width_and_types();
+    test_biom_subset();
+    test_biom_unique_samples();
+    test_biom_rarefied();
+    test_biom_not_biom();
+    test_biom_read_shape();
+    test_bptree_constructor_malformed();
 
     test_propstack_constructor();
-    test_propstack_push_and_pop();
-    test_propstack_get();
+    test_propstack_next_and_reduce();
+    test_propstack_max_live();
+    test_newick_shape();
 
     test_unifrac_set_proportions();
     test_unifrac_deconvolute_stripes();
     test_unifrac_stripes_to_condensed_form_even();
     test_unifrac_stripes_to_condensed_form_odd();
+    test_unifrac_stripes_to_matrix();
+    test_run_tasks();
+    test_serve();
     test_unweighted_unifrac();
     test_unweighted_unifrac_fast();
     test_unnormalized_weighted_unifrac();
     test_normalized_weighted_unifrac();
+    test_weighted_normalized_unifrac_pairwise_reference();
     test_generalized_unifrac();
     test_vaw_unifrac_weighted_normalized();
     test_unifrac_sample_counts();
+    test_unifrac_checkpoint();
+    test_pcoa();
+    test_permutation_tests();
     test_set_tasks();
     test_test_table_ids_are_subset_of_tree();
 
@@ -1,52 +1,71 @@
 #include "tree.hpp"
 #include <stack>
 #include <algorithm>
+#include <cstdint>
+#include <stdexcept>
 
 using namespace su;
 
+/* lookup tables over a byte of parentheses, least significant bit first
+ *
+ * total[b]      : the change in excess across the byte
+ * min_prefix[b] : the minimum excess reached within the byte, relative to
+ *                 the excess preceding it
+ */
+struct ExcessTables {
+    int8_t total[256];
+    int8_t min_prefix[256];
+
+    ExcessTables() {
+        for(unsigned int b = 0; b < 256; b++) {
+            int e = 0;
+            int m = 8;
+            for(unsigned int k = 0; k < 8; k++) {
+                e += ((b >> k) & 1) ? 1 : -1;
+                if(e < m)
+                    m = e;
+            }
+            total[b] = e;
+            min_prefix[b] = m;
+        }
+    }
+};
+static const ExcessTables excess_tables;
+
+static inline uint32_t select_in_word(uint64_t word, uint32_t k) {
+    // index of the kth set bit within a word
+    for(uint32_t i = 0; i < k; i++)
+        word &= word - 1;
+    return __builtin_ctzll(word);
+}
+
 BPTree::BPTree(std::string newick) {
-    openclose = std::vector<uint32_t>();
+    fingerprint_cache = 0;
     lengths = std::vector<double>();
     names = std::vector<std::string>();
-    excess = std::vector<uint32_t>();
 
-    select_0_index = std::vector<uint32_t>();
-    select_1_index = std::vector<uint32_t>();
-    structure = std::vector<bool>();
-    structure.reserve(500000);  // a fair sized tree... avoid reallocs, and its not _that_ much waste if this is wrong
+    std::vector<bool> bp = std::vector<bool>();
+    bp.reserve(500000);  // a fair sized tree... avoid reallocs, and its not _that_ much waste if this is wrong
 
     // three pass for parse. not ideal, but easier to map from IOW code    
-    newick_to_bp(newick);
+    newick_to_bp(newick, bp);
+    set_structure(bp);
+    bp = std::vector<bool>();  // release the unpacked topology
 
     // resize is correct here as we are not performing a push_back
-    openclose.resize(nparens);
     lengths.resize(nparens);
     names.resize(nparens);
-    select_0_index.resize(nparens / 2);
-    select_1_index.resize(nparens / 2);
-    excess.resize(nparens);
 
-    structure_to_openclose();
-    newick_to_metadata(newick);
     index_and_cache();
+    newick_to_metadata(newick);
 }
 
 BPTree::BPTree(std::vector<bool> input_structure, std::vector<double> input_lengths, std::vector<std::string> input_names) {
-    structure = input_structure;
+    fingerprint_cache = 0;
     lengths = input_lengths;
     names = input_names;
     
-    nparens = structure.size();
-
-    openclose = std::vector<uint32_t>();
-    select_0_index = std::vector<uint32_t>();
-    select_1_index = std::vector<uint32_t>();
-    openclose.resize(nparens);
-    select_0_index.resize(nparens / 2);
-    select_1_index.resize(nparens / 2);
-    excess.resize(nparens);
-
-    structure_to_openclose();
+    set_structure(input_structure);
     index_and_cache();
 }
 
@@ -67,12 +86,11 @@ BPTree BPTree::mask(std::vector<bool> topology_mask, std::vector<double> in_leng
     new_names.resize(count);
 
     auto mask_it = topology_mask.begin();
-    auto base_it = this->structure.begin();
     uint32_t new_idx = 0;
     uint32_t old_idx = 0;
-    for(; mask_it != topology_mask.end(); mask_it++, base_it++, old_idx++) {
+    for(; mask_it != topology_mask.end(); mask_it++, old_idx++) {
         if(*mask_it) {
-            new_structure[new_idx] = this->structure[old_idx];
+            new_structure[new_idx] = this->get(old_idx);
             new_lengths[new_idx] = in_lengths[old_idx];
             new_names[new_idx] = this->names[old_idx];
             new_idx++;
@@ -94,24 +112,191 @@ std::unordered_set<std::string> BPTree::get_tip_names() {
     return observed;
 }
 
-BPTree BPTree::shear(std::unordered_set<std::string> to_keep) {
-    std::vector<bool> shearmask = std::vector<bool>(this->nparens);
-    int32_t p;
+BPTree BPTree::shear(const std::unordered_set<std::string> &to_keep) {
+    return shear_impl(to_keep, false, NULL);
+}
+
+BPTree BPTree::shear_collapse(const std::unordered_set<std::string> &to_keep) {
+    return shear_impl(to_keep, true, NULL);
+}
+
+BPTree BPTree::shear_collapse(const std::unordered_set<std::string> &to_keep, std::string &missing) {
+    return shear_impl(to_keep, true, &missing);
+}
+
+void BPTree::index_tips() {
+    tip_index.clear();
+    tip_index.reserve(nparens / 4);
+
+    for(uint32_t i = 0; i + 1 < nparens; i++) {
+        if(isleaf(i))
+            tip_index[names[i]] = i;
+    }
+}
+
+uint64_t BPTree::fingerprint() {
+    if(fingerprint_cache != 0)
+        return fingerprint_cache;
+
+    // FNV-1a over the packed topology, the branch lengths and the names
+    uint64_t h = 14695981039346656037ULL;
+    auto mix = [&h](const void *data, size_t len) {
+        const unsigned char *bytes = (const unsigned char*)data;
+        for(size_t i = 0; i < len; i++) {
+            h ^= bytes[i];
+            h *= 1099511628211ULL;
+        }
+    };
+
+    mix(&nparens, sizeof(nparens));
+    mix(structure.data(), structure.size() * sizeof(uint64_t));
+    mix(lengths.data(), lengths.size() * sizeof(double));
+    for(auto &name : names) {
+        uint32_t len = name.length();
+        mix(&len, sizeof(len));
+        mix(name.data(), len);
+    }
+
+    fingerprint_cache = (h == 0) ? 1 : h;  // zero denotes not computed
+    return fingerprint_cache;
+}
+
+uint64_t BPTree::memory_bytes() const {
+    uint64_t total = structure.capacity() * sizeof(uint64_t) +
+                     rank_super.capacity() * sizeof(uint32_t) +
+                     rmm.capacity() * sizeof(int32_t) +
+                     lengths.capacity() * sizeof(double);
+    for(auto &name : names)
+        total += sizeof(std::string) + name.capacity();
+    // each indexed tip holds a copy of its name, the index and a chain pointer
+    for(auto &tip : tip_index)
+        total += sizeof(std::string) + tip.first.capacity() + sizeof(uint32_t) + 2 * sizeof(void*);
+    return total;
+}
+
+void BPTree::retain(uint32_t node, std::unordered_map<uint32_t, uint32_t> &retained) {
+    if(retained.count(node) > 0)
+        return;
+    retained[node] = 0;
+
+    // walk up until we reach an ancestor already retained, so that each
+    // node is visited once regardless of the number of tips below it
+    while(node != 0) {
+        uint32_t p = parent(node);
+        auto hit = retained.find(p);
+        if(hit != retained.end()) {
+            hit->second++;
+            return;
+        }
+        retained[p] = 1;
+        node = p;
+    }
+}
 
-	for(unsigned int i = 0; i < this->nparens; i++) {
-        if(this->isleaf(i) && to_keep.count(this->names[i]) > 0) {
-            shearmask[i] = true;
-            shearmask[i+1] = true;
+BPTree BPTree::shear_impl(const std::unordered_set<std::string> &to_keep, bool collapse,
+                          std::string *missing) {
+    std::unordered_map<uint32_t, uint32_t> retained;
+    retained.reserve(to_keep.size() * 4);
+    if(missing != NULL)
+        missing->clear();
+
+    if(!tip_index.empty()) {
+        for(auto &name : to_keep) {
+            auto hit = tip_index.find(name);
+            if(hit != tip_index.end())
+                retain(hit->second, retained);
+            else if(missing != NULL && missing->empty())
+                *missing = name;
+        }
+    } else {
+        // the names of to_keep which are found, as a tip name may repeat
+        std::unordered_set<const std::string*> found;
+
+        // a leaf is an open immediately followed by a close, which can be
+        // found a word at a time
+        uint32_t n_words = structure.size();
+        for(uint32_t w = 0; w < n_words; w++) {
+            uint64_t word = structure[w];
+            uint64_t next = (w + 1 < n_words) ? structure[w + 1] : 0;
+            uint64_t leaves = word & ~((word >> 1) | (next << 63));
+
+            while(leaves) {
+                uint32_t i = (w << 6) + __builtin_ctzll(leaves);
+                leaves &= leaves - 1;
+                auto hit = to_keep.find(names[i]);
+                if(hit != to_keep.end()) {
+                    retain(i, retained);
+                    if(missing != NULL)
+                        found.insert(&*hit);
+                }
+            }
+        }
 
-            p = this->parent(i);
-            while(p != -1 && !shearmask[p]) {
-                shearmask[p] = true;
-                shearmask[this->close(p)] = true;
-                p = this->parent(p);
+        if(missing != NULL && found.size() < to_keep.size()) {
+            for(auto &name : to_keep) {
+                if(found.count(&name) == 0) {
+                    *missing = name;
+                    break;
+                }
             }
         }
     }
-    return this->mask(shearmask, this->lengths);
+
+    // the open parentheses in index order are the retained nodes in preorder
+    std::vector<std::pair<uint32_t, uint32_t> > nodes(retained.begin(), retained.end());
+    std::sort(nodes.begin(), nodes.end());
+
+    std::vector<bool> new_structure;
+    std::vector<double> new_lengths;
+    std::vector<std::string> new_names;
+    new_structure.reserve(nodes.size() * 2);
+    new_lengths.reserve(nodes.size() * 2);
+    new_names.reserve(nodes.size() * 2);
+
+    // the enclosing nodes of the current position. when collapsing, a node
+    // with a single retained child is dropped and its length is carried
+    // down to the next node kept.
+    struct Enclosing {
+        uint32_t close;
+        bool kept;
+        double carry;
+    };
+    std::vector<Enclosing> stack;
+
+    auto emit_close = [&](const Enclosing &node) {
+        if(node.kept) {
+            new_structure.push_back(false);
+            new_lengths.push_back(lengths[node.close]);
+            new_names.push_back(names[node.close]);
+        }
+    };
+
+    for(auto &node : nodes) {
+        uint32_t current = node.first;
+        while(!stack.empty() && stack.back().close < current) {
+            emit_close(stack.back());
+            stack.pop_back();
+        }
+
+        double carry = stack.empty() ? 0.0 : stack.back().carry;
+        uint32_t current_close = close(current);
+
+        // 0 == root, and a retained node without retained children is a tip
+        if(!collapse || current == 0 || node.second != 1) {
+            new_structure.push_back(true);
+            new_lengths.push_back(lengths[current] + carry);
+            new_names.push_back(names[current]);
+            stack.push_back({current_close, true, 0.0});
+        } else {
+            stack.push_back({current_close, false, carry + lengths[current]});
+        }
+    }
+    while(!stack.empty()) {
+        emit_close(stack.back());
+        stack.pop_back();
+    }
+
+    return BPTree(new_structure, new_lengths, new_names);
 }
 
 BPTree BPTree::collapse() {
@@ -176,45 +361,141 @@ BPTree BPTree::collapse() {
 BPTree::~BPTree() {
 }
 
+void BPTree::set_structure(const std::vector<bool> &input_structure) {
+    nparens = input_structure.size();
+    structure = std::vector<uint64_t>((nparens + 63) / 64, 0);
+
+    uint32_t idx = 0;
+    for(auto i = input_structure.begin(); i != input_structure.end(); i++, idx++) {
+        if(*i)
+            structure[idx >> 6] |= (1ULL << (idx & 63));
+    }
+}
+
 void BPTree::index_and_cache() {
-    // should probably do the open/close in here too
-    unsigned int idx = 0;
-    auto i = structure.begin();
-    auto k0 = select_0_index.begin();
-    auto k1 = select_1_index.begin();
-    auto e_it = excess.begin();
-    unsigned int e = 0;  
-
-    for(; i != structure.end(); i++, idx++ ) {
-        if(*i) {
-            *(k1++) = idx;
-            *(e_it++) = ++e;
+    uint32_t n_words = structure.size();
+    uint32_t n_super = (n_words + 7) / 8;
+
+    rank_super = std::vector<uint32_t>(n_super);
+
+    // range min-max tree, stored as an implicit complete binary tree rooted
+    // at index 1. unused leaves hold a sentinel which can never be a target.
+    rmm_leaves = 1;
+    while(rmm_leaves < n_words)
+        rmm_leaves <<= 1;
+    rmm = std::vector<int32_t>(2 * rmm_leaves, INT32_MAX);
+
+    // a single pass fills the rank directory and the leaves of the rmm tree
+    uint32_t ones = 0;
+    int32_t e = 0;
+    for(uint32_t w = 0; w < n_words; w++) {
+        uint64_t word = structure[w];
+        if((w & 7) == 0)
+            rank_super[w >> 3] = ones;
+        ones += __builtin_popcountll(word);
+
+        // the padding past nparens is zero, so the final word is
+        // finished a bit at a time
+        uint32_t valid = std::min(64u, nparens - w * 64);
+        int32_t m = INT32_MAX;
+        uint32_t k = 0;
+        for(; k + 8 <= valid; k += 8) {
+            uint8_t byte = (word >> k) & 0xFF;
+            m = std::min(m, e + excess_tables.min_prefix[byte]);
+            e += excess_tables.total[byte];
         }
-        else {
-            *(k0++) = idx;
-            *(e_it++) = --e;
+        for(; k < valid; k++) {
+            e += ((word >> k) & 1) ? 1 : -1;
+            m = std::min(m, e);
         }
+        rmm[rmm_leaves + w] = m;
     }
+    for(uint32_t node = rmm_leaves - 1; node > 0; node--)
+        rmm[node] = std::min(rmm[2 * node], rmm[2 * node + 1]);
+}
+
+uint32_t BPTree::rank1(uint32_t i) {
+    uint32_t w = i >> 6;
+    uint32_t r = rank_super[w >> 3];
+    for(uint32_t k = w & ~7u; k < w; k++)
+        r += __builtin_popcountll(structure[k]);
+
+    uint32_t offset = i & 63;
+    uint64_t mask = offset == 63 ? ~0ULL : ((1ULL << (offset + 1)) - 1);
+    return r + __builtin_popcountll(structure[w] & mask);
+}
+
+int32_t BPTree::excess(int64_t i) {
+    if(i < 0)
+        return 0;
+    return 2 * (int32_t)rank1(i) - (int32_t)(i + 1);
+}
+
+uint32_t BPTree::select1(uint32_t k) {
+    // find the last superblock preceded by at most k ones
+    uint32_t lo = 0;
+    uint32_t hi = rank_super.size();
+    while(hi - lo > 1) {
+        uint32_t mid = (lo + hi) / 2;
+        if(rank_super[mid] <= k)
+            lo = mid;
+        else
+            hi = mid;
+    }
+
+    uint32_t r = rank_super[lo];
+    uint32_t w = lo * 8;
+    for(;; w++) {
+        uint32_t c = __builtin_popcountll(structure[w]);
+        if(r + c > k)
+            break;
+        r += c;
+    }
+    return (w << 6) + select_in_word(structure[w], k - r);
+}
+
+uint32_t BPTree::select0(uint32_t k) {
+    // as select1, but the number of zeros preceding a superblock is derived
+    // from the rank directory
+    uint32_t lo = 0;
+    uint32_t hi = rank_super.size();
+    while(hi - lo > 1) {
+        uint32_t mid = (lo + hi) / 2;
+        if((mid * 512) - rank_super[mid] <= k)
+            lo = mid;
+        else
+            hi = mid;
+    }
+
+    uint32_t r = (lo * 512) - rank_super[lo];
+    uint32_t w = lo * 8;
+    for(;; w++) {
+        uint32_t c = 64 - __builtin_popcountll(structure[w]);
+        if(r + c > k)
+            break;
+        r += c;
+    }
+    return (w << 6) + select_in_word(~structure[w], k - r);
 }
 
 uint32_t BPTree::postorderselect(uint32_t k) { 
-    return open(select_0_index[k]);
+    return open(select0(k));
 }
 
 uint32_t BPTree::preorderselect(uint32_t k) {
-    return select_1_index[k];
+    return select1(k);
 }
 
 inline uint32_t BPTree::open(uint32_t i) {
-    return structure[i] ? i : openclose[i];
+    return get(i) ? i : bwd(i, 0) + 1;
 }
 
 inline uint32_t BPTree::close(uint32_t i) {
-    return structure[i] ? openclose[i] : i;
+    return get(i) ? fwd(i, -1) : i;
 }
 
 bool BPTree::isleaf(unsigned int idx) {
-    return (structure[idx] && !structure[idx + 1]);
+    return (get(idx) && !get(idx + 1));
 }
 
 uint32_t BPTree::leftchild(uint32_t i) {
@@ -238,7 +519,7 @@ uint32_t BPTree::rightsibling(uint32_t i) {
     uint32_t position = close(i) + 1;
     if(position >= nparens)
         return 0;  // will return 0 if no sibling as root cannot have a sibling
-    else if(structure[position])
+    else if(get(position))
         return position;
     else 
         return 0;
@@ -249,26 +530,193 @@ int32_t BPTree::parent(uint32_t i) {
 }
 
 int32_t BPTree::enclose(uint32_t i) {
-    if(structure[i])
+    if(get(i))
         return bwd(i, -2) + 1;
     else
         return bwd(i - 1, -2) + 1; 
 }
 
-int32_t BPTree::bwd(uint32_t i, int d) {
-    uint32_t target_excess = excess[i] + d;
-    for(int current_idx = i - 1; current_idx >= 0; current_idx--) {
-        if(excess[current_idx] == target_excess)
-            return current_idx;
+int64_t BPTree::scan_fwd(int64_t q, int64_t to, int32_t e, int32_t target) {
+    // scan positions [q, to], where e is excess(q - 1). whole bytes are
+    // skipped if their minimum excess cannot reach the target.
+    while(q <= to) {
+        if((q & 7) == 0 && q + 7 <= to) {
+            uint8_t byte = (structure[q >> 6] >> (q & 63)) & 0xFF;
+            if(e + excess_tables.min_prefix[byte] > target) {
+                e += excess_tables.total[byte];
+                q += 8;
+                continue;
+            }
+        }
+        e += get(q) ? 1 : -1;
+        if(e == target)
+            return q;
+        q++;
+    }
+    return -1;
+}
+
+int64_t BPTree::scan_bwd(int64_t q, int64_t to, int32_t e, int32_t target) {
+    // scan positions [to, q] in reverse, where e is excess(q)
+    while(q >= to) {
+        if((q & 7) == 7 && q - 7 >= to) {
+            uint8_t byte = (structure[(q - 7) >> 6] >> ((q - 7) & 63)) & 0xFF;
+            int32_t before = e - excess_tables.total[byte];
+            if(before + excess_tables.min_prefix[byte] > target) {
+                e = before;
+                q -= 8;
+                continue;
+            }
+        }
+        if(e == target)
+            return q;
+        e -= get(q) ? 1 : -1;
+        q--;
+    }
+    return -1;
+}
+
+int64_t BPTree::rmm_next(uint32_t w, int32_t target) {
+    // the first word following w whose minimum excess reaches the target
+    uint32_t node = rmm_leaves + w;
+    while(node > 1) {
+        if((node & 1) == 0 && rmm[node + 1] <= target) {
+            node++;
+            while(node < rmm_leaves) {
+                node <<= 1;
+                if(rmm[node] > target)
+                    node++;
+            }
+            return node - rmm_leaves;
+        }
+        node >>= 1;
+    }
+    return -1;
+}
+
+int64_t BPTree::rmm_prev(uint32_t w, int32_t target) {
+    // the last word preceding w whose minimum excess reaches the target
+    uint32_t node = rmm_leaves + w;
+    while(node > 1) {
+        if((node & 1) == 1 && rmm[node - 1] <= target) {
+            node--;
+            while(node < rmm_leaves) {
+                node = (node << 1) + 1;
+                if(rmm[node] > target)
+                    node--;
+            }
+            return node - rmm_leaves;
+        }
+        node >>= 1;
     }
     return -1;
 }
 
-void BPTree::newick_to_bp(std::string newick) {
+int32_t BPTree::fwd(uint32_t i, int32_t d) {
+    int32_t e = excess(i);
+    int32_t target = e + d;
+    uint32_t w = i >> 6;
+    int64_t word_end = std::min((int64_t)(w + 1) * 64, (int64_t)nparens) - 1;
+
+    int64_t found = scan_fwd((int64_t)i + 1, word_end, e, target);
+    if(found >= 0)
+        return found;
+
+    int64_t next = rmm_next(w, target);
+    if(next < 0)
+        return -1;
+
+    int64_t first = next * 64;
+    word_end = std::min(first + 64, (int64_t)nparens) - 1;
+    return scan_fwd(first, word_end, excess(first - 1), target);
+}
+
+int32_t BPTree::bwd(uint32_t i, int32_t d) {
+    int32_t e = excess(i);
+    int32_t target = e + d;
+    if(i == 0)
+        return -1;
+
+    uint32_t w = i >> 6;
+    e -= get(i) ? 1 : -1;  // excess(i - 1)
+
+    int64_t found = scan_bwd((int64_t)i - 1, (int64_t)w * 64, e, target);
+    if(found >= 0)
+        return found;
+
+    int64_t prev = rmm_prev(w, target);
+    if(prev < 0)
+        return -1;
+
+    int64_t last = prev * 64 + 63;
+    return scan_bwd(last, prev * 64, excess(last), target);
+}
+
+void su::newick_shape(const std::string &newick, uint32_t &n_nodes, uint32_t &n_tips, uint32_t &max_live) {
+    // as PropStack::max_live, a completed node needs one buffer above those
+    // live, and leaves one in place of its children. a tip is the token
+    // before a ',' or ')' which follows a '(' or ','. the root is not
+    // traversed.
+    std::vector<uint32_t> n_children;
+    uint32_t live = 0;
+    char last_structure = 0;
+    bool in_quote = false;
+
+    n_nodes = 0;
+    n_tips = 0;
+    max_live = 0;
+
+    auto complete = [&](uint32_t children) {
+        n_nodes++;
+        if(n_children.empty())
+            return;  // the root
+        max_live = std::max(max_live, live + 1);
+        live = live - children + 1;
+        n_children.back()++;
+    };
+
+    for(char c : newick) {
+        if(c == '\'')
+            in_quote = !in_quote;
+        if(in_quote)
+            continue;
+
+        switch(c) {
+            case '(':
+                n_children.push_back(0);
+                last_structure = c;
+                break;
+            case ',':
+            case ')':
+                if(last_structure == '(' || last_structure == ',') {
+                    n_tips++;
+                    complete(0);
+                }
+                if(c == ')' && !n_children.empty()) {
+                    uint32_t children = n_children.back();
+                    n_children.pop_back();
+                    complete(children);
+                }
+                last_structure = c;
+                break;
+            default:
+                break;
+        }
+    }
+
+    if(n_nodes == 0 && newick.find_first_not_of(" \t\r\n;") != std::string::npos) {
+        // a single tip
+        n_nodes = 1;
+        n_tips = 1;
+    }
+}
+
+void BPTree::newick_to_bp(std::string newick, std::vector<bool> &bp) {
     char last_structure;
     bool potential_single_descendent = false;
     int count = 0;
     bool in_quote = false;
+    int64_t depth = 0;
     for(auto c = newick.begin(); c != newick.end(); c++) {
         if(*c == '\'') 
             in_quote = !in_quote;
@@ -278,35 +726,43 @@ void BPTree::newick_to_bp(std::string newick) {
 
         switch(*c) {
             case '(':
-                // opening of a node
+                // opening of a node, of which there can only be one at the root
+                if(depth == 0 && !bp.empty())
+                    throw std::invalid_argument("Malformed newick: more than one root");
+                depth++;
                 count++;
-                structure.push_back(true);
+                bp.push_back(true);
                 last_structure = *c;
                 potential_single_descendent = true;
                 break;
             case ')':
                 // closing of a node
+                if(depth == 0)
+                    throw std::invalid_argument("Malformed newick: unbalanced parentheses");
+                depth--;
                 if(potential_single_descendent || (last_structure == ',')) {
                     // we have a single descendent or a last child (i.e. ",)" scenario)
                     count += 3;
-                    structure.push_back(true);
-                    structure.push_back(false);
-                    structure.push_back(false);
+                    bp.push_back(true);
+                    bp.push_back(false);
+                    bp.push_back(false);
                     potential_single_descendent = false;
                 } else {
                     // it is possible still to have a single descendent in the case of 
                     // multiple single descendents (e.g., (...()...) )
                     count += 1;
-                    structure.push_back(false);
+                    bp.push_back(false);
                 }
                 last_structure = *c;
                 break;
             case ',':
+                if(depth == 0)
+                    throw std::invalid_argument("Malformed newick: sibling outside of the root");
                 if(last_structure != ')') {
                     // we have a new tip
                     count += 2;
-                    structure.push_back(true);
-                    structure.push_back(false);
+                    bp.push_back(true);
+                    bp.push_back(false);
                 }
                 potential_single_descendent = false;
                 last_structure = *c;
@@ -315,26 +771,16 @@ void BPTree::newick_to_bp(std::string newick) {
                 break;
         }
     }
-    nparens = structure.size();
-}
 
+    if(in_quote)
+        throw std::invalid_argument("Malformed newick: unterminated quote");
+    if(depth != 0)
+        throw std::invalid_argument("Malformed newick: unbalanced parentheses");
+    if(bp.empty())
+        throw std::invalid_argument("Malformed newick: no nodes found");
+}
 
-void BPTree::structure_to_openclose() {
-    std::stack<unsigned int> oc;
-    unsigned int open_idx;
-    unsigned int i = 0;
 
-    for(auto it = structure.begin(); it != structure.end(); it++, i++) {
-        if(*it) {
-            oc.push(i);
-        } else {
-            open_idx = oc.top();
-            oc.pop();
-            openclose[i] = open_idx;
-            openclose[open_idx] = i;
-        }
-    }
-}
 // trim from end
 // from http://stackoverflow.com/a/217605
 static inline std::string &rtrim(std::string &s) {
@@ -453,10 +899,89 @@ std::string BPTree::tokenize(std::string::iterator &start, const std::string::it
 }   
 
 std::vector<bool> BPTree::get_structure() {
-    return structure;
+    std::vector<bool> out(nparens);
+    for(uint32_t i = 0; i < nparens; i++)
+        out[i] = get(i);
+    return out;
 }
 
 std::vector<uint32_t> BPTree::get_openclose() {
+    std::vector<uint32_t> openclose(nparens);
+    std::stack<uint32_t> oc;
+
+    for(uint32_t i = 0; i < nparens; i++) {
+        if(get(i)) {
+            oc.push(i);
+        } else {
+            uint32_t open_idx = oc.top();
+            oc.pop();
+            openclose[i] = open_idx;
+            openclose[open_idx] = i;
+        }
+    }
     return openclose;
 }
 
+ShearCache::ShearCache(size_t cap) : capacity(cap) {
+}
+
+std::shared_ptr<BPTree> ShearCache::get(BPTree &tree, const std::unordered_set<std::string> &to_keep,
+                                        std::string &missing) {
+    // an order independent hash of the retained names, combined with the
+    // identity of the tree
+    uint64_t fingerprint = tree.fingerprint();
+    uint64_t key = fingerprint ^ (to_keep.size() * 0x9E3779B97F4A7C15ULL);
+    uint64_t names_hash = 0;
+    for(auto &name : to_keep) {
+        uint64_t z = std::hash<std::string>()(name) + 0x9E3779B97F4A7C15ULL;
+        z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+        z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+        names_hash += z ^ (z >> 31);
+    }
+    key ^= names_hash * 0xFF51AFD7ED558CCDULL;
+
+    // the key narrows the entries, which are matched on the names themselves
+    auto matches = [&](const Entry &entry) {
+        return entry.key == key && entry.fingerprint == fingerprint && entry.names == to_keep;
+    };
+
+    {
+        std::lock_guard<std::mutex> guard(lock);
+        for(auto it = entries.begin(); it != entries.end(); it++) {
+            if(matches(*it)) {
+                entries.splice(entries.begin(), entries, it);
+                missing.clear();
+                return entries.front().sheared;
+            }
+        }
+    }
+
+    // shear outside of the lock, another thread may race us to the same
+    // result in which case the duplicate is simply replaced
+    std::shared_ptr<BPTree> sheared = std::make_shared<BPTree>(tree.shear_collapse(to_keep, missing));
+    if(!missing.empty())
+        return sheared;
+
+    std::lock_guard<std::mutex> guard(lock);
+    for(auto it = entries.begin(); it != entries.end(); it++) {
+        if(matches(*it)) {
+            entries.erase(it);
+            break;
+        }
+    }
+    entries.push_front(Entry{key, fingerprint, to_keep, sheared});
+    while(entries.size() > capacity)
+        entries.pop_back();
+
+    return sheared;
+}
+
+size_t ShearCache::size() {
+    std::lock_guard<std::mutex> guard(lock);
+    return entries.size();
+}
+
+void ShearCache::clear() {
+    std::lock_guard<std::mutex> guard(lock);
+    entries.clear();
+}
@@ -3,6 +3,11 @@
 #include <iostream>
 #include <vector>
 #include <unordered_set>
+#include <unordered_map>
+#include <list>
+#include <memory>
+#include <mutex>
+#include <stdint.h>
 
 namespace su {
     class BPTree {
@@ -17,6 +22,8 @@ namespace su {
             /* default constructor
              *
              * @param newick A newick string
+             *
+             * std::invalid_argument is thrown if the newick is malformed
              */
             BPTree(std::string newick);
             
@@ -86,8 +93,8 @@ namespace su {
 
             /* serialize the structure as a sequence of 1s and 0s */
             void print() {
-                for(auto c = structure.begin(); c != structure.end(); c++) {
-                    if(*c)
+                for(uint32_t i = 0; i < nparens; i++) {
+                    if(get(i))
                         std::cout << "1";
                     else
                         std::cout << "0";
@@ -96,28 +103,167 @@ namespace su {
             }
             BPTree mask(std::vector<bool> topology_mask, std::vector<double> in_lengths); // mask self
 
-            BPTree shear(std::unordered_set<std::string> to_keep);
+            /* Retain only the tips in to_keep and their ancestors
+             *
+             * The retained nodes are marked bottom-up from the tips, so the
+             * cost is proportional to the retained subtree if the tips have
+             * been indexed (see index_tips), and otherwise requires a single
+             * word-level scan of the topology to locate the tips.
+             *
+             * @param to_keep The names of the tips to retain
+             */
+            BPTree shear(const std::unordered_set<std::string> &to_keep);
 
             BPTree collapse();
 
+            /* Shear and collapse in a single pass
+             *
+             * Equivalent to shear(to_keep).collapse() but without constructing
+             * the intermediate tree.
+             *
+             * @param to_keep The names of the tips to retain
+             */
+            BPTree shear_collapse(const std::unordered_set<std::string> &to_keep);
+
+            /* Shear and collapse, noting a name which is not a tip
+             *
+             * The names are checked as the tips are located, so this costs no
+             * more than shear_collapse(to_keep).
+             *
+             * @param to_keep The names of the tips to retain
+             * @param missing Set to a name of to_keep which is not a tip of
+             *      the tree, or emptied if every name is a tip, an output
+             */
+            BPTree shear_collapse(const std::unordered_set<std::string> &to_keep, std::string &missing);
+
+            /* Index the tip names so that shearing does not scan the topology
+             *
+             * This is worthwhile for trees which are sheared repeatedly. If a
+             * tip name is duplicated, only the last occurrence is indexed.
+             */
+            void index_tips();
+
+            /* A hash of the topology, branch lengths and names
+             *
+             * The value is computed once and cached.
+             */
+            uint64_t fingerprint();
+
+            /* an estimate of the bytes held by the tree
+             *
+             * The topology, its indexes, the lengths, and the names are counted.
+             */
+            uint64_t memory_bytes() const;
+
         private:
-            std::vector<bool> structure;          // the topology
-            std::vector<uint32_t> openclose;      // cache'd mapping between parentheses
-            std::vector<uint32_t> select_0_index; // cache of select 0
-            std::vector<uint32_t> select_1_index; // cache of select 1
-            std::vector<uint32_t> excess;
-
-            void index_and_cache();  // construct the select caches
-            void newick_to_bp(std::string newick);  // convert a newick string to parentheses
+            /* The topology is stored succinctly. The parentheses are packed 64
+             * per word, and two small indexes are built over them: a rank
+             * directory of the number of opening parentheses preceding each
+             * superblock of 512 parentheses, and a range min-max tree holding
+             * the minimum excess within each word. Together, these support
+             * rank, select, and forward/backward excess searches (and thus
+             * open, close and enclose) in logarithmic time using roughly 2.1
+             * bits per parenthesis.
+             */
+            std::vector<uint64_t> structure;      // the topology, 64 parentheses per word
+            std::vector<uint32_t> rank_super;     // number of 1s preceding each superblock
+            std::vector<int32_t> rmm;             // range min-max tree over the excess, one leaf per word
+            uint32_t rmm_leaves;                  // index of the first leaf in rmm
+
+            std::unordered_map<std::string, uint32_t> tip_index;  // tip name -> index position, see index_tips
+            uint64_t fingerprint_cache;                           // zero if not yet computed
+
+            /* mark a node, and its ancestors, as retained. the value retained
+             * per node is the number of retained children.
+             */
+            void retain(uint32_t node, std::unordered_map<uint32_t, uint32_t> &retained);
+            BPTree shear_impl(const std::unordered_set<std::string> &to_keep, bool collapse,
+                              std::string *missing);
+
+            void index_and_cache();  // construct the rank directory and range min-max tree
+            void set_structure(const std::vector<bool> &input_structure);  // pack a topology into words
+            void newick_to_bp(std::string newick, std::vector<bool> &bp);  // convert a newick string to parentheses
             void newick_to_metadata(std::string newick);  // convert newick to attributes
-            void structure_to_openclose();  // set the cache mapping between parentheses pairs
             void set_node_metadata(unsigned int open_idx, std::string &token); // set attributes for a node
             bool is_structure_character(char c);  // test if a character is a newick structure
             inline uint32_t open(uint32_t i);  // obtain the index of the opening for a given parenthesis
             inline uint32_t close(uint32_t i);  // obtain the index of the closing for a given parenthesis
             std::string tokenize(std::string::iterator &start, const std::string::iterator &end);  // newick -> tokens
 
-            int32_t bwd(uint32_t i, int32_t d);
+            /* test whether the parenthesis at an index position is an opening */
+            inline bool get(uint32_t i) const {
+                return (structure[i >> 6] >> (i & 63)) & 1ULL;
+            }
+
+            uint32_t rank1(uint32_t i);    // number of opening parentheses in [0, i]
+            uint32_t select0(uint32_t k);  // index of the kth closing parenthesis
+            uint32_t select1(uint32_t k);  // index of the kth opening parenthesis
+            int32_t excess(int64_t i);     // opening minus closing parentheses in [0, i]
+
+            int32_t fwd(uint32_t i, int32_t d);  // first j > i with excess(j) == excess(i) + d
+            int32_t bwd(uint32_t i, int32_t d);  // last j < i with excess(j) == excess(i) + d
             int32_t enclose(uint32_t i);
+
+            /* word level scans and range min-max tree descents used by fwd and bwd */
+            int64_t scan_fwd(int64_t q, int64_t to, int32_t e, int32_t target);
+            int64_t scan_bwd(int64_t q, int64_t to, int32_t e, int32_t target);
+            int64_t rmm_next(uint32_t w, int32_t target);
+            int64_t rmm_prev(uint32_t w, int32_t target);
+    };
+
+    /* the shape of a newick tree, from a scan of the string
+     *
+     * @param newick A newick string
+     * @param n_nodes The number of nodes, including the root, an output
+     * @param n_tips The number of tips, an output
+     * @param max_live The number of buffers PropStack needs to traverse the
+     *      tree in postorder, as PropStack::max_live, an output
+     *
+     * The tree is not constructed, so this is far cheaper in time and
+     * memory than parsing it.
+     */
+    void newick_shape(const std::string &newick, uint32_t &n_nodes, uint32_t &n_tips, uint32_t &max_live);
+
+    /* A bounded cache of sheared and collapsed trees
+     *
+     * Entries are keyed by the fingerprint of the tree sheared from and an
+     * order independent hash of the retained tip names, and hold the names so
+     * that a hash collision is not taken for a hit. The least recently used
+     * entry is evicted once the capacity is exceeded. The cache is safe to use
+     * from multiple threads.
+     */
+    class ShearCache {
+        public:
+            ShearCache(size_t capacity);
+
+            /* obtain tree.shear_collapse(to_keep, missing), computing it if needed
+             *
+             * A result with a missing name is not cached. As every tree is
+             * fingerprinted, the cache is for trees which are sheared repeatedly.
+             *
+             * @param tree The tree to shear
+             * @param to_keep The names of the tips to retain
+             * @param missing Set to a name of to_keep which is not a tip of
+             *      the tree, or emptied if every name is a tip, an output
+             */
+            std::shared_ptr<BPTree> get(BPTree &tree, const std::unordered_set<std::string> &to_keep,
+                                        std::string &missing);
+
+            /* the number of cached trees */
+            size_t size();
+
+            /* drop all cached trees */
+            void clear();
+        private:
+            struct Entry {
+                uint64_t key;
+                uint64_t fingerprint;
+                std::unordered_set<std::string> names;
+                std::shared_ptr<BPTree> sheared;
+            };
+
+            size_t capacity;
+            std::mutex lock;
+            std::list<Entry> entries;  // most recently used first
     };
 }
@@ -1,17 +1,23 @@
 #include "tree.hpp"
 #include "biom.hpp"
 #include "unifrac.hpp"
-#include "affinity.hpp"
+#include "pool.hpp"
+#include "stats.hpp"
 #include <unordered_map>
 #include <cstdlib>
 #include <thread>
+#include <atomic>
+#include <memory>
+#include <new>
 #include <signal.h>
 #include <stdarg.h>
 #include <algorithm>
 #include <pthread.h>
+#include <unistd.h>
+#include <cstdio>
+#include <cstring>
 
-static pthread_mutex_t printf_mutex;
-static bool* report_status;
+static pthread_mutex_t printf_mutex = PTHREAD_MUTEX_INITIALIZER;
 
 std::string su::test_table_ids_are_subset_of_tree(su::biom &table, su::BPTree &tree) {
     std::unordered_set<std::string> tip_names = tree.get_tip_names();
@@ -41,79 +47,79 @@ int sync_printf(const char *format, ...) {
     va_end(args);
 }
 
-void sig_handler(int signo) {
-    // http://www.thegeekstuff.com/2012/03/catch-signals-sample-c-code
-    if (signo == SIGUSR1) {
-        if(report_status == NULL)
-            fprintf(stderr, "Cannot report status.\n");
-        else {
-            for(int i = 0; i < CPU_SETSIZE; i++) {
-                report_status[i] = true;
-            }
-        }
-    }
-}
-
 using namespace su;
 
 
-PropStack::PropStack(uint32_t vecsize) {
+PropStack::PropStack(uint32_t vecsize, uint32_t capacity) {
     defaultsize = vecsize;
-    prop_stack = std::stack<double*>();
-    prop_map = std::unordered_map<uint32_t, double*>();
-
-    prop_map.reserve(1000);
+    top = 0;
+    slots = std::vector<double*>(capacity);
+
+    for(unsigned int i = 0; i < capacity; i++) {
+        if(posix_memalign((void **)&slots[i], 32, sizeof(double) * defaultsize) != 0) {
+            // the destructor does not run for a constructor which throws
+            for(unsigned int j = 0; j < i; j++)
+                free(slots[j]);
+            throw std::bad_alloc();
+        }
+    }
 }
 
 PropStack::~PropStack() {
-    double *vec;
-    // drain stack
-    for(unsigned int i = 0; i < prop_stack.size(); i++) {
-        vec = prop_stack.top();
-        prop_stack.pop();
-        free(vec);
-    }
+    for(unsigned int i = 0; i < slots.size(); i++)
+        free(slots[i]);
+}
 
-    // drain the map
-    for(auto it = prop_map.begin(); it != prop_map.end(); it++) {
-        vec = it->second;
-        free(vec);
+double* PropStack::next() {
+    if(top >= slots.size()) {
+        fprintf(stderr, "PropStack capacity of %zu exceeded; [%s]:%d\n",
+                slots.size(), __FILE__, __LINE__);
+        exit(EXIT_FAILURE);
     }
-    prop_map.clear();
+    return slots[top];
+}
+
+void PropStack::reduce(uint32_t n_children) {
+    // the next buffer takes the place of the first child
+    uint32_t first = top - n_children;
+    double *vec = slots[first];
+    slots[first] = slots[top];
+    slots[top] = vec;
+    top = first + 1;
 }
 
 double* PropStack::get(uint32_t i) {
-    return prop_map[i];
+    return slots[top - 1 - i];
 }
 
-void PropStack::push(uint32_t node) {
-    double* vec = prop_map[node];
-    prop_map.erase(node);
-    prop_stack.push(vec);
+uint32_t PropStack::size() {
+    return top;
 }
 
-double* PropStack::pop(uint32_t node) {
-    /*
-     * if we don't have any available vectors, create one
-     * add it to our record of known vectors so we can track our mallocs
-     */
-    double *vec;
-    int err = 0;
-    if(prop_stack.empty()) {
-        err = posix_memalign((void **)&vec, 32, sizeof(double) * defaultsize);
-        if(vec == NULL || err != 0) {
-            fprintf(stderr, "Failed to allocate %zd bytes, err %d; [%s]:%d\n",
-                    sizeof(double) * defaultsize, err, __FILE__, __LINE__);
-            exit(EXIT_FAILURE);
+uint32_t PropStack::max_live(BPTree &tree) {
+    // simulate the traversal over the parentheses: a close completes a
+    // node, which needs one buffer above those live and leaves one in place
+    // of its children. the root is not traversed.
+    std::vector<bool> structure = tree.get_structure();
+    std::vector<uint32_t> n_children;
+    uint32_t live = 0;
+    uint32_t peak = 0;
+
+    n_children.reserve(64);
+    for(auto open = structure.begin(); open + 1 < structure.end(); open++) {
+        if(*open) {
+            n_children.push_back(0);
+        } else {
+            uint32_t c = n_children.back();
+            n_children.pop_back();
+            if(live + 1 > peak)
+                peak = live + 1;
+            live = live - c + 1;
+            if(!n_children.empty())
+                n_children.back()++;
         }
     }
-    else {
-        vec = prop_stack.top();
-        prop_stack.pop();
-    }
-
-    prop_map[node] = vec;
-    return vec;
+    return peak;
 }
 
 double** su::deconvolute_stripes(std::vector<double*> &stripes, uint32_t n) {
@@ -156,24 +162,95 @@ double** su::deconvolute_stripes(std::vector<double*> &stripes, uint32_t n) {
 void su::stripes_to_condensed_form(std::vector<double*> &stripes, uint32_t n, double* &cf, unsigned int start, unsigned int stop) {
     // n must be >= 2, but that should be enforced upstream as that would imply
     // computing unifrac on a single sample.
+    stripes_to_matrix(stripes, n, cf, false, start, stop, 1, false);
+}
 
-    uint64_t comb_N = comb_2(n);
-    for(unsigned int stripe = start; stripe < stop; stripe++) {
-        // compute the (i, j) position of each element in each stripe
-        uint64_t i = 0;
-        uint64_t j = stripe + 1;
-        for(uint64_t k = 0; k < n; k++, i++, j++) {
-            if(j == n) {
-                i = 0;
-                j = n - (stripe + 1);
+// the stripes and rows of a tile of stripes_to_matrix, so that a tile of
+// each stripe and the rows written are about 32KB
+#define STRIPE_TILE 64
+#define ROW_TILE 64
+
+// write the rows of tid's tiles from the stripes [start, stop), see stripes_to_matrix
+void stripes_to_matrix_rows(std::vector<double*> &stripes, uint32_t n, double* out, bool square,
+                            const std::vector<uint64_t> &rows, unsigned int start, unsigned int stop,
+                            unsigned int skip, unsigned int tid, unsigned int nthreads,
+                            std::atomic<unsigned int>* pending) {
+    for(uint64_t s0 = start, tile = 0; s0 < stop; s0 += STRIPE_TILE, tile++) {
+        uint64_t s1 = std::min(s0 + STRIPE_TILE, (uint64_t)stop);
+        for(uint64_t r0 = (uint64_t)tid * ROW_TILE; r0 < n; r0 += (uint64_t)nthreads * ROW_TILE) {
+            uint64_t r1 = std::min(r0 + ROW_TILE, (uint64_t)n);
+            for(uint64_t i = r0; i < r1; i++) {
+                double* row = out + rows[i];
+                if(square && s0 == 0)
+                    row[i] = 0.0;
+
+                // element i of stripe s pairs i with i + s + 1, which is past
+                // the last sample from s = n - i - 1, and pairs i - s - 1 with i,
+                // which is before the first sample until s = i
+                uint64_t wrap = std::max(s0, std::min(s1, n - i - 1));
+                uint64_t lead = std::max(s0, std::min(s1, i));
+                for(uint64_t s = s0; s < wrap; s++) {
+                    if(s != skip)
+                        row[i + s + 1] = stripes[s][i];
+                }
+                for(uint64_t s = lead; s < s1; s++) {
+                    if(s != skip)
+                        row[i + n - s - 1] = stripes[s][i + n - s - 1];
+                }
+                if(square) {
+                    for(uint64_t s = wrap; s < s1; s++) {
+                        if(s != skip)
+                            row[i + s + 1 - n] = stripes[s][i];
+                    }
+                    // with an even n, stripe n / 2 - 1 pairs i with i + n / 2 from
+                    // both ends, and the pair takes the element of the later sample
+                    uint64_t lead_square = 2 * lead == n ? lead - 1 : lead;
+                    for(uint64_t s = s0; s < lead_square; s++) {
+                        if(s != skip)
+                            row[i - s - 1] = stripes[s][i - s - 1];
+                    }
+                }
             }
-            // determine the position in the condensed form vector for a given (i, j)
-            // based off of
-            // https://docs.scipy.org/doc/scipy/reference/generated/scipy.spatial.distance.squareform.html
-            uint64_t comb_N_minus_i = comb_2(n - i);
-            cf[comb_N - comb_N_minus_i + (j - i - 1)] = stripes[stripe][k];
         }
+
+        if(pending != NULL && pending[tile].fetch_sub(1) == 1) {
+            for(uint64_t s = s0; s < s1; s++) {
+                free(stripes[s]);
+                stripes[s] = NULL;
+            }
+        }
+    }
+}
+
+void su::stripes_to_matrix(std::vector<double*> &stripes, uint32_t n, double* out, bool square,
+                           unsigned int start, unsigned int stop, unsigned int nthreads,
+                           bool release) {
+    if(stop <= start || n < 2)
+        return;
+
+    // (i, j) is at rows[i] + j
+    std::vector<uint64_t> rows(n);
+    for(uint64_t i = 0; i < n; i++)
+        rows[i] = square ? i * n : i * n - i * (i + 1) / 2 - i - 1;
+
+    // the stripe whose pairs are those of the last stripe, if both are written
+    unsigned int n_stripes = (n + 1) / 2;
+    unsigned int skip = n_stripes;
+    if(n % 2 == 1 && n_stripes >= 2 && start <= n_stripes - 2 && stop >= n_stripes)
+        skip = n_stripes - 2;
+
+    nthreads = std::max(1U, std::min(nthreads, (n + ROW_TILE - 1) / ROW_TILE));
+    unsigned int n_tiles = (stop - start + STRIPE_TILE - 1) / STRIPE_TILE;
+    std::unique_ptr<std::atomic<unsigned int>[]> pending;
+    if(release) {
+        pending.reset(new std::atomic<unsigned int>[n_tiles]);
+        for(unsigned int tile = 0; tile < n_tiles; tile++)
+            pending[tile] = nthreads;
     }
+
+    su::run_tasks(nthreads, [&](unsigned int tid) {
+        stripes_to_matrix_rows(stripes, n, out, square, rows, start, stop, skip, tid, nthreads, pending.get());
+    });
 }
 
 void progressbar(float progress) {
@@ -192,56 +269,161 @@ void progressbar(float progress) {
     std::cout.flush();
 }
 
-void initialize_embedded(double*& prop, const su::task_parameters* task_p) {
-    int err = 0;
-    err = posix_memalign((void **)&prop, 32, sizeof(double) * task_p->n_samples * 2);
-    if(prop == NULL || err != 0) {
-        fprintf(stderr, "Failed to allocate %zd bytes, err %d; [%s]:%d\n",
-                sizeof(double) * task_p->n_samples * 2, err, __FILE__, __LINE__);
-        exit(EXIT_FAILURE);
-    }
+// the working buffers of a task return false, leaving the buffer NULL, if
+// they cannot be allocated
+bool initialize_embedded(double*& prop, const su::task_parameters* task_p) {
+    prop = NULL;
+    return posix_memalign((void **)&prop, 32, sizeof(double) * task_p->n_samples * 2) == 0;
 }
 
-void initialize_sample_counts(double*& counts, const su::task_parameters* task_p, biom &table) {
-    int err = 0;
-    err = posix_memalign((void **)&counts, 32, sizeof(double) * task_p->n_samples * 2);
-    if(counts == NULL || err != 0) {
-        fprintf(stderr, "Failed to allocate %zd bytes, err %d; [%s]:%d\n",
-                sizeof(double) * task_p->n_samples, err, __FILE__, __LINE__);
-        exit(EXIT_FAILURE);
-    }
+bool initialize_sample_counts(double*& counts, const su::task_parameters* task_p, biom &table) {
+    counts = NULL;
+    if(posix_memalign((void **)&counts, 32, sizeof(double) * task_p->n_samples * 2) != 0)
+        return false;
     for(unsigned int i = 0; i < table.n_samples; i++) {
         counts[i] = table.sample_counts[i];
         counts[i + table.n_samples] = table.sample_counts[i];
     }
+    return true;
 }
 
-void initialize_stripes(std::vector<double*> &dm_stripes,
+// the stripes allocated before a failure are left to the caller to free
+bool initialize_stripes(std::vector<double*> &dm_stripes,
                         std::vector<double*> &dm_stripes_total,
-                        Method unifrac_method,
+                        bool need_total,
                         const su::task_parameters* task_p) {
-    int err = 0;
+    // stripes which are already allocated, as when a caller reuses buffers
+    // over rounds, are only reset
     for(unsigned int i = task_p->start; i < task_p->stop; i++){
-        err = posix_memalign((void **)&dm_stripes[i], 32, sizeof(double) * task_p->n_samples);
-        if(dm_stripes[i] == NULL || err != 0) {
-            fprintf(stderr, "Failed to allocate %zd bytes, err %d; [%s]:%d\n",
-                    sizeof(double) * task_p->n_samples, err, __FILE__, __LINE__);
-            exit(EXIT_FAILURE);
+        if(dm_stripes[i] == NULL &&
+           posix_memalign((void **)&dm_stripes[i], 32, sizeof(double) * task_p->n_samples) != 0) {
+            dm_stripes[i] = NULL;
+            return false;
         }
         for(unsigned int j = 0; j < task_p->n_samples; j++)
             dm_stripes[i][j] = 0.;
 
-        if(unifrac_method == unweighted || unifrac_method == weighted_normalized || unifrac_method == generalized) {
-            err = posix_memalign((void **)&dm_stripes_total[i], 32, sizeof(double) * task_p->n_samples);
-            if(dm_stripes_total[i] == NULL || err != 0) {
-                fprintf(stderr, "Failed to allocate %zd bytes err %d; [%s]:%d\n",
-                        sizeof(double) * task_p->n_samples, err, __FILE__, __LINE__);
-                exit(EXIT_FAILURE);
+        if(need_total) {
+            if(dm_stripes_total[i] == NULL &&
+               posix_memalign((void **)&dm_stripes_total[i], 32, sizeof(double) * task_p->n_samples) != 0) {
+                dm_stripes_total[i] = NULL;
+                return false;
             }
             for(unsigned int j = 0; j < task_p->n_samples; j++)
                 dm_stripes_total[i][j] = 0.;
         }
     }
+    return true;
+}
+
+std::string su::checkpoint_path(const su::checkpoint_parameters &checkpoint, const su::task_parameters* task_p) {
+    return checkpoint.prefix + "." + std::to_string(task_p->start) + "-" + std::to_string(task_p->stop) + ".ckpt";
+}
+
+// the magic both opens and closes a checkpoint, so that a truncated file is
+// not resumed
+static const char CHECKPOINT_MAGIC[] = "SSU-CHECKPOINT-1";
+
+// write the state of a task, having computed the nodes before next_k
+//
+// the file is written under a temporary name and renamed into place, so
+// that a task interrupted while writing leaves its previous checkpoint.
+static bool write_checkpoint(const std::string &path,
+                             uint64_t fingerprint,
+                             uint32_t next_k,
+                             std::vector<double*> &dm_stripes,
+                             std::vector<double*> &dm_stripes_total,
+                             bool need_total,
+                             double* sample_totals,
+                             const su::task_parameters* task_p) {
+    std::string tmp = path + ".tmp";
+    FILE *fp = fopen(tmp.c_str(), "wb");
+    if(fp == NULL)
+        return false;
+
+    size_t n = task_p->n_samples;
+    uint32_t header[4] = {task_p->n_samples, task_p->start, task_p->stop, next_k};
+    uint8_t flags[2] = {need_total, sample_totals != NULL};
+    bool okay = fwrite(CHECKPOINT_MAGIC, sizeof(CHECKPOINT_MAGIC), 1, fp) == 1 &&
+                fwrite(&fingerprint, sizeof(fingerprint), 1, fp) == 1 &&
+                fwrite(header, sizeof(header), 1, fp) == 1 &&
+                fwrite(flags, sizeof(flags), 1, fp) == 1;
+
+    for(unsigned int i = task_p->start; okay && i < task_p->stop; i++) {
+        okay = fwrite(dm_stripes[i], sizeof(double), n, fp) == n;
+        if(okay && need_total)
+            okay = fwrite(dm_stripes_total[i], sizeof(double), n, fp) == n;
+    }
+    if(okay && sample_totals != NULL)
+        okay = fwrite(sample_totals, sizeof(double), n, fp) == n;
+    if(okay)
+        okay = fwrite(CHECKPOINT_MAGIC, sizeof(CHECKPOINT_MAGIC), 1, fp) == 1;
+
+    okay = fflush(fp) == 0 && okay;
+    okay = fsync(fileno(fp)) == 0 && okay;
+    okay = fclose(fp) == 0 && okay;
+
+    if(okay)
+        okay = rename(tmp.c_str(), path.c_str()) == 0;
+    if(!okay)
+        remove(tmp.c_str());
+    return okay;
+}
+
+// restore the state of a task from its checkpoint, returning the postorder
+// position to continue from
+//
+// zero is returned if there is no checkpoint, or if it is not of this task
+// and fingerprint, in which case the state is left reset.
+static uint32_t read_checkpoint(const std::string &path,
+                                uint64_t fingerprint,
+                                std::vector<double*> &dm_stripes,
+                                std::vector<double*> &dm_stripes_total,
+                                bool need_total,
+                                double* sample_totals,
+                                const su::task_parameters* task_p) {
+    FILE *fp = fopen(path.c_str(), "rb");
+    if(fp == NULL)
+        return 0;
+
+    size_t n = task_p->n_samples;
+    char magic[sizeof(CHECKPOINT_MAGIC)];
+    uint64_t file_fingerprint;
+    uint32_t header[4];
+    uint8_t flags[2];
+    bool okay = fread(magic, sizeof(magic), 1, fp) == 1 &&
+                memcmp(magic, CHECKPOINT_MAGIC, sizeof(magic)) == 0 &&
+                fread(&file_fingerprint, sizeof(file_fingerprint), 1, fp) == 1 &&
+                fread(header, sizeof(header), 1, fp) == 1 &&
+                fread(flags, sizeof(flags), 1, fp) == 1;
+
+    okay = okay && file_fingerprint == fingerprint &&
+           header[0] == task_p->n_samples &&
+           header[1] == task_p->start &&
+           header[2] == task_p->stop &&
+           flags[0] == need_total &&
+           flags[1] == (sample_totals != NULL);
+
+    for(unsigned int i = task_p->start; okay && i < task_p->stop; i++) {
+        okay = fread(dm_stripes[i], sizeof(double), n, fp) == n;
+        if(okay && need_total)
+            okay = fread(dm_stripes_total[i], sizeof(double), n, fp) == n;
+    }
+    if(okay && sample_totals != NULL)
+        okay = fread(sample_totals, sizeof(double), n, fp) == n;
+    okay = okay && fread(magic, sizeof(magic), 1, fp) == 1 &&
+           memcmp(magic, CHECKPOINT_MAGIC, sizeof(magic)) == 0;
+    fclose(fp);
+
+    if(okay)
+        return header[3];
+
+    fprintf(stderr, "Ignoring checkpoint %s, which is not of this computation\n", path.c_str());
+    initialize_stripes(dm_stripes, dm_stripes_total, need_total, task_p);
+    if(sample_totals != NULL)
+        for(unsigned int i = 0; i < n; i++)
+            sample_totals[i] = 0.;
+    return 0;
 }
 
 // Computes Faith's PD for the samples in  `table` over the phylogenetic
@@ -250,7 +432,7 @@ void initialize_stripes(std::vector<double*> &dm_stripes,
 void su::faith_pd(biom &table,
                   BPTree &tree,
                   double* result) {
-    PropStack propstack(table.n_samples);
+    PropStack propstack(table.n_samples, PropStack::max_live(tree));
 
     uint32_t node;
     double *node_proportions;
@@ -263,7 +445,7 @@ void su::faith_pd(biom &table,
         length = tree.lengths[node];
 
         // get node proportions and set intermediate scores
-        node_proportions = propstack.pop(node);
+        node_proportions = propstack.next();
         set_proportions(node_proportions, tree, node, table, propstack);
 
         for (unsigned int sample = 0; sample < table.n_samples; sample++){
@@ -273,19 +455,47 @@ void su::faith_pd(biom &table,
     }
 }
 
+void su::sample_totals(biom &table,
+                       BPTree &tree,
+                       bool presence,
+                       bool bypass_tips,
+                       double* totals) {
+    PropStack propstack(table.n_samples, PropStack::max_live(tree));
+
+    uint32_t node;
+    double *node_proportions;
+    double length;
+
+    for(unsigned int i = 0; i < table.n_samples; i++)
+        totals[i] = 0.0;
+
+    for(unsigned int k = 0; k < (tree.nparens / 2) - 1; k++) {
+        node = tree.postorderselect(k);
+        length = tree.lengths[node];
+
+        node_proportions = propstack.next();
+        set_proportions(node_proportions, tree, node, table, propstack);
+
+        if(bypass_tips && tree.isleaf(node))
+            continue;
+
+        if(presence) {
+            for(unsigned int i = 0; i < table.n_samples; i++)
+                totals[i] += (node_proportions[i] > 0) * length;
+        } else {
+            for(unsigned int i = 0; i < table.n_samples; i++)
+                totals[i] += node_proportions[i] * length;
+        }
+    }
+}
+
 void su::unifrac(biom &table,
                  BPTree &tree,
                  Method unifrac_method,
                  std::vector<double*> &dm_stripes,
                  std::vector<double*> &dm_stripes_total,
-                 const su::task_parameters* task_p) {
-    // processor affinity
-    int err = bind_to_core(task_p->tid);
-    if(err != 0) {
-        fprintf(stderr, "Unable to bind thread %d to core: %d\n", task_p->tid, err);
-        exit(EXIT_FAILURE);
-    }
-
+                 const su::task_parameters* task_p,
+                 const su::checkpoint_parameters* checkpoint) {
     if(table.n_samples != task_p->n_samples) {
         fprintf(stderr, "Task and table n_samples not equal\n");
         exit(EXIT_FAILURE);
@@ -303,7 +513,9 @@ void su::unifrac(biom &table,
             func = &su::_unweighted_unifrac_task;
             break;
         case weighted_normalized:
-            func = &su::_normalized_weighted_unifrac_task;
+            // the numerator is shared with unnormalized, the denominator is
+            // formed from per-sample totals, see below
+            func = &su::_unnormalized_weighted_unifrac_task;
             break;
         case weighted_unnormalized:
             func = &su::_unnormalized_weighted_unifrac_task;
@@ -321,26 +533,68 @@ void su::unifrac(biom &table,
         exit(1);
     }
 
-    PropStack propstack(table.n_samples);
+    PropStack propstack(table.n_samples, PropStack::max_live(tree));
 
     uint32_t node;
     double *node_proportions;
     double *embedded_proportions;
     double length;
 
-    initialize_embedded(embedded_proportions, task_p);
-    initialize_stripes(std::ref(dm_stripes), std::ref(dm_stripes_total), unifrac_method, task_p);
+    // the denominator of weighted normalized UniFrac for samples i and j,
+    // sum(length * (u_i + u_j)), separates into T_i + T_j where
+    // T_i = sum(length * u_i). the totals are accumulated per sample rather
+    // than per pair, so no total stripes are needed.
+    double *sample_totals = NULL;
+    if(unifrac_method == weighted_normalized)
+        sample_totals = (double*)calloc(sizeof(double), task_p->n_samples);
+
+    bool need_total = unifrac_method == unweighted || unifrac_method == generalized;
+    bool allocated = (unifrac_method != weighted_normalized || sample_totals != NULL) &&
+                     initialize_embedded(embedded_proportions, task_p) &&
+                     initialize_stripes(std::ref(dm_stripes), std::ref(dm_stripes_total),
+                                        need_total, task_p);
+    if(!allocated) {
+        free(sample_totals);
+        free(embedded_proportions);
+        throw std::bad_alloc();
+    }
 
-    for(unsigned int k = 0; k < (tree.nparens / 2) - 1; k++) {
+    uint32_t n_nodes = (tree.nparens / 2) - 1;
+    uint32_t stop_k = n_nodes;
+    uint32_t resume_k = 0;
+    double last_checkpoint = su::wall_seconds();
+    std::string checkpoint_file;
+    if(checkpoint != NULL) {
+        checkpoint_file = su::checkpoint_path(*checkpoint, task_p);
+        if(checkpoint->stop_node != 0 && checkpoint->stop_node < n_nodes)
+            stop_k = checkpoint->stop_node;
+        if(checkpoint->resume)
+            resume_k = read_checkpoint(checkpoint_file, checkpoint->fingerprint,
+                                       dm_stripes, dm_stripes_total, need_total,
+                                       sample_totals, task_p);
+    }
+
+    int reported = su::status_requests();
+    for(unsigned int k = 0; k < stop_k; k++) {
         node = tree.postorderselect(k);
         length = tree.lengths[node];
 
-        node_proportions = propstack.pop(node);
+        node_proportions = propstack.next();
         set_proportions(node_proportions, tree, node, table, propstack);
 
+        // the contributions of the nodes before resume_k are in the restored
+        // stripes, only their proportions are needed by their ancestors
+        if(k < resume_k)
+            continue;
+
         if(task_p->bypass_tips && tree.isleaf(node))
             continue;
 
+        if(sample_totals != NULL) {
+            for(unsigned int i = 0; i < task_p->n_samples; i++)
+                sample_totals[i] += node_proportions[i] * length;
+        }
+
         embed_proportions(embedded_proportions, node_proportions, task_p->n_samples);
         /*
          * The values in the example vectors correspond to index positions of an
@@ -388,18 +642,48 @@ void su::unifrac(biom &table,
          */
         func(dm_stripes, dm_stripes_total, embedded_proportions, length, task_p);
 
-        if(__builtin_expect(report_status[task_p->tid], false)) {
+        if(__builtin_expect(su::status_requests() != reported, false)) {
             sync_printf("tid:%d\tstart:%d\tstop:%d\tk:%d\ttotal:%d\n", task_p->tid, task_p->start, task_p->stop, k, (tree.nparens / 2) - 1);
-            report_status[task_p->tid] = false;
+            reported = su::status_requests();
+        }
+
+        if(checkpoint != NULL && su::wall_seconds() - last_checkpoint >= checkpoint->interval) {
+            if(!write_checkpoint(checkpoint_file, checkpoint->fingerprint, k + 1,
+                                 dm_stripes, dm_stripes_total, need_total,
+                                 sample_totals, task_p))
+                fprintf(stderr, "Unable to write checkpoint %s\n", checkpoint_file.c_str());
+            last_checkpoint = su::wall_seconds();
         }
     }
 
-    if(unifrac_method == weighted_normalized || unifrac_method == unweighted || unifrac_method == generalized) {
+    if(stop_k < n_nodes) {
+        // stopped early, the stripes are left unnormalized for a resume
+        if(!write_checkpoint(checkpoint_file, checkpoint->fingerprint, std::max(stop_k, resume_k),
+                             dm_stripes, dm_stripes_total, need_total,
+                             sample_totals, task_p))
+            fprintf(stderr, "Unable to write checkpoint %s\n", checkpoint_file.c_str());
+        free(sample_totals);
+        free(embedded_proportions);
+        return;
+    }
+
+    if(unifrac_method == unweighted || unifrac_method == generalized) {
         for(unsigned int i = task_p->start; i < task_p->stop; i++) {
             for(unsigned int j = 0; j < task_p->n_samples; j++) {
                 dm_stripes[i][j] = dm_stripes[i][j] / dm_stripes_total[i][j];
             }
         }
+    } else if(unifrac_method == weighted_normalized) {
+        // stripe i pairs sample j with sample (j + i + 1) mod n_samples
+        for(unsigned int i = task_p->start; i < task_p->stop; i++) {
+            for(unsigned int j = 0; j < task_p->n_samples; j++) {
+                unsigned int k = j + i + 1;
+                if(k >= task_p->n_samples)
+                    k -= task_p->n_samples;
+                dm_stripes[i][j] = dm_stripes[i][j] / (sample_totals[j] + sample_totals[k]);
+            }
+        }
+        free(sample_totals);
     }
 
     free(embedded_proportions);
@@ -410,14 +694,8 @@ void su::unifrac_vaw(biom &table,
                      Method unifrac_method,
                      std::vector<double*> &dm_stripes,
                      std::vector<double*> &dm_stripes_total,
-                     const su::task_parameters* task_p) {
-    // processor affinity
-    int err = bind_to_core(task_p->tid);
-    if(err != 0) {
-        fprintf(stderr, "Unable to bind thread %d to core: %d\n", task_p->tid, err);
-        exit(EXIT_FAILURE);
-    }
-
+                     const su::task_parameters* task_p,
+                     const su::checkpoint_parameters* checkpoint) {
     if(table.n_samples != task_p->n_samples) {
         fprintf(stderr, "Task and table n_samples not equal\n");
         exit(EXIT_FAILURE);
@@ -454,8 +732,9 @@ void su::unifrac_vaw(biom &table,
         exit(1);
     }
 
-    PropStack propstack(table.n_samples);
-    PropStack countstack(table.n_samples);
+    uint32_t max_live = PropStack::max_live(tree);
+    PropStack propstack(table.n_samples, max_live);
+    PropStack countstack(table.n_samples, max_live);
 
     uint32_t node;
     double *node_proportions;
@@ -465,21 +744,48 @@ void su::unifrac_vaw(biom &table,
     double *sample_total_counts;
     double length;
 
-    initialize_embedded(embedded_proportions, task_p);
-    initialize_embedded(embedded_counts, task_p);
-    initialize_sample_counts(sample_total_counts, task_p, table);
-    initialize_stripes(std::ref(dm_stripes), std::ref(dm_stripes_total), unifrac_method, task_p);
+    embedded_proportions = embedded_counts = sample_total_counts = NULL;
+    bool need_total = unifrac_method != weighted_unnormalized;
+    bool allocated = initialize_embedded(embedded_proportions, task_p) &&
+                     initialize_embedded(embedded_counts, task_p) &&
+                     initialize_sample_counts(sample_total_counts, task_p, table) &&
+                     initialize_stripes(std::ref(dm_stripes), std::ref(dm_stripes_total), need_total, task_p);
+    if(!allocated) {
+        free(embedded_proportions);
+        free(embedded_counts);
+        free(sample_total_counts);
+        throw std::bad_alloc();
+    }
 
-    for(unsigned int k = 0; k < (tree.nparens / 2) - 1; k++) {
+    uint32_t n_nodes = (tree.nparens / 2) - 1;
+    uint32_t stop_k = n_nodes;
+    uint32_t resume_k = 0;
+    double last_checkpoint = su::wall_seconds();
+    std::string checkpoint_file;
+    if(checkpoint != NULL) {
+        checkpoint_file = su::checkpoint_path(*checkpoint, task_p);
+        if(checkpoint->stop_node != 0 && checkpoint->stop_node < n_nodes)
+            stop_k = checkpoint->stop_node;
+        if(checkpoint->resume)
+            resume_k = read_checkpoint(checkpoint_file, checkpoint->fingerprint,
+                                       dm_stripes, dm_stripes_total, need_total,
+                                       NULL, task_p);
+    }
+
+    int reported = su::status_requests();
+    for(unsigned int k = 0; k < stop_k; k++) {
         node = tree.postorderselect(k);
         length = tree.lengths[node];
 
-        node_proportions = propstack.pop(node);
-        node_counts = countstack.pop(node);
+        node_proportions = propstack.next();
+        node_counts = countstack.next();
 
         set_proportions(node_proportions, tree, node, table, propstack);
         set_proportions(node_counts, tree, node, table, countstack, false);
 
+        if(k < resume_k)
+            continue;
+
         if(task_p->bypass_tips && tree.isleaf(node))
             continue;
 
@@ -488,12 +794,31 @@ void su::unifrac_vaw(biom &table,
 
         func(dm_stripes, dm_stripes_total, embedded_proportions, embedded_counts, sample_total_counts, length, task_p);
 
-        if(__builtin_expect(report_status[task_p->tid], false)) {
+        if(__builtin_expect(su::status_requests() != reported, false)) {
             sync_printf("tid:%d\tstart:%d\tstop:%d\tk:%d\ttotal:%d\n", task_p->tid, task_p->start, task_p->stop, k, (tree.nparens / 2) - 1);
-            report_status[task_p->tid] = false;
+            reported = su::status_requests();
+        }
+
+        if(checkpoint != NULL && su::wall_seconds() - last_checkpoint >= checkpoint->interval) {
+            if(!write_checkpoint(checkpoint_file, checkpoint->fingerprint, k + 1,
+                                 dm_stripes, dm_stripes_total, need_total,
+                                 NULL, task_p))
+                fprintf(stderr, "Unable to write checkpoint %s\n", checkpoint_file.c_str());
+            last_checkpoint = su::wall_seconds();
         }
     }
 
+    if(stop_k < n_nodes) {
+        if(!write_checkpoint(checkpoint_file, checkpoint->fingerprint, std::max(stop_k, resume_k),
+                             dm_stripes, dm_stripes_total, need_total,
+                             NULL, task_p))
+            fprintf(stderr, "Unable to write checkpoint %s\n", checkpoint_file.c_str());
+        free(embedded_proportions);
+        free(embedded_counts);
+        free(sample_total_counts);
+        return;
+    }
+
     if(unifrac_method == weighted_normalized || unifrac_method == unweighted || unifrac_method == generalized) {
         for(unsigned int i = task_p->start; i < task_p->stop; i++) {
             for(unsigned int j = 0; j < task_p->n_samples; j++) {
@@ -507,6 +832,161 @@ void su::unifrac_vaw(biom &table,
     free(sample_total_counts);
 }
 
+void su::unifrac_cross(biom &table,
+                       BPTree &tree,
+                       Method unifrac_method,
+                       bool variance_adjust,
+                       const std::vector<uint32_t> &rows,
+                       const std::vector<uint32_t> &cols,
+                       double* dm,
+                       const su::task_parameters* task_p) {
+    void (*func)(double*,              // dm
+                 double*,              // dm_total
+                 const double*,        // row_proportions
+                 const double*,        // col_proportions
+                 unsigned int,         // n_rows
+                 unsigned int,         // n_cols
+                 double,               // length
+                 const su::task_parameters*) = NULL;
+    void (*func_vaw)(double*,          // dm
+                     double*,          // dm_total
+                     const double*,    // row_proportions
+                     const double*,    // col_proportions
+                     const double*,    // row_counts
+                     const double*,    // col_counts
+                     const double*,    // row_total_counts
+                     const double*,    // col_total_counts
+                     unsigned int,     // n_rows
+                     unsigned int,     // n_cols
+                     double,           // length
+                     const su::task_parameters*) = NULL;
+
+    switch(unifrac_method) {
+        case unweighted:
+            func = &su::_unweighted_unifrac_cross_task;
+            func_vaw = &su::_vaw_unweighted_unifrac_cross_task;
+            break;
+        case weighted_normalized:
+            // as with su::unifrac, the denominator is formed from
+            // per-sample totals
+            func = &su::_unnormalized_weighted_unifrac_cross_task;
+            func_vaw = &su::_vaw_normalized_weighted_unifrac_cross_task;
+            break;
+        case weighted_unnormalized:
+            func = &su::_unnormalized_weighted_unifrac_cross_task;
+            func_vaw = &su::_vaw_unnormalized_weighted_unifrac_cross_task;
+            break;
+        case generalized:
+            func = &su::_generalized_unifrac_cross_task;
+            func_vaw = &su::_vaw_generalized_unifrac_cross_task;
+            break;
+        default:
+            break;
+    }
+
+    if(func == NULL) {
+        fprintf(stderr, "Unknown unifrac task\n");
+        exit(1);
+    }
+
+    // only the block of rows belonging to this task is touched
+    unsigned int n_rows = task_p->stop - task_p->start;
+    unsigned int n_cols = cols.size();
+    uint64_t block_size = (uint64_t)n_rows * n_cols;
+    double *dm_block = dm + (uint64_t)task_p->start * n_cols;
+    const uint32_t *row_index = rows.data() + task_p->start;
+
+    bool need_total = unifrac_method == unweighted || unifrac_method == generalized ||
+                      (variance_adjust && unifrac_method == weighted_normalized);
+    bool need_sample_totals = !variance_adjust && unifrac_method == weighted_normalized;
+
+    // the per-node values of the compared samples are gathered so the
+    // tasks operate over contiguous memory independent of the table size
+    double *row_props = (double*)calloc(sizeof(double), n_rows * 3 + n_cols * 3);
+    double *dm_total = need_total ? (double*)calloc(sizeof(double), block_size) : NULL;
+    if(row_props == NULL || (need_total && dm_total == NULL)) {
+        fprintf(stderr, "Failed to allocate %zd bytes; [%s]:%d\n",
+                sizeof(double) * (block_size + n_rows * 3 + n_cols * 3), __FILE__, __LINE__);
+        exit(EXIT_FAILURE);
+    }
+    double *row_counts = row_props + n_rows;
+    double *row_totals = row_counts + n_rows;  // total counts, or weighted totals
+    double *col_props = row_totals + n_rows;
+    double *col_counts = col_props + n_cols;
+    double *col_totals = col_counts + n_cols;
+
+    for(uint64_t i = 0; i < block_size; i++)
+        dm_block[i] = 0.;
+
+    if(variance_adjust) {
+        for(unsigned int i = 0; i < n_rows; i++)
+            row_totals[i] = table.sample_counts[row_index[i]];
+        for(unsigned int j = 0; j < n_cols; j++)
+            col_totals[j] = table.sample_counts[cols[j]];
+    }
+
+    uint32_t max_live = PropStack::max_live(tree);
+    PropStack propstack(table.n_samples, max_live);
+    PropStack countstack(variance_adjust ? table.n_samples : 0, variance_adjust ? max_live : 0);
+
+    uint32_t node;
+    double *node_proportions;
+    double *node_counts;
+    double length;
+
+    for(unsigned int k = 0; k < (tree.nparens / 2) - 1; k++) {
+        node = tree.postorderselect(k);
+        length = tree.lengths[node];
+
+        node_proportions = propstack.next();
+        set_proportions(node_proportions, tree, node, table, propstack);
+        if(variance_adjust) {
+            node_counts = countstack.next();
+            set_proportions(node_counts, tree, node, table, countstack, false);
+        }
+
+        if(task_p->bypass_tips && tree.isleaf(node))
+            continue;
+
+        for(unsigned int i = 0; i < n_rows; i++)
+            row_props[i] = node_proportions[row_index[i]];
+        for(unsigned int j = 0; j < n_cols; j++)
+            col_props[j] = node_proportions[cols[j]];
+
+        if(variance_adjust) {
+            for(unsigned int i = 0; i < n_rows; i++)
+                row_counts[i] = node_counts[row_index[i]];
+            for(unsigned int j = 0; j < n_cols; j++)
+                col_counts[j] = node_counts[cols[j]];
+
+            func_vaw(dm_block, dm_total, row_props, col_props, row_counts, col_counts,
+                     row_totals, col_totals, n_rows, n_cols, length, task_p);
+        } else {
+            if(need_sample_totals) {
+                for(unsigned int i = 0; i < n_rows; i++)
+                    row_totals[i] += row_props[i] * length;
+                for(unsigned int j = 0; j < n_cols; j++)
+                    col_totals[j] += col_props[j] * length;
+            }
+
+            func(dm_block, dm_total, row_props, col_props, n_rows, n_cols, length, task_p);
+        }
+    }
+
+    if(need_total) {
+        for(uint64_t i = 0; i < block_size; i++)
+            dm_block[i] = dm_block[i] / dm_total[i];
+    } else if(need_sample_totals) {
+        for(unsigned int i = 0; i < n_rows; i++)
+            for(unsigned int j = 0; j < n_cols; j++)
+                dm_block[(uint64_t)i * n_cols + j] /= row_totals[i] + col_totals[j];
+    }
+
+    free(row_props);
+    if(dm_total != NULL)
+        free(dm_total);
+}
+
 void su::set_proportions(double* props,
                          BPTree &tree,
                          uint32_t node,
@@ -520,24 +1000,27 @@ void su::set_proportions(double* props,
            if(normalize)
                props[i] /= table.sample_counts[i];
        }
+       ps.reduce(0);
 
     } else {
         unsigned int current = tree.leftchild(node);
         unsigned int right = tree.rightchild(node);
+        uint32_t n_children = 0;
         double *vec;
 
         for(unsigned int i = 0; i < table.n_samples; i++)
             props[i] = 0;
 
+        // the children are the most recently completed nodes
         while(current <= right && current != 0) {
-            vec = ps.get(current);  // pull from prop map
-            ps.push(current);  // remove from prop map, place back on stack
+            vec = ps.get(n_children++);
 
             for(unsigned int i = 0; i < table.n_samples; i++)
                 props[i] = props[i] + vec[i];
 
             current = tree.rightsibling(current);
         }
+        ps.reduce(n_children);
     }
 }
 
@@ -568,42 +1051,40 @@ void su::process_stripes(biom &table,
                          bool variance_adjust,
                          std::vector<double*> &dm_stripes,
                          std::vector<double*> &dm_stripes_total,
-                         std::vector<std::thread> &threads,
-                         std::vector<su::task_parameters> &tasks) {
-
-    // register a signal handler so we can ask the master thread for its
-    // progress
-    if (signal(SIGUSR1, sig_handler) == SIG_ERR)
-        fprintf(stderr, "Can't catch SIGUSR1\n");
-
-    report_status = (bool*)calloc(sizeof(bool), CPU_SETSIZE);
-    pthread_mutex_init(&printf_mutex, NULL);
-
-    for(unsigned int tid = 0; tid < threads.size(); tid++) {
-        if(variance_adjust)
-            threads[tid] = std::thread(su::unifrac_vaw,
-                                       std::ref(table),
-                                       std::ref(tree_sheared),
-                                       method,
-                                       std::ref(dm_stripes),
-                                       std::ref(dm_stripes_total),
-                                       &tasks[tid]);
-        else
-            threads[tid] = std::thread(su::unifrac,
-                                       std::ref(table),
-                                       std::ref(tree_sheared),
-                                       method,
-                                       std::ref(dm_stripes),
-                                       std::ref(dm_stripes_total),
-                                       &tasks[tid]);
-    }
-
-    for(unsigned int tid = 0; tid < threads.size(); tid++) {
-        threads[tid].join();
-    }
-
-    if(report_status != NULL) {
-        pthread_mutex_destroy(&printf_mutex);
-        free(report_status);
-    }
+                         std::vector<su::task_parameters> &tasks,
+                         const su::checkpoint_parameters* checkpoint) {
+    // so that the master thread can be asked for its progress
+    su::report_status_on_signal();
+
+    // the tasks of the pool must not throw, so a failed allocation is
+    // raised once they have all finished
+    std::atomic<bool> exhausted(false);
+    su::run_tasks(tasks.size(), [&](unsigned int tid) {
+        su::task_parameters *task_p = &tasks[tid];
+        double cpu_start = su::thread_cpu_seconds();
+        try {
+            if(variance_adjust)
+                su::unifrac_vaw(table, tree_sheared, method, dm_stripes, dm_stripes_total, task_p, checkpoint);
+            else
+                su::unifrac(table, tree_sheared, method, dm_stripes, dm_stripes_total, task_p, checkpoint);
+        } catch(const std::bad_alloc &e) {
+            exhausted = true;
+        }
+        task_p->cpu_seconds = su::thread_cpu_seconds() - cpu_start;
+    });
+    if(exhausted)
+        throw std::bad_alloc();
+}
+
+void su::process_cross(biom &table,
+                       BPTree &tree_sheared,
+                       Method method,
+                       bool variance_adjust,
+                       const std::vector<uint32_t> &rows,
+                       const std::vector<uint32_t> &cols,
+                       double* dm,
+                       std::vector<su::task_parameters> &tasks) {
+    su::run_tasks(tasks.size(), [&](unsigned int tid) {
+        su::unifrac_cross(table, tree_sheared, method, variance_adjust, rows, cols, dm, &tasks[tid]);
+    });
 }
@@ -1,4 +1,5 @@
 #include <stack>
+#include <string>
 #include <vector>
 #include <unordered_map>
 #include <thread>
@@ -9,38 +10,156 @@
     namespace su {
         enum Method {unweighted, weighted_normalized, weighted_unnormalized, generalized};
         
+        /* buffers for node proportions during a postorder traversal
+         *
+         * In postorder, the proportions still needed are those of completed
+         * nodes whose parent has not yet been visited, and a node consumes
+         * exactly its children, which are the most recently completed. The
+         * buffers are therefore managed as a stack of slots: a node's buffer
+         * is taken from the slot above the live ones, and on completion it
+         * replaces the slots of its children. The number of slots required
+         * is bounded by max_live, and is allocated at construction.
+         */
         class PropStack {
             private:
-                std::stack<double*> prop_stack;
-                std::unordered_map<uint32_t, double*> prop_map;
+                std::vector<double*> slots;
+                uint32_t top;  // the number of live buffers
                 uint32_t defaultsize;
             public:
-                PropStack(uint32_t vecsize);
+                /* @param vecsize The length of each buffer
+                 * @param capacity The number of buffers, see max_live
+                 */
+                PropStack(uint32_t vecsize, uint32_t capacity);
                 ~PropStack();
-                double* pop(uint32_t i);
-                void push(uint32_t i);
+
+                /* the buffer for the next node, above the live buffers */
+                double* next();
+
+                /* complete the next node, replacing the buffers of its
+                 * n_children children with its own
+                 */
+                void reduce(uint32_t n_children);
+
+                /* a live buffer, where 0 is the most recently completed */
                 double* get(uint32_t i);
+
+                /* the number of live buffers */
+                uint32_t size();
+
+                /* the number of buffers needed to traverse a tree in postorder
+                 *
+                 * @param tree The tree to be traversed
+                 */
+                static uint32_t max_live(BPTree &tree);
         };
 
         void faith_pd(biom &table, BPTree &tree, double* result);
 
+        /* the branch length weighted total of each sample
+         *
+         * totals[i] is the sum over nodes of length * proportion of sample i,
+         * or length * presence of sample i if presence is true. the nodes
+         * are those traversed by su::unifrac under bypass_tips.
+         */
+        void sample_totals(biom &table, BPTree &tree, bool presence, bool bypass_tips, double* totals);
+
+        /* periodic checkpoints of the stripes of su::unifrac and su::unifrac_vaw
+         *
+         * prefix <std::string> the path prefix of the checkpoint files, to
+         *      which each task appends the stripes it computes, see
+         *      checkpoint_path.
+         * interval <double> the least seconds between the checkpoints of a
+         *      task. zero writes one after every node.
+         * fingerprint <uint64_t> a hash of the inputs and parameters of the
+         *      computation. a checkpoint is only resumed if it was written
+         *      under the same fingerprint.
+         * resume <bool> continue each task from its checkpoint if present.
+         * stop_node <uint32_t> if not zero, each task stops at this postorder
+         *      position, writing a checkpoint, and does not finalize its
+         *      stripes. a long computation can then be run in slices, such as
+         *      within the time limit of a scheduler, each resuming the last.
+         *
+         * A checkpoint holds the stripes of a task, their totals and the
+         * postorder position reached. On resume, the proportions of the nodes
+         * before that position are recomputed, which is cheap relative to the
+         * stripes, and the stripes continue from there.
+         */
+        struct checkpoint_parameters {
+            std::string prefix;
+            double interval;
+            uint64_t fingerprint;
+            bool resume;
+            uint32_t stop_node;
+        };
+
+        // the checkpoint file of a task, <prefix>.<start>-<stop>.ckpt
+        std::string checkpoint_path(const checkpoint_parameters &checkpoint, const task_parameters* task_p);
+
         std::string test_table_ids_are_subset_of_tree(biom &table, BPTree &tree);
         void unifrac(biom &table, 
                      BPTree &tree, 
                      Method unifrac_method,
                      std::vector<double*> &dm_stripes,
                      std::vector<double*> &dm_stripes_total,
-                     const task_parameters* task_p);
+                     const task_parameters* task_p,
+                     const checkpoint_parameters* checkpoint = NULL);
         
         void unifrac_vaw(biom &table, 
                          BPTree &tree, 
                          Method unifrac_method,
                          std::vector<double*> &dm_stripes,
                          std::vector<double*> &dm_stripes_total,
-                         const task_parameters* task_p);
+                         const task_parameters* task_p,
+                         const checkpoint_parameters* checkpoint = NULL);
         
+        /* compute the distances between two sets of samples
+         *
+         * rows and cols are the indices of the samples of table to compare. dm
+         * is row-major of dimension (rows.size(), cols.size()), and the rows
+         * [task_p->start, task_p->stop) of it are computed.
+         */
+        void unifrac_cross(biom &table,
+                           BPTree &tree,
+                           Method unifrac_method,
+                           bool variance_adjust,
+                           const std::vector<uint32_t> &rows,
+                           const std::vector<uint32_t> &cols,
+                           double* dm,
+                           const task_parameters* task_p);
+
         double** deconvolute_stripes(std::vector<double*> &stripes, uint32_t n);
         void stripes_to_condensed_form(std::vector<double*> &stripes, uint32_t n, double* &cf, unsigned int start, unsigned int stop);
+
+        /* write the distances of the stripes [start, stop) into a matrix
+         *
+         * stripes <vector of double*> the stripes, of which [start, stop) are read.
+         * n <uint32_t> the number of samples.
+         * out <double*> the condensed form of the upper triangle, of length comb_2(n),
+         *      or if square, the symmetric n x n matrix in row-major order.
+         * square <bool> whether out is the square matrix, whose diagonal is zeroed by
+         *      the call from stripe 0.
+         * start <uint> the first stripe to write.
+         * stop <uint> the stripe after the last to write.
+         * nthreads <uint> the number of threads writing.
+         * release <bool> whether to free each stripe, and set it to NULL, once it
+         *      has been written.
+         *
+         * A stripe and the stripe n - 2 - its index hold the same pairs. When both
+         * are written the later is used, as it is when they are written by
+         * successive calls in order. The writes are done a tile of STRIPE_TILE
+         * stripes by ROW_TILE rows at a time, in which each stripe is read in a
+         * short run and each row is written in one, so both are in cache. The
+         * tiles of rows are dealt to the threads in turn, and the last thread
+         * through a tile of stripes frees them.
+         */
+        void stripes_to_matrix(std::vector<double*> &stripes, uint32_t n, double* out, bool square,
+                               unsigned int start, unsigned int stop, unsigned int nthreads,
+                               bool release);
+        /* compute the proportions of a node, completing it on ps
+         *
+         * props must be ps.next(), and the children of node must be the
+         * most recently completed nodes on ps.
+         */
         void set_proportions(double* props, 
                              BPTree &tree, uint32_t node, 
                              biom &table, 
@@ -80,15 +199,31 @@
             return val;
         }
 
-        // process the stripes described by tasks
+        /* process the stripes described by tasks, each on a thread of the worker pool
+         *
+         * Throws std::bad_alloc, once every task has finished, if the working
+         * memory or the stripes of a task cannot be allocated. The stripes which
+         * were allocated are left in dm_stripes and dm_stripes_total.
+         */
         void process_stripes(biom &table, 
                              BPTree &tree_sheared, 
                              Method method,
                              bool variance_adjust,
                              std::vector<double*> &dm_stripes, 
                              std::vector<double*> &dm_stripes_total,
-                             std::vector<std::thread> &threads,
-                             std::vector<su::task_parameters> &tasks);
+                             std::vector<su::task_parameters> &tasks,
+                             const checkpoint_parameters* checkpoint = NULL);
+
+        // process the rows of a rectangular block described by tasks, each on a
+        // thread of the worker pool
+        void process_cross(biom &table,
+                           BPTree &tree_sheared,
+                           Method method,
+                           bool variance_adjust,
+                           const std::vector<uint32_t> &rows,
+                           const std::vector<uint32_t> &cols,
+                           double* dm,
+                           std::vector<su::task_parameters> &tasks);
     }
 #define __UNIFRAC 1
 #endif
@@ -76,67 +76,6 @@ void su::_vaw_unnormalized_weighted_unifrac_task(std::vector<double*> &__restric
         }
     }
 }
-void su::_normalized_weighted_unifrac_task(std::vector<double*> &__restrict__ dm_stripes, 
-                                           std::vector<double*> &__restrict__ dm_stripes_total,
-                                           double* __restrict__ embedded_proportions, 
-                                           double length, 
-                                           const su::task_parameters* task_p) {
-    double *dm_stripe;
-    double *dm_stripe_total;
-    unsigned int trailing = task_p->n_samples - (task_p->n_samples % 4);
-
-    // point of thread
-    for(unsigned int stripe = task_p->start; stripe < task_p->stop; stripe++) {
-        dm_stripe = dm_stripes[stripe];
-        dm_stripe_total = dm_stripes_total[stripe];
-
-        for(unsigned int j = 0; j < task_p->n_samples / 4; j++) {
-            int k = j * 4;
-            int l = k + stripe;
-
-            double u1 = embedded_proportions[k];
-            double u2 = embedded_proportions[k + 1];
-            double u3 = embedded_proportions[k + 2];
-            double u4 = embedded_proportions[k + 3];
-         
-            double v1 = embedded_proportions[l + 1];
-            double v2 = embedded_proportions[l + 2];
-            double v3 = embedded_proportions[l + 3];
-            double v4 = embedded_proportions[l + 4];
-            
-            double diff1 = u1 - v1;   
-            double diff2 = u2 - v2;   
-            double diff3 = u3 - v3;   
-            double diff4 = u4 - v4;
-
-            double sum1 = u1 + v1;   
-            double sum2 = u2 + v2;   
-            double sum3 = u3 + v3;   
-            double sum4 = u4 + v4;
-
-            dm_stripe[k]     += fabs(diff1) * length;
-            dm_stripe[k + 1] += fabs(diff2) * length;
-            dm_stripe[k + 2] += fabs(diff3) * length;
-            dm_stripe[k + 3] += fabs(diff4) * length;
-
-            dm_stripe_total[k]     += sum1 * length;
-            dm_stripe_total[k + 1] += sum2 * length;
-            dm_stripe_total[k + 2] += sum3 * length;
-            dm_stripe_total[k + 3] += sum4 * length;
-        }
-
-        for(unsigned int k = trailing; k < task_p->n_samples; k++) {
-            double u = embedded_proportions[k];
-            double v = embedded_proportions[k + stripe + 1];
-            double diff = u - v;   
-            double sum = u + v;   
-               
-            dm_stripe[k] += fabs(diff) * length;
-            dm_stripe_total[k] += sum * length;
-        }
-    }
-}
-
 void su::_vaw_normalized_weighted_unifrac_task(std::vector<double*> &__restrict__ dm_stripes, 
                                                std::vector<double*> &__restrict__ dm_stripes_total,
                                                double* __restrict__ embedded_proportions, 
@@ -332,3 +271,182 @@ void su::_vaw_unweighted_unifrac_task(std::vector<double*> &__restrict__ dm_stri
     }
 }
 
+
+/* the rectangular tasks pair each row sample with each column sample. a
+ * row's proportion is constant over the inner loop, so the inner loops are
+ * over contiguous column values and accumulate into contiguous output.
+ */
+void su::_unnormalized_weighted_unifrac_cross_task(double* __restrict__ dm,
+                                                   double* __restrict__ /* dm_total */,
+                                                   const double* __restrict__ row_proportions,
+                                                   const double* __restrict__ col_proportions,
+                                                   unsigned int n_rows,
+                                                   unsigned int n_cols,
+                                                   double length,
+                                                   const su::task_parameters* /* task_p */) {
+    for(unsigned int i = 0; i < n_rows; i++) {
+        double *dm_row = dm + (uint64_t)i * n_cols;
+        double u = row_proportions[i];
+
+        for(unsigned int j = 0; j < n_cols; j++)
+            dm_row[j] += fabs(u - col_proportions[j]) * length;
+    }
+}
+
+void su::_unweighted_unifrac_cross_task(double* __restrict__ dm,
+                                        double* __restrict__ dm_total,
+                                        const double* __restrict__ row_proportions,
+                                        const double* __restrict__ col_proportions,
+                                        unsigned int n_rows,
+                                        unsigned int n_cols,
+                                        double length,
+                                        const su::task_parameters* /* task_p */) {
+    for(unsigned int i = 0; i < n_rows; i++) {
+        double *dm_row = dm + (uint64_t)i * n_cols;
+        double *dm_row_total = dm_total + (uint64_t)i * n_cols;
+        int32_t u = row_proportions[i] > 0;
+
+        for(unsigned int j = 0; j < n_cols; j++) {
+            int32_t v = col_proportions[j] > 0;
+
+            dm_row[j] += (u ^ v) * length;
+            dm_row_total[j] += (u | v) * length;
+        }
+    }
+}
+
+void su::_generalized_unifrac_cross_task(double* __restrict__ dm,
+                                         double* __restrict__ dm_total,
+                                         const double* __restrict__ row_proportions,
+                                         const double* __restrict__ col_proportions,
+                                         unsigned int n_rows,
+                                         unsigned int n_cols,
+                                         double length,
+                                         const su::task_parameters* task_p) {
+    for(unsigned int i = 0; i < n_rows; i++) {
+        double *dm_stripe = dm + (uint64_t)i * n_cols;
+        double *dm_stripe_total = dm_total + (uint64_t)i * n_cols;
+        double u = row_proportions[i];
+
+        for(unsigned int j = 0; j < n_cols; j++) {
+            double v = col_proportions[j];
+            double s = u + v;
+            GUNIFRAC(u, v, s, j)
+        }
+    }
+}
+
+#define VAW_CROSS(i, j) double m = row_total_counts[i] + col_total_counts[j]; \
+                        double mi = row_counts[i] + col_counts[j];            \
+                        double vaw = sqrt(mi * (m - mi));
+
+void su::_vaw_unnormalized_weighted_unifrac_cross_task(double* __restrict__ dm,
+                                                       double* __restrict__ /* dm_total */,
+                                                       const double* __restrict__ row_proportions,
+                                                       const double* __restrict__ col_proportions,
+                                                       const double* __restrict__ row_counts,
+                                                       const double* __restrict__ col_counts,
+                                                       const double* __restrict__ row_total_counts,
+                                                       const double* __restrict__ col_total_counts,
+                                                       unsigned int n_rows,
+                                                       unsigned int n_cols,
+                                                       double length,
+                                                       const su::task_parameters* /* task_p */) {
+    for(unsigned int i = 0; i < n_rows; i++) {
+        double *dm_row = dm + (uint64_t)i * n_cols;
+        double u = row_proportions[i];
+
+        for(unsigned int j = 0; j < n_cols; j++) {
+            VAW_CROSS(i, j)
+            if(vaw > 0)
+                dm_row[j] += (fabs(u - col_proportions[j]) * length) / vaw;
+        }
+    }
+}
+
+void su::_vaw_normalized_weighted_unifrac_cross_task(double* __restrict__ dm,
+                                                     double* __restrict__ dm_total,
+                                                     const double* __restrict__ row_proportions,
+                                                     const double* __restrict__ col_proportions,
+                                                     const double* __restrict__ row_counts,
+                                                     const double* __restrict__ col_counts,
+                                                     const double* __restrict__ row_total_counts,
+                                                     const double* __restrict__ col_total_counts,
+                                                     unsigned int n_rows,
+                                                     unsigned int n_cols,
+                                                     double length,
+                                                     const su::task_parameters* /* task_p */) {
+    for(unsigned int i = 0; i < n_rows; i++) {
+        double *dm_row = dm + (uint64_t)i * n_cols;
+        double *dm_row_total = dm_total + (uint64_t)i * n_cols;
+        double u = row_proportions[i];
+
+        for(unsigned int j = 0; j < n_cols; j++) {
+            double v = col_proportions[j];
+            VAW_CROSS(i, j)
+            if(vaw > 0) {
+                dm_row[j] += (fabs(u - v) * length) / vaw;
+                dm_row_total[j] += ((u + v) * length) / vaw;
+            }
+        }
+    }
+}
+
+void su::_vaw_unweighted_unifrac_cross_task(double* __restrict__ dm,
+                                            double* __restrict__ dm_total,
+                                            const double* __restrict__ row_proportions,
+                                            const double* __restrict__ col_proportions,
+                                            const double* __restrict__ row_counts,
+                                            const double* __restrict__ col_counts,
+                                            const double* __restrict__ row_total_counts,
+                                            const double* __restrict__ col_total_counts,
+                                            unsigned int n_rows,
+                                            unsigned int n_cols,
+                                            double length,
+                                            const su::task_parameters* /* task_p */) {
+    for(unsigned int i = 0; i < n_rows; i++) {
+        double *dm_row = dm + (uint64_t)i * n_cols;
+        double *dm_row_total = dm_total + (uint64_t)i * n_cols;
+        int32_t u = row_proportions[i] > 0;
+
+        for(unsigned int j = 0; j < n_cols; j++) {
+            int32_t v = col_proportions[j] > 0;
+            VAW_CROSS(i, j)
+            if(vaw > 0) {
+                dm_row[j] += ((u ^ v) * length) / vaw;
+                dm_row_total[j] += ((u | v) * length) / vaw;
+            }
+        }
+    }
+}
+
+void su::_vaw_generalized_unifrac_cross_task(double* __restrict__ dm,
+                                             double* __restrict__ dm_total,
+                                             const double* __restrict__ row_proportions,
+                                             const double* __restrict__ col_proportions,
+                                             const double* __restrict__ row_counts,
+                                             const double* __restrict__ col_counts,
+                                             const double* __restrict__ row_total_counts,
+                                             const double* __restrict__ col_total_counts,
+                                             unsigned int n_rows,
+                                             unsigned int n_cols,
+                                             double length,
+                                             const su::task_parameters* task_p) {
+    for(unsigned int i = 0; i < n_rows; i++) {
+        double *dm_row = dm + (uint64_t)i * n_cols;
+        double *dm_row_total = dm_total + (uint64_t)i * n_cols;
+        double u1 = row_proportions[i];
+
+        for(unsigned int j = 0; j < n_cols; j++) {
+            double v1 = col_proportions[j];
+            VAW_CROSS(i, j)
+            if(vaw > 0.0) {
+                double sum1 = (u1 + v1) / vaw;
+                double sub1 = fabs(u1 - v1) / vaw;
+                double sum_pow1 = pow(sum1, task_p->g_unifrac_alpha) * length;
+                dm_row[j] += sum_pow1 * (sub1 / sum1);
+                dm_row_total[j] += sum_pow1;
+            }
+        }
+    }
+}
@@ -18,17 +18,16 @@ namespace su {
      *      vector will look like [A B C A B C].
      * length <double> the branch length of the current node to its parent.
      * task_p <task_parameters*> task specific parameters.
+     *
+     * weighted normalized UniFrac does not have a task of its own. its numerator
+     * is that of unnormalized weighted UniFrac, and its denominator is formed from
+     * per-sample totals within su::unifrac.
      */
     void _unnormalized_weighted_unifrac_task(std::vector<double*> &__restrict__ dm_stripes, 
                                              std::vector<double*> &__restrict__ dm_stripes_total,
                                              double* __restrict__ embedded_proportions,
                                              double length,
                                              const su::task_parameters* task_p);
-    void _normalized_weighted_unifrac_task(std::vector<double*> &__restrict__ dm_stripes, 
-                                           std::vector<double*> &__restrict__ dm_stripes_total,
-                                           double* __restrict__ embedded_proportions,
-                                           double length,
-                                           const su::task_parameters* task_p);
     void _unweighted_unifrac_task(std::vector<double*> &__restrict__ dm_stripes, 
                                   std::vector<double*> &__restrict__ dm_stripes_total,
                                   double* __restrict__ embedded_proportions,
@@ -88,4 +87,105 @@ namespace su {
                                        double* __restrict__ sample_total_counts,
                                        double length,
                                        const su::task_parameters* task_p);
+    /* rectangular tasks, for the distances between two sets of samples
+     *
+     * all methods utilize the same function signature. that signature is as follows:
+     *
+     * dm <double*> the block being accumulated into for unique branch length,
+     *      row-major of dimension (n_rows, n_cols)
+     * dm_total <double*> the block being accumulated into for total branch length,
+     *      of the same dimension as dm
+     * row_proportions <double*> the proportions of the node for the row samples
+     * col_proportions <double*> the proportions of the node for the column samples
+     * n_rows <uint> the number of row samples
+     * n_cols <uint> the number of column samples
+     * length <double> the branch length of the current node to its parent.
+     * task_p <task_parameters*> task specific parameters.
+     *
+     * as with the striped tasks, weighted normalized UniFrac uses the
+     * unnormalized task, and its denominator is formed from per-sample totals.
+     */
+    void _unnormalized_weighted_unifrac_cross_task(double* __restrict__ dm,
+                                                   double* __restrict__ dm_total,
+                                                   const double* __restrict__ row_proportions,
+                                                   const double* __restrict__ col_proportions,
+                                                   unsigned int n_rows,
+                                                   unsigned int n_cols,
+                                                   double length,
+                                                   const su::task_parameters* task_p);
+    void _unweighted_unifrac_cross_task(double* __restrict__ dm,
+                                        double* __restrict__ dm_total,
+                                        const double* __restrict__ row_proportions,
+                                        const double* __restrict__ col_proportions,
+                                        unsigned int n_rows,
+                                        unsigned int n_cols,
+                                        double length,
+                                        const su::task_parameters* task_p);
+    void _generalized_unifrac_cross_task(double* __restrict__ dm,
+                                         double* __restrict__ dm_total,
+                                         const double* __restrict__ row_proportions,
+                                         const double* __restrict__ col_proportions,
+                                         unsigned int n_rows,
+                                         unsigned int n_cols,
+                                         double length,
+                                         const su::task_parameters* task_p);
+
+    /* rectangular variance adjusted tasks
+     *
+     * the signature is that of the rectangular tasks, with the following
+     * between col_proportions and n_rows:
+     *
+     * row_counts <double*> the unnormalized counts of the node for the row samples
+     * col_counts <double*> the unnormalized counts of the node for the column samples
+     * row_total_counts <double*> the total counts of the row samples
+     * col_total_counts <double*> the total counts of the column samples
+     */
+    void _vaw_unnormalized_weighted_unifrac_cross_task(double* __restrict__ dm,
+                                                       double* __restrict__ dm_total,
+                                                       const double* __restrict__ row_proportions,
+                                                       const double* __restrict__ col_proportions,
+                                                       const double* __restrict__ row_counts,
+                                                       const double* __restrict__ col_counts,
+                                                       const double* __restrict__ row_total_counts,
+                                                       const double* __restrict__ col_total_counts,
+                                                       unsigned int n_rows,
+                                                       unsigned int n_cols,
+                                                       double length,
+                                                       const su::task_parameters* task_p);
+    void _vaw_normalized_weighted_unifrac_cross_task(double* __restrict__ dm,
+                                                     double* __restrict__ dm_total,
+                                                     const double* __restrict__ row_proportions,
+                                                     const double* __restrict__ col_proportions,
+                                                     const double* __restrict__ row_counts,
+                                                     const double* __restrict__ col_counts,
+                                                     const double* __restrict__ row_total_counts,
+                                                     const double* __restrict__ col_total_counts,
+                                                     unsigned int n_rows,
+                                                     unsigned int n_cols,
+                                                     double length,
+                                                     const su::task_parameters* task_p);
+    void _vaw_unweighted_unifrac_cross_task(double* __restrict__ dm,
+                                            double* __restrict__ dm_total,
+                                            const double* __restrict__ row_proportions,
+                                            const double* __restrict__ col_proportions,
+                                            const double* __restrict__ row_counts,
+                                            const double* __restrict__ col_counts,
+                                            const double* __restrict__ row_total_counts,
+                                            const double* __restrict__ col_total_counts,
+                                            unsigned int n_rows,
+                                            unsigned int n_cols,
+                                            double length,
+                                            const su::task_parameters* task_p);
+    void _vaw_generalized_unifrac_cross_task(double* __restrict__ dm,
+                                             double* __restrict__ dm_total,
+                                             const double* __restrict__ row_proportions,
+                                             const double* __restrict__ col_proportions,
+                                             const double* __restrict__ row_counts,
+                                             const double* __restrict__ col_counts,
+                                             const double* __restrict__ row_total_counts,
+                                             const double* __restrict__ col_total_counts,
+                                             unsigned int n_rows,
+                                             unsigned int n_cols,
+                                             double length,
+                                             const su::task_parameters* task_p);
 }
@@ -6,15 +6,23 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
-import pkg_resources
-
 from unifrac._methods import (unweighted,
                               weighted_normalized,
                               weighted_unnormalized,
-                              generalized, meta)
-from unifrac._api import ssu, faith_pd
+                              generalized, meta, rarefied, pcoa)
+from unifrac._api import (ssu, ssu_cross, ssu_append, ssu_knn, ssu_rarefied,
+                          ssu_pcoa, ssu_partial, ssu_merge, ssu_plan, faith_pd,
+                          configure_threads, serve)
+from unifrac._distributed import distributed, LocalExecutor
+from unifrac._stream import iter_blocks
+from unifrac._permutation import permanova, permdisp
+from unifrac._client import Client
+from unifrac._version import __version__
 
 
-__version__ = pkg_resources.get_distribution('unifrac').version
 __all__ = ['unweighted', 'weighted_normalized', 'weighted_unnormalized',
-           'generalized', 'meta', 'ssu', 'faith_pd']
+           'generalized', 'meta', 'rarefied', 'pcoa', 'distributed',
+           'LocalExecutor', 'iter_blocks', 'permanova', 'permdisp',
+           'ssu', 'ssu_cross', 'ssu_append', 'ssu_knn', 'ssu_rarefied',
+           'ssu_pcoa', 'ssu_partial', 'ssu_merge', 'ssu_plan', 'faith_pd',
+           'configure_threads', 'serve', 'Client', '__version__']
@@ -1,13 +1,112 @@
 #distutils: language = c++
 from libcpp cimport bool
+from libc.stdint cimport uint32_t, uint64_t
 
 cdef extern from "../sucpp/api.hpp":
     struct mat:
         double* condensed_form
         unsigned int n_samples
         unsigned int cf_size
+        bool is_upper_triangle
         char** sample_ids
 
+    struct mat_full:
+        unsigned int n_samples
+        double* matrix
+        char** sample_ids
+
+    struct rect_mat:
+        unsigned int n_rows
+        unsigned int n_cols
+        double* values
+        char** row_ids
+        char** col_ids
+
+    struct knn_result:
+        unsigned int n_queries
+        unsigned int k
+        uint32_t* indices
+        double* distances
+        char** query_ids
+        unsigned int n_samples
+        char** sample_ids
+        uint64_t n_evaluated
+
+    struct run_stats:
+        unsigned int n_phases
+        const char* phase_names[8]
+        double wall_seconds[8]
+        double cpu_seconds[8]
+        uint64_t bytes_allocated[8]
+        uint64_t peak_rss_kb[8]
+        unsigned int n_threads
+        double* thread_cpu_seconds
+        unsigned int n_duplicates
+
+    struct partial_mat:
+        uint32_t n_samples
+        char** sample_ids
+        double** stripes
+        uint32_t stripe_start
+        uint32_t stripe_stop
+        uint32_t stripe_total
+        bool is_upper_triangle
+
+    struct stripe_stream:
+        uint32_t n_samples
+        uint32_t n_stripes
+        char** sample_ids
+
+    struct loaded_tree:
+        uint32_t n_nodes
+
+    struct ordination:
+        unsigned int n_samples
+        unsigned int n_axes
+        char** sample_ids
+        double* eigvals
+        double* proportion_explained
+        double* coordinates
+
+    struct permutation_test:
+        const char* method_name
+        const char* statistic_name
+        unsigned int n_samples
+        unsigned int n_groups
+        double statistic
+        double p_value
+        unsigned int permutations
+
+    struct cost_model:
+        double node_seconds
+        double stripe_seconds
+
+    struct partial_plan:
+        unsigned int n_samples
+        unsigned int n_obs
+        unsigned int nnz
+        unsigned int n_tree_nodes
+        unsigned int n_compute_nodes
+        unsigned int n_stripes
+        unsigned int threads
+        unsigned int n_partials
+        bool feasible
+        cost_model model
+        uint64_t table_bytes
+        uint64_t tree_bytes
+        uint64_t thread_bytes
+        unsigned int* starts
+        unsigned int* stops
+        uint64_t* stripe_bytes
+        uint64_t* peak_bytes
+        double* seconds
+
+    struct table_subset:
+        const char** sample_ids
+        unsigned int n_sample_ids
+        const char** feature_ids
+        unsigned int n_feature_ids
+
     struct results_vec:
         unsigned int n_samples
         double* values
@@ -19,15 +118,173 @@ cdef extern from "../sucpp/api.hpp":
         table_missing,
         table_empty,
         unknown_method,
-        table_and_tree_do_not_overlap
+        table_and_tree_do_not_overlap,
+        table_bad_format_version,
+        tree_malformed,
+        sample_missing,
+        existing_result_mismatch,
+        memory_limit_exceeded,
+        stripes_out_of_bounds,
+        grouping_invalid
+
+    enum io_status:
+        read_okay,
+        write_okay,
+        open_error,
+        read_error,
+        magic_incompatible,
+        bad_header,
+        unexpected_end
+
+    enum merge_status:
+        merge_okay,
+        incomplete_stripe_set,
+        sample_id_consistency,
+        square_mismatch,
+        partials_mismatch,
+        stripes_overlap
 
     compute_status one_off(const char* biom_filename, const char* tree_filename, 
                                const char* unifrac_method, bool variance_adjust, double alpha,
                                bool bypass_tips, unsigned int threads, mat** result)
 
+    compute_status one_off_stats(const char* biom_filename, const char* tree_filename,
+                                 const char* unifrac_method, bool variance_adjust, double alpha,
+                                 bool bypass_tips, unsigned int threads, mat** result,
+                                 run_stats** stats)
+
+    compute_status one_off_budgeted(const char* biom_filename, const char* tree_filename,
+                                    const char* unifrac_method, bool variance_adjust, double alpha,
+                                    bool bypass_tips, unsigned int threads, uint64_t max_memory,
+                                    mat** result, run_stats** stats)
+
+    compute_status one_off_subset(const char* biom_filename, const char* tree_filename,
+                                  const char* unifrac_method, bool variance_adjust, double alpha,
+                                  bool bypass_tips, unsigned int threads, uint64_t max_memory,
+                                  const table_subset* subset, mat** result, run_stats** stats)
+
+    compute_status one_off_matrix(const char* biom_filename, const char* tree_filename,
+                                  const char* unifrac_method, bool variance_adjust, double alpha,
+                                  bool bypass_tips, unsigned int threads, uint64_t max_memory,
+                                  const table_subset* subset, mat_full** result, run_stats** stats)
+
+    compute_status one_off_rarefied(const char* biom_filename, const char* tree_filename,
+                                    const char* unifrac_method, bool variance_adjust, double alpha,
+                                    bool bypass_tips, unsigned int threads, unsigned int depth,
+                                    unsigned int iterations, uint64_t seed, mat** mean,
+                                    mat** variance, mat** replicates)
+
+    compute_status one_off_pcoa(const char* biom_filename, const char* tree_filename,
+                                const char* unifrac_method, bool variance_adjust, double alpha,
+                                bool bypass_tips, unsigned int threads, unsigned int n_axes,
+                                ordination** result)
+
+    compute_status one_off_cross(const char* biom_filename, const char* tree_filename,
+                                 const char* unifrac_method, bool variance_adjust, double alpha,
+                                 bool bypass_tips, unsigned int threads,
+                                 const char** row_ids, unsigned int n_rows,
+                                 const char** col_ids, unsigned int n_cols,
+                                 rect_mat** result)
+
+    compute_status append_samples(const char* biom_filename, const char* tree_filename,
+                                  const char* unifrac_method, bool variance_adjust, double alpha,
+                                  bool bypass_tips, unsigned int threads, mat* existing,
+                                  mat** result)
+
+    compute_status knn_query(const char* biom_filename, const char* tree_filename,
+                             const char* unifrac_method, bool variance_adjust, double alpha,
+                             bool bypass_tips, unsigned int threads,
+                             const char** query_ids, unsigned int n_queries,
+                             unsigned int k, bool prune, knn_result** result)
+
+    compute_status partial(const char* biom_filename, const char* tree_filename,
+                           const char* unifrac_method, bool variance_adjust, double alpha,
+                           bool bypass_tips, unsigned int threads, unsigned int stripe_start,
+                           unsigned int stripe_stop, partial_mat** result)
+
+    compute_status partial_subset(const char* biom_filename, const char* tree_filename,
+                                  const char* unifrac_method, bool variance_adjust, double alpha,
+                                  bool bypass_tips, unsigned int threads, unsigned int stripe_start,
+                                  unsigned int stripe_stop, const table_subset* subset,
+                                  partial_mat** result)
+
+    io_status read_mat(const char* filename, mat** result)
+
+    io_status write_partial(const char* filename, partial_mat* result)
+
+    io_status read_partial(const char* filename, partial_mat** result)
+
+    compute_status open_stripe_stream(const char* biom_filename, const char* tree_filename,
+                                      const char* unifrac_method, bool variance_adjust,
+                                      double alpha, bool bypass_tips, stripe_stream** result)
+
+    compute_status stream_stripes(stripe_stream* stream, unsigned int threads,
+                                  unsigned int stripe_start, unsigned int stripe_stop,
+                                  partial_mat** result) nogil
+
+    compute_status load_tree(const char* tree_filename, loaded_tree** result)
+
+    int serve_requests "serve"(const char* socket_path, const char** tree_names,
+                               loaded_tree** trees, unsigned int n_trees,
+                               unsigned int threads) nogil
+
+    void configure_worker_pool(unsigned int size, bool bind_to_cores) nogil
+
+    unsigned int worker_pool_size() nogil
+
+    compute_status permanova_mat(mat* dm, const unsigned int* grouping,
+                                 unsigned int n_groups, unsigned int permutations,
+                                 uint64_t seed, unsigned int threads,
+                                 permutation_test* result) nogil
+
+    compute_status permdisp_mat(mat* dm, const unsigned int* grouping,
+                                unsigned int n_groups, unsigned int permutations,
+                                uint64_t seed, unsigned int threads,
+                                permutation_test* result) nogil
+
+    merge_status merge_partial(partial_mat** partial_mats, int n_partials,
+                               unsigned int nthreads, mat** result)
+
+    merge_status merge_partial_matrix(partial_mat** partial_mats, int n_partials,
+                                      unsigned int nthreads, mat_full** result)
+
+    compute_status calibrate_cost_model(const char* biom_filename, const char* tree_filename,
+                                        const char* unifrac_method, bool variance_adjust,
+                                        bool bypass_tips, cost_model* model)
+
+    compute_status plan_partials(const char* biom_filename, const char* tree_filename,
+                                 const char* unifrac_method, bool variance_adjust,
+                                 const cost_model* model, uint64_t memory_limit,
+                                 double time_limit, unsigned int max_threads,
+                                 unsigned int n_partials, partial_plan** result)
+
     compute_status faith_pd_one_off(const char* biom_filename, const char* tree_filename,
                                     results_vec** result)
 
+    compute_status faith_pd_one_off_stats(const char* biom_filename, const char* tree_filename,
+                                          results_vec** result, run_stats** stats)
+
+    compute_status faith_pd_subset(const char* biom_filename, const char* tree_filename,
+                                   const table_subset* subset, results_vec** result,
+                                   run_stats** stats)
+
     void destroy_mat(mat** result)
+    void destroy_mat_full(mat_full** result)
 
     void destroy_results_vec(results_vec** result)
+
+    void destroy_rect_mat(rect_mat** result)
+
+    void destroy_knn_result(knn_result** result)
+
+    void destroy_run_stats(run_stats** stats)
+
+    void destroy_partial_mat(partial_mat** result)
+
+    void destroy_partial_plan(partial_plan** plan)
+
+    void destroy_stripe_stream(stripe_stream** stream)
+
+    void destroy_loaded_tree(loaded_tree** tree)
+
+    void destroy_ordination(ordination** result)
@@ -1,11 +1,119 @@
-import skbio
+import os
+
 import numpy as np
 cimport numpy as np
-import pandas as pd
+from libc.stdlib cimport malloc, calloc, free
+
+# skbio and pandas are costly to import, and are only needed to construct
+# the result objects, so they are imported on use
+
+cdef dict _run_stats_to_dict(run_stats *stats):
+    cdef unsigned int i
+
+    phases = {}
+    for i in range(stats.n_phases):
+        phases[stats.phase_names[i].decode('utf-8')] = {
+            'wall_seconds': stats.wall_seconds[i],
+            'cpu_seconds': stats.cpu_seconds[i],
+            'bytes_allocated': stats.bytes_allocated[i],
+            'peak_rss_kb': stats.peak_rss_kb[i]}
+
+    return {'phases': phases,
+            'thread_cpu_seconds': [stats.thread_cpu_seconds[i]
+                                   for i in range(stats.n_threads)],
+            'duplicates': stats.n_duplicates}
+
+cdef const char** _c_string_array(list encoded) except NULL:
+    cdef:
+        const char** out
+        unsigned int i
+
+    out = <const char**>malloc(sizeof(char*) * max(len(encoded), 1))
+    if out == NULL:
+        raise MemoryError()
+    for i in range(len(encoded)):
+        out[i] = encoded[i]
+    return out
+
+cdef _raise_for_status(compute_status status, unsigned int stripe_start=0,
+                       unsigned int stripe_stop=0):
+    if status == okay:
+        return
+    elif status == tree_missing:
+        raise IOError("Tree file not found.")
+    elif status == table_missing:
+        raise IOError("Table file not found.")
+    elif status == table_empty:
+        raise ValueError("Table file is empty.")
+    elif status == table_and_tree_do_not_overlap:
+        raise ValueError("The table does not appear to be completely "
+                         "represented by the phylogeny.")
+    elif status == table_bad_format_version:
+        raise ValueError("Table does not appear to be a BIOM-Format v2.1")
+    elif status == tree_malformed:
+        raise ValueError("The phylogeny does not appear to be newick")
+    elif status == unknown_method:
+        raise ValueError("Unknown method.")
+    elif status == sample_missing:
+        raise ValueError("A requested sample is not in the table.")
+    elif status == existing_result_mismatch:
+        raise ValueError("The existing distances do not agree with the "
+                         "table and parameters.")
+    elif status == memory_limit_exceeded:
+        raise MemoryError("The memory limit is too small to compute a "
+                          "single stripe.")
+    elif status == stripes_out_of_bounds:
+        raise ValueError("The stripes [%d, %d) are out of bounds."
+                         % (stripe_start, stripe_stop))
+    elif status == grouping_invalid:
+        raise ValueError("The grouping must have at least two groups, "
+                         "and not a group for each sample.")
+    else:
+        raise Exception("Unknown Error: {}".format(status))
+
+cdef class _TableSubset:
+    """The samples and features of a table to compute over, for the API
+
+    The encoded IDs are held by the instance, so the subset is valid for as
+    long as the instance is. An axis of None is not restricted.
+    """
+    cdef table_subset subset
+    cdef list sample_bytes
+    cdef list feature_bytes
+
+    def __cinit__(self, sample_ids, feature_ids):
+        self.subset.sample_ids = NULL
+        self.subset.n_sample_ids = 0
+        self.subset.feature_ids = NULL
+        self.subset.n_feature_ids = 0
+
+        for ids in (sample_ids, feature_ids):
+            if isinstance(ids, str):
+                raise TypeError("IDs must be given as a list, not a str")
+
+        if sample_ids is not None:
+            self.sample_bytes = [str(id_).encode() for id_ in sample_ids]
+            self.subset.sample_ids = _c_string_array(self.sample_bytes)
+            self.subset.n_sample_ids = len(self.sample_bytes)
+        if feature_ids is not None:
+            self.feature_bytes = [str(id_).encode() for id_ in feature_ids]
+            self.subset.feature_ids = _c_string_array(self.feature_bytes)
+            self.subset.n_feature_ids = len(self.feature_bytes)
+
+    def __dealloc__(self):
+        free(self.subset.sample_ids)
+        free(self.subset.feature_ids)
+
+    cdef const table_subset* pointer(self):
+        # the whole table is loaded the usual way
+        if self.sample_bytes is None and self.feature_bytes is None:
+            return NULL
+        return &self.subset
 
 def ssu(str biom_filename, str tree_filename,
         str unifrac_method, bool variance_adjust, double alpha,
-        bool bypass_tips, unsigned int threads):
+        bool bypass_tips, unsigned int threads, bool stats=False,
+        uint64_t max_memory=0, sample_ids=None, feature_ids=None):
     """Execute a call to Strided State UniFrac via the direct API
 
     Parameters
@@ -27,11 +135,31 @@ def ssu(str biom_filename, str tree_filename,
         by about 50%, but is an approximation.
     threads : int
         The number of threads to use.
+    stats : bool, optional
+        Whether to record the time and memory of each phase of the
+        computation.
+    max_memory : int, optional
+        The bytes the computation may hold, including the loaded inputs and
+        the result. The stripes are computed in as many rounds as needed to
+        fit. The default of 0 is no limit.
+    sample_ids : list of str, optional
+        The samples to compute over, which are kept in the order of the
+        table. Only their columns are read from the table. Default is every
+        sample.
+    feature_ids : list of str, optional
+        The features to compute over. IDs which are not in the table are
+        ignored. Default is every feature.
 
     Returns
     -------
     skbio.DistanceMatrix
-        The resulting distance matrix
+        The resulting distance matrix. If `stats`, the phase statistics are
+        the `stats` attribute of the matrix, a dict of the phases, each a
+        dict of 'wall_seconds', 'cpu_seconds', 'bytes_allocated' and
+        'peak_rss_kb', of the 'thread_cpu_seconds' of the compute phase,
+        and of the number of 'duplicates', the samples whose counts repeat
+        those of an earlier sample and whose distances were copied rather
+        than computed.
 
     Raises
     ------
@@ -41,23 +169,35 @@ def ssu(str biom_filename, str tree_filename,
     ValueError
         If the table is empty
         If the table is not completely represented by the phylogeny
+        If the table does not appear to be BIOM-Format v2.1
+        If the phylogeny does not appear to be in Newick format
         If an unknown method is requested.
+        If a sample of `sample_ids` is not present in the table
+    MemoryError
+        If `max_memory` is too small to compute a single stripe
     Exception
         If an unkown error is experienced
+
+    Notes
+    -----
+    The features which are not observed in the samples of `sample_ids` are
+    dropped before the tree is sheared, so the result is that of a table
+    filtered to the subset, without one being written.
+
+    The stripes are written straight into the square matrix, which the
+    returned matrix holds without a copy.
     """
     cdef:
-        mat *result;
+        mat_full *result;
+        _TableSubset subset = _TableSubset(sample_ids, feature_ids)
+        run_stats *run_stats_result = NULL;
         compute_status status;
-        np.ndarray[np.double_t, ndim=1] numpy_arr
-        double *cf
-        int i
         bytes biom_py_bytes
         bytes tree_py_bytes
         bytes met_py_bytes
         char* biom_c_string
         char* tree_c_string
         char* met_c_string
-        list ids
 
     biom_py_bytes = biom_filename.encode()
     tree_py_bytes = tree_filename.encode()
@@ -66,29 +206,63 @@ def ssu(str biom_filename, str tree_filename,
     tree_c_string = tree_py_bytes
     met_c_string = met_py_bytes
 
-    status = one_off(biom_c_string,
-                     tree_c_string,
-                     met_c_string,
-                     variance_adjust,
-                     alpha,
-                     bypass_tips,
-                     threads,
-                     &result)
+    status = one_off_matrix(biom_c_string,
+                            tree_c_string,
+                            met_c_string,
+                            variance_adjust,
+                            alpha,
+                            bypass_tips,
+                            threads,
+                            max_memory,
+                            subset.pointer(),
+                            &result,
+                            &run_stats_result if stats else NULL)
 
-    if status != okay:
-        if status == tree_missing:
-            raise IOError("Tree file not found.")
-        elif status == table_missing:
-            raise IOError("Table file not found.")
-        elif status == table_empty:
-            raise ValueError("Table file is empty.")
-        elif status == table_and_tree_do_not_overlap:
-            raise ValueError("The table does not appear to be completely "
-                             "represented by the phylogeny.")
-        elif status == unknown_method:
-            raise ValueError("Unknown method.")
-        else:
-            raise Exception("Unknown Error: {}".format(status))
+    _raise_for_status(status)
+
+    dm = _mat_full_to_distance_matrix(result)
+    destroy_mat_full(&result)
+    if run_stats_result != NULL:
+        dm.stats = _run_stats_to_dict(run_stats_result)
+        destroy_run_stats(&run_stats_result)
+    return dm
+
+cdef class _Allocation:
+    """A buffer allocated by libssu, freed once no array refers to it"""
+    cdef void* data
+
+    def __dealloc__(self):
+        free(self.data)
+
+cdef object _mat_full_to_distance_matrix(mat_full *result):
+    cdef:
+        np.npy_intp dims[2]
+        _Allocation allocation = _Allocation()
+        unsigned int i
+        list ids
+
+    # the array adopts the matrix rather than copying it, and the matrix is
+    # symmetric and hollow by construction, so it is not validated again
+    dims[0] = result.n_samples
+    dims[1] = result.n_samples
+    numpy_arr = np.PyArray_SimpleNewFromData(2, dims, np.NPY_DOUBLE,
+                                             result.matrix)
+    allocation.data = result.matrix
+    result.matrix = NULL
+    np.set_array_base(numpy_arr, allocation)
+
+    ids = []
+    for i in range(result.n_samples):
+        ids.append(result.sample_ids[i].decode('utf-8'))
+
+    import skbio
+    return skbio.DistanceMatrix(numpy_arr, ids, validate=False)
+
+cdef object _mat_to_distance_matrix(mat *result):
+    cdef:
+        np.ndarray[np.double_t, ndim=1] numpy_arr
+        unsigned int i
+        list ids
 
     ids = []
     numpy_arr = np.zeros(result.cf_size, dtype=np.double)
@@ -97,12 +271,15 @@ def ssu(str biom_filename, str tree_filename,
     for i in range(result.n_samples):
         ids.append(result.sample_ids[i].decode('utf-8'))
 
-    destroy_mat(&result)
-
+    import skbio
     return skbio.DistanceMatrix(numpy_arr, ids)
 
-def faith_pd(str biom_filename, str tree_filename):
-    """Execute a call to the Stacked Faith API in the UniFrac package
+def ssu_rarefied(str biom_filename, str tree_filename,
+                 str unifrac_method, bool variance_adjust, double alpha,
+                 bool bypass_tips, unsigned int threads, unsigned int depth,
+                 unsigned int iterations, uint64_t seed,
+                 bool keep_replicates=False):
+    """Execute Strided State UniFrac over rarefied replicates of a table
 
     Parameters
     ----------
@@ -110,11 +287,38 @@ def faith_pd(str biom_filename, str tree_filename):
         A filepath to a BIOM 2.1 formatted table (HDF5)
     tree_filename : str
         A filepath to a Newick formatted tree
+    unifrac_method : str
+        The requested UniFrac method, one of {unweighted,
+        weighted_normalized, weighted_unnormalized, generalized}
+    variance_adjust : bool
+        Whether to perform Variance Adjusted UniFrac
+    alpha : float
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFraca
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+    threads : int
+        The number of threads to use.
+    depth : int
+        The number of counts drawn without replacement from each sample.
+        Samples with fewer counts are omitted.
+    iterations : int
+        The number of replicates.
+    seed : int
+        The random seed. Replicate r is drawn with seed + r.
+    keep_replicates : bool, optional
+        Whether to return the distance matrix of each replicate.
 
     Returns
     -------
-    pd.Series
-        Series of Faith's PD for each sample in `biom_filename`
+    skbio.DistanceMatrix
+        The mean of the replicates
+    skbio.DistanceMatrix
+        The sample variance of the replicates, or zero for a single
+        replicate
+    list of skbio.DistanceMatrix
+        The replicates if `keep_replicates`, otherwise an empty list
 
     Raises
     ------
@@ -123,40 +327,1308 @@ def faith_pd(str biom_filename, str tree_filename):
         If the table is not found
     ValueError
         If the table is empty
+        If fewer than two samples have at least `depth` counts
+        If `depth` or `iterations` is zero
         If the table is not completely represented by the phylogeny
+        If the table does not appear to be BIOM-Format v2.1
+        If the phylogeny does not appear to be in Newick format
+        If an unknown method is requested.
     Exception
         If an unkown error is experienced
     """
     cdef:
-        results_vec *result;
+        mat *mean;
+        mat *variance;
+        mat **replicates = NULL;
         compute_status status;
-        np.ndarray[np.double_t, ndim=1] numpy_arr
+        unsigned int r
+        bytes biom_py_bytes
+        bytes tree_py_bytes
+        bytes met_py_bytes
+        char* biom_c_string
+        char* tree_c_string
+        char* met_c_string
+        list replicate_dms
+
+    biom_py_bytes = biom_filename.encode()
+    tree_py_bytes = tree_filename.encode()
+    met_py_bytes = unifrac_method.encode()
+    biom_c_string = biom_py_bytes
+    tree_c_string = tree_py_bytes
+    met_c_string = met_py_bytes
+
+    if keep_replicates and iterations > 0:
+        replicates = <mat**>malloc(sizeof(mat*) * iterations)
+
+    status = one_off_rarefied(biom_c_string,
+                              tree_c_string,
+                              met_c_string,
+                              variance_adjust,
+                              alpha,
+                              bypass_tips,
+                              threads,
+                              depth,
+                              iterations,
+                              seed,
+                              &mean,
+                              &variance,
+                              replicates)
+
+    if status != okay:
+        free(replicates)
+        if status == table_empty:
+            raise ValueError("Table file is empty, or fewer than two samples "
+                             "have at least the requested depth.")
+        _raise_for_status(status)
+
+    replicate_dms = []
+    if replicates != NULL:
+        for r in range(iterations):
+            replicate_dms.append(_mat_to_distance_matrix(replicates[r]))
+            destroy_mat(&replicates[r])
+        free(replicates)
+
+    mean_dm = _mat_to_distance_matrix(mean)
+    variance_dm = _mat_to_distance_matrix(variance)
+    destroy_mat(&mean)
+    destroy_mat(&variance)
+
+    return mean_dm, variance_dm, replicate_dms
+
+def ssu_pcoa(str biom_filename, str tree_filename,
+             str unifrac_method, bool variance_adjust, double alpha,
+             bool bypass_tips, unsigned int threads, unsigned int n_axes):
+    """Execute Strided State UniFrac and its principal coordinates
+
+    Parameters
+    ----------
+    biom_filename : str
+        A filepath to a BIOM 2.1 formatted table (HDF5)
+    tree_filename : str
+        A filepath to a Newick formatted tree
+    unifrac_method : str
+        The requested UniFrac method, one of {unweighted,
+        weighted_normalized, weighted_unnormalized, generalized}
+    variance_adjust : bool
+        Whether to perform Variance Adjusted UniFrac
+    alpha : float
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFraca
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+    threads : int
+        The number of threads to use.
+    n_axes : int
+        The number of axes, which is reduced to the number of samples if
+        more.
+
+    Returns
+    -------
+    skbio.OrdinationResults
+        The principal coordinates of the distance matrix, which is not kept.
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+    ValueError
+        If the table is empty
+        If `n_axes` is zero
+        If the table is not completely represented by the phylogeny
+        If the table does not appear to be BIOM-Format v2.1
+        If the phylogeny does not appear to be in Newick format
+        If an unknown method is requested.
+    Exception
+        If an unkown error is experienced
+    """
+    cdef:
+        ordination *result;
+        compute_status status;
+        np.ndarray[np.double_t, ndim=1] eigvals
+        np.ndarray[np.double_t, ndim=1] proportion_explained
+        np.ndarray[np.double_t, ndim=2] coordinates
+        unsigned int i
         bytes biom_py_bytes
         bytes tree_py_bytes
+        bytes met_py_bytes
         char* biom_c_string
         char* tree_c_string
+        char* met_c_string
         list ids
+        list axes
 
+    if n_axes == 0:
+        raise ValueError("The number of axes must be positive.")
 
     biom_py_bytes = biom_filename.encode()
     tree_py_bytes = tree_filename.encode()
+    met_py_bytes = unifrac_method.encode()
     biom_c_string = biom_py_bytes
     tree_c_string = tree_py_bytes
+    met_c_string = met_py_bytes
 
-    status = faith_pd_one_off(biom_c_string, tree_c_string, &result)
+    status = one_off_pcoa(biom_c_string,
+                          tree_c_string,
+                          met_c_string,
+                          variance_adjust,
+                          alpha,
+                          bypass_tips,
+                          threads,
+                          n_axes,
+                          &result)
 
-    if status != okay:
-        if status == tree_missing:
-            raise IOError("Tree file not found.")
-        elif status == table_missing:
-            raise IOError("Table file not found.")
-        elif status == table_empty:
-            raise ValueError("Table file is empty.")
-        elif status == table_and_tree_do_not_overlap:
-            raise ValueError("The table does not appear to be completely "
-                             "represented by the phylogeny.")
+    _raise_for_status(status)
+
+    ids = []
+    for i in range(result.n_samples):
+        ids.append(result.sample_ids[i].decode('utf-8'))
+    axes = ['PC%d' % (i + 1) for i in range(result.n_axes)]
+
+    eigvals = np.zeros(result.n_axes, dtype=np.double)
+    eigvals[:] = <np.double_t[:result.n_axes]> result.eigvals
+    proportion_explained = np.zeros(result.n_axes, dtype=np.double)
+    proportion_explained[:] = \
+        <np.double_t[:result.n_axes]> result.proportion_explained
+    coordinates = np.zeros((result.n_samples, result.n_axes),
+                           dtype=np.double)
+    coordinates[:, :] = \
+        <np.double_t[:result.n_samples, :result.n_axes]> result.coordinates
+
+    destroy_ordination(&result)
+
+    import pandas as pd
+    import skbio
+    return skbio.OrdinationResults(
+        short_method_name='PCoA',
+        long_method_name='Principal Coordinate Analysis',
+        eigvals=pd.Series(eigvals, index=axes),
+        samples=pd.DataFrame(coordinates, index=ids, columns=axes),
+        proportion_explained=pd.Series(proportion_explained, index=axes))
+
+def ssu_cross(str biom_filename, str tree_filename, list row_ids,
+              list col_ids, str unifrac_method, bool variance_adjust,
+              double alpha, bool bypass_tips, unsigned int threads):
+    """Compute UniFrac between two sets of samples via the direct API
+
+    Parameters
+    ----------
+    biom_filename : str
+        A filepath to a BIOM 2.1 formatted table (HDF5)
+    tree_filename : str
+        A filepath to a Newick formatted tree
+    row_ids : list of str
+        The samples for the rows of the result
+    col_ids : list of str
+        The samples for the columns of the result
+    unifrac_method : str
+        The requested UniFrac method, one of {unweighted,
+        weighted_normalized, weighted_unnormalized, generalized}
+    variance_adjust : bool
+        Whether to perform Variance Adjusted UniFrac
+    alpha : float
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFraca
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+    threads : int
+        The number of threads to use.
+
+    Returns
+    -------
+    pd.DataFrame
+        The distances, indexed by row_ids and with col_ids as columns
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+    ValueError
+        If the table is empty
+        If the table is not completely represented by the phylogeny
+        If the table does not appear to be BIOM-Format v2.1
+        If the phylogeny does not appear to be in Newick format
+        If an unknown method is requested.
+        If a sample is not present in the table
+    Exception
+        If an unkown error is experienced
+
+    Notes
+    -----
+    The compute scales with ``len(row_ids) * len(col_ids)`` rather than with
+    the square of the number of samples in the table, so this is preferable
+    to ``ssu`` when comparing a few samples against many.
+    """
+    cdef:
+        rect_mat *result;
+        compute_status status;
+        np.ndarray[np.double_t, ndim=1] numpy_arr
+        unsigned int n_rows = len(row_ids)
+        unsigned int n_cols = len(col_ids)
+        unsigned int i
+        const char** row_c_ids
+        const char** col_c_ids
+        bytes biom_py_bytes
+        bytes tree_py_bytes
+        bytes met_py_bytes
+        char* biom_c_string
+        char* tree_c_string
+        char* met_c_string
+        list row_py_bytes
+        list col_py_bytes
+
+    biom_py_bytes = biom_filename.encode()
+    tree_py_bytes = tree_filename.encode()
+    met_py_bytes = unifrac_method.encode()
+    biom_c_string = biom_py_bytes
+    tree_c_string = tree_py_bytes
+    met_c_string = met_py_bytes
+
+    # the encoded IDs must outlive the call
+    row_py_bytes = [str(id_).encode() for id_ in row_ids]
+    col_py_bytes = [str(id_).encode() for id_ in col_ids]
+    row_c_ids = <const char**>malloc(sizeof(char*) * max(n_rows, 1))
+    col_c_ids = <const char**>malloc(sizeof(char*) * max(n_cols, 1))
+    for i in range(n_rows):
+        row_c_ids[i] = row_py_bytes[i]
+    for i in range(n_cols):
+        col_c_ids[i] = col_py_bytes[i]
+
+    status = one_off_cross(biom_c_string,
+                           tree_c_string,
+                           met_c_string,
+                           variance_adjust,
+                           alpha,
+                           bypass_tips,
+                           threads,
+                           row_c_ids,
+                           n_rows,
+                           col_c_ids,
+                           n_cols,
+                           &result)
+    free(row_c_ids)
+    free(col_c_ids)
+
+    _raise_for_status(status)
+
+    numpy_arr = np.zeros(n_rows * n_cols, dtype=np.double)
+    if n_rows * n_cols > 0:
+        numpy_arr[:] = <np.double_t[:n_rows * n_cols]> result.values
+
+    destroy_rect_mat(&result)
+
+    import pandas as pd
+    return pd.DataFrame(numpy_arr.reshape((n_rows, n_cols)),
+                        index=list(row_ids), columns=list(col_ids))
+
+def ssu_append(str biom_filename, str tree_filename, existing,
+               str unifrac_method, bool variance_adjust, double alpha,
+               bool bypass_tips, unsigned int threads):
+    """Extend a distance matrix with the new samples of a table
+
+    Parameters
+    ----------
+    biom_filename : str
+        A filepath to a BIOM 2.1 formatted table (HDF5), containing the
+        samples of `existing` and the samples to add
+    tree_filename : str
+        A filepath to a Newick formatted tree
+    existing : skbio.DistanceMatrix, str or list of str
+        The existing distances, computed with the same parameters. Either a
+        matrix, a filepath to a matrix written by ssu, or the files written
+        by ssu_partial, which are merged
+    unifrac_method : str
+        The requested UniFrac method, one of {unweighted,
+        weighted_normalized, weighted_unnormalized, generalized}
+    variance_adjust : bool
+        Whether to perform Variance Adjusted UniFrac
+    alpha : float
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFraca
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+    threads : int
+        The number of threads to use.
+
+    Returns
+    -------
+    skbio.DistanceMatrix
+        The enlarged distance matrix, with the samples of `existing` first
+        and the new samples following in the order of the table
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+        If the existing matrix or a partial result cannot be read
+    ValueError
+        If the table is empty
+        If the table is not completely represented by the phylogeny
+        If the table does not appear to be BIOM-Format v2.1
+        If the phylogeny does not appear to be in Newick format
+        If an unknown method is requested.
+        If a sample of `existing` is not present in the table
+        If `existing` does not agree with the table and parameters
+    Exception
+        If an unkown error is experienced
+
+    Notes
+    -----
+    Only the distances of the new samples are computed, so the compute
+    scales with the number of new samples rather than the square of the
+    number of samples. A few of the existing samples are recomputed to
+    verify `existing`.
+    """
+    cdef:
+        mat existing_mat
+        mat *loaded = NULL
+        mat *result;
+        compute_status status;
+        io_status io_err
+        np.ndarray[np.double_t, ndim=1] existing_cf
+        np.ndarray[np.double_t, ndim=1] numpy_arr
+        unsigned int i
+        bytes biom_py_bytes
+        bytes tree_py_bytes
+        bytes met_py_bytes
+        char* biom_c_string
+        char* tree_c_string
+        char* met_c_string
+        bytes filename
+        list existing_py_bytes
+        list ids
+
+    biom_py_bytes = biom_filename.encode()
+    tree_py_bytes = tree_filename.encode()
+    met_py_bytes = unifrac_method.encode()
+    biom_c_string = biom_py_bytes
+    tree_c_string = tree_py_bytes
+    met_c_string = met_py_bytes
+
+    # a matrix of ssu is read as its condensed form, rather than by skbio,
+    # so the square matrix is not formed
+    if isinstance(existing, (str, list)):
+        if isinstance(existing, str):
+            filename = existing.encode()
+            io_err = read_mat(filename, &loaded)
+            if io_err != read_okay:
+                raise IOError("Unable to read the distance matrix %s; err %d"
+                              % (existing, io_err))
         else:
-            raise Exception("Unknown Error: {}".format(status))
+            _merge_partials(existing, threads, &loaded, NULL)
+
+        status = append_samples(biom_c_string,
+                                tree_c_string,
+                                met_c_string,
+                                variance_adjust,
+                                alpha,
+                                bypass_tips,
+                                threads,
+                                loaded,
+                                &result)
+        destroy_mat(&loaded)
+    else:
+        # the existing matrix is described in place rather than copied
+        existing_cf = np.ascontiguousarray(existing.condensed_form(),
+                                           dtype=np.double)
+        existing_py_bytes = [str(id_).encode() for id_ in existing.ids]
+        existing_mat.n_samples = len(existing_py_bytes)
+        existing_mat.cf_size = existing_cf.shape[0]
+        existing_mat.is_upper_triangle = True
+        existing_mat.condensed_form = &existing_cf[0] if existing_mat.cf_size else NULL
+        existing_mat.sample_ids = <char**>malloc(sizeof(char*) *
+                                                 max(existing_mat.n_samples, 1))
+        for i in range(existing_mat.n_samples):
+            existing_mat.sample_ids[i] = existing_py_bytes[i]
+
+        status = append_samples(biom_c_string,
+                                tree_c_string,
+                                met_c_string,
+                                variance_adjust,
+                                alpha,
+                                bypass_tips,
+                                threads,
+                                &existing_mat,
+                                &result)
+        free(existing_mat.sample_ids)
+
+    _raise_for_status(status)
+
+    ids = []
+    numpy_arr = np.zeros(result.cf_size, dtype=np.double)
+    numpy_arr[:] = <np.double_t[:result.cf_size]> result.condensed_form
+
+    for i in range(result.n_samples):
+        ids.append(result.sample_ids[i].decode('utf-8'))
+
+    destroy_mat(&result)
+
+    import skbio
+    return skbio.DistanceMatrix(numpy_arr, ids)
+
+def ssu_knn(str biom_filename, str tree_filename, list query_ids,
+            unsigned int k, str unifrac_method, bool variance_adjust,
+            double alpha, bool bypass_tips, unsigned int threads,
+            bool prune=True):
+    """Find the nearest neighbours of samples by UniFrac via the direct API
+
+    Parameters
+    ----------
+    biom_filename : str
+        A filepath to a BIOM 2.1 formatted table (HDF5)
+    tree_filename : str
+        A filepath to a Newick formatted tree
+    query_ids : list of str
+        The samples to find the neighbours of
+    k : int
+        The number of neighbours of each query. This is reduced if the table
+        has fewer than k other samples.
+    unifrac_method : str
+        The requested UniFrac method, one of {unweighted,
+        weighted_normalized, weighted_unnormalized, generalized}
+    variance_adjust : bool
+        Whether to perform Variance Adjusted UniFrac
+    alpha : float
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFraca
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+    threads : int
+        The number of threads to use.
+    prune : bool, optional
+        Skip the samples which cannot be among the neighbours. This does not
+        change the result. Default is True.
+
+    Returns
+    -------
+    np.ndarray
+        The indices of the neighbours into the sample IDs, of shape
+        ``(len(query_ids), k)`` and ordered by increasing distance
+    np.ndarray
+        The distances to the neighbours, of the same shape
+    list of str
+        The sample IDs of the table, which the indices refer to
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+    ValueError
+        If the table is empty
+        If the table is not completely represented by the phylogeny
+        If the table does not appear to be BIOM-Format v2.1
+        If the phylogeny does not appear to be in Newick format
+        If an unknown method is requested.
+        If a sample is not present in the table
+    Exception
+        If an unkown error is experienced
+
+    Notes
+    -----
+    The neighbours of a query are drawn from all other samples in the table,
+    and only the distances of a batch of queries are held at any time.
+    Pruning uses lower bounds from the branch length weighted totals of the
+    samples, which exist for unweighted, weighted_normalized and
+    weighted_unnormalized without variance adjustment.
+    """
+    cdef:
+        knn_result *result;
+        compute_status status;
+        np.ndarray[np.uint32_t, ndim=1] indices
+        np.ndarray[np.double_t, ndim=1] distances
+        unsigned int n_queries = len(query_ids)
+        unsigned int i
+        const char** query_c_ids
+        bytes biom_py_bytes
+        bytes tree_py_bytes
+        bytes met_py_bytes
+        char* biom_c_string
+        char* tree_c_string
+        char* met_c_string
+        list query_py_bytes
+        list ids
+
+    biom_py_bytes = biom_filename.encode()
+    tree_py_bytes = tree_filename.encode()
+    met_py_bytes = unifrac_method.encode()
+    biom_c_string = biom_py_bytes
+    tree_c_string = tree_py_bytes
+    met_c_string = met_py_bytes
+
+    # the encoded IDs must outlive the call
+    query_py_bytes = [str(id_).encode() for id_ in query_ids]
+    query_c_ids = <const char**>malloc(sizeof(char*) * max(n_queries, 1))
+    for i in range(n_queries):
+        query_c_ids[i] = query_py_bytes[i]
+
+    status = knn_query(biom_c_string,
+                       tree_c_string,
+                       met_c_string,
+                       variance_adjust,
+                       alpha,
+                       bypass_tips,
+                       threads,
+                       query_c_ids,
+                       n_queries,
+                       k,
+                       prune,
+                       &result)
+    free(query_c_ids)
+
+    _raise_for_status(status)
+
+    k = result.k
+    indices = np.zeros(n_queries * k, dtype=np.uint32)
+    distances = np.zeros(n_queries * k, dtype=np.double)
+    if n_queries * k > 0:
+        indices[:] = <np.uint32_t[:n_queries * k]> result.indices
+        distances[:] = <np.double_t[:n_queries * k]> result.distances
+
+    ids = []
+    for i in range(result.n_samples):
+        ids.append(result.sample_ids[i].decode('utf-8'))
+
+    destroy_knn_result(&result)
+
+    return (indices.reshape((n_queries, k)),
+            distances.reshape((n_queries, k)), ids)
+
+def ssu_partial(str biom_filename, str tree_filename,
+                str unifrac_method, bool variance_adjust, double alpha,
+                bool bypass_tips, unsigned int threads,
+                unsigned int stripe_start, unsigned int stripe_stop,
+                str output_filename, sample_ids=None, feature_ids=None):
+    """Compute a range of stripes of a UniFrac distance matrix to a file
+
+    Parameters
+    ----------
+    biom_filename : str
+        A filepath to a BIOM 2.1 formatted table (HDF5)
+    tree_filename : str
+        A filepath to a Newick formatted tree
+    unifrac_method : str
+        The requested UniFrac method, one of {unweighted,
+        weighted_normalized, weighted_unnormalized, generalized}
+    variance_adjust : bool
+        Whether to perform Variance Adjusted UniFrac
+    alpha : float
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFraca
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+    threads : int
+        The number of threads to use.
+    stripe_start : int
+        The first stripe to compute.
+    stripe_stop : int
+        The stripe to stop before.
+    output_filename : str
+        The file to write the partial result into, which ssu_merge reads.
+    sample_ids : list of str, optional
+        The samples to compute over, which are kept in the order of the
+        table. Only their columns are read from the table. Default is every
+        sample.
+    feature_ids : list of str, optional
+        The features to compute over. IDs which are not in the table are
+        ignored. Default is every feature.
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+        If the output file cannot be written
+    ValueError
+        If the table is empty
+        If the table is not completely represented by the phylogeny
+        If the table does not appear to be BIOM-Format v2.1
+        If the phylogeny does not appear to be in Newick format
+        If an unknown method is requested.
+        If the stripes are out of bounds
+        If a sample of `sample_ids` is not present in the table
+    Exception
+        If an unkown error is experienced
+
+    Notes
+    -----
+    A table of n samples has (n + 1) // 2 stripes. The partial result is
+    written rather than returned, as it is only of use to a merge, which may
+    be in another process. The stripes are those of the table subset, so
+    every partial of a matrix must be computed with the same subset.
+    """
+    cdef:
+        partial_mat *result;
+        _TableSubset subset = _TableSubset(sample_ids, feature_ids)
+        compute_status status;
+        io_status io_err;
+        bytes biom_py_bytes
+        bytes tree_py_bytes
+        bytes met_py_bytes
+        bytes out_py_bytes
+
+    biom_py_bytes = biom_filename.encode()
+    tree_py_bytes = tree_filename.encode()
+    met_py_bytes = unifrac_method.encode()
+    out_py_bytes = output_filename.encode()
+
+    status = partial_subset(biom_py_bytes,
+                            tree_py_bytes,
+                            met_py_bytes,
+                            variance_adjust,
+                            alpha,
+                            bypass_tips,
+                            threads,
+                            stripe_start,
+                            stripe_stop,
+                            subset.pointer(),
+                            &result)
+
+    _raise_for_status(status, stripe_start, stripe_stop)
+
+    io_err = write_partial(out_py_bytes, result)
+    destroy_partial_mat(&result)
+    if io_err != write_okay:
+        raise IOError("Unable to write the partial result: %s"
+                      % output_filename)
+
+cdef class StripeStream:
+    """A table and tree loaded once, from which stripes are computed on demand
+
+    Parameters
+    ----------
+    biom_filename : str
+        A filepath to a BIOM 2.1 formatted table (HDF5)
+    tree_filename : str
+        A filepath to a Newick formatted tree
+    unifrac_method : str
+        The requested UniFrac method, one of {unweighted,
+        weighted_normalized, weighted_unnormalized, generalized}
+    variance_adjust : bool
+        Whether to perform Variance Adjusted UniFrac
+    alpha : float
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFraca
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+
+    Attributes
+    ----------
+    sample_ids : list of str
+        The sample IDs, in the order of the stripes.
+    n_stripes : int
+        The number of stripes of the full matrix, (n + 1) // 2 of n samples.
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+    ValueError
+        If the table is empty
+        If the table is not completely represented by the phylogeny
+        If the table does not appear to be BIOM-Format v2.1
+        If the phylogeny does not appear to be in Newick format
+        If an unknown method is requested.
+
+    Notes
+    -----
+    Stripe s pairs sample j with sample (j + s + 1) % n for each j. The
+    last stripe repeats pairs of the others: all of it for an odd n, and its
+    second half for an even n.
+    """
+    cdef stripe_stream *stream
+    cdef readonly list sample_ids
+    cdef readonly unsigned int n_stripes
+
+    def __cinit__(self, str biom_filename, str tree_filename,
+                  str unifrac_method, bool variance_adjust, double alpha,
+                  bool bypass_tips):
+        cdef:
+            compute_status status
+            unsigned int i
+            bytes biom_py_bytes = biom_filename.encode()
+            bytes tree_py_bytes = tree_filename.encode()
+            bytes met_py_bytes = unifrac_method.encode()
+
+        self.stream = NULL
+        status = open_stripe_stream(biom_py_bytes,
+                                    tree_py_bytes,
+                                    met_py_bytes,
+                                    variance_adjust,
+                                    alpha,
+                                    bypass_tips,
+                                    &self.stream)
+
+        _raise_for_status(status)
+
+        self.sample_ids = [self.stream.sample_ids[i].decode('utf-8')
+                           for i in range(self.stream.n_samples)]
+        self.n_stripes = self.stream.n_stripes
+
+    def __dealloc__(self):
+        if self.stream != NULL:
+            destroy_stripe_stream(&self.stream)
+
+    def stripes(self, unsigned int stripe_start, unsigned int stripe_stop,
+                unsigned int threads=1):
+        """Compute a range of stripes
+
+        Parameters
+        ----------
+        stripe_start : int
+            The first stripe to compute.
+        stripe_stop : int
+            The stripe to stop before.
+        threads : int, optional
+            The number of threads to use.
+
+        Returns
+        -------
+        np.ndarray
+            The stripes, of shape (stripe_stop - stripe_start, n).
+
+        Raises
+        ------
+        ValueError
+            If the stripes are out of bounds
+
+        Notes
+        -----
+        The GIL is released during the computation, and a stream computes
+        one range at a time.
+        """
+        cdef:
+            partial_mat *result
+            compute_status status
+            unsigned int i
+            uint32_t n = self.stream.n_samples
+            np.ndarray[np.double_t, ndim=2] numpy_arr
+
+        with nogil:
+            status = stream_stripes(self.stream, threads, stripe_start,
+                                    stripe_stop, &result)
+
+        _raise_for_status(status, stripe_start, stripe_stop)
+
+        numpy_arr = np.empty((stripe_stop - stripe_start, n), dtype=np.double)
+        for i in range(stripe_stop - stripe_start):
+            numpy_arr[i, :] = <np.double_t[:n]> result.stripes[i]
+        destroy_partial_mat(&result)
+        return numpy_arr
+
+cdef int _merge_partials(list partial_filenames, unsigned int threads,
+                         mat **result, mat_full **full) except -1:
+    # merges into full if it is not NULL, otherwise into result
+    cdef:
+        partial_mat **partial_mats
+        io_status io_err
+        merge_status merge_err
+        unsigned int i
+        unsigned int n_read = 0
+        unsigned int n_partials = len(partial_filenames)
+        bytes filename
+
+    if n_partials == 0:
+        raise ValueError("No partial results to merge.")
+
+    partial_mats = <partial_mat**>malloc(sizeof(partial_mat*) * n_partials)
+    try:
+        for i in range(n_partials):
+            filename = str(partial_filenames[i]).encode()
+            io_err = read_partial(filename, &partial_mats[i])
+            if io_err != read_okay:
+                raise IOError("Unable to read the partial result %s; err %d"
+                              % (partial_filenames[i], io_err))
+            n_read += 1
+
+        if full != NULL:
+            merge_err = merge_partial_matrix(partial_mats, n_partials,
+                                             threads, full)
+        else:
+            merge_err = merge_partial(partial_mats, n_partials, threads,
+                                      result)
+        if merge_err != merge_okay:
+            if merge_err == incomplete_stripe_set:
+                raise ValueError("The partial results do not cover every "
+                                 "stripe.")
+            elif merge_err == stripes_overlap:
+                raise ValueError("The partial results overlap.")
+            elif merge_err == sample_id_consistency:
+                raise ValueError("The partial results are of different "
+                                 "samples.")
+            elif merge_err in (partials_mismatch, square_mismatch):
+                raise ValueError("The partial results are of different "
+                                 "matrices.")
+            else:
+                raise Exception("Unknown Error: {}".format(merge_err))
+    finally:
+        # the merged matrix does not refer to the partial results, so they
+        # are always freed
+        for i in range(n_read):
+            destroy_partial_mat(&partial_mats[i])
+        free(partial_mats)
+
+    return 0
+
+def ssu_merge(list partial_filenames, unsigned int threads=1):
+    """Merge partial results into a UniFrac distance matrix
+
+    Parameters
+    ----------
+    partial_filenames : list of str
+        The files written by ssu_partial, which together must cover every
+        stripe exactly once.
+    threads : int, optional
+        The number of threads to use.
+
+    Returns
+    -------
+    skbio.DistanceMatrix
+        The resulting distance matrix.
+
+    Raises
+    ------
+    IOError
+        If a partial result cannot be read
+    ValueError
+        If no partial results are provided
+        If the partial results do not cover every stripe exactly once
+        If the partial results are of different samples
+    """
+    cdef mat_full *result = NULL
+
+    _merge_partials(partial_filenames, threads, NULL, &result)
+    dm = _mat_full_to_distance_matrix(result)
+    destroy_mat_full(&result)
+    return dm
+
+def configure_threads(unsigned int size=0, str affinity='core'):
+    """Configure the worker threads shared by the computations
+
+    Parameters
+    ----------
+    size : int, optional
+        The number of worker threads. Default is 0, a thread for each
+        processor available to the process.
+    affinity : str, optional
+        The placement of the threads. 'core' binds each thread to a
+        processor, and 'none' leaves them to the scheduler. Default is
+        'core'.
+
+    Returns
+    -------
+    int
+        The number of worker threads.
+
+    Raises
+    ------
+    ValueError
+        If the affinity is not recognized.
+
+    Notes
+    -----
+    The worker threads are created on first use and reused by every call,
+    so that the threads of a computation are not started and bound on each
+    call. The ``threads`` of a call is the most of its tasks run at once,
+    and calls made concurrently share the worker threads. Threads busy with
+    a task finish it before they are replaced.
+    """
+    if affinity not in ('core', 'none'):
+        raise ValueError("Affinity (%s) unrecognized. Available choices "
+                         "are: core, none" % affinity)
+
+    cdef bool bind_to_cores = affinity == 'core'
+    with nogil:
+        configure_worker_pool(size, bind_to_cores)
+        size = worker_pool_size()
+    return size
+
+
+def serve(str socket_path, dict trees, unsigned int threads=1):
+    """Serve UniFrac computations against trees kept in memory
+
+    Parameters
+    ----------
+    socket_path : str
+        The path of the UNIX socket to serve requests on.
+    trees : dict of str to str
+        The filepaths of Newick formatted trees, by the names with which
+        they are requested.
+    threads : int, optional
+        The most threads used by the computations at once. Default is 1.
+
+    Raises
+    ------
+    IOError
+        If a tree file is not found
+        If the socket cannot be created, or is served by another process
+    ValueError
+        If no trees are provided
+        If a phylogeny does not appear to be in Newick format
+
+    See Also
+    --------
+    unifrac.Client
+
+    Notes
+    -----
+    The trees are parsed once, and each request is computed against a
+    tree sheared to its table. The requests are computed in the order
+    received, each once its threads are within `threads`. This blocks until
+    a client requests a shutdown, with the GIL released, so the server may
+    be run in a thread. This is the server of ``ssu --mode serve``.
+    """
+    cdef:
+        list names = [str(name).encode() for name in trees]
+        list filenames = [str(filename).encode() for filename in
+                          trees.values()]
+        unsigned int n_trees = len(names)
+        unsigned int i
+        const char** c_names = NULL
+        loaded_tree** loaded = NULL
+        compute_status status
+        int served
+        bytes socket_py_bytes = socket_path.encode()
+        const char* socket_c_string = socket_py_bytes
+
+    if n_trees == 0:
+        raise ValueError("At least one tree is required.")
+
+    loaded = <loaded_tree**>calloc(n_trees, sizeof(loaded_tree*))
+    if loaded == NULL:
+        raise MemoryError()
+    try:
+        for i in range(n_trees):
+            status = load_tree(filenames[i], &loaded[i])
+            _raise_for_status(status)
+
+        c_names = _c_string_array(names)
+        with nogil:
+            served = serve_requests(socket_c_string, c_names, loaded,
+                                    n_trees, threads)
+    finally:
+        for i in range(n_trees):
+            destroy_loaded_tree(&loaded[i])
+        free(loaded)
+        free(c_names)
+
+    if served != 0:
+        raise IOError(served, "The socket cannot be served: %s"
+                      % os.strerror(served), socket_path)
+
+
+def ssu_permutation_test(str test, dm, grouping, unsigned int permutations,
+                         uint64_t seed, unsigned int threads):
+    """Test a grouping of the samples of a distance matrix by permutation
+
+    Parameters
+    ----------
+    test : str
+        The test, one of {permanova, permdisp}
+    dm : skbio.DistanceMatrix, str or list of str
+        The distance matrix, a filepath to a matrix written by ssu, or the
+        files written by ssu_partial, which are merged
+    grouping : dict or sequence
+        The group of each sample by its ID, or of each sample in the order
+        of the matrix
+    permutations : int
+        The number of permutations of the grouping
+    seed : int
+        The random seed. Permutation p is drawn with seed + p.
+    threads : int
+        The number of threads to use, over which the permutations are
+        divided, and to merge partial results.
+
+    Returns
+    -------
+    pandas.Series
+        The results of the test, as by scikit-bio's permanova and permdisp.
+
+    Raises
+    ------
+    IOError
+        If the matrix or a partial result cannot be read
+    ValueError
+        If the test is unknown
+        If a sample is not in the grouping, or the grouping is not of the
+        length of the matrix
+        If there are fewer than two groups, or a group for each sample
+    """
+    cdef:
+        mat *loaded = NULL
+        mat view
+        np.ndarray[np.double_t, ndim=1] condensed
+        np.ndarray[np.uint32_t, ndim=1] codes
+        permutation_test result
+        compute_status status
+        io_status io_err
+        unsigned int n_groups
+        unsigned int i
+        bint is_permanova = test == 'permanova'
+        bytes filename
+        list ids
+
+    if test not in ('permanova', 'permdisp'):
+        raise ValueError("Unknown test: %s" % test)
+
+    # a matrix of ssu is read as its condensed form, rather than by skbio,
+    # so the square matrix is not formed
+    if isinstance(dm, (str, list)):
+        if isinstance(dm, str):
+            filename = dm.encode()
+            io_err = read_mat(filename, &loaded)
+            if io_err != read_okay:
+                raise IOError("Unable to read the distance matrix %s; err %d"
+                              % (dm, io_err))
+        else:
+            _merge_partials(dm, threads, &loaded, NULL)
+        ids = [loaded.sample_ids[i].decode('utf-8')
+               for i in range(loaded.n_samples)]
+    else:
+        ids = list(dm.ids)
+        condensed = np.ascontiguousarray(dm.condensed_form(),
+                                         dtype=np.double)
+        view.n_samples = len(ids)
+        view.cf_size = condensed.shape[0]
+        view.is_upper_triangle = True
+        view.condensed_form = &condensed[0] if condensed.shape[0] else NULL
+        view.sample_ids = NULL
+
+    try:
+        if isinstance(grouping, dict):
+            missing = [id_ for id_ in ids if id_ not in grouping]
+            if missing:
+                raise ValueError("The samples %s are not in the grouping."
+                                 % ', '.join(missing[:5]))
+            groups = [grouping[id_] for id_ in ids]
+        else:
+            groups = list(grouping)
+            if len(groups) != len(ids):
+                raise ValueError("The grouping is of %d samples, and the "
+                                 "distance matrix of %d."
+                                 % (len(groups), len(ids)))
+
+        # the groups are numbered in the order they are first seen
+        numbering = {}
+        codes = np.array([numbering.setdefault(group, len(numbering))
+                          for group in groups], dtype=np.uint32)
+        n_groups = len(numbering)
+        if codes.shape[0] == 0:
+            raise ValueError("The distance matrix has no samples.")
+
+        with nogil:
+            if is_permanova:
+                status = permanova_mat(loaded if loaded != NULL else &view,
+                                       <unsigned int*>&codes[0], n_groups,
+                                       permutations, seed, threads, &result)
+            else:
+                status = permdisp_mat(loaded if loaded != NULL else &view,
+                                      <unsigned int*>&codes[0], n_groups,
+                                      permutations, seed, threads, &result)
+    finally:
+        if loaded != NULL:
+            destroy_mat(&loaded)
+
+    _raise_for_status(status)
+
+    import pandas as pd
+    method_name = result.method_name.decode('utf-8')
+    return pd.Series(
+        data=[method_name, result.statistic_name.decode('utf-8'),
+              result.n_samples, result.n_groups, result.statistic,
+              result.p_value, result.permutations],
+        index=['method name', 'test statistic name', 'sample size',
+               'number of groups', 'test statistic', 'p-value',
+               'number of permutations'],
+        name='%s results' % method_name)
+
+def ssu_plan(str biom_filename, str tree_filename, str unifrac_method,
+             bool variance_adjust, uint64_t memory_limit=0,
+             double time_limit=0, unsigned int max_threads=1,
+             unsigned int n_partials=0, bool calibrate=False,
+             bool bypass_tips=False):
+    """Plan the partitions and threads of a partial computation
+
+    Parameters
+    ----------
+    biom_filename : str
+        A filepath to a BIOM 2.1 formatted table (HDF5)
+    tree_filename : str
+        A filepath to a Newick formatted tree
+    unifrac_method : str
+        The requested UniFrac method, one of {unweighted,
+        weighted_normalized, weighted_unnormalized, generalized}
+    variance_adjust : bool
+        Whether to perform Variance Adjusted UniFrac
+    memory_limit : int, optional
+        The bytes each job may use. The default of 0 is no limit.
+    time_limit : float, optional
+        The compute seconds of each job. The default of 0 is no limit.
+    max_threads : int, optional
+        The most threads a job may use.
+    n_partials : int, optional
+        The number of partitions. The default of 0 chooses the fewest within
+        the limits.
+    calibrate : bool, optional
+        Measure the cost model on the inputs, rather than use the default.
+    bypass_tips : bool, optional
+        Whether the calibration bypasses the tips.
+
+    Returns
+    -------
+    dict
+        The plan, of the shape of the inputs, the chosen 'threads' and
+        'n_partials', whether the plan is 'feasible' within the limits, the
+        'cost_model' and estimated bytes of the inputs and each thread, and
+        the 'partitions', each a dict of 'start', 'stop', 'stripe_bytes',
+        'peak_bytes' and 'seconds'.
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+    ValueError
+        If the table is empty
+        If the table does not appear to be BIOM-Format v2.1
+        If the phylogeny does not appear to be in Newick format
+        If an unknown method is requested.
+    Exception
+        If an unkown error is experienced
+
+    Notes
+    -----
+    Only the shape of the table is read and the tree is scanned rather than
+    parsed, so the estimates are upper bounds, and planning is quick even
+    for inputs which must be split to be computed.
+    """
+    cdef:
+        partial_plan *result;
+        cost_model model;
+        cost_model *model_ptr = NULL;
+        compute_status status;
+        unsigned int p
+        bytes biom_py_bytes
+        bytes tree_py_bytes
+        bytes met_py_bytes
+
+    biom_py_bytes = biom_filename.encode()
+    tree_py_bytes = tree_filename.encode()
+    met_py_bytes = unifrac_method.encode()
+
+    status = okay
+    if calibrate:
+        status = calibrate_cost_model(biom_py_bytes, tree_py_bytes,
+                                      met_py_bytes, variance_adjust,
+                                      bypass_tips, &model)
+        model_ptr = &model
+
+    if status == okay:
+        status = plan_partials(biom_py_bytes, tree_py_bytes, met_py_bytes,
+                               variance_adjust, model_ptr, memory_limit,
+                               time_limit, max_threads, n_partials, &result)
+
+    _raise_for_status(status)
+
+    plan = {'n_samples': result.n_samples,
+            'n_obs': result.n_obs,
+            'nnz': result.nnz,
+            'n_tree_nodes': result.n_tree_nodes,
+            'n_compute_nodes': result.n_compute_nodes,
+            'n_stripes': result.n_stripes,
+            'memory_limit': memory_limit,
+            'time_limit': time_limit,
+            'cost_model': {'node_seconds': result.model.node_seconds,
+                           'stripe_seconds': result.model.stripe_seconds,
+                           'calibrated': calibrate},
+            'feasible': result.feasible,
+            'threads': result.threads,
+            'n_partials': result.n_partials,
+            'table_bytes': result.table_bytes,
+            'tree_bytes': result.tree_bytes,
+            'thread_bytes': result.thread_bytes,
+            'partitions': [{'start': result.starts[p],
+                            'stop': result.stops[p],
+                            'stripe_bytes': result.stripe_bytes[p],
+                            'peak_bytes': result.peak_bytes[p],
+                            'seconds': result.seconds[p]}
+                           for p in range(result.n_partials)]}
+    destroy_partial_plan(&result)
+    return plan
+
+def faith_pd(str biom_filename, str tree_filename, bool stats=False,
+             sample_ids=None, feature_ids=None):
+    """Execute a call to the Stacked Faith API in the UniFrac package
+
+    Parameters
+    ----------
+    biom_filename : str
+        A filepath to a BIOM 2.1 formatted table (HDF5)
+    tree_filename : str
+        A filepath to a Newick formatted tree
+    stats : bool, optional
+        Whether to record the time and memory of each phase of the
+        computation.
+    sample_ids : list of str, optional
+        The samples to compute over, which are kept in the order of the
+        table. Only their columns are read from the table. Default is every
+        sample.
+    feature_ids : list of str, optional
+        The features to compute over. IDs which are not in the table are
+        ignored. Default is every feature.
+
+    Returns
+    -------
+    pd.Series
+        Series of Faith's PD for each sample in `biom_filename`. If `stats`,
+        the phase statistics are ``attrs['stats']`` of the series, as
+        described for `ssu`.
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+    ValueError
+        If the table is empty
+        If the table is not completely represented by the phylogeny
+        If the table does not appear to be BIOM-Format v2.1
+        If the phylogeny does not appear to be in Newick format
+        If a sample of `sample_ids` is not present in the table
+    Exception
+        If an unkown error is experienced
+    """
+    cdef:
+        results_vec *result;
+        _TableSubset subset = _TableSubset(sample_ids, feature_ids)
+        run_stats *run_stats_result = NULL;
+        compute_status status;
+        np.ndarray[np.double_t, ndim=1] numpy_arr
+        bytes biom_py_bytes
+        bytes tree_py_bytes
+        char* biom_c_string
+        char* tree_c_string
+        list ids
+
+
+    biom_py_bytes = biom_filename.encode()
+    tree_py_bytes = tree_filename.encode()
+    biom_c_string = biom_py_bytes
+    tree_c_string = tree_py_bytes
+
+    status = faith_pd_subset(biom_c_string, tree_c_string, subset.pointer(),
+                             &result, &run_stats_result if stats else NULL)
+
+    _raise_for_status(status)
 
     numpy_arr = np.zeros(result.n_samples, dtype=np.double)
     numpy_arr[:] = <np.double_t[:result.n_samples]> result.values
@@ -165,9 +1637,13 @@ def faith_pd(str biom_filename, str tree_filename):
     for i in range(result.n_samples):
         ids.append(result.sample_ids[i].decode('utf-8'))
 
+    import pandas as pd
     faith_pd_series = pd.Series(numpy_arr, index=ids)
     faith_pd_series.rename("faith_pd", inplace=True)
 
     destroy_results_vec(&result)
+    if run_stats_result != NULL:
+        faith_pd_series.attrs['stats'] = _run_stats_to_dict(run_stats_result)
+        destroy_run_stats(&run_stats_result)
 
     return faith_pd_series
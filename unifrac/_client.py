@@ -0,0 +1,190 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2017, UniFrac development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import socket
+
+from unifrac._methods import METHODS
+
+
+# the exceptions of the errors of a response, as raised by ssu
+_ERRORS = {'tree_missing': IOError,
+           'table_missing': IOError,
+           'open_error': IOError,
+           'memory_limit_exceeded': MemoryError}
+
+# the fields of the responses which are numbers
+_INTEGERS = ('n_samples', 'threads', 'queued', 'running', 'threads_in_use',
+             'thread_budget', 'completed', 'failed')
+_FLOATS = ('wait_seconds', 'compute_seconds', 'wait_seconds_mean',
+           'wait_seconds_max', 'compute_seconds_mean', 'compute_seconds_max')
+
+
+def _format_request(fields):
+    pairs = []
+    for name, value in fields.items():
+        value = str(value)
+        if any(c in value for c in '\t\r\n'):
+            raise ValueError("The %s may not contain a tab or a newline."
+                             % name)
+        pairs.append('%s=%s' % (name, value))
+    return ('\t'.join(pairs) + '\n').encode('utf-8')
+
+
+def _parse_response(line):
+    response = {}
+    for pair in line.decode('utf-8').rstrip('\r\n').split('\t'):
+        if pair:
+            name, _, value = pair.partition('=')
+            response[name] = value
+
+    for name in _INTEGERS:
+        if name in response:
+            response[name] = int(response[name])
+    for name in _FLOATS:
+        if name in response:
+            response[name] = float(response[name])
+    if 'trees' in response:
+        response['trees'] = [t for t in response['trees'].split(',') if t]
+    return response
+
+
+class Client:
+    """A client of a UniFrac server, as by ``ssu --mode serve``
+
+    Parameters
+    ----------
+    socket_path : str
+        The path of the UNIX socket of the server.
+    timeout : float, optional
+        The most seconds to wait for a response, which includes the time
+        queued behind other requests. Default is None, to wait indefinitely.
+
+    See Also
+    --------
+    unifrac.serve
+
+    Notes
+    -----
+    Each request is made over its own connection, so a client may be used
+    from several threads at once.
+    """
+    def __init__(self, socket_path: str, timeout: float = None):
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+
+    def _request(self, fields):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            conn.sendall(_format_request(fields))
+            chunks = []
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+
+        response = _parse_response(b''.join(chunks))
+        if response.get('status') != 'okay':
+            error = _ERRORS.get(response.get('error'), ValueError)
+            raise error(response.get('message', 'The server did not '
+                                                'respond.'))
+        return response
+
+    def compute(self, tree: str, table: str, output: str,
+                method: str = 'unweighted', threads: int = 1,
+                variance_adjusted: bool = False, alpha: float = 1.0,
+                bypass_tips: bool = False, max_memory: int = None) -> dict:
+        """Compute UniFrac on the server into a file
+
+        Parameters
+        ----------
+        tree : str
+            The name of a tree loaded by the server.
+        table : str
+            A filepath to a BIOM-Format 2.1 file, readable by the server.
+            Relative paths are of the working directory of the client.
+        output : str
+            The filepath of the distance matrix, which is written by the
+            server as tab-delimited text, as by ``ssu``.
+        method : str, optional
+            The UniFrac method to use. The available choices are:
+            'unweighted', 'weighted_unnormalized', 'weighted_normalized', and
+            'generalized'. Default is 'unweighted'.
+        threads : int, optional
+            The number of threads to use, of at most the budget of the
+            server. Default is 1.
+        variance_adjusted : bool, optional
+            Adjust for varianace or not. Default is False.
+        alpha : float, optional
+            The value of alpha for Generalized UniFrac; only applies to
+            Generalized UniFrac. Default is 1.0.
+        bypass_tips : bool
+            Bypass the tips of the tree in the computation. This reduces
+            compute by about 50%, but is an approximation.
+        max_memory : int, optional
+            The bytes to compute within, as for ``ssu``. Default is no limit.
+
+        Returns
+        -------
+        dict
+            The n_samples of the matrix, the threads it was computed with,
+            and the wait_seconds queued and compute_seconds taken.
+
+        Raises
+        ------
+        IOError
+            If the table is not found
+            If the output cannot be written
+        ValueError
+            If the method is not recognized.
+            If the tree is not loaded by the server.
+            If the table does not appear to be BIOM-Format v2.1.
+            If the table is empty or not completely represented by the tree.
+        MemoryError
+            If max_memory is too small to compute a single stripe.
+        """
+        method_ = method.replace('-', '_')
+        if method_ not in METHODS:
+            raise ValueError("Method (%s) unrecognized. Available methods "
+                             "are: %s" % (method, ', '.join(METHODS.keys())))
+
+        # the server has its own working directory
+        fields = {'command': 'compute', 'tree': tree,
+                  'table': os.path.abspath(table),
+                  'output': os.path.abspath(output),
+                  'method': method_, 'threads': threads,
+                  'variance_adjusted': int(bool(variance_adjusted)),
+                  'alpha': repr(float(alpha)),
+                  'bypass_tips': int(bool(bypass_tips))}
+        if max_memory is not None:
+            fields['max_memory'] = int(max_memory)
+
+        response = self._request(fields)
+        return {name: response[name] for name in
+                ('n_samples', 'threads', 'wait_seconds', 'compute_seconds')}
+
+    def metrics(self) -> dict:
+        """The state of the queue of the server and its latencies
+
+        Returns
+        -------
+        dict
+            The requests queued and running, the threads_in_use of the
+            thread_budget, the requests completed and failed, the
+            wait_seconds_mean and wait_seconds_max of their time queued, the
+            compute_seconds_mean and compute_seconds_max of their time
+            computing, and the names of the trees.
+        """
+        response = self._request({'command': 'metrics'})
+        del response['status']
+        return response
+
+    def shutdown(self):
+        """Stop the server once the requests it has received are answered"""
+        self._request({'command': 'shutdown'})
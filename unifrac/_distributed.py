@@ -0,0 +1,178 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2017, UniFrac development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+from concurrent.futures import Executor, Future
+from typing import TYPE_CHECKING
+from warnings import warn
+
+import unifrac as qsu
+from unifrac._methods import METHODS
+
+if TYPE_CHECKING:  # skbio is imported on use, see ssu_merge
+    import skbio
+
+
+class LocalExecutor(Executor):
+    """An executor which runs each task in the calling process
+
+    This stands in for a cluster or process pool executor, so that a
+    distributed computation can be run, and debugged, without one. Tasks are
+    run as they are submitted, and their exceptions are raised from the
+    result of their future.
+    """
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def _compute_partial(table, phylogeny, method, variance_adjusted, alpha,
+                     bypass_tips, threads, start, stop, output):
+    # a module level function, so that it can be pickled to a worker
+    qsu.ssu_partial(table, phylogeny, method, variance_adjusted, alpha,
+                    bypass_tips, threads, start, stop, output)
+    return output
+
+
+def distributed(table: str,
+                phylogeny: str,
+                method: str = 'unweighted',
+                n_partials: int = None,
+                threads: int = 1,
+                variance_adjusted: bool = False,
+                alpha: float = 1.0,
+                bypass_tips: bool = False,
+                memory_limit: int = None,
+                executor: Executor = None,
+                scratch_dir: str = None,
+                keep_partials: bool = False) -> 'skbio.DistanceMatrix':
+    """Compute UniFrac as partial results over a pool of workers
+
+    Parameters
+    ----------
+    table : str
+        A filepath to a BIOM-Format 2.1 file.
+    phylogeny : str
+        A filepath to a Newick formatted tree.
+    method : str, optional
+        The UniFrac method to use. The available choices are:
+        'unweighted', 'weighted_unnormalized', 'weighted_normalized', and
+        'generalized'. Default is 'unweighted'.
+    n_partials : int, optional
+        The number of partial results, each computed by one task. By
+        default this is the fewest within `memory_limit` if one is given,
+        otherwise the number of CPUs.
+    threads : int, optional
+        The most threads each task may use. Default is 1.
+    variance_adjusted : bool, optional
+        Adjust for varianace or not. Default is False.
+    alpha : float, optional
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFrac. Default is 1.0.
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+    memory_limit : int, optional
+        The bytes each task may use, which the partitions and the threads of
+        each task are planned within. Default is no limit.
+    executor : concurrent.futures.Executor, optional
+        The executor the tasks are submitted to, which must be able to read
+        the inputs and write to `scratch_dir`. Default is a process pool with
+        a worker for each CPU, which is shut down on return.
+    scratch_dir : str, optional
+        The directory the partial results are written into. Default is a
+        temporary directory.
+    keep_partials : bool, optional
+        Whether to keep the partial results in `scratch_dir`. Default is
+        False, in which case they are removed once merged.
+
+    Returns
+    -------
+    skbio.DistanceMatrix
+        The resulting distance matrix.
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+    ValueError
+        If the method is not recognized.
+        If the table does not appear to be BIOM-Format v2.1.
+        If the phylogeny does not appear to be in Newick format.
+
+    Notes
+    -----
+    The stripes of the matrix are planned as by ``ssu --mode partial-plan``,
+    and each task reads the inputs itself, so only the file paths are sent
+    to the workers. The partial results are written to `scratch_dir` as each
+    task completes, and are merged once all have.
+    """
+    method_ = method.replace('-', '_')
+    if method_ not in METHODS:
+        raise ValueError("Method (%s) unrecognized. Available methods are: %s"
+                         % (method, ', '.join(METHODS.keys())))
+
+    table = str(table)
+    phylogeny = str(phylogeny)
+    if n_partials is None and memory_limit is None:
+        n_partials = os.cpu_count() or 1
+
+    plan = qsu.ssu_plan(table, phylogeny, method_, variance_adjusted,
+                        memory_limit or 0, 0, threads, n_partials or 0)
+    if not plan['feasible']:
+        warn("The partitions are estimated to exceed the memory limit.",
+             Warning)
+
+    own_scratch = scratch_dir is None
+    if own_scratch:
+        scratch_dir = tempfile.mkdtemp(prefix='unifrac-')
+    else:
+        os.makedirs(scratch_dir, exist_ok=True)
+
+    own_executor = executor is None
+    if own_executor:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(min(plan['n_partials'],
+                                           os.cpu_count() or 1))
+
+    outputs = []
+    futures = []
+    try:
+        for part in plan['partitions']:
+            output = os.path.join(scratch_dir, 'partial-%d-%d.ssu'
+                                  % (part['start'], part['stop']))
+            outputs.append(output)
+            futures.append(executor.submit(_compute_partial, table,
+                                           phylogeny, method_,
+                                           variance_adjusted, alpha,
+                                           bypass_tips, plan['threads'],
+                                           part['start'], part['stop'],
+                                           output))
+
+        # in submission order, so the first failure is raised
+        partials = [future.result() for future in futures]
+        return qsu.ssu_merge(partials, threads)
+    finally:
+        # tasks which have not started are not needed after a failure
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+        if not keep_partials:
+            if own_scratch:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+            else:
+                for output in outputs:
+                    if os.path.exists(output):
+                        os.remove(output)
@@ -8,13 +8,16 @@
 from warnings import warn
 from functools import reduce
 from operator import or_
+from typing import TYPE_CHECKING
 
 import numpy as np
-import skbio
 
 import unifrac as qsu
 from unifrac._meta import CONSOLIDATIONS
 
+if TYPE_CHECKING:  # skbio is imported on use, see meta
+    import skbio
+
 
 def is_biom_v210(f):
     import h5py
@@ -36,11 +39,15 @@ def is_biom_v210(f):
 
 
 def is_newick(f):
+    import skbio
     sniffer = skbio.io.format.newick.newick.sniffer_function
     return sniffer(f)[0]
 
 
 def _validate(table, phylogeny):
+    # The compiled loaders perform these checks as the files are read, so the
+    # method wrappers do not call this. It remains available for callers that
+    # want to check inputs prior to a long running computation.
     if not is_biom_v210(table):
         raise ValueError("Table does not appear to be a BIOM-Format v2.1")
     if not is_newick(phylogeny):
@@ -51,7 +58,9 @@ def unweighted(table: str,
                phylogeny: str,
                threads: int = 1,
                variance_adjusted: bool = False,
-               bypass_tips: bool = False) -> skbio.DistanceMatrix:
+               bypass_tips: bool = False,
+               sample_ids: list = None,
+               feature_ids: list = None) -> 'skbio.DistanceMatrix':
     """Compute Unweighted UniFrac
 
     Parameters
@@ -67,6 +76,13 @@ def unweighted(table: str,
     bypass_tips : bool
         Bypass the tips of the tree in the computation. This reduces compute
         by about 50%, but is an approximation.
+    sample_ids : list of str, optional
+        The samples to compute over, which are kept in the order of the
+        table. Only their columns are read from the table. Default is every
+        sample.
+    feature_ids : list of str, optional
+        The features to compute over. IDs which are not in the table are
+        ignored. Default is every feature.
 
     Returns
     -------
@@ -81,6 +97,7 @@ def unweighted(table: str,
     ValueError
         If the table does not appear to be BIOM-Format v2.1.
         If the phylogeny does not appear to be in Newick format.
+        If a sample of `sample_ids` is not present in the table.
 
     Notes
     -----
@@ -98,16 +115,18 @@ def unweighted(table: str,
        powerful beta diversity measure for comparing communities based on
        phylogeny. BMC Bioinformatics 12:118 (2011).
     """
-    _validate(table, phylogeny)
     return qsu.ssu(table, phylogeny, 'unweighted',
-                   variance_adjusted, 1.0, bypass_tips, threads)
+                   variance_adjusted, 1.0, bypass_tips, threads,
+                   sample_ids=sample_ids, feature_ids=feature_ids)
 
 
 def weighted_normalized(table: str,
                         phylogeny: str,
                         threads: int = 1,
                         variance_adjusted: bool = False,
-                        bypass_tips: bool = False) -> skbio.DistanceMatrix:
+                        bypass_tips: bool = False,
+                        sample_ids: list = None,
+                        feature_ids: list = None) -> 'skbio.DistanceMatrix':
     """Compute weighted normalized UniFrac
 
     Parameters
@@ -123,6 +142,13 @@ def weighted_normalized(table: str,
     bypass_tips : bool
         Bypass the tips of the tree in the computation. This reduces compute
         by about 50%, but is an approximation.
+    sample_ids : list of str, optional
+        The samples to compute over, which are kept in the order of the
+        table. Only their columns are read from the table. Default is every
+        sample.
+    feature_ids : list of str, optional
+        The features to compute over. IDs which are not in the table are
+        ignored. Default is every feature.
 
     Returns
     -------
@@ -137,6 +163,7 @@ def weighted_normalized(table: str,
     ValueError
         If the table does not appear to be BIOM-Format v2.1.
         If the phylogeny does not appear to be in Newick format.
+        If a sample of `sample_ids` is not present in the table.
 
     Notes
     -----
@@ -154,14 +181,17 @@ def weighted_normalized(table: str,
        phylogeny. BMC Bioinformatics 12:118 (2011).
     """
     return qsu.ssu(str(table), str(phylogeny), 'weighted_normalized',
-                   variance_adjusted, 1.0, bypass_tips, threads)
+                   variance_adjusted, 1.0, bypass_tips, threads,
+                   sample_ids=sample_ids, feature_ids=feature_ids)
 
 
 def weighted_unnormalized(table: str,
                           phylogeny: str,
                           threads: int = 1,
                           variance_adjusted: bool = False,
-                          bypass_tips: bool = False) -> skbio.DistanceMatrix:
+                          bypass_tips: bool = False,
+                          sample_ids: list = None,
+                          feature_ids: list = None) -> 'skbio.DistanceMatrix':
     # noqa
     """Compute weighted unnormalized UniFrac
 
@@ -178,6 +208,13 @@ def weighted_unnormalized(table: str,
     bypass_tips : bool
         Bypass the tips of the tree in the computation. This reduces compute
         by about 50%, but is an approximation.
+    sample_ids : list of str, optional
+        The samples to compute over, which are kept in the order of the
+        table. Only their columns are read from the table. Default is every
+        sample.
+    feature_ids : list of str, optional
+        The features to compute over. IDs which are not in the table are
+        ignored. Default is every feature.
 
     Returns
     -------
@@ -192,6 +229,7 @@ def weighted_unnormalized(table: str,
     ValueError
         If the table does not appear to be BIOM-Format v2.1.
         If the phylogeny does not appear to be in Newick format.
+        If a sample of `sample_ids` is not present in the table.
 
     Notes
     -----
@@ -209,7 +247,8 @@ def weighted_unnormalized(table: str,
        phylogeny. BMC Bioinformatics 12:118 (2011).
     """
     return qsu.ssu(str(table), str(phylogeny), 'weighted_unnormalized',
-                   variance_adjusted, 1.0, bypass_tips, threads)
+                   variance_adjusted, 1.0, bypass_tips, threads,
+                   sample_ids=sample_ids, feature_ids=feature_ids)
 
 
 def generalized(table: str,
@@ -217,7 +256,9 @@ def generalized(table: str,
                 threads: int = 1,
                 alpha: float = 1.0,
                 variance_adjusted: bool = False,
-                bypass_tips: bool = False) -> skbio.DistanceMatrix:
+                bypass_tips: bool = False,
+                sample_ids: list = None,
+                feature_ids: list = None) -> 'skbio.DistanceMatrix':
     """Compute Generalized UniFrac
 
     Parameters
@@ -238,6 +279,13 @@ def generalized(table: str,
     bypass_tips : bool
         Bypass the tips of the tree in the computation. This reduces compute
         by about 50%, but is an approximation.
+    sample_ids : list of str, optional
+        The samples to compute over, which are kept in the order of the
+        table. Only their columns are read from the table. Default is every
+        sample.
+    feature_ids : list of str, optional
+        The features to compute over. IDs which are not in the table are
+        ignored. Default is every feature.
 
     Returns
     -------
@@ -252,6 +300,7 @@ def generalized(table: str,
     ValueError
         If the table does not appear to be BIOM-Format v2.1.
         If the phylogeny does not appear to be in Newick format.
+        If a sample of `sample_ids` is not present in the table.
 
     Notes
     -----
@@ -280,10 +329,12 @@ def generalized(table: str,
              "optimized.",
              Warning)
         return weighted_normalized(table, phylogeny, threads,
-                                   variance_adjusted)
+                                   variance_adjusted, sample_ids=sample_ids,
+                                   feature_ids=feature_ids)
     else:
         return qsu.ssu(str(table), str(phylogeny), 'generalized',
-                       variance_adjusted, alpha, bypass_tips, threads)
+                       variance_adjusted, alpha, bypass_tips, threads,
+                       sample_ids=sample_ids, feature_ids=feature_ids)
 
 
 METHODS = {'unweighted': unweighted,
@@ -292,11 +343,162 @@ METHODS = {'unweighted': unweighted,
            'generalized': generalized}
 
 
+def rarefied(table: str,
+             phylogeny: str,
+             depth: int,
+             iterations: int = 10,
+             seed: int = 0,
+             method: str = 'unweighted',
+             threads: int = 1,
+             variance_adjusted: bool = False,
+             alpha: float = 1.0,
+             bypass_tips: bool = False,
+             keep_replicates: bool = False) -> tuple:
+    """Compute UniFrac over repeated rarefactions of a table
+
+    Parameters
+    ----------
+    table : str
+        A filepath to a BIOM-Format 2.1 file.
+    phylogeny : str
+        A filepath to a Newick formatted tree.
+    depth : int
+        The number of counts drawn without replacement from each sample.
+        Samples with fewer counts are omitted.
+    iterations : int, optional
+        The number of rarefied replicates. Default is 10.
+    seed : int, optional
+        The random seed. Replicate r is drawn with seed + r, so a result is
+        reproducible. Default is 0.
+    method : str, optional
+        The UniFrac method to use. The available choices are:
+        'unweighted', 'weighted_unnormalized', 'weighted_normalized', and
+        'generalized'. Default is 'unweighted'.
+    threads : int, optional
+        The number of threads to use. Default is 1
+    variance_adjusted : bool, optional
+        Adjust for varianace or not. Default is False.
+    alpha : float, optional
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFrac. Default is 1.0.
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+    keep_replicates : bool, optional
+        Whether to return the distance matrix of each replicate. Default is
+        False, in which case only the mean and variance are held in memory.
+
+    Returns
+    -------
+    skbio.DistanceMatrix
+        The mean of the replicates.
+    skbio.DistanceMatrix
+        The sample variance of the replicates.
+    list of skbio.DistanceMatrix
+        The replicates if `keep_replicates`, otherwise an empty list.
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+    ValueError
+        If the method is not recognized.
+        If fewer than two samples have at least `depth` counts.
+        If the table does not appear to be BIOM-Format v2.1.
+        If the phylogeny does not appear to be in Newick format.
+
+    Notes
+    -----
+    The table is read, and the phylogeny parsed and sheared, once for all of
+    the replicates.
+    """
+    method_ = method.replace('-', '_')
+    if method_ not in METHODS:
+        raise ValueError("Method (%s) unrecognized. Available methods are: %s"
+                         % (method, ', '.join(METHODS.keys())))
+
+    return qsu.ssu_rarefied(str(table), str(phylogeny), method_,
+                            variance_adjusted, alpha, bypass_tips, threads,
+                            depth, iterations, seed, keep_replicates)
+
+
+def pcoa(table: str,
+         phylogeny: str,
+         method: str = 'unweighted',
+         n_axes: int = 10,
+         threads: int = 1,
+         variance_adjusted: bool = False,
+         alpha: float = 1.0,
+         bypass_tips: bool = False) -> 'skbio.OrdinationResults':
+    """Compute the principal coordinates of UniFrac
+
+    Parameters
+    ----------
+    table : str
+        A filepath to a BIOM-Format 2.1 file.
+    phylogeny : str
+        A filepath to a Newick formatted tree.
+    method : str, optional
+        The UniFrac method to use. The available choices are:
+        'unweighted', 'weighted_unnormalized', 'weighted_normalized', and
+        'generalized'. Default is 'unweighted'.
+    n_axes : int, optional
+        The number of axes. Default is 10, or the number of samples if fewer.
+    threads : int, optional
+        The number of threads to use. Default is 1
+    variance_adjusted : bool, optional
+        Adjust for varianace or not. Default is False.
+    alpha : float, optional
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFrac. Default is 1.0.
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+
+    Returns
+    -------
+    skbio.OrdinationResults
+        The principal coordinates of the samples, as by
+        ``skbio.stats.ordination.pcoa`` truncated to `n_axes`.
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+    ValueError
+        If the method is not recognized.
+        If `n_axes` is not positive.
+        If the table does not appear to be BIOM-Format v2.1.
+        If the phylogeny does not appear to be in Newick format.
+
+    Notes
+    -----
+    The distance matrix is not returned to Python, nor is its square form
+    made. Only the requested axes are computed, by subspace iteration over
+    the condensed form, so the cost is proportional to the number of pairs
+    for each axis rather than to the cube of the number of samples. As by
+    scikit-bio, negative eigenvalues are reported as zero, and the proportion
+    explained is relative to the sum of all of the eigenvalues.
+    """
+    method_ = method.replace('-', '_')
+    if method_ not in METHODS:
+        raise ValueError("Method (%s) unrecognized. Available methods are: %s"
+                         % (method, ', '.join(METHODS.keys())))
+    if n_axes < 1:
+        raise ValueError("The number of axes must be positive.")
+
+    return qsu.ssu_pcoa(str(table), str(phylogeny), method_,
+                        variance_adjusted, alpha, bypass_tips, threads,
+                        n_axes)
+
+
 def meta(tables: tuple, phylogenies: tuple, weights: tuple = None,
          consolidation: str = None, method: str = None,
          threads: int = 1, variance_adjusted: bool = False,
          alpha: float = None, bypass_tips: bool = False) -> \
-         skbio.DistanceMatrix:
+         'skbio.DistanceMatrix':
     """Compute meta UniFrac
 
     Parameters
@@ -418,4 +620,5 @@ def meta(tables: tuple, phylogenies: tuple, weights: tuple = None,
     all_ids = sorted(reduce(or_, [set(dm.ids) for dm in dms]))
     dm = consolidation_(dms, [dm.ids for dm in dms], weights, all_ids)
 
+    import skbio
     return skbio.DistanceMatrix(dm, ids=all_ids)
@@ -0,0 +1,136 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2017, UniFrac development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from typing import TYPE_CHECKING
+
+from unifrac._api import ssu_permutation_test
+
+if TYPE_CHECKING:  # pandas is imported on use, see ssu_permutation_test
+    import pandas as pd
+
+
+def _grouping(grouping, column):
+    # a DataFrame is of its column, and a Series is of its index, so that
+    # each is taken by sample ID, as by skbio
+    if column is not None:
+        if column not in grouping:
+            raise ValueError("Column (%s) is not in the grouping." % column)
+        grouping = grouping[column]
+    if hasattr(grouping, 'to_dict'):
+        return grouping.to_dict()
+    return grouping
+
+
+def permanova(distance_matrix,
+              grouping,
+              column: str = None,
+              permutations: int = 999,
+              seed: int = 0,
+              threads: int = 1) -> 'pd.Series':
+    """Test for differences among groups of samples by PERMANOVA
+
+    Parameters
+    ----------
+    distance_matrix : skbio.DistanceMatrix, str or list of str
+        The distance matrix, a filepath to a matrix written by ``ssu``, or
+        the filepaths of the partial results of a matrix, which are merged.
+    grouping : pandas.DataFrame, pandas.Series, dict or sequence
+        The group of each sample. A DataFrame or Series is indexed by the
+        sample IDs, as is a dict, and a sequence is in the order of the
+        samples of the matrix.
+    column : str, optional
+        The column of `grouping` if it is a DataFrame.
+    permutations : int, optional
+        The number of permutations of the grouping. Default is 999. With
+        none, the p-value is NaN.
+    seed : int, optional
+        The random seed. Permutation p is drawn with seed + p, so a result
+        is reproducible with any number of threads. Default is 0.
+    threads : int, optional
+        The number of threads, over which the permutations are divided.
+        Default is 1.
+
+    Returns
+    -------
+    pandas.Series
+        The results of the test, as by ``skbio.stats.distance.permanova``.
+
+    Raises
+    ------
+    IOError
+        If the matrix or a partial result cannot be read.
+    ValueError
+        If a sample is not in the grouping.
+        If there are fewer than two groups, or a group for each sample.
+
+    Notes
+    -----
+    The test statistic is the pseudo-F of Anderson (2001). Each permutation
+    is a pass over the condensed form of the matrix, so the square matrix is
+    not formed, and is not reindexed. The p-values differ from those of
+    scikit-bio, as the permutations are drawn differently.
+    """
+    return ssu_permutation_test('permanova', distance_matrix,
+                                _grouping(grouping, column), permutations,
+                                seed, threads)
+
+
+def permdisp(distance_matrix,
+             grouping,
+             column: str = None,
+             permutations: int = 999,
+             seed: int = 0,
+             threads: int = 1) -> 'pd.Series':
+    """Test for differences in dispersion among groups of samples by PERMDISP
+
+    Parameters
+    ----------
+    distance_matrix : skbio.DistanceMatrix, str or list of str
+        The distance matrix, a filepath to a matrix written by ``ssu``, or
+        the filepaths of the partial results of a matrix, which are merged.
+    grouping : pandas.DataFrame, pandas.Series, dict or sequence
+        The group of each sample. A DataFrame or Series is indexed by the
+        sample IDs, as is a dict, and a sequence is in the order of the
+        samples of the matrix.
+    column : str, optional
+        The column of `grouping` if it is a DataFrame.
+    permutations : int, optional
+        The number of permutations of the grouping. Default is 999. With
+        none, the p-value is NaN.
+    seed : int, optional
+        The random seed. Permutation p is drawn with seed + p, so a result
+        is reproducible with any number of threads. Default is 0.
+    threads : int, optional
+        The number of threads, over which the permutations are divided.
+        Default is 1.
+
+    Returns
+    -------
+    pandas.Series
+        The results of the test, as by ``skbio.stats.distance.permdisp``
+        with ``test='centroid'``.
+
+    Raises
+    ------
+    IOError
+        If the matrix or a partial result cannot be read.
+    ValueError
+        If a sample is not in the grouping.
+        If there are fewer than two groups, or a group for each sample.
+
+    Notes
+    -----
+    The test statistic is the F of the distances of the samples to the
+    centroids of their groups (Anderson 2006). The distances are computed
+    from the condensed form of the matrix rather than from its principal
+    coordinates, so they are those of all of the axes. Where the matrix is
+    not Euclidean, they are of the positive axes less the negative, as by
+    vegan's ``betadisper``, whereas scikit-bio drops the negative axes.
+    """
+    return ssu_permutation_test('permdisp', distance_matrix,
+                                _grouping(grouping, column), permutations,
+                                seed, threads)
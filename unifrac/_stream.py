@@ -0,0 +1,184 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2017, UniFrac development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import queue
+import threading
+
+import numpy as np
+
+from unifrac._api import StripeStream
+from unifrac._methods import METHODS
+
+
+# the default number of distances of a block
+BLOCK_VALUES = 1 << 22
+
+# marks the end of the blocks in the buffer
+_DONE = object()
+
+
+def _block_pairs(stripes, stripe_start):
+    # stripe s pairs sample j with sample (j + s + 1) % n, so the pairs of
+    # offset o are those of offset n - o. those of the offsets above n / 2,
+    # and the second half of offset n / 2, are repeats
+    n = stripes.shape[1]
+    offsets = np.arange(stripe_start + 1,
+                        stripe_start + 1 + stripes.shape[0])[:, None]
+    first = np.broadcast_to(np.arange(n)[None, :], stripes.shape)
+    second = (first + offsets) % n
+    keep = (2 * offsets < n) | ((2 * offsets == n) & (first < offsets))
+
+    first, second = first[keep], second[keep]
+    return (np.minimum(first, second), np.maximum(first, second),
+            stripes[keep])
+
+
+def _compute_blocks(stream, ranges, threads, buffer, cancelled):
+    # computes the blocks into the buffer, which blocks when it is full so
+    # that at most its size of blocks are held ahead of the consumer
+    try:
+        for start, stop in ranges:
+            if cancelled.is_set():
+                return
+            # the last block may have fewer stripes than threads
+            stripes = stream.stripes(start, stop, min(threads, stop - start))
+            pairs = _block_pairs(stripes, start)
+            buffer.put(pairs)
+        buffer.put(_DONE)
+    except BaseException as e:
+        buffer.put(e)
+
+
+def _iter_blocks(stream, ranges, threads, prefetch):
+    ids = np.asarray(stream.sample_ids, dtype=object)
+
+    if prefetch == 0:
+        for start, stop in ranges:
+            stripes = stream.stripes(start, stop, min(threads, stop - start))
+            rows, cols, distances = _block_pairs(stripes, start)
+            yield ids[rows], ids[cols], distances
+        return
+
+    buffer = queue.Queue(maxsize=prefetch)
+    cancelled = threading.Event()
+    worker = threading.Thread(target=_compute_blocks,
+                              args=(stream, ranges, threads, buffer,
+                                    cancelled),
+                              daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            rows, cols, distances = item
+            yield ids[rows], ids[cols], distances
+    finally:
+        # the consumer may stop early, in which case the worker finishes the
+        # block it is computing, and is unblocked by draining the buffer
+        cancelled.set()
+        while worker.is_alive():
+            try:
+                buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        worker.join()
+
+
+def iter_blocks(table: str,
+                phylogeny: str,
+                method: str = 'unweighted',
+                threads: int = 1,
+                variance_adjusted: bool = False,
+                alpha: float = 1.0,
+                bypass_tips: bool = False,
+                block_size: int = None,
+                prefetch: int = 1):
+    """Compute UniFrac a block of stripes at a time
+
+    Parameters
+    ----------
+    table : str
+        A filepath to a BIOM-Format 2.1 file.
+    phylogeny : str
+        A filepath to a Newick formatted tree.
+    method : str, optional
+        The UniFrac method to use. The available choices are:
+        'unweighted', 'weighted_unnormalized', 'weighted_normalized', and
+        'generalized'. Default is 'unweighted'.
+    threads : int, optional
+        The number of threads to compute each block with. Default is 1.
+    variance_adjusted : bool, optional
+        Adjust for varianace or not. Default is False.
+    alpha : float, optional
+        The value of alpha for Generalized UniFrac; only applies to
+        Generalized UniFrac. Default is 1.0.
+    bypass_tips : bool
+        Bypass the tips of the tree in the computation. This reduces compute
+        by about 50%, but is an approximation.
+    block_size : int, optional
+        The number of stripes of each block, each of which holds a distance
+        for every sample. Default is about 4 million distances per block, and
+        at least one stripe per thread.
+    prefetch : int, optional
+        The most blocks computed ahead of the consumer, in a background
+        thread. 0 computes each block on request. Default is 1.
+
+    Returns
+    -------
+    generator of tuple
+        (row_ids, col_ids, distances) for each block, of the IDs of the two
+        samples of each pair and their distance, as one dimensional arrays.
+        Each pair is yielded once, with the row sample before the column
+        sample in the order of the table.
+
+    Raises
+    ------
+    IOError
+        If the tree file is not found
+        If the table is not found
+    ValueError
+        If the method is not recognized.
+        If the table does not appear to be BIOM-Format v2.1.
+        If the phylogeny does not appear to be in Newick format.
+        If the block size is not positive or the prefetch is negative.
+
+    Notes
+    -----
+    The table and tree are read once, and each block is a range of the
+    stripes of ``ssu --mode partial``. At most `prefetch` blocks are held
+    ahead of the consumer, so the memory held is proportional to the block
+    size rather than to the square of the number of samples. If the
+    consumer stops early, the block being computed is completed before the
+    generator is closed.
+    """
+    method_ = method.replace('-', '_')
+    if method_ not in METHODS:
+        raise ValueError("Method (%s) unrecognized. Available methods are: %s"
+                         % (method, ', '.join(METHODS.keys())))
+    if block_size is not None and block_size < 1:
+        raise ValueError("The block size must be positive.")
+    if prefetch < 0:
+        raise ValueError("The prefetch must not be negative.")
+
+    # opened here, rather than on the first block, so that bad inputs are
+    # raised on the call
+    stream = StripeStream(str(table), str(phylogeny), method_,
+                          variance_adjusted, alpha, bypass_tips)
+
+    n_samples = len(stream.sample_ids)
+    if block_size is None:
+        block_size = max(threads, BLOCK_VALUES // n_samples)
+
+    # the stripes beyond n // 2 only repeat pairs
+    n_stripes = n_samples // 2
+    ranges = [(start, min(start + block_size, n_stripes))
+              for start in range(0, n_stripes, block_size)]
+
+    return _iter_blocks(stream, ranges, threads, prefetch)
@@ -7,6 +7,8 @@
 # ----------------------------------------------------------------------------
 import unittest
 import os
+import threading
+import time
 from io import StringIO
 from tempfile import gettempdir
 import pkg_resources
@@ -15,10 +17,12 @@ import numpy as np
 import numpy.testing as npt
 from biom import Table, load_table
 from biom.util import biom_open
-from skbio import TreeNode
+from skbio import TreeNode, DistanceMatrix
 import skbio.diversity
 
-from unifrac import ssu, faith_pd
+from unifrac import (ssu, ssu_cross, ssu_append, ssu_knn, ssu_rarefied,
+                     ssu_partial, ssu_merge, ssu_plan, faith_pd,
+                     configure_threads, serve, Client)
 
 
 class UnifracAPITests(unittest.TestCase):
@@ -75,6 +79,451 @@ class UnifracAPITests(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, "Unknown method."):
             ssu(e1, t1, 'unweightedfoo', False, 1.0, False, 1)
 
+    def test_ssu_table_not_biom(self):
+        t1 = self.get_data_path('t1.newick')
+        with self.assertRaisesRegex(ValueError, "BIOM-Format v2.1"):
+            ssu(t1, t1, 'unweighted', False, 1.0, False, 1)
+
+    def test_ssu_malformed_tree(self):
+        e1 = self.get_data_path('e1.biom')
+        tree = os.path.join(gettempdir(), 'malformed.newick')
+        for newick in ['((A:1,B:2):3;', '(A:1,B:2)r;)', '(A:1,B:x)r;', '']:
+            with open(tree, 'w') as fp:
+                fp.write(newick)
+
+            with self.assertRaisesRegex(ValueError,
+                                        "does not appear to be newick"):
+                ssu(e1, tree, 'unweighted', False, 1.0, False, 1)
+            with self.assertRaisesRegex(ValueError,
+                                        "does not appear to be newick"):
+                faith_pd(e1, tree)
+        os.remove(tree)
+
+    def test_ssu_cross(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        ids = list(load_table(table).ids())
+        rows = ids[:3]
+        cols = ids[2:][::-1]
+
+        for method in ('unweighted', 'weighted_normalized',
+                       'weighted_unnormalized', 'generalized'):
+            for vaw in (False, True):
+                exp = ssu(table, tree, method, vaw, 0.5, False, 1)
+                obs = ssu_cross(table, tree, rows, cols, method, vaw, 0.5,
+                                False, 1)
+                self.assertEqual(list(obs.index), rows)
+                self.assertEqual(list(obs.columns), cols)
+                npt.assert_almost_equal(obs.values,
+                                        [[exp[r, c] for c in cols]
+                                         for r in rows])
+
+    def test_ssu_cross_sample_missing(self):
+        t1 = self.get_data_path('t1.newick')
+        e1 = self.get_data_path('e1.biom')
+        with self.assertRaisesRegex(ValueError, "not in the table"):
+            ssu_cross(e1, t1, ['A'], ['B', 'missing'], 'unweighted', False,
+                      1.0, False, 1)
+
+    def test_ssu_append(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        table_inmem = load_table(table)
+        ids = list(table_inmem.ids())
+        old_ids = ids[::2]
+        new_ids = ids[1::2]
+
+        subset = os.path.join(gettempdir(), 'ssu_append_subset.biom')
+        subset_inmem = table_inmem.filter(old_ids, inplace=False)
+        with biom_open(subset, 'w') as fp:
+            subset_inmem.to_hdf5(fp, 'test')
+
+        for method in ('unweighted', 'weighted_normalized',
+                       'weighted_unnormalized', 'generalized'):
+            for vaw in (False, True):
+                existing = ssu(subset, tree, method, vaw, 0.5, False, 1)
+                exp = ssu(table, tree, method, vaw, 0.5, False, 1)
+                obs = ssu_append(table, tree, existing, method, vaw, 0.5,
+                                 False, 1)
+                self.assertEqual(obs.ids, tuple(old_ids + new_ids))
+                npt.assert_almost_equal(obs.data,
+                                        exp.filter(obs.ids).data)
+
+        # the existing distances are from another method
+        existing = ssu(subset, tree, 'weighted_unnormalized', False, 1.0,
+                       False, 1)
+        with self.assertRaisesRegex(ValueError, "do not agree"):
+            ssu_append(table, tree, existing, 'unweighted', False, 1.0,
+                       False, 1)
+
+        # the existing distances as the partial results of ssu_partial
+        partials = [os.path.join(gettempdir(), 'ssu_append_partial.%d' % i)
+                    for i in range(2)]
+        ssu_partial(subset, tree, 'unweighted', False, 1.0, False, 1, 0, 1,
+                    partials[0])
+        ssu_partial(subset, tree, 'unweighted', False, 1.0, False, 1, 1, 3,
+                    partials[1])
+        try:
+            obs = ssu_append(table, tree, partials, 'unweighted', False, 1.0,
+                             False, 2)
+        finally:
+            for partial in partials:
+                os.remove(partial)
+        exp = ssu(table, tree, 'unweighted', False, 1.0, False, 1)
+        self.assertEqual(obs.ids, tuple(old_ids + new_ids))
+        npt.assert_almost_equal(obs.data, exp.filter(obs.ids).data)
+
+        with self.assertRaisesRegex(IOError, "Unable to read"):
+            ssu_append(table, tree, 'does-not-exist', 'unweighted', False,
+                       1.0, False, 1)
+        with self.assertRaisesRegex(ValueError, "No partial results"):
+            ssu_append(table, tree, [], 'unweighted', False, 1.0, False, 1)
+        os.remove(subset)
+
+    def test_ssu_sample_ids(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        table_inmem = load_table(table)
+        ids = list(table_inmem.ids())
+        # kept in the order of the table
+        sample_ids = ids[5:1:-2] + ids[:1]
+        kept = [i for i in ids if i in sample_ids]
+
+        for method in ('unweighted', 'weighted_normalized',
+                       'weighted_unnormalized', 'generalized'):
+            for vaw in (False, True):
+                exp = ssu(table, tree, method, vaw, 0.5, False, 1)
+                obs = ssu(table, tree, method, vaw, 0.5, False, 1,
+                          sample_ids=sample_ids)
+                self.assertEqual(obs.ids, tuple(kept))
+                npt.assert_almost_equal(obs.data, exp.filter(kept).data)
+
+        output = os.path.join(gettempdir(), 'ssu-partial-subset.test')
+        ssu_partial(table, tree, 'unweighted', False, 1.0, False, 1, 0, 2,
+                    output, sample_ids=sample_ids)
+        try:
+            obs = ssu_merge([output])
+        finally:
+            os.remove(output)
+        exp = ssu(table, tree, 'unweighted', False, 1.0, False, 1)
+        self.assertEqual(obs.ids, tuple(kept))
+        npt.assert_almost_equal(obs.data, exp.filter(kept).data)
+
+        exp = faith_pd(table, tree)
+        obs = faith_pd(table, tree, sample_ids=sample_ids)
+        self.assertEqual(list(obs.index), kept)
+        npt.assert_almost_equal(obs.values, exp[kept].values)
+
+        with self.assertRaisesRegex(ValueError, "not in the table"):
+            ssu(table, tree, 'unweighted', False, 1.0, False, 1,
+                sample_ids=ids[:2] + ['missing'])
+        with self.assertRaisesRegex(ValueError, "not in the table"):
+            faith_pd(table, tree, sample_ids=['missing'])
+        with self.assertRaisesRegex(TypeError, "not a str"):
+            ssu(table, tree, 'unweighted', False, 1.0, False, 1,
+                sample_ids=ids[0])
+
+    def test_ssu_feature_ids(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        table_inmem = load_table(table)
+        feature_ids = list(table_inmem.ids(axis='observation'))[::3]
+
+        subset = os.path.join(gettempdir(), 'ssu_feature_subset.biom')
+        subset_inmem = table_inmem.filter(feature_ids, axis='observation',
+                                          inplace=False)
+        with biom_open(subset, 'w') as fp:
+            subset_inmem.to_hdf5(fp, 'test')
+
+        try:
+            for method in ('unweighted', 'weighted_normalized'):
+                exp = ssu(subset, tree, method, False, 1.0, False, 1)
+                obs = ssu(table, tree, method, False, 1.0, False, 1,
+                          feature_ids=feature_ids + ['missing'])
+                self.assertEqual(obs.ids, exp.ids)
+                npt.assert_almost_equal(obs.data, exp.data)
+
+            exp = faith_pd(subset, tree)
+            obs = faith_pd(table, tree, feature_ids=feature_ids)
+            npt.assert_almost_equal(obs.values, exp.values)
+        finally:
+            os.remove(subset)
+
+    def test_ssu_knn(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        ids = list(load_table(table).ids())
+        queries = [ids[4], ids[0]]
+
+        for method in ('unweighted', 'weighted_normalized',
+                       'weighted_unnormalized', 'generalized'):
+            full = ssu(table, tree, method, False, 0.5, False, 1)
+            for prune in (False, True):
+                indices, distances, obs_ids = ssu_knn(table, tree, queries, 3,
+                                                      method, False, 0.5,
+                                                      False, 1, prune)
+                self.assertEqual(obs_ids, ids)
+                self.assertEqual(indices.shape, (2, 3))
+                self.assertEqual(distances.shape, (2, 3))
+                for q, row, dists in zip(queries, indices, distances):
+                    exp = full[q].copy()
+                    exp[ids.index(q)] = np.inf
+                    order = np.argsort(exp, kind='stable')[:3]
+                    npt.assert_equal(row, order)
+                    npt.assert_almost_equal(dists, exp[order])
+
+    def test_ssu_knn_k_exceeds_samples(self):
+        t1 = self.get_data_path('t1.newick')
+        e1 = self.get_data_path('e1.biom')
+        indices, distances, ids = ssu_knn(e1, t1, ['A'], 10, 'unweighted',
+                                          False, 1.0, False, 1)
+        self.assertEqual(indices.shape, (1, 2))
+        npt.assert_almost_equal(distances, [[8 / 13., 10 / 16.]])
+        self.assertEqual([ids[i] for i in indices[0]], ['C', 'B'])
+
+    def test_ssu_rarefied(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        ids = list(load_table(table).ids())
+        # 10084.PC.636 has 87 counts
+        exp_ids = [i for i in ids if i != '10084.PC.636']
+
+        mean, variance, replicates = ssu_rarefied(table, tree, 'unweighted',
+                                                  False, 1.0, False, 1, 100,
+                                                  4, 11, True)
+        self.assertEqual(list(mean.ids), exp_ids)
+        self.assertEqual(list(variance.ids), exp_ids)
+        self.assertEqual(len(replicates), 4)
+
+        stacked = np.array([r.condensed_form() for r in replicates])
+        npt.assert_almost_equal(mean.condensed_form(), stacked.mean(axis=0))
+        npt.assert_almost_equal(variance.condensed_form(),
+                                stacked.var(axis=0, ddof=1))
+
+        # the replicates are reproducible, whether or not they are kept
+        obs_mean, obs_variance, obs_replicates = \
+            ssu_rarefied(table, tree, 'unweighted', False, 1.0, False, 1,
+                         100, 4, 11)
+        self.assertEqual(obs_replicates, [])
+        npt.assert_equal(obs_mean.data, mean.data)
+        npt.assert_equal(obs_variance.data, variance.data)
+
+    def test_ssu_rarefied_too_deep(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        with self.assertRaisesRegex(ValueError, "requested depth"):
+            ssu_rarefied(table, tree, 'unweighted', False, 1.0, False, 1,
+                         138, 2, 0)
+
+    def test_ssu_stats(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        exp = ssu(table, tree, 'weighted_normalized', False, 1.0, False, 1)
+        self.assertFalse(hasattr(exp, 'stats'))
+
+        obs = ssu(table, tree, 'weighted_normalized', False, 1.0, False, 1,
+                  stats=True)
+        npt.assert_equal(obs.data, exp.data)
+        self.assertEqual(list(obs.stats['phases']),
+                         ['parse', 'load', 'shear', 'compute', 'condense'])
+        for phase in obs.stats['phases'].values():
+            self.assertEqual(set(phase), {'wall_seconds', 'cpu_seconds',
+                                          'bytes_allocated', 'peak_rss_kb'})
+            self.assertGreaterEqual(phase['wall_seconds'], 0)
+            self.assertGreater(phase['peak_rss_kb'], 0)
+        self.assertEqual(len(obs.stats['thread_cpu_seconds']), 1)
+
+    def test_ssu_duplicates(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        table_inmem = load_table(table)
+        ids = list(table_inmem.ids())
+
+        # two samples are repeated, one of them twice
+        repeats = [ids[1], ids[4], ids[1]]
+        data = table_inmem.matrix_data.toarray()
+        repeated = Table(np.hstack([data] + [data[:, [ids.index(i)]]
+                                             for i in repeats]),
+                         table_inmem.ids(axis='observation'),
+                         ids + ['repeat%d' % i for i in range(3)])
+        path = os.path.join(gettempdir(), 'ssu_duplicates.biom')
+        with biom_open(path, 'w') as fp:
+            repeated.to_hdf5(fp, 'test')
+
+        try:
+            all_ids = list(repeated.ids())
+            for method in ('unweighted', 'weighted_normalized'):
+                for vaw in (False, True):
+                    exp = ssu_cross(path, tree, all_ids, all_ids, method, vaw,
+                                    1.0, False, 1)
+                    obs = ssu(path, tree, method, vaw, 1.0, False, 1,
+                              stats=True)
+                    self.assertEqual(obs.stats['duplicates'], 3)
+                    self.assertEqual(list(obs.stats['phases'])[-1], 'expand')
+                    npt.assert_almost_equal(obs.data, exp.values)
+        finally:
+            os.remove(path)
+
+    def test_ssu_max_memory(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        exp = ssu(table, tree, 'unweighted', False, 1.0, False, 1)
+
+        # from a single round to a round for each stripe, as the table,
+        # trees and result take about 215KB
+        for max_memory in (2 ** 30, 215600, 215300):
+            obs = ssu(table, tree, 'unweighted', False, 1.0, False, 1,
+                      max_memory=max_memory)
+            npt.assert_equal(obs.data, exp.data)
+            self.assertEqual(obs.ids, exp.ids)
+
+        with self.assertRaisesRegex(MemoryError, 'single stripe'):
+            ssu(table, tree, 'unweighted', False, 1.0, False, 1,
+                max_memory=2 ** 17)
+
+    def test_configure_threads(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        exp = ssu(table, tree, 'unweighted', False, 1.0, False, 1)
+
+        # more threads of a call than workers, and back to the default
+        try:
+            self.assertEqual(configure_threads(2, 'none'), 2)
+            obs = ssu(table, tree, 'unweighted', False, 1.0, False, 4)
+            npt.assert_equal(obs.data, exp.data)
+        finally:
+            self.assertGreaterEqual(configure_threads(), 1)
+
+        with self.assertRaisesRegex(ValueError, 'Affinity'):
+            configure_threads(2, 'socket')
+
+    def test_serve(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        socket_path = os.path.join(gettempdir(), 'ssu-serve-%d.sock'
+                                   % os.getpid())
+        output = os.path.join(gettempdir(), 'ssu-serve.dm')
+
+        with self.assertRaisesRegex(IOError, 'Tree file not found'):
+            serve(socket_path, {'missing': tree + '.missing'})
+
+        server = threading.Thread(target=serve,
+                                  args=(socket_path, {'crawford': tree}, 2))
+        server.start()
+        client = Client(socket_path, timeout=60)
+        # the server parses the tree before it listens
+        for _ in range(500):
+            try:
+                client.metrics()
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                time.sleep(0.01)
+
+        try:
+            obs = client.compute('crawford', table, output, threads=4)
+            self.assertEqual(obs['n_samples'], 9)
+            self.assertEqual(obs['threads'], 2)
+            exp = ssu(table, tree, 'unweighted', False, 1.0, False, 1)
+            dm = DistanceMatrix.read(output)
+            npt.assert_almost_equal(dm.data, exp.data)
+            self.assertEqual(dm.ids, exp.ids)
+
+            with self.assertRaisesRegex(IOError, 'cannot be served'):
+                serve(socket_path, {'crawford': tree})
+            with self.assertRaisesRegex(ValueError, 'not loaded'):
+                client.compute('other', table, output)
+            with self.assertRaises(IOError):
+                client.compute('crawford', table + '.missing', output)
+            with self.assertRaisesRegex(ValueError, 'Method'):
+                client.compute('crawford', table, output, method='bogus')
+
+            metrics = client.metrics()
+            self.assertEqual(metrics['completed'], 1)
+            self.assertEqual(metrics['failed'], 2)
+            self.assertEqual(metrics['queued'], 0)
+            self.assertEqual(metrics['thread_budget'], 2)
+            self.assertEqual(metrics['trees'], ['crawford'])
+            self.assertGreater(metrics['compute_seconds_max'], 0)
+        finally:
+            client.shutdown()
+            server.join()
+            if os.path.exists(output):
+                os.remove(output)
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_ssu_partial_merge(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        exp = ssu(table, tree, 'generalized', True, 0.5, False, 1)
+
+        # the 9 samples are 5 stripes
+        plan = ssu_plan(table, tree, 'generalized', True, n_partials=3)
+        self.assertEqual(plan['n_samples'], 9)
+        self.assertEqual(plan['n_stripes'], 5)
+        self.assertTrue(plan['feasible'])
+        self.assertEqual([(p['start'], p['stop'])
+                          for p in plan['partitions']],
+                         [(0, 2), (2, 4), (4, 5)])
+
+        outputs = []
+        for part in plan['partitions']:
+            output = os.path.join(gettempdir(), 'ssu-partial-%d.test'
+                                  % part['start'])
+            ssu_partial(table, tree, 'generalized', True, 0.5, False, 1,
+                        part['start'], part['stop'], output)
+            outputs.append(output)
+
+        try:
+            # the order of the partials does not matter
+            obs = ssu_merge(outputs[::-1])
+            self.assertEqual(obs.ids, exp.ids)
+            npt.assert_equal(obs.data, exp.data)
+
+            with self.assertRaisesRegex(ValueError, 'every stripe'):
+                ssu_merge(outputs[:2])
+            with self.assertRaisesRegex(ValueError, 'overlap'):
+                ssu_merge(outputs + outputs[:1])
+            with self.assertRaisesRegex(IOError, 'Unable to read'):
+                ssu_merge(outputs[:2] + [table])
+        finally:
+            for output in outputs:
+                os.remove(output)
+
+        with self.assertRaisesRegex(ValueError, 'No partial'):
+            ssu_merge([])
+        with self.assertRaisesRegex(ValueError, 'out of bounds'):
+            ssu_partial(table, tree, 'unweighted', False, 1.0, False, 1, 4,
+                        6, os.path.join(gettempdir(), 'ssu-partial.test'))
+
+    def test_ssu_plan_memory_limit(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        whole = ssu_plan(table, tree, 'unweighted', False)
+        self.assertEqual(whole['n_partials'], 1)
+        self.assertEqual(whole['cost_model']['calibrated'], False)
+
+        limit = whole['partitions'][0]['peak_bytes'] - 1
+        obs = ssu_plan(table, tree, 'unweighted', False, memory_limit=limit)
+        self.assertGreater(obs['n_partials'], 1)
+        self.assertTrue(obs['feasible'])
+        for part in obs['partitions']:
+            self.assertLessEqual(part['peak_bytes'], limit)
+
+        obs = ssu_plan(table, tree, 'unweighted', False, memory_limit=1)
+        self.assertFalse(obs['feasible'])
+
+        obs = ssu_plan(table, tree, 'unweighted', False, calibrate=True)
+        self.assertEqual(obs['cost_model']['calibrated'], True)
+        self.assertGreaterEqual(obs['cost_model']['stripe_seconds'], 0)
+
+    def test_faith_pd_stats(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        obs = faith_pd(table, tree, stats=True)
+        self.assertEqual(list(obs.attrs['stats']['phases']),
+                         ['parse', 'load', 'shear', 'compute'])
+        self.assertEqual(obs.attrs['stats']['thread_cpu_seconds'], [])
+
 
 class EdgeCasesTests(unittest.TestCase):
     # These tests were mostly ported from skbio's
@@ -0,0 +1,59 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016-2017, UniFrac development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import unittest
+import json
+import subprocess
+import sys
+
+
+# the modules which are only needed once a result object is constructed
+DEFERRED = ('skbio', 'pandas', 'pkg_resources')
+
+# generous relative to the time taken once the deferred modules are avoided,
+# while still catching one of them being imported eagerly again
+MAX_IMPORT_SECONDS = 1.0
+
+IMPORT_BENCHMARK = """
+import json
+import sys
+import time
+
+import numpy
+
+start = time.perf_counter()
+import unifrac
+elapsed = time.perf_counter() - start
+
+print(json.dumps({'elapsed': elapsed,
+                  'loaded': [m for m in %r if m in sys.modules]}))
+""" % (DEFERRED, )
+
+
+class ImportTests(unittest.TestCase):
+    def run_benchmark(self):
+        out = subprocess.check_output([sys.executable, '-c',
+                                       IMPORT_BENCHMARK])
+        return json.loads(out.decode('utf-8'))
+
+    def test_import_defers_modules(self):
+        obs = self.run_benchmark()
+        self.assertEqual(obs['loaded'], [])
+
+    def test_import_time(self):
+        # best of a few runs, to be robust to a cold filesystem cache
+        elapsed = min(self.run_benchmark()['elapsed'] for _ in range(3))
+        self.assertLess(elapsed, MAX_IMPORT_SECONDS)
+
+    def test_version(self):
+        import unifrac
+        self.assertIsInstance(unifrac.__version__, str)
+        self.assertNotEqual(unifrac.__version__, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,12 +6,21 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 import unittest
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import pkg_resources
 
 import numpy as np
 import numpy.testing as npt
 
-from unifrac import meta
+from biom import load_table
+from biom.util import biom_open
+
+from unifrac import (meta, rarefied, pcoa, distributed, LocalExecutor, ssu,
+                     ssu_rarefied, ssu_partial, iter_blocks, permanova,
+                     permdisp, unweighted, generalized)
 
 
 class StateUnifracTests(unittest.TestCase):
@@ -75,6 +84,280 @@ class StateUnifracTests(unittest.TestCase):
                                                 "unrecognized."):
             meta(('a', ), ('b', ), method='bar')
 
+    def test_methods_sample_ids(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        ids = list(load_table(table).ids())
+        sample_ids = ids[1::2]
+
+        exp = ssu(table, tree, 'unweighted', False, 1.0, False, 1)
+        obs = unweighted(table, tree, sample_ids=sample_ids)
+        self.assertEqual(obs.ids, tuple(sample_ids))
+        npt.assert_almost_equal(obs.data, exp.filter(sample_ids).data)
+
+        exp = ssu(table, tree, 'generalized', False, 0.5, False, 1)
+        obs = generalized(table, tree, alpha=0.5, sample_ids=sample_ids)
+        npt.assert_almost_equal(obs.data, exp.filter(sample_ids).data)
+
+    def test_rarefied(self):
+        t1 = self.get_data_path('t1.newick')
+        e1 = self.get_data_path('e1.biom')
+        # the sample totals are 2, 5 and 3
+        mean, variance, replicates = rarefied(e1, t1, 2, iterations=3,
+                                              seed=5,
+                                              method='weighted-normalized')
+        exp_mean, exp_variance, _ = ssu_rarefied(e1, t1,
+                                                 'weighted_normalized', False,
+                                                 1.0, False, 1, 2, 3, 5)
+        self.assertEqual(list(mean.ids), ['A', 'B', 'C'])
+        npt.assert_equal(mean.data, exp_mean.data)
+        npt.assert_equal(variance.data, exp_variance.data)
+        self.assertEqual(replicates, [])
+
+    def test_rarefied_bad_method(self):
+        with self.assertRaisesRegex(ValueError, r"Method \(bar\) "
+                                                "unrecognized."):
+            rarefied('a', 'b', 10, method='bar')
+
+    def test_pcoa(self):
+        from skbio.stats.ordination import pcoa as skbio_pcoa
+
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        for method in ('unweighted', 'weighted_normalized', 'generalized'):
+            dm = ssu(table, tree, method, False, 0.5, False, 1)
+            exp = skbio_pcoa(dm)
+
+            obs = pcoa(table, tree, method, n_axes=3, alpha=0.5)
+            self.assertEqual(obs.short_method_name, 'PCoA')
+            self.assertEqual(list(obs.samples.index), list(dm.ids))
+            self.assertEqual(list(obs.samples.columns),
+                             ['PC1', 'PC2', 'PC3'])
+            npt.assert_almost_equal(obs.eigvals.values,
+                                    exp.eigvals.values[:3])
+            npt.assert_almost_equal(obs.proportion_explained.values,
+                                    exp.proportion_explained.values[:3])
+            # the sign of an axis is arbitrary
+            npt.assert_almost_equal(np.abs(obs.samples.values),
+                                    np.abs(exp.samples.values[:, :3]))
+
+        # more axes than samples are reduced, and negative eigenvalues are
+        # reported as zero
+        obs = pcoa(table, tree, 'unweighted', n_axes=100)
+        self.assertEqual(obs.samples.shape, (9, 9))
+        self.assertTrue((obs.eigvals.values >= 0).all())
+
+    def test_pcoa_errors(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        with self.assertRaisesRegex(ValueError, r"Method \(bar\) "
+                                                "unrecognized."):
+            pcoa(table, tree, method='bar')
+        with self.assertRaisesRegex(ValueError, "axes must be positive"):
+            pcoa(table, tree, n_axes=0)
+        with self.assertRaisesRegex(IOError, "Tree file not found."):
+            pcoa(table, 'does-not-exist')
+
+    def test_distributed(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        exp = ssu(table, tree, 'weighted_normalized', False, 1.0, False, 1)
+
+        # in process, over a thread pool, and over the default process pool
+        for executor in (LocalExecutor(), ThreadPoolExecutor(2), None):
+            obs = distributed(table, tree, 'weighted-normalized',
+                              n_partials=3, executor=executor)
+            self.assertEqual(obs.ids, exp.ids)
+            npt.assert_equal(obs.data, exp.data)
+
+    def test_distributed_scratch_dir(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        scratch = tempfile.mkdtemp()
+        try:
+            distributed(table, tree, n_partials=2, executor=LocalExecutor(),
+                        scratch_dir=scratch, keep_partials=True)
+            self.assertEqual(sorted(os.listdir(scratch)),
+                             ['partial-0-3.ssu', 'partial-3-5.ssu'])
+
+            distributed(table, tree, n_partials=5, executor=LocalExecutor(),
+                        scratch_dir=scratch)
+            self.assertEqual(sorted(os.listdir(scratch)),
+                             ['partial-0-3.ssu', 'partial-3-5.ssu'])
+        finally:
+            shutil.rmtree(scratch)
+
+    def test_distributed_errors(self):
+        with self.assertRaisesRegex(ValueError, r"Method \(bar\) "
+                                                "unrecognized."):
+            distributed('a', 'b', method='bar')
+
+        tree = self.get_data_path('crawford.tre')
+        with self.assertRaisesRegex(IOError, "Table file not found"):
+            distributed('does-not-exist', tree, executor=LocalExecutor())
+
+    def test_permanova(self):
+        from skbio.stats.distance import permanova as skbio_permanova
+
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        dm = ssu(table, tree, 'weighted_normalized', False, 1.0, False, 1)
+        grouping = ['a', 'b', 'a', 'b', 'a', 'b', 'a', 'b', 'b']
+        exp = skbio_permanova(dm, grouping, permutations=0)
+
+        obs = permanova(dm, grouping, permutations=99, seed=3)
+        self.assertEqual(obs.name, 'PERMANOVA results')
+        self.assertEqual(list(obs.index), list(exp.index))
+        self.assertEqual(obs['method name'], 'PERMANOVA')
+        self.assertEqual(obs['test statistic name'], 'pseudo-F')
+        self.assertEqual(obs['sample size'], 9)
+        self.assertEqual(obs['number of groups'], 2)
+        self.assertEqual(obs['number of permutations'], 99)
+        self.assertAlmostEqual(obs['test statistic'], exp['test statistic'])
+        self.assertTrue(0 < obs['p-value'] <= 1)
+
+        # by sample ID, of a matrix on disk, of partial results, and over
+        # threads, the permutations are the same
+        scratch = tempfile.mkdtemp()
+        try:
+            path = os.path.join(scratch, 'dm.tsv')
+            dm.write(path)
+            partials = [os.path.join(scratch, 'p0'),
+                        os.path.join(scratch, 'p1')]
+            ssu_partial(table, tree, 'weighted_normalized', False, 1.0,
+                        False, 1, 0, 2, partials[0])
+            ssu_partial(table, tree, 'weighted_normalized', False, 1.0,
+                        False, 1, 2, 5, partials[1])
+
+            by_id = dict(zip(dm.ids, grouping))
+            for source in (path, partials):
+                for threads in (1, 3):
+                    other = permanova(source, by_id, permutations=99,
+                                      seed=3, threads=threads)
+                    self.assertAlmostEqual(other['test statistic'],
+                                           obs['test statistic'])
+                    self.assertEqual(other['p-value'], obs['p-value'])
+        finally:
+            shutil.rmtree(scratch)
+
+        obs = permanova(dm, grouping, permutations=0)
+        self.assertTrue(np.isnan(obs['p-value']))
+
+    def test_permdisp(self):
+        import pandas as pd
+        import skbio
+        from skbio.stats.distance import permdisp as skbio_permdisp
+
+        # of Euclidean distances, the centroid distances are as by skbio
+        points = np.array([[0, 0], [1, 0], [0, 2], [5, 5], [6, 4], [7, 7],
+                           [3, 1], [2, 6]], dtype=float)
+        data = np.sqrt(((points[:, None] - points[None, :]) ** 2).sum(-1))
+        dm = skbio.DistanceMatrix(data, list('abcdefgh'))
+        metadata = pd.DataFrame({'group': list('xxxyyyxy')},
+                                index=list('abcdefgh'))
+        exp = skbio_permdisp(dm, metadata, column='group', test='centroid',
+                             permutations=0, dimensions=7)
+
+        obs = permdisp(dm, metadata, column='group', permutations=19)
+        self.assertEqual(obs.name, 'PERMDISP results')
+        self.assertEqual(obs['test statistic name'], 'F-value')
+        self.assertAlmostEqual(obs['test statistic'], exp['test statistic'])
+        self.assertTrue(0 < obs['p-value'] <= 1)
+
+        other = permdisp(dm, metadata['group'], permutations=19, threads=2)
+        self.assertEqual(other['p-value'], obs['p-value'])
+
+    def test_permutation_test_errors(self):
+        import pandas as pd
+
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        dm = ssu(table, tree, 'unweighted', False, 1.0, False, 1)
+        with self.assertRaisesRegex(ValueError, "at least two groups"):
+            permanova(dm, ['a'] * 9)
+        with self.assertRaisesRegex(ValueError, "at least two groups"):
+            permdisp(dm, list(range(9)))
+        with self.assertRaisesRegex(ValueError, "is of 2 samples"):
+            permanova(dm, ['a', 'b'])
+        with self.assertRaisesRegex(ValueError, "not in the grouping"):
+            permanova(dm, {dm.ids[0]: 'a'})
+        with self.assertRaisesRegex(ValueError, r"Column \(foo\)"):
+            permanova(dm, pd.DataFrame({'bar': [0] * 9}, index=dm.ids),
+                      column='foo')
+        with self.assertRaisesRegex(IOError, "Unable to read"):
+            permanova('does-not-exist', ['a'] * 9)
+
+    def _assemble(self, blocks, ids):
+        index = {i: k for k, i in enumerate(ids)}
+        obs = np.zeros((len(ids), len(ids)))
+        seen = np.zeros((len(ids), len(ids)), dtype=int)
+        for row_ids, col_ids, distances in blocks:
+            self.assertEqual(len(row_ids), len(distances))
+            self.assertEqual(len(col_ids), len(distances))
+            rows = np.array([index[i] for i in row_ids])
+            cols = np.array([index[i] for i in col_ids])
+            self.assertTrue((rows < cols).all())
+            obs[rows, cols] = distances
+            np.add.at(seen, (rows, cols), 1)
+        return obs + obs.T, seen
+
+    def test_iter_blocks(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+
+        # an even number of samples, for which the last stripe is half
+        # repeats, as well as the odd number of the full table
+        full = load_table(table)
+        even = os.path.join(tempfile.mkdtemp(), 'even.biom')
+        with biom_open(even, 'w') as fp:
+            full.filter(full.ids()[:8], inplace=False).to_hdf5(fp, 'test')
+
+        try:
+            for path in (table, even):
+                for method in ('unweighted', 'weighted_normalized'):
+                    for vaw in (False, True):
+                        exp = ssu(path, tree, method, vaw, 1.0, False, 1)
+                        n = len(exp.ids)
+                        for block_size in (1, 2, None):
+                            for prefetch in (0, 1, 3):
+                                blocks = iter_blocks(path, tree, method,
+                                                     variance_adjusted=vaw,
+                                                     block_size=block_size,
+                                                     prefetch=prefetch)
+                                obs, seen = self._assemble(blocks, exp.ids)
+                                npt.assert_equal(obs, exp.data)
+                                # each pair exactly once
+                                npt.assert_equal(seen.sum(),
+                                                 n * (n - 1) // 2)
+                                self.assertEqual(seen.max(), 1)
+        finally:
+            shutil.rmtree(os.path.dirname(even))
+
+    def test_iter_blocks_close_early(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+
+        blocks = iter_blocks(table, tree, block_size=1, prefetch=2)
+        row_ids, col_ids, distances = next(blocks)
+        self.assertEqual(len(distances), 9)
+        blocks.close()
+        with self.assertRaises(StopIteration):
+            next(blocks)
+
+    def test_iter_blocks_errors(self):
+        tree = self.get_data_path('crawford.tre')
+        table = self.get_data_path('crawford.biom')
+        with self.assertRaisesRegex(ValueError, r"Method \(bar\) "
+                                                "unrecognized."):
+            iter_blocks(table, tree, method='bar')
+        with self.assertRaisesRegex(ValueError, "block size"):
+            iter_blocks(table, tree, block_size=0)
+        with self.assertRaisesRegex(ValueError, "prefetch"):
+            iter_blocks(table, tree, prefetch=-1)
+        # raised on the call, not on the first block
+        with self.assertRaisesRegex(IOError, "Table file not found"):
+            iter_blocks('does-not-exist', tree)
+
     def test_meta_unifrac_bad_consolidation(self):
         with self.assertRaisesRegex(ValueError,
                                     r"Consolidation \(foo\) unrecognized."):